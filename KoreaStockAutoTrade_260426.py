@@ -78,20 +78,42 @@
 # 260313 RSI 조건 완화: 32로 수정
 # 260313 매수 조건 완화: 50일선 대비 위치 포함하여 로그 추가
 # 260426 50일선 계산 기간 조정: 최근 100일로 조정
+# 261018 공용 KIS 클라이언트(kis_client.py)로 전환: Session 연결 재사용, 타임아웃/재시도 통일, 토큰 재발급은 1회만 수행(진행 중 플래그 대체)
+# 261018 토큰 캐시 파일(kis_token_cache.json) 추가: 재시작 시 저장된 토큰 재사용, 만료 1시간 전부터만 재발급
+# 261018 주문 전 해시키 발급 왕복 제거(ORDER_USE_HASHKEY), 주문별 전송 지연 기록
+# 261018 주문 체결 추적(kis_orders.py): 거래 기록은 실제 체결 수량/단가 기준, 미체결 주문은 제한 시간 후 취소
+# 261018 디스코드 발송을 알림 서비스(notify_service.py)로 이전: send_message는 큐에 넣고 바로 반환
+# 261018 일일 요약 리포트를 전체 종목 Markdown 문서 1개 + 요약 embed로 웹훅 1회 발송 (종목별 분할 발송/대기 제거)
+# 261018 KIS API 호출 계측(kis_metrics.py): tr_id별 지연/상태 코드/재시도/바이트, 루프 반복마다 호출 예산 한 줄 로그, Prometheus textfile/SQLite 저장
+# 261018 실행 중 진단(diagnostics.py): SIGUSR1 또는 korea_trader.diagnostics.trigger 파일로 스택 샘플링 + 메모리 스냅샷 저장, 루프 단계별 실행 시간 상시 기록
+# 261018 RSI 계산을 행별 df.loc 루프 대신 kis_indicators.wilder_rsi_series(NumPy 배열 1회 계산)로 교체 (시드/평활 규칙 동일)
+# 261018 이동평균 일봉 캐시(kis_daily_bars.py): (종목, 마지막 마감 거래일)당 1회 조회, 장중 당일 봉은 현재가 반영, 기간별 이평은 누적 합 (사이클당 종목별 일봉 재조회 4~6회 제거)
+# 261018 한국거래소 달력(market_calendar_krx.json): 설날/추석/부처님오신날/대체공휴일/선거일/연말 휴장, 새해 첫날·수능일 10:00 개장 반영, 다음 개장 시각까지 정확히 대기 + 개장 5분 전 토큰/일봉 미리 갱신
+# 261018 분봉 조회를 당일분봉 페이지 순차 조회 대신 주식일별분봉조회 시간 구간 동시 조회(kis_minute_bars.py)로 교체: 최근 3거래일 30분봉을 시간순으로 반환, KIS 초당 요청 한도 10건
+# 261018 봉 로컬 저장소(kis_bars.db) 사용: 일봉/1분봉을 RSI 확인 도구와 공유, 마감된 거래일은 재조회 없이 저장분 사용, 분봉은 거래일별 동기화 시각 이후 구간만 조회
 
 
 
 
 #파트1
 
-import requests
-import json
+import os
 import datetime
 import time
 import yaml
 import pandas as pd
 import numpy as np
 from pytz import timezone
+from kis_client import KISClient
+from kis_orders import OrderTracker, MARKET_DOMESTIC
+from notify_service import create_notifier, build_attachment
+from kis_metrics import APIMetrics
+from diagnostics import Diagnostics, StageTimer
+from kis_indicators import wilder_averages, wilder_rsi_series
+from kis_daily_bars import DailyBarCache
+from kis_bar_store import init_bar_store
+from market_calendar import KRX_CALENDAR_PATH, MarketCalendar
+from kis_minute_bars import fetch_minute_bars, minute_bars_output2
 
 
 def log(msg):
@@ -142,6 +164,7 @@ RSI_OVERBOUGHT = 70  # RSI가 이 값 이상이면 매도 신호
 # RSI 계산 기간 및 분봉 설정
 RSI_PERIOD = 14  # RSI 계산 기간
 MINUTE_CANDLE = 30  # 분봉 (30분봉 사용)
+MINUTE_FETCH_DAYS = 3  # 분봉 조회 거래일 수 (30분봉 하루 13개 - RSI 계산에 충분한 만큼, 거래일당 구간 4개 동시 조회)
 
 # 매매 조건 체크 주기 (분 단위)
 CHECK_INTERVAL_MINUTES = 60  # 매매 조건/분석 주기: 60분마다
@@ -249,38 +272,114 @@ MESSAGE_LEVEL_DEBUG = 4       # 상세 디버그 정보
 # 전송할 메시지 레벨 (1=중요한 것만, 4=모든 메시지)
 MESSAGE_SEND_LEVEL = MESSAGE_LEVEL_IMPORTANT
 
-# 반복 메시지 필터링
+# 반복 메시지 필터링 (알림 서비스에서 처리)
 MESSAGE_COOLDOWN = 300        # 같은 메시지 재전송 방지 시간 (초)
-MESSAGE_HISTORY = {}          # 메시지 히스토리 저장
 
-# 배치 발송 설정
+# 배치 발송 설정 (알림 서비스에서 처리)
 ENABLE_BATCH_SEND = True      # 배치 발송 활성화
 BATCH_SEND_INTERVAL = 60      # 배치 발송 간격 (초)
 MAX_BATCH_SIZE = 10           # 최대 배치 크기
-MESSAGE_BATCH = []            # 배치 메시지 저장
-LAST_BATCH_SEND = 0           # 마지막 배치 발송 시간
 
 # AWS 환경에서 메시지 압축
 ENABLE_MESSAGE_COMPRESSION = True  # 메시지 압축 활성화
 # ===== 메시지 최적화 설정 끝 =====
 
+# ===== 알림 서비스 설정 =====
+# 디스코드 발송(레이트 리밋, 429 retry_after, 중복 제거, 배치, 재시도)은 notify_service.py 백그라운드 스레드/서버가 담당
+# send_message는 큐에 넣고 바로 반환 → 매매 스레드가 디스코드 응답을 기다리지 않음
+MIN_DISCORD_SEND_INTERVAL = 2  # 초 단위 최소 간격
+NOTIFY_SERVER_ADDRESS = tuple(config['NOTIFY_SERVER_ADDRESS']) if config.get('NOTIFY_SERVER_ADDRESS') else None  # 로컬 알림 서버 (없으면 프로세스 안에서 직접 발송)
+NOTIFY_AUTHKEY = config.get('NOTIFY_AUTHKEY')  # 알림 서버와 공유하는 비밀값 (없으면 알림 서버를 쓰지 않고 직접 발송)
+NOTIFY_SOURCE = 'KR'          # 중복 제거 키 구분 (같은 알림 서버를 쓰는 다른 봇과 구분)
+NOTIFIER = create_notifier(DISCORD_WEBHOOK_URL, address=NOTIFY_SERVER_ADDRESS, authkey=NOTIFY_AUTHKEY,
+                           min_interval=MIN_DISCORD_SEND_INTERVAL, batch_interval=BATCH_SEND_INTERVAL,
+                           max_batch_size=MAX_BATCH_SIZE, dedup_window=MESSAGE_COOLDOWN)
+# ===== 알림 서비스 설정 끝 =====
+
+# ===== API 호출 계측 설정 =====
+# 모든 KIS 호출을 tr_id별로 기록 (지연 히스토그램, 상태 코드, 재시도, 바이트) → 메인 루프 반복마다 한 줄 요약
+# 누적 집계는 Prometheus textfile, 반복별 tr_id 집계는 SQLite(api_cycle_metrics, 스크립트 파일명 포함)로 저장
+API_METRICS_PROM_PATH = 'kis_metrics_kr.prom'  # Prometheus textfile (None이면 저장 안 함)
+API_METRICS_DB_PATH = 'kis_metrics.db'     # 주기별 집계 DB (미국/국내 트레이더 공유, None이면 저장 안 함)
+KIS_API_RATE_LIMIT = 20                    # KIS 초당 호출 한도 (실전 계좌 기준, 예산 사용률 표시용)
+API_METRICS_LABEL = os.path.basename(__file__)  # 버전(날짜)별 스크립트 구분
+API_METRICS = APIMetrics('KR', rate_limit_per_second=KIS_API_RATE_LIMIT,
+                         prom_path=API_METRICS_PROM_PATH, db_path=API_METRICS_DB_PATH)
+# ===== API 호출 계측 설정 끝 =====
+
+# ===== 실행 중 진단 설정 =====
+# kill -USR1 <pid> 또는 touch korea_trader.diagnostics.trigger → 메인 루프 스택 샘플링 + tracemalloc 상위 할당을 diagnostics/ 폴더에 저장
+# tracemalloc은 캡처 때만 추적 (config.yaml DIAGNOSTICS_TRACE_FROM_START: true면 시작부터 추적 - 메모리 누수 조사용)
+# 메인 루프 단계별 실행 시간은 상시 기록 (시장 마감 시 로그 출력 후 초기화)
+DIAGNOSTICS_SAMPLE_SECONDS = 30    # 스택 샘플링 시간 (초)
+DIAGNOSTICS_TRACE_FROM_START = bool(config.get('DIAGNOSTICS_TRACE_FROM_START', False))  # 시작부터 할당 추적 (기본 끔)
+STAGE_TIMER = StageTimer()
+DIAGNOSTICS = Diagnostics('korea_trader', stages=STAGE_TIMER, sample_seconds=DIAGNOSTICS_SAMPLE_SECONDS,
+                          trace_from_start=DIAGNOSTICS_TRACE_FROM_START,
+                          watch={'DAILY_SUMMARY_DATA': lambda: len(DAILY_SUMMARY_DATA),
+                                 'ORDER_TRACKER 미체결': lambda: len(ORDER_TRACKER.open_orders())})
+# ===== 실행 중 진단 설정 끝 =====
+
 # ===== 토큰 발급 중복 방지 설정 =====
 TOKEN_REQUEST_COOLDOWN = 120  # 토큰 발급 요청 간격 (초) - 서버 이상 대응을 위해 2분으로 조정
 LAST_TOKEN_REQUEST_TIME = 0  # 마지막 토큰 발급 요청 시간
-TOKEN_REQUEST_IN_PROGRESS = False  # 토큰 발급 진행 중 플래그
+
+TOKEN_CACHE_PATH = 'kis_token_cache.json'  # 토큰 캐시 파일 (미국 트레이더와 공유, 소유자만 읽기/쓰기)
+TOKEN_REFRESH_MARGIN = 3600                # 만료까지 남은 시간이 이보다 짧으면 재발급 (초)
+
+# KIS API 공용 클라이언트 (연결 재사용, 타임아웃/재시도, 토큰 재발급 1회 보장, 캐시된 토큰 재사용)
+ORDER_USE_HASHKEY = False                  # 주문 전 해시키 발급 여부 (선택 항목, 끄면 주문당 API 왕복 1회 절약)
+KIS_REQUESTS_PER_SECOND = 10       # 전체 스레드 합산 KIS API 초당 요청 한도 (분봉 구간 동시 조회 포함)
+KIS = KISClient(APP_KEY, APP_SECRET, URL_BASE, timeout=10, max_retries=2,
+                requests_per_second=KIS_REQUESTS_PER_SECOND,
+                min_reissue_interval=TOKEN_REQUEST_COOLDOWN,
+                token_cache_path=TOKEN_CACHE_PATH, token_refresh_margin=TOKEN_REFRESH_MARGIN,
+                order_hashkey=ORDER_USE_HASHKEY, metrics=API_METRICS)
 # ===== 토큰 발급 중복 방지 설정 끝 =====
 
+# ===== 주문 체결 추적 설정 =====
+# 접수된 주문을 추적하고 체결 조회 1회로 미체결 주문 전체를 대사 → 거래 기록은 실제 체결 기준으로 반영
+ORDER_FILL_TIMEOUT = 120           # 접수 후 이 시간(초)까지 미체결이면 취소 (시장가 주문이라 재주문 없이 다음 분석에서 다시 판단)
+ORDER_TRACKER = OrderTracker(KIS, CANO, ACNT_PRDT_CD, MARKET_DOMESTIC,
+                             on_fill=lambda order, qty, price: on_order_fill(order, qty, price),
+                             fill_timeout=ORDER_FILL_TIMEOUT)
+# ===== 주문 체결 추적 설정 끝 =====
+
 # ===== 종목 정보 파일 저장 설정 =====
 # JSON 파일 저장 기능 제거 - API에서 실시간 조회하므로 불필요
 # ===== 종목 정보 파일 저장 설정 끝 =====
 
 # ===== 일일 거래 요약 데이터 수집 설정 =====
 DAILY_SUMMARY_DATA = {}  # 종목별 일일 분석 데이터 저장
+DAILY_SUMMARY_GZIP = False  # 요약 리포트 첨부 파일 gzip 압축 (디스코드 미리보기는 압축하지 않은 .md만 가능)
 # ===== 일일 거래 요약 데이터 수집 설정 끝 =====
 
+# ===== 거래소 달력 설정 =====
+# 휴장일(음력 공휴일/대체공휴일/선거일/연말 휴장)과 특별 거래 시간(새해 첫 거래일·수능일 10:00 개장 등)은 달력 파일 기준
+# 새 연도 추가: market_calendar.py의 음력 공휴일/수능일 표에 연도 추가 후 python market_calendar.py krx 2028
+MARKET_CALENDAR_PATH = KRX_CALENDAR_PATH   # 한국거래소 달력 파일 (market_calendar_krx.json)
+MARKET_CALENDAR = MarketCalendar(MARKET_CALENDAR_PATH)
+MARKET_PREWARM_MINUTES = 5         # 개장 몇 분 전에 토큰/일봉 캐시를 미리 갱신할지 (0이면 안 함)
+# ===== 거래소 달력 설정 끝 =====
+
+# ===== 봉 로컬 저장소 설정 =====
+# 일봉/1분봉은 kis_bars.db에 저장해 RSI 확인 도구(Koreastock_RSI_Check_0126.py)와 공유
+# 마감된 거래일은 다시 조회하지 않고, 분봉은 거래일별 동기화 시각 이후 구간만 조회 (재시작해도 유지)
+BAR_STORE_ENABLED = True           # 봉 로컬 저장소 사용 여부
+if BAR_STORE_ENABLED:
+    init_bar_store()
+# ===== 봉 로컬 저장소 설정 끝 =====
+
+# ===== 일봉 캐시 설정 =====
+# 이동평균용 일봉은 (종목, 마지막 마감 거래일) 기준으로 1회만 조회하고, 장중 당일 봉은 최근 현재가로 반영
+# 20/50일 등 기간별 이동평균은 누적 합으로 계산 (get_moving_average 호출마다 일봉 재조회 제거)
+DAILY_BARS = DailyBarCache(lambda code, min_bars: (get_daily_data(code) or {}).get('output2'),
+                           lambda: get_last_closed_trading_day().strftime('%Y%m%d'),
+                           min_bars=LONG_MA_PERIOD, use_store=BAR_STORE_ENABLED)
+# ===== 일봉 캐시 설정 끝 =====
+
 def send_message(msg, symbol=None, level=MESSAGE_LEVEL_INFO):
-    """디스코드 메시지 전송 (최적화된 버전)"""
-    global MESSAGE_HISTORY, MESSAGE_BATCH, LAST_BATCH_SEND
+    """디스코드 메시지 전송 (알림 서비스 큐에 넣고 바로 반환)"""
     
     # 메시지 레벨 필터링
     if level > MESSAGE_SEND_LEVEL:
@@ -296,26 +395,15 @@ def send_message(msg, symbol=None, level=MESSAGE_LEVEL_INFO):
     
     full_message = f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] {symbol_info}{str(msg)}"
     
-    # 반복 메시지 필터링
-    msg_hash = hash(f"{symbol}_{msg}")
-    current_time = time.time()
-    
-    if msg_hash in MESSAGE_HISTORY:
-        if current_time - MESSAGE_HISTORY[msg_hash] < MESSAGE_COOLDOWN:
-            return  # 쿨다운 시간 내 같은 메시지는 전송하지 않음
-    
-    MESSAGE_HISTORY[msg_hash] = current_time
-    
-    # 배치 발송 처리
+    # 반복 메시지 필터링/배치 발송은 알림 서비스에서 처리 (쿨다운 시간 내 같은 메시지는 전송하지 않음)
+    dedup_key = f"{NOTIFY_SOURCE}_{symbol}_{msg}"
     if ENABLE_BATCH_SEND and level > MESSAGE_LEVEL_CRITICAL:
-        MESSAGE_BATCH.append(full_message)
-        
-        # 배치가 가득 찼거나 시간이 지났으면 발송
-        if len(MESSAGE_BATCH) >= MAX_BATCH_SIZE or (current_time - LAST_BATCH_SEND) >= BATCH_SEND_INTERVAL:
-            send_batch_messages()
+        queued = NOTIFIER.add_to_batch(full_message, dedup_key)
     else:
         # 중요한 메시지는 즉시 발송
-        send_immediate_message(full_message)
+        queued = NOTIFIER.send(full_message, dedup_key)
+    if not queued:
+        return
     
     # 콘솔 출력 (로컬 디버깅용)
     print(f"[Level {level}] {full_message}")
@@ -335,41 +423,6 @@ def compress_message(msg):
     
     return compressed.strip()
 
-def send_immediate_message(message):
-    """즉시 메시지 발송"""
-    try:
-        message_data = {"content": message}
-        requests.post(DISCORD_WEBHOOK_URL, data=message_data, timeout=5)
-    except Exception as e:
-        print(f"메시지 발송 실패: {e}")
-
-def send_batch_messages():
-    """배치 메시지 발송"""
-    global MESSAGE_BATCH, LAST_BATCH_SEND
-    
-    if not MESSAGE_BATCH:
-        return
-    
-    try:
-        # 배치 메시지를 하나로 합치기
-        batch_content = "\n".join(MESSAGE_BATCH[-MAX_BATCH_SIZE:])  # 최대 크기 제한
-        message_data = {"content": f"📊 **배치 업데이트**\n```\n{batch_content}\n```"}
-        
-        requests.post(DISCORD_WEBHOOK_URL, data=message_data, timeout=10)
-        MESSAGE_BATCH.clear()
-        LAST_BATCH_SEND = time.time()
-        
-        print(f"배치 메시지 발송 완료: {len(MESSAGE_BATCH)} 건")
-    except Exception as e:
-        print(f"배치 메시지 발송 실패: {e}")
-
-def cleanup_message_history():
-    """오래된 메시지 히스토리 정리"""
-    global MESSAGE_HISTORY
-    current_time = time.time()
-    MESSAGE_HISTORY = {k: v for k, v in MESSAGE_HISTORY.items() 
-                      if current_time - v < MESSAGE_COOLDOWN * 2}
-
 def collect_daily_summary_data(symbol, rsi_value, current_price, ma_value, buy_signal, sell_signal, buy_reason, sell_reason, trade_failure_reason=None):
     """일일 거래 요약 데이터 수집
     trade_failure_reason: 거래 미진행 사유 ('insufficient_balance': 잔고 부족, 'condition_not_met': 조건 미충족, None: 정상)
@@ -661,112 +714,70 @@ def generate_daily_summary_messages(symbol):
     
     return messages
 
+def render_daily_summary_report(current_date):
+    """전체 종목 일일 요약을 Markdown 문서 1개로 생성 (종목별 generate_daily_summary_messages 결과를 이어 붙임)"""
+    sections = [f"# 한국 자동 매매 일일 요약 ({current_date})"]
+    for symbol in DAILY_SUMMARY_DATA:
+        messages = generate_daily_summary_messages(symbol)
+        if not messages:
+            print(f"❌ {symbol} 메시지 생성 실패")
+            continue
+        sections.append("---")
+        sections.extend(message.strip() for message in messages)
+    return "\n\n".join(sections) + "\n"
+
+def build_daily_summary_embed(current_date):
+    """요약 embed (종목 수, 신호/거래 건수, 거래 내역 최대 10건)"""
+    buy_signals = sum(len(data['buy_signals']) for data in DAILY_SUMMARY_DATA.values())
+    sell_signals = sum(len(data['sell_signals']) for data in DAILY_SUMMARY_DATA.values())
+    trades = [(symbol, trade) for symbol, data in DAILY_SUMMARY_DATA.items() for trade in data['trades']]
+    trade_lines = [f"{trade['time']} {symbol} {trade['type']} {trade['qty']}주 @ {trade['price']:,.0f}원"
+                   for symbol, trade in trades[:10]]
+    if len(trades) > 10:
+        trade_lines.append(f"... 외 {len(trades) - 10}건 (첨부 리포트 참고)")
+    return {
+        "title": f"📊 한국 자동 매매 일일 요약 ({current_date})",
+        "description": (f"종목 {len(DAILY_SUMMARY_DATA)}개 | 매수 신호 {buy_signals}회 · 매도 신호 {sell_signals}회 | 거래 {len(trades)}건\n"
+                        "종목별 상세 내용은 첨부 리포트 참고"),
+        "fields": [{"name": "거래 내역", "value": "\n".join(trade_lines) or "거래 없음", "inline": False}],
+    }
+
 def send_daily_summary():
-    """일일 요약 메시지 발송 (분활 및 디버깅 포함)"""
-    global DAILY_SUMMARY_DATA
-    
-    # DAILY_SUMMARY_DATA가 비어있는 경우 처리 (거래가 없어도 분석 데이터가 있으면 리포트 발송)
-    log(f"📊 일일 요약 리포트 발송 시작 - DAILY_SUMMARY_DATA 상태 확인")
-    log(f"📊 종목 수: {len(DAILY_SUMMARY_DATA)}개")
-    
+    """일일 요약 리포트 발송 (전체 종목 리포트 첨부 파일 + 요약 embed, 웹훅 요청 1회)"""
     if not DAILY_SUMMARY_DATA:
-        log("⚠️ DAILY_SUMMARY_DATA가 비어있음 - 리포트 발송 불가")
         send_message("📊 오늘은 분석 데이터가 없어 요약 리포트를 발송하지 않습니다", level=MESSAGE_LEVEL_CRITICAL)
         return
-    
-    # 각 종목별 상세 정보 로그
-    for symbol, data in DAILY_SUMMARY_DATA.items():
-        symbol_name = get_symbol_name(symbol)
-        log(f"📊 {symbol_name}({symbol}) 분석 포인트: {len(data.get('analysis_points', []))}개, 매수신호: {len(data.get('buy_signals', []))}개, 매도신호: {len(data.get('sell_signals', []))}개")
-    
-    print(f"📊 일일 요약 발송 시작 - 종목 수: {len(DAILY_SUMMARY_DATA)}")
-    
-    # 디스코드 연속 발송 오류 예방: 요약 시작 전 2초 대기
-    time.sleep(2)
-    
-    for symbol_index, symbol in enumerate(DAILY_SUMMARY_DATA.keys()):
-        symbol_name = get_symbol_name(symbol)  # 종목명 가져오기
-        print(f"📤 {symbol_name}({symbol}) 요약 메시지 생성 중...")
-        messages = generate_daily_summary_messages(symbol)
-        
-        if messages:
-            print(f"✅ {symbol_name}({symbol}) 메시지 {len(messages)}개 생성 완료")
-            
-            for i, message in enumerate(messages):
-                print(f"📨 {symbol_name}({symbol}) 메시지{i+1} 발송 시작 (길이: {len(message)}자)")
-                try:
-                    if i == 0:
-                        # 심볼 간 구분을 위해 심볼 위에 구분선과 빈 줄 추가
-                        send_message("***************************************", level=MESSAGE_LEVEL_CRITICAL)
-                        send_message("", level=MESSAGE_LEVEL_CRITICAL)
-                        send_message("", level=MESSAGE_LEVEL_CRITICAL)
-                        send_message("", level=MESSAGE_LEVEL_CRITICAL)
-                        # 첫 번째 메시지에 종목명 포함
-                        send_message(message, symbol, level=MESSAGE_LEVEL_CRITICAL)
-                        print(f"✅ {symbol_name}({symbol}) 메시지{i+1} 발송 완료")
-                    else:
-                        # 나머지 메시지는 종목명 없이 발송
-                        send_message(message, level=MESSAGE_LEVEL_CRITICAL)
-                        print(f"✅ 메시지{i+1} 발송 완료")
-                    
-                    time.sleep(2)  # 메시지 간 간격(연속 발송 방지) - 5초에서 2초로 단축
-                except Exception as e:
-                    print(f"❌ {symbol} 메시지{i+1} 발송 실패: {str(e)}")
-        else:
-            print(f"❌ {symbol} 메시지 생성 실패")
-    
-    # 오래된 메시지 히스토리 정리
-    global MESSAGE_HISTORY
-    current_time = time.time()
-    MESSAGE_HISTORY = {k: v for k, v in MESSAGE_HISTORY.items() 
-                      if current_time - v < MESSAGE_COOLDOWN * 2}
+
+    started_at = time.time()
+    current_date = datetime.datetime.now(timezone('Asia/Seoul')).strftime('%Y-%m-%d')
+    report = render_daily_summary_report(current_date)
+    filename, data = build_attachment(report, f"daily_summary_KR_{current_date}.md", compress=DAILY_SUMMARY_GZIP)
+    # 발송은 알림 서비스 스레드에서 처리 (여기서는 큐에 넣고 바로 반환)
+    NOTIFIER.send_file(filename, data, embeds=[build_daily_summary_embed(current_date)])
+    print(f"📊 일일 요약 리포트 발송 요청: {filename} ({len(data):,} bytes, 종목 {len(DAILY_SUMMARY_DATA)}개, {time.time() - started_at:.2f}초)")
 
 
 def get_access_token():
-    """토큰 발급 (중복 방지 로직 포함)"""
-    global LAST_TOKEN_REQUEST_TIME, TOKEN_REQUEST_IN_PROGRESS
+    """토큰 발급 (공용 KIS 클라이언트 사용, 쿨다운 내 재요청은 기존 토큰 반환)"""
+    global LAST_TOKEN_REQUEST_TIME
     
     current_time = time.time()
     
-    # 토큰 발급 진행 중이면 대기
-    if TOKEN_REQUEST_IN_PROGRESS:
-        send_message("토큰 발급이 이미 진행 중입니다. 대기합니다...", level=MESSAGE_LEVEL_DEBUG)
-        return None
-    
-    # 쿨다운 시간 체크
+    # 쿨다운 시간 체크 (쿨다운 중에는 보유 토큰을 그대로 사용)
     if current_time - LAST_TOKEN_REQUEST_TIME < TOKEN_REQUEST_COOLDOWN:
+        if KIS.access_token:
+            return KIS.access_token
         remaining_time = TOKEN_REQUEST_COOLDOWN - (current_time - LAST_TOKEN_REQUEST_TIME)
         send_message(f"토큰 발급 쿨다운 중입니다. {remaining_time:.0f}초 후 재시도 가능합니다.", level=MESSAGE_LEVEL_DEBUG)
         return None
     
-    # 토큰 발급 시작
-    TOKEN_REQUEST_IN_PROGRESS = True
     LAST_TOKEN_REQUEST_TIME = current_time
-    
     try:
-        headers = {"content-type":"application/json"}
-        body = {"grant_type":"client_credentials",
-        "appkey":APP_KEY, 
-        "appsecret":APP_SECRET}
-        PATH = "oauth2/tokenP"
-        URL = f"{URL_BASE}/{PATH}"
-        res = requests.post(URL, headers=headers, data=json.dumps(body))
-        
-        # 응답 확인
-        if res.status_code != 200:
-            # send_message(f"토큰 발급 실패: 상태 코드 {res.status_code}", level=MESSAGE_LEVEL_CRITICAL)  # 로그 스팸 방지
-            return None
-            
-        access_token = res.json()["access_token"]
-        # send_message("✅ 새로운 토큰 발급 완료", level=MESSAGE_LEVEL_IMPORTANT)  # 로그 스팸 방지
-        return access_token
-        
+        # 동시 호출 시에도 클라이언트 내부 락으로 1회만 발급
+        return KIS.refresh_token()
     except Exception as e:
         # send_message(f"🚨 토큰 발급 중 오류 발생: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)  # 로그 스팸 방지
         return None
-    finally:
-        # 토큰 발급 완료 (성공/실패 관계없이)
-        TOKEN_REQUEST_IN_PROGRESS = False
 
 def refresh_token():
     """토큰 갱신"""
@@ -783,145 +794,84 @@ def refresh_token():
         send_message(f"🚨 토큰 갱신 중 오류 발생: {str(e)}")
         return False
 
-def hashkey(datas):
-    """암호화"""
-    try:
-        PATH = "uapi/hashkey"
-        URL = f"{URL_BASE}/{PATH}"
-        headers = {
-        'content-Type' : 'application/json',
-        'appKey' : APP_KEY,
-        'appSecret' : APP_SECRET,
-        }
-        res = requests.post(URL, headers=headers, data=json.dumps(datas))
-        hashkey = res.json()["HASH"]
-        return hashkey
-    except Exception as e:
-        send_message(f"🚨 해시키 생성 중 오류 발생: {str(e)}")
-        return None
-
 def is_korean_holiday(date=None):
-    """주어진 날짜가 한국 공휴일인지 확인합니다.
+    """주어진 날짜가 한국거래소 휴장일(주말 제외)인지 확인합니다. (휴장 여부, 휴장 사유)
     날짜를 지정하지 않으면 현재 날짜를 사용합니다."""
     
     if date is None:
         date = datetime.datetime.now(timezone('Asia/Seoul'))
+    if isinstance(date, datetime.datetime):
+        date = date.date()
     
-    # 날짜를 YYYY-MM-DD 형식으로 변환
-    date_str = date.strftime('%Y-%m-%d')
-    
-    # 고정 연간 공휴일 목록 (MM-DD 형식)
-    annual_holidays = {
-        '01-01': '신정',        # 신정
-        '03-01': '삼일절',      # 삼일절
-        '05-05': '어린이날',    # 어린이날
-        '06-06': '현충일',      # 현충일
-        '08-15': '광복절',      # 광복절
-        '10-03': '개천절',      # 개천절
-        '10-09': '한글날',      # 한글날
-        '12-25': '크리스마스'   # 크리스마스
-    }
-    
-    # 특별 공휴일 (연도별로 업데이트 필요)
-    special_holidays = {
-        '2025-05-06': '어린이날 연휴', # 어린이날 다음날
-        '2025-06-03': '대통령선거', 
-        # 필요에 따라 2025년 다른 특별 공휴일 추가
-    }
-    
-    # 고정 연간 공휴일 확인
-    mm_dd = date.strftime('%m-%d')
-    if mm_dd in annual_holidays:
-        return True, annual_holidays[mm_dd]
-    
-    # 특별 공휴일 확인
-    if date_str in special_holidays:
-        return True, special_holidays[date_str]
-    
-    return False, None
+    # 주말은 공휴일로 보지 않음 (휴장 사유는 달력 파일 기준)
+    if date.weekday() >= 5:
+        return False, None
+    holiday_name = MARKET_CALENDAR.holiday_name(date)
+    return holiday_name is not None, holiday_name
+
+def get_last_closed_trading_day(now=None):
+    """마지막으로 마감된 거래일 (date, 장 마감 전이면 전 거래일 - 주말/휴장일 건너뜀)"""
+    now_ts = now.timestamp() if now else time.time()
+    return MARKET_CALENDAR.last_closed_session(now_ts)
 
 def is_market_open():
-    """국내 시장 시간 체크 - 공휴일 포함"""
+    """국내 시장 시간 체크 - 휴장일/지연 개장/연장 마감 포함 (거래소 달력 기준)"""
     try:
-        KST_time = datetime.datetime.now(timezone('Asia/Seoul'))
-        
-        # 주말 체크
-        if KST_time.weekday() >= 5:
-            return False
-        
-        # 공휴일 체크
-        is_holiday, _ = is_korean_holiday(KST_time)
-        if is_holiday:
-            return False
-            
-        market_start = KST_time.replace(hour=9, minute=0, second=0, microsecond=0)
-        market_end = KST_time.replace(hour=15, minute=30, second=0, microsecond=0)
-        is_market_open = market_start <= KST_time <= market_end
-        
-        return is_market_open
+        return MARKET_CALENDAR.is_open(time.time())
     except Exception as e:
         send_message(f"🚨 시장 시간 확인 중 오류: {str(e)}")
         # 오류 발생 시 기본적으로 닫힘으로 처리
         return False
 
+def sleep_until(target_ts):
+    """target_ts(epoch 초)까지 대기 (긴 대기는 1시간 단위로 나눠 시스템 시계 보정/절전 복귀에도 정확히 깨어남)"""
+    while True:
+        remaining = target_ts - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 3600))
+
+def prewarm_market_open():
+    """개장 직전 준비: 토큰 갱신, 종목별 일봉 캐시 갱신"""
+    started_at = time.time()
+    if not refresh_token():
+        send_message("개장 전 토큰 갱신 실패, 개장 시 다시 시도합니다.", level=MESSAGE_LEVEL_IMPORTANT)
+        return
+    # 전 거래일까지의 일봉을 미리 받아 두면 개장 후 첫 분석은 현재가/분봉만 조회
+    ready = sum(1 for code in SYMBOLS if DAILY_BARS.get(code) is not None)
+    print(f"⏱ 개장 전 준비 완료: {time.time() - started_at:.1f}초 (일봉 준비 {ready}/{len(SYMBOLS)}종목)")
+
 def wait_for_market_open():
-    """시장 개장 대기 (주말 및 공휴일 처리)"""
+    """다음 개장 시각까지 대기 (거래소 달력 기준, 개장 MARKET_PREWARM_MINUTES분 전에 토큰/캐시 미리 갱신)"""
     try:
-        print("[정보] 한국 시장이 닫혀 있습니다. 개장까지 대기합니다...")
-        send_message("한국 시장이 닫혀 있습니다. 개장까지 대기합니다...", level=MESSAGE_LEVEL_IMPORTANT)
-        
-        while not is_market_open():
-            # 현재 한국 시간 확인
-            kst_time = datetime.datetime.now(timezone('Asia/Seoul'))
-            
-            # 공휴일 확인
-            is_holiday, holiday_name = is_korean_holiday(kst_time)
-            
-            # 다음 체크 시간 결정
-            next_check = 60  # 기본 대기 시간 60분
-            
-            # 개장일(월~금) 확인
-            weekday = kst_time.weekday()  # 0=월요일, 6=일요일
-            is_weekend = weekday >= 5  # 주말 여부
-            
-            if is_holiday:
-                # 공휴일인 경우
-                print(f"[정보] 오늘은 {holiday_name}입니다. 장이 열리지 않습니다.")
-                send_message(f"오늘은 {holiday_name}입니다. 장이 열리지 않습니다.", level=MESSAGE_LEVEL_IMPORTANT)
-                next_check = 240  # 공휴일에는 4시간 간격으로 체크
-            elif is_weekend:
-                # 일요일 && 15시 이후 - 개장 임박
-                if weekday == 6 and kst_time.hour >= 15:
-                    next_check = 180
-                # 토요일 또는 일요일 오전 - 여전히 많은 시간 남음
-                else:
-                    next_check = 240  # 주말에는 4시간 간격으로 체크
-            else:
-                # 평일
-                # 15시 이후 또는 00시~08시까지는 240분 단위 대기
-                if kst_time.hour >= 15 or kst_time.hour < 8:
-                    next_check = 240
-                # 08시~09시 - 개장 준비 시간
-                elif kst_time.hour == 8:
-                    next_check = 15  # 15분 간격으로 체크
-                # 09시 이후부터 개장 전(09:00 전)까지는 5분 단위 대기
-                elif kst_time.hour == 8 and kst_time.minute >= 45:
-                    next_check = 5
-                else:
-                    next_check = 30  # 다른 평일 시간대
-            
-            day_name = ['월','화','수','목','금','토','일'][weekday]
-            status_msg = f"한국시간: {kst_time.strftime('%Y-%m-%d %H:%M')} {day_name}요일"
-            if is_holiday:
-                status_msg += f" ({holiday_name})"
-            print(f"[대기] 다음 확인까지 {next_check}분 대기... ({status_msg})")
-            # 대기 메시지는 너무 빈번하므로 INFO 레벨로 (필요시 IMPORTANT로 변경 가능)
-            send_message(f"다음 확인까지 {next_check}분 대기... ({status_msg})", level=MESSAGE_LEVEL_INFO)
-            time.sleep(next_check * 60)
+        now = time.time()
+        open_dt, close_dt = MARKET_CALENDAR.next_session(now)
+        open_ts = open_dt.timestamp()
+        kst_time = datetime.datetime.now(timezone('Asia/Seoul'))
+        
+        # 오늘 휴장 사유와 다음 개장 일정 (특별 거래 시간이면 함께 표시)
+        status_msg = f"다음 개장: {open_dt.strftime('%Y-%m-%d %H:%M')} ~ {close_dt.strftime('%H:%M')}"
+        note = MARKET_CALENDAR.describe(open_dt.date())
+        if note:
+            status_msg += f" ({note})"
+        is_holiday, holiday_name = is_korean_holiday(kst_time)
+        if is_holiday:
+            print(f"[정보] 오늘은 {holiday_name}입니다. 장이 열리지 않습니다.")
+            send_message(f"오늘은 {holiday_name}입니다. 장이 열리지 않습니다.", level=MESSAGE_LEVEL_IMPORTANT)
+        hours, rem = divmod(int(open_ts - now), 3600)
+        print(f"[대기] 한국 시장이 닫혀 있습니다. {status_msg}까지 {hours}시간 {rem // 60}분 대기...")
+        send_message(f"한국 시장이 닫혀 있습니다. {status_msg}까지 대기합니다...", level=MESSAGE_LEVEL_IMPORTANT)
+        
+        # 개장 몇 분 전 준비 후 개장 시각까지 정확히 대기
+        prewarm_at = open_ts - MARKET_PREWARM_MINUTES * 60
+        if MARKET_PREWARM_MINUTES > 0 and prewarm_at > time.time():
+            sleep_until(prewarm_at)
+            prewarm_market_open()
+        sleep_until(open_ts)
         
         print("[성공] 🔔 한국 시장이 개장되었습니다!")
         send_message("🔔 한국 시장이 개장되었습니다!", level=MESSAGE_LEVEL_CRITICAL)
-        if not refresh_token():  # 시장 개장 시 토큰 갱신
+        if not refresh_token():  # 시장 개장 시 토큰 확인 (개장 전 준비에서 갱신했으면 기존 토큰 사용)
             send_message("토큰 갱신에 실패했습니다. 2분 후 다시 시도합니다.", level=MESSAGE_LEVEL_IMPORTANT)
             time.sleep(120)
             refresh_token()
@@ -935,7 +885,6 @@ def get_daily_data(code):
     
     print(f"📊 일봉 데이터 조회: {code}")
     PATH = "uapi/domestic-stock/v1/quotations/inquire-daily-itemchartprice"
-    URL = f"{URL_BASE}/{PATH}"
     
     # 토큰 체크
     if not ACCESS_TOKEN:
@@ -948,15 +897,6 @@ def get_daily_data(code):
                 send_message("토큰 재발급도 실패, 다음 체크에서 재시도합니다.", level=MESSAGE_LEVEL_CRITICAL)
                 return None
     
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "FHKST03010100",
-        "custtype": "P"
-    }
-    
     # 50일 이동평균 계산이 가능하도록 충분한 기간(최근 100일) 조회
     today = datetime.datetime.now(timezone('Asia/Seoul')).strftime('%Y%m%d')
     start_date = (datetime.datetime.now(timezone('Asia/Seoul')) - datetime.timedelta(days=100)).strftime('%Y%m%d')
@@ -971,20 +911,11 @@ def get_daily_data(code):
     }
     
     try:
-        res = requests.get(URL, headers=headers, params=params)
-        
-        # 응답 코드가 만료된 토큰 오류인 경우
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message("토큰이 만료되었습니다. 새 토큰을 발급합니다.", level=MESSAGE_LEVEL_IMPORTANT)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 새 토큰으로 다시 시도
-                headers['authorization'] = f"Bearer {ACCESS_TOKEN}"
-                res = requests.get(URL, headers=headers, params=params)
-            else:
-                print("토큰 재발급 실패, 1분 후 다시 시도합니다.")
-                time.sleep(60)
-                return None
+        # 토큰 만료 시 재발급/재시도는 KIS 클라이언트에서 처리
+        res = KIS.get(PATH, "FHKST03010100", params)
+        if res is None:
+            print("토큰 발급 실패로 일봉 조회 불가")
+            return None
         
         if res.status_code == 200:
             data = res.json()
@@ -1001,62 +932,8 @@ def get_daily_data(code):
         print(f"일봉 데이터 요청 중 오류 발생: {e}")
         return None
 
-def calculate_moving_average(data, periods=MA_PERIOD):
-    """이동평균 계산"""
-    try:
-        # 데이터 유효성 확인
-        if "output2" not in data or not data["output2"]:
-            print("이동평균 계산을 위한 데이터가 부족합니다")
-            return None
-
-        # 데이터프레임 생성
-        df = pd.DataFrame(data["output2"])
-        print(f"이동평균 계산을 위한 데이터 프레임 생성 완료: {len(df)} 행")
-        
-        # 가격 컬럼 확인 (일봉에서는 종가 사용)
-        if 'stck_clpr' in df.columns:
-            df['close_price'] = pd.to_numeric(df['stck_clpr'], errors='coerce')
-        else:
-            print("종가 데이터 컬럼을 찾을 수 없습니다:", df.columns)
-            return None
-        
-        # 결측값 처리
-        df = df.dropna(subset=['close_price'])
-        
-        # 날짜 컬럼 처리
-        if 'stck_bsop_date' in df.columns:
-            df['date'] = pd.to_datetime(df['stck_bsop_date'], format='%Y%m%d')
-        else:
-            print("날짜 컬럼 생성 실패")
-            return None
-        
-        # 데이터 정렬 (오래된 순서대로)
-        df = df.sort_values(by='date').reset_index(drop=True)
-        
-        # 데이터 충분성 확인
-        if len(df) < periods:
-            print(f"이동평균 계산을 위한 데이터 부족 (필요: {periods}, 현재: {len(df)})")
-            return None
-        
-        # 이동평균 계산
-        df['ma'] = df['close_price'].rolling(window=periods).mean()
-        
-        # 최신 이동평균 값 추출
-        latest_ma = df['ma'].iloc[-1]
-        if pd.isna(latest_ma):
-            print("이동평균 계산 결과가 NaN입니다")
-            return None
-            
-        latest_ma = round(latest_ma, 2)
-        print(f"✅ {periods}일 이동평균 계산 완료: {latest_ma}")
-        return latest_ma
-    
-    except Exception as e:
-        print(f"이동평균 계산 중 오류 발생: {e}")
-        return None
-
 def get_moving_average(code, periods=MA_PERIOD):
-    """종목의 이동평균 조회"""
+    """종목의 이동평균 조회 (일봉 캐시 - 거래일당 1회 조회, 장중 당일 봉은 최근 현재가)"""
     global ACCESS_TOKEN
     print(f"📊 이동평균 조회: {code} ({periods}일)")
     try:
@@ -1069,18 +946,19 @@ def get_moving_average(code, periods=MA_PERIOD):
                 if not ACCESS_TOKEN:
                     return None
         
-        # 일봉 데이터 조회
-        data = get_daily_data(code)
-        
-        if not data:
+        # 일봉 조회 (캐시에 없거나 거래일이 바뀌었을 때만 API 조회)
+        if DAILY_BARS.get(code) is None:
             send_message(f"{code} 일봉 데이터 조회 실패, 이동평균 계산 불가", code)
             return None
             
-        # 이동평균 계산
-        ma_value = calculate_moving_average(data, periods)
+        # 이동평균 계산 (누적 합, 장중이면 현재가를 당일 봉으로 포함)
+        ma_value = DAILY_BARS.sma(code, periods)
+        if ma_value is None:
+            print(f"이동평균 계산을 위한 데이터 부족 (필요: {periods}, 현재: {len(DAILY_BARS.get(code))})")
+            return None
         
-        if ma_value is not None:
-            print(f"📊 종목 {code}의 {periods}일 이동평균: {ma_value}")
+        ma_value = round(ma_value, 2)
+        print(f"📊 종목 {code}의 {periods}일 이동평균: {ma_value}")
         return ma_value
     
     except Exception as e:
@@ -1098,16 +976,11 @@ def get_moving_average(code, periods=MA_PERIOD):
 
 #파트2
 
-def get_minute_data(code, time_unit=MINUTE_CANDLE, period=30):
-    """분봉 데이터 조회"""
+def get_minute_data(code, time_unit=MINUTE_CANDLE, days=MINUTE_FETCH_DAYS):
+    """분봉 데이터 조회 (최근 days거래일 time_unit분봉, 시간순 - 저장소에 없는 시간 구간만 동시에 조회)"""
     global ACCESS_TOKEN
     
-    log(f"📈 분봉 데이터 조회: {code} ({time_unit}분)")
-    PATH = "uapi/domestic-stock/v1/quotations/inquire-time-itemchartprice"
-    URL = f"{URL_BASE}/{PATH}"
-    
-    all_data = []
-    next_key = ""
+    log(f"📈 분봉 데이터 조회: {code} ({time_unit}분, {days}거래일)")
     
     # 토큰 체크
     if not ACCESS_TOKEN:
@@ -1120,64 +993,20 @@ def get_minute_data(code, time_unit=MINUTE_CANDLE, period=30):
                 send_message("토큰 재발급도 실패, 다음 체크에서 재시도합니다.", level=MESSAGE_LEVEL_CRITICAL)
                 return None
     
-    for _ in range(period):
-        headers = {
-            "Content-Type": "application/json", 
-            "authorization": f"Bearer {ACCESS_TOKEN}",
-            "appKey": APP_KEY,
-            "appSecret": APP_SECRET,
-            "tr_id": "FHKST03010200",
-            "custtype": "P"
-        }
-        
-        params = {
-            "FID_ETC_CLS_CODE": "",
-            "FID_COND_MRKT_DIV_CODE": "J",
-            "FID_INPUT_ISCD": code,
-            "FID_INPUT_HOUR_1": time_unit,
-            "FID_PW_DATA_INCU_YN": "Y",
-            "CTX_AREA_FK100": next_key,
-            "CTX_AREA_NK100": ""
-        }
-        
-        try:
-            res = requests.get(URL, headers=headers, params=params)
-            
-            # 응답 코드가 만료된 토큰 오류인 경우
-            if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-                send_message("토큰이 만료되었습니다. 새 토큰을 발급합니다.", level=MESSAGE_LEVEL_IMPORTANT)
-                ACCESS_TOKEN = get_access_token()
-                if ACCESS_TOKEN:
-                    # 새 토큰으로 다시 시도
-                    headers['authorization'] = f"Bearer {ACCESS_TOKEN}"
-                    res = requests.get(URL, headers=headers, params=params)
-                else:
-                    send_message("토큰 재발급 실패, 2분 후 다시 시도합니다.", level=MESSAGE_LEVEL_IMPORTANT)
-                    time.sleep(120)
-                    continue
-            
-            if res.status_code == 200:
-                data = res.json()
-                if "output2" in data and data["output2"]:
-                    all_data.extend(data["output2"])
-                    next_key = data.get("ctx_area_fk100", "")
-                    if not next_key:
-                        break
-                else:
-                    print(f"요청 코드: {code}, 추가 데이터 없음")
-                    break
-            else:
-                print(f"API 호출 실패. 상태 코드: {res.status_code}, 응답 내용: {res.text}")
-                break
-        except Exception as e:
-            print(f"데이터 요청 중 오류 발생: {e}")
-            time.sleep(1)
-            break
-            
-        time.sleep(0.5)
+    try:
+        # 토큰 만료 시 재발급/재시도와 초당 요청 한도는 KIS 클라이언트에서 처리
+        started_at = time.time()
+        bars = fetch_minute_bars(KIS, code, int(time_unit), days, MARKET_CALENDAR, started_at,
+                                 use_store=BAR_STORE_ENABLED)
+    except Exception as e:
+        print(f"데이터 요청 중 오류 발생: {e}")
+        return None
+    if bars is None:
+        print(f"요청 코드: {code}, 분봉 데이터 없음")
+        return None
     
-        log(f"✅ {code} 분봉 데이터 조회 완료: {len(all_data)} 건")
-    return {"output2": all_data} if all_data else None
+    log(f"✅ {code} 분봉 데이터 조회 완료: {len(bars)} 건 ({time.time() - started_at:.1f}초)")
+    return {"output2": minute_bars_output2(bars)}
 
 
 # 2. calculate_rsi 개선 (None 반환, 가격 컬럼 자동 탐색)
@@ -1193,54 +1022,32 @@ def calculate_rsi(data, periods=RSI_PERIOD):
         if not price_col:
             print("가격 데이터 컬럼을 찾을 수 없습니다:", df.columns)
             return None
-        df['price'] = pd.to_numeric(df[price_col], errors='coerce')
-        df = df.dropna(subset=['price'])
-        if len(df) < periods + 1:
-            print(f"RSI 데이터 부족 (필요: {periods + 1}, 현재: {len(df)})")
+        prices = pd.to_numeric(df[price_col], errors='coerce').dropna().to_numpy(dtype=np.float64)
+        if len(prices) < periods + 1:
+            print(f"RSI 데이터 부족 (필요: {periods + 1}, 현재: {len(prices)})")
             return None
         
-        # 가격 변화량 계산
-        df['price_change'] = df['price'].diff()
-        
-        # 상승분과 하락분 분리
-        df['gain'] = df['price_change'].where(df['price_change'] > 0, 0)
-        df['loss'] = -df['price_change'].where(df['price_change'] < 0, 0)
-        
-        # 초기 평균 계산 (단순 평균) - Wilder's smoothing 방식
-        df['avg_gain'] = 0.0
-        df['avg_loss'] = 0.0
-        
-        # 첫 번째 EMA 계산 (periods 번째부터)
-        # 표준 RSI 계산: 첫 periods개의 gain/loss의 평균 사용
-        if len(df) >= periods + 1:
-            # 첫 periods개의 gain/loss 평균 (인덱스 1부터 periods까지)
-            df.loc[periods, 'avg_gain'] = df['gain'].iloc[1:periods + 1].mean()
-            df.loc[periods, 'avg_loss'] = df['loss'].iloc[1:periods + 1].mean()
-        
-        # 이후 EMA 계산 (Wilder's smoothing: alpha = 1/periods)
-        alpha = 1.0 / periods
-        for i in range(periods + 1, len(df)):
-                df.loc[i, 'avg_gain'] = alpha * df['gain'].iloc[i] + (1 - alpha) * df['avg_gain'].iloc[i - 1]
-                df.loc[i, 'avg_loss'] = alpha * df['loss'].iloc[i] + (1 - alpha) * df['avg_loss'].iloc[i - 1]
-        
-        # RSI 계산
-        df['rs'] = df['avg_gain'] / df['avg_loss'].replace(0, np.nan)
-        df['rsi'] = 100 - (100 / (1 + df['rs']))
-        
+        # Wilder's smoothing RSI (첫 periods개 변화량 단순 평균 후 alpha = 1/periods) - 배열 전체를 한 번에 계산
+        avg_gain, avg_loss = wilder_averages(prices, periods)
+        rsi = wilder_rsi_series(prices, periods, averages=(avg_gain, avg_loss))
+        valid = np.flatnonzero(~np.isnan(rsi))
+        if len(valid) == 0:
+            print("RSI 계산 불가 (하락 구간 없음)")
+            return None
         # 마지막 유효한 RSI 값 반환
-        last_valid_rsi = df['rsi'].dropna().iloc[-1]
+        last_valid_rsi = float(rsi[valid[-1]])
         
         # 디버깅 정보 출력 (문제 발생 시 전환)
-        price_volatility = df['price'].iloc[-5:].max() - df['price'].iloc[-5:].min()
-        current_price = df['price'].iloc[-1]
+        price_volatility = prices[-5:].max() - prices[-5:].min()
+        current_price = prices[-1]
         
         log(f"🔍 RSI 디버깅 - 최근5일 가격범위: {price_volatility:.0f}원")
         log(f"🔍 RSI 값: {last_valid_rsi:.2f} | 최신가격: {current_price:.0f}원")
         
         # RSI 이상값 감지
         if abs(last_valid_rsi - 50) > 40:
-            avg_gain_val = df['avg_gain'].iloc[-1]
-            avg_loss_val = df['avg_loss'].iloc[-1]
+            avg_gain_val = avg_gain[-1]
+            avg_loss_val = avg_loss[-1]
             print(f"⚠️ RSI 극값 - Gain:{avg_gain_val:.2f}, Loss:{avg_loss_val:.2f}, RS:{avg_gain_val/avg_loss_val:.3f}")
         
         return round(last_valid_rsi, 2)
@@ -1319,44 +1126,17 @@ def get_current_rsi(code, periods=RSI_PERIOD, time_unit=MINUTE_CANDLE):
 
 def get_current_price(code):
     """현재가 조회"""
-    global ACCESS_TOKEN
-    
     PATH = "uapi/domestic-stock/v1/quotations/inquire-price"
-    URL = f"{URL_BASE}/{PATH}"
-    
-    # 토큰 확인
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message(f"{code} 현재가 조회 실패: 토큰 없음", code)
-            return None
-    
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "FHKST01010100"
-    }
     params = {
         "fid_cond_mrkt_div_code": "J",
         "fid_input_iscd": code,
     }
     
     try:
-        res = requests.get(URL, headers=headers, params=params)
-        
-        # 토큰 오류 처리
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message(f"{code} 현재가 조회 중 토큰 오류. 토큰 갱신 중...", code)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 새 토큰으로 다시 시도
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                res = requests.get(URL, headers=headers, params=params)
-            else:
-                send_message(f"{code} 토큰 갱신 실패", code)
-                return None
+        res = KIS.get(PATH, "FHKST01010100", params)
+        if res is None:
+            send_message(f"{code} 현재가 조회 실패: 토큰 없음", code)
+            return None
         
         if res.status_code != 200:
             send_message(f"{code} 현재가 조회 실패: 상태 코드 {res.status_code}", code)
@@ -1367,45 +1147,21 @@ def get_current_price(code):
             send_message(f"{code} 현재가 데이터 없음: {data}", code)
             return None
             
-        return int(data['output']['stck_prpr'])
+        current_price = int(data['output']['stck_prpr'])
+        if is_market_open():
+            # 장중 이동평균의 당일 봉 종가로 사용
+            DAILY_BARS.update_live_price(code, current_price,
+                                         datetime.datetime.now(timezone('Asia/Seoul')).strftime('%Y%m%d'))
+        return current_price
         
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg:
-            send_message(f"{code} 현재가 조회 중 토큰 오류: {e}", code)
-            # 토큰 갱신 시도
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 재귀적으로 다시 시도
-                return get_current_price(code)
-        else:
-            send_message(f"{code} 현재가 조회 중 오류: {e}", code)
+        send_message(f"{code} 현재가 조회 중 오류: {e}", code)
         return None
 
 
 def get_balance():
     """현금 잔고조회"""
-    global ACCESS_TOKEN
-    
     PATH = "uapi/domestic-stock/v1/trading/inquire-psbl-order"
-    URL = f"{URL_BASE}/{PATH}"
-    
-    # 토큰 확인
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message("주문가능현금 조회 실패: 토큰 없음")
-            return 0
-    
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "TTTC8908R",
-        "custtype": "P",
-    }
-    
     params = {
         "CANO": CANO,
         "ACNT_PRDT_CD": ACNT_PRDT_CD,
@@ -1417,19 +1173,10 @@ def get_balance():
     }
     
     try:
-        res = requests.get(URL, headers=headers, params=params)
-        
-        # 토큰 오류 처리
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message("주문가능현금 조회 중 토큰 오류. 토큰 갱신 중...")
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 새 토큰으로 다시 시도
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                res = requests.get(URL, headers=headers, params=params)
-            else:
-                send_message("토큰 갱신 실패")
-                return 0
+        res = KIS.get(PATH, "TTTC8908R", params)
+        if res is None:
+            send_message("주문가능현금 조회 실패: 토큰 없음")
+            return 0
         
         if res.status_code != 200:
             send_message(f"주문가능현금 조회 실패: 상태 코드 {res.status_code}")
@@ -1441,41 +1188,13 @@ def get_balance():
         return int(cash)
         
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg:
-            send_message(f"주문가능현금 조회 중 토큰 오류: {e}")
-            # 토큰 갱신 시도
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 재귀적으로 다시 시도
-                return get_balance()
-        else:
-            send_message(f"주문가능현금 조회 중 오류: {e}")
+        send_message(f"주문가능현금 조회 중 오류: {e}")
         return 0
 
 
 def get_stock_balance():
     """주식 잔고조회"""
-    global ACCESS_TOKEN
-    
     PATH = "uapi/domestic-stock/v1/trading/inquire-balance"
-    URL = f"{URL_BASE}/{PATH}"
-    
-    # 토큰 확인
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message("주식 잔고 조회 실패: 토큰 없음")
-            return {}
-    
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "TTTC8434R",
-        "custtype": "P"
-    }
     params = {
         "CANO": CANO,
         "ACNT_PRDT_CD": ACNT_PRDT_CD,
@@ -1491,19 +1210,10 @@ def get_stock_balance():
     }
     
     try:
-        res = requests.get(URL, headers=headers, params=params)
-        
-        # 토큰 오류 처리
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message("주식 잔고 조회 중 토큰 오류. 토큰 갱신 중...")
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 새 토큰으로 다시 시도
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                res = requests.get(URL, headers=headers, params=params)
-            else:
-                send_message("토큰 갱신 실패")
-                return {}
+        res = KIS.get(PATH, "TTTC8434R", params)
+        if res is None:
+            send_message("주식 잔고 조회 실패: 토큰 없음")
+            return {}
                 
         if res.status_code != 200:
             send_message(f"주식 잔고 조회 실패: 상태 코드 {res.status_code}")
@@ -1545,24 +1255,12 @@ def get_stock_balance():
         return stock_dict
         
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg:
-            send_message(f"주식 잔고 조회 중 토큰 오류: {e}")
-            # 토큰 갱신 시도
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 재귀적으로 다시 시도
-                return get_stock_balance()
-        else:
-            send_message(f"주식 잔고 조회 중 오류: {e}")
+        send_message(f"주식 잔고 조회 중 오류: {e}")
         return {}
 
-def buy(code, qty, price=0):
-    """주식 시장가/지정가 매수"""
-    global ACCESS_TOKEN
-    
+def buy(code, qty, price=0, trade_type='buy'):
+    """주식 시장가/지정가 매수 (접수된 주문은 ORDER_TRACKER로 체결 추적, 거래 기록은 체결 확인 시)"""
     PATH = "uapi/domestic-stock/v1/trading/order-cash"
-    URL = f"{URL_BASE}/{PATH}"
     
     # 지정가인지 시장가인지 확인
     if price == 0:
@@ -1571,13 +1269,6 @@ def buy(code, qty, price=0):
         ord_dvsn = "00"  # 지정가
         price = str(price)
     
-    # 토큰 확인
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message(f"{code} 매수 실패: 토큰 없음", code)
-            return False
-    
     data = {
         "CANO": CANO,
         "ACNT_PRDT_CD": ACNT_PRDT_CD,
@@ -1587,42 +1278,12 @@ def buy(code, qty, price=0):
         "ORD_UNPR": "0" if ord_dvsn == "01" else price,
     }
     
-    # 해시키 생성
-    hash_key = hashkey(data)
-    if not hash_key:
-        send_message(f"{code} 매수 실패: 해시키 생성 오류", code)
-        return False
-    
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "TTTC0802U",
-        "custtype": "P",
-        "hashkey": hash_key
-    }
-    
     try:
-        res = requests.post(URL, headers=headers, data=json.dumps(data))
-        
-        # 토큰 오류 처리
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message(f"{code} 매수 중 토큰 오류. 토큰 갱신 중...", code)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 새 토큰으로 다시 시도
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                hash_key = hashkey(data)  # 해시키 재생성
-                if hash_key:
-                    headers["hashkey"] = hash_key
-                    res = requests.post(URL, headers=headers, data=json.dumps(data))
-                else:
-                    send_message(f"{code} 매수 실패: 해시키 재생성 오류", code)
-                    return False
-            else:
-                send_message(f"{code} 매수 실패: 토큰 갱신 실패", code)
-                return False
+        # 매수 주문 (해시키는 ORDER_USE_HASHKEY 설정 시에만, 토큰 만료 시 재발급/재시도는 KIS 클라이언트에서 처리)
+        res = KIS.submit_order(PATH, "TTTC0802U", data)
+        if res is None:
+            send_message(f"{code} 매수 실패: 토큰 또는 해시키 생성 오류", code)
+            return False
                 
         if res.status_code != 200:
             send_message(f"{code} 매수 실패: 상태 코드 {res.status_code}", code)
@@ -1631,31 +1292,20 @@ def buy(code, qty, price=0):
         res_data = res.json()
         if res_data['rt_cd'] == '0':
             price_type = "시장가" if ord_dvsn == "01" else f"{price}원"
-            send_message(f"✅ {code} {qty}주 {price_type} 매수 주문 성공", code)
+            send_message(f"✅ {code} {qty}주 {price_type} 매수 주문 접수", code)
+            ORDER_TRACKER.track(code, 'buy', qty, price, res_data, trade_type=trade_type)
             return True
         else:
             send_message(f"❌ {code} 매수 실패: {res_data['msg1']}", code)
             return False
             
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg:
-            send_message(f"{code} 매수 중 토큰 오류: {e}", code)
-            # 토큰 갱신 시도
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 재귀적으로 다시 시도
-                return buy(code, qty, price)
-        else:
-            send_message(f"{code} 매수 중 오류: {e}", code)
+        send_message(f"{code} 매수 중 오류: {e}", code)
         return False
 
-def sell(code, qty="all", price=0):
-    """주식 시장가/지정가 매도"""
-    global ACCESS_TOKEN
-    
+def sell(code, qty="all", price=0, trade_type='sell'):
+    """주식 시장가/지정가 매도 (접수된 주문은 ORDER_TRACKER로 체결 추적, 거래 기록은 체결 확인 시)"""
     PATH = "uapi/domestic-stock/v1/trading/order-cash"
-    URL = f"{URL_BASE}/{PATH}"
     
     # 보유 주식 확인
     try:
@@ -1664,7 +1314,11 @@ def sell(code, qty="all", price=0):
             send_message(f"❌ {code} 종목을 보유하고 있지 않습니다", code)
             return False
 
-        held_qty = int(stock_dict[code]['hldg_qty'])
+        # 이미 접수된 매도 주문의 미체결 수량은 제외 (중복 매도 방지)
+        held_qty = int(stock_dict[code]['hldg_qty']) - ORDER_TRACKER.open_quantity(code, 'sell')
+        if held_qty <= 0:
+            send_message(f"⏳ {code} 미체결 매도 주문이 있어 추가 매도하지 않습니다", code)
+            return False
 
         # "all" 입력 시 보유 수량 전량 매도
         if qty == "all":
@@ -1684,13 +1338,6 @@ def sell(code, qty="all", price=0):
             ord_dvsn = "00"  # 지정가
             price = str(price)
         
-        # 토큰 확인
-        if not ACCESS_TOKEN:
-            ACCESS_TOKEN = get_access_token()
-            if not ACCESS_TOKEN:
-                send_message(f"{code} 매도 실패: 토큰 없음", code)
-                return False
-        
         price_type = "시장가" if ord_dvsn == "01" else f"{price}원"
         send_message(f"매도 주문 시작: {code} {qty}주 {price_type}", code)
         
@@ -1703,42 +1350,12 @@ def sell(code, qty="all", price=0):
             "ORD_UNPR": "0" if ord_dvsn == "01" else price,
         }
         
-        # 해시키 생성
-        hash_key = hashkey(data)
-        if not hash_key:
-            send_message(f"{code} 매도 실패: 해시키 생성 오류", code)
-            return False
-        
-        headers = {
-            "Content-Type": "application/json", 
-            "authorization": f"Bearer {ACCESS_TOKEN}",
-            "appKey": APP_KEY,
-            "appSecret": APP_SECRET,
-            "tr_id": "TTTC0801U",
-            "custtype": "P",
-            "hashkey": hash_key
-        }
-        
         try:
-            res = requests.post(URL, headers=headers, data=json.dumps(data))
-            
-            # 토큰 오류 처리
-            if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-                send_message(f"{code} 매도 중 토큰 오류. 토큰 갱신 중...", code)
-                ACCESS_TOKEN = get_access_token()
-                if ACCESS_TOKEN:
-                    # 새 토큰으로 다시 시도
-                    headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                    hash_key = hashkey(data)  # 해시키 재생성
-                    if hash_key:
-                        headers["hashkey"] = hash_key
-                        res = requests.post(URL, headers=headers, data=json.dumps(data))
-                    else:
-                        send_message(f"{code} 매도 실패: 해시키 재생성 오류", code)
-                        return False
-                else:
-                    send_message(f"{code} 매도 실패: 토큰 갱신 실패", code)
-                    return False
+            # 매도 주문 (해시키는 ORDER_USE_HASHKEY 설정 시에만, 토큰 만료 시 재발급/재시도는 KIS 클라이언트에서 처리)
+            res = KIS.submit_order(PATH, "TTTC0801U", data)
+            if res is None:
+                send_message(f"{code} 매도 실패: 토큰 또는 해시키 생성 오류", code)
+                return False
             
             # 주문 결과 확인
             if res.status_code != 200:
@@ -1747,23 +1364,15 @@ def sell(code, qty="all", price=0):
                 
             res_data = res.json()
             if res_data['rt_cd'] == '0':
-                send_message(f"✅ {code} {qty}주 {price_type} 매도 주문 성공", code)
+                send_message(f"✅ {code} {qty}주 {price_type} 매도 주문 접수", code)
+                ORDER_TRACKER.track(code, 'sell', qty, price, res_data, trade_type=trade_type)
                 return True
             else:
                 send_message(f"❌ {code} 매도 실패: {res_data['msg1']}", code)
                 return False
                 
         except Exception as e:
-            error_msg = str(e).lower()
-            if 'access_token' in error_msg:
-                send_message(f"{code} 매도 중 토큰 오류: {e}", code)
-                # 토큰 갱신 시도
-                ACCESS_TOKEN = get_access_token()
-                if ACCESS_TOKEN:
-                    # 재귀적으로 다시 시도
-                    return sell(code, qty, price)
-            else:
-                send_message(f"{code} 매도 중 오류: {e}", code)
+            send_message(f"{code} 매도 중 오류: {e}", code)
             return False
             
     except Exception as e:
@@ -1883,6 +1492,25 @@ def check_buy_conditions(code, current_rsi, current_price):
 
 #파트3
 
+def on_order_fill(order, fill_qty, fill_price):
+    """체결 확인 (ORDER_TRACKER 콜백): 실제 체결 수량/단가로 거래 기록"""
+    side_name = '매수' if order.side == 'buy' else '매도'
+    send_message(f"✅ [{side_name} 체결] {order.symbol} {fill_qty}주 @ {fill_price:,.0f}원 (누적 {order.filled_qty}/{order.qty}주)",
+                 order.symbol, level=MESSAGE_LEVEL_CRITICAL)
+    add_trade_record(order.symbol, order.trade_type, fill_qty, fill_price)
+
+@STAGE_TIMER.timed()
+def run_order_reconcile():
+    """미체결 주문 체결 대사 + 제한 시간 지난 주문 취소 (메인 루프 매 반복)"""
+    if not ORDER_TRACKER.has_open_orders():
+        return
+    ORDER_TRACKER.reconcile()
+    for order in ORDER_TRACKER.expired_orders():
+        remaining = order.remaining_qty
+        side_name = '매수' if order.side == 'buy' else '매도'
+        if ORDER_TRACKER.cancel(order):
+            send_message(f"⌛ {order.symbol} {side_name} 미체결 {remaining}주 취소 ({ORDER_FILL_TIMEOUT}초 경과)", order.symbol, level=MESSAGE_LEVEL_IMPORTANT)
+
 def main():
     """메인 함수"""
     global ACCESS_TOKEN
@@ -1894,6 +1522,9 @@ def main():
     
     token_retry_count = 0
     max_token_retries = 5
+
+    # 진단 트리거 등록 (메인 루프 스레드가 샘플링 대상)
+    DIAGNOSTICS.install()
     
     while True:  # 메인 무한 루프
         try:
@@ -1975,9 +1606,6 @@ def main():
                 if (current_time - last_token_refresh).total_seconds() >= 10800:
                     refresh_token()
                     last_token_refresh = current_time
-                    
-                    # 메시지 히스토리 정리 (토큰 갱신 시마다)
-                    cleanup_message_history()
                 
                 # 시장 상태 확인 (상태 변경 시에만 메시지 발송)
                 current_market_status = is_market_open()
@@ -1996,20 +1624,30 @@ def main():
                         send_message("🔔 한국 시장이 마감되었습니다. 다음 개장일까지 대기합니다...", level=MESSAGE_LEVEL_CRITICAL)
                         
                         # 일일 요약 메시지 발송 (거래가 없어도 분석 데이터가 있으면 리포트 발송)
+                        # 마감 전 체결분 반영 후 남은 당일 주문은 소멸 처리
+                        try:
+                            ORDER_TRACKER.reconcile()
+                        except Exception as e:
+                            send_message(f"주문 체결 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+                        for order in ORDER_TRACKER.expire_all():
+                            send_message(f"⌛ {order.symbol} 미체결 {order.remaining_qty}주 장 마감으로 소멸", order.symbol, level=MESSAGE_LEVEL_IMPORTANT)
                         log(f"📊 시장 마감 - 분석 데이터 상태 확인: 종목 수 {len(DAILY_SUMMARY_DATA)}개")
+                        latency = KIS.order_latency_summary()
+                        if latency['count']:
+                            log(f"⏱ 주문 전송 지연: {latency['count']}건 평균 {latency['avg'] * 1000:.0f}ms / p95 {latency['p95'] * 1000:.0f}ms / 최대 {latency['max'] * 1000:.0f}ms")
                         if DAILY_SUMMARY_DATA:
                             # 각 종목별 분석 포인트 수 확인
                             for symbol, data in DAILY_SUMMARY_DATA.items():
                                 symbol_name = get_symbol_name(symbol)
                                 log(f"📊 {symbol_name}({symbol}) 분석 포인트: {len(data.get('analysis_points', []))}개")
                             
-                            send_message("📊 자동 매매 요약 리포트를 발송하겠습니다", level=MESSAGE_LEVEL_CRITICAL)
-                            # 요약 발송 전 추가 2초 대기
-                            time.sleep(2)
                             send_daily_summary()
                         else:
                             log("⚠️ 시장 마감 시 분석 데이터가 비어있음 - 리포트 발송 불가")
                             send_message("📊 오늘은 분석 데이터가 없어 요약 리포트를 발송하지 않습니다", level=MESSAGE_LEVEL_CRITICAL)
+                        # 당일 루프 단계별 실행 시간 (다음 거래일은 새로 집계)
+                        log(f"⏱ {STAGE_TIMER.format_summary()}")
+                        STAGE_TIMER.reset()
                         
                         wait_for_market_open()
                         continue
@@ -2023,6 +1661,7 @@ def main():
                 minutes_elapsed = (current_time - last_check_time).total_seconds() / 60
                 
                 if force_first_check or minutes_elapsed >= CHECK_INTERVAL_MINUTES:
+                    check_started = time.perf_counter()
                     # 현금 잔고 확인
                     total_cash = get_balance()
                     if total_cash <= 0:
@@ -2041,6 +1680,7 @@ def main():
                     
                     # 종목별 처리
                     for code in SYMBOLS:
+                        symbol_started = time.perf_counter()
                         try:
                             # RSI 조회
                             current_rsi = get_current_rsi(code)
@@ -2139,9 +1779,8 @@ def main():
                                             buy_result = buy(code, qty)
                                             if buy_result:
                                                 bought_list.append(code)
-                                                send_message(f"✅ {code} {qty}주 매수 완료", code, level=MESSAGE_LEVEL_CRITICAL)
-                                                # 거래 내역 추가
-                                                add_trade_record(code, 'buy', qty, current_price)
+                                                send_message(f"✅ {code} {qty}주 매수 주문 접수", code, level=MESSAGE_LEVEL_CRITICAL)
+                                                # 거래 내역은 체결 확인 시 기록 (on_order_fill)
                                             else:
                                                 # 매수 실행 실패 (잔고 부족 등)
                                                 send_message(f"❌ {code} 매수 실행 실패 (잔고 부족 등)", code, level=MESSAGE_LEVEL_IMPORTANT)
@@ -2189,9 +1828,8 @@ def main():
                                         if sell_result:
                                             if code in bought_list:
                                                 bought_list.remove(code)
-                                            send_message(f"✅ {code} 매도 완료", code, level=MESSAGE_LEVEL_CRITICAL)
-                                            # 거래 내역 추가
-                                            add_trade_record(code, 'sell', "all", current_price)
+                                            send_message(f"✅ {code} 매도 주문 접수", code, level=MESSAGE_LEVEL_CRITICAL)
+                                            # 거래 내역은 체결 확인 시 기록 (on_order_fill)
                                     else:
                                         # 매도 조건 미충족이어도 분석 데이터 수집
                                         ma_value = get_moving_average(code, MA_PERIOD)
@@ -2219,6 +1857,9 @@ def main():
                         except Exception as e:
                             send_message(f"🚨 {code} 처리 중 오류: {str(e)}", code)
                             continue
+                        finally:
+                            STAGE_TIMER.add('symbol_check', time.perf_counter() - symbol_started)
+                    STAGE_TIMER.add('rsi_check', time.perf_counter() - check_started)
                     
                     # 다음 체크를 위한 설정 업데이트
                     last_check_time = current_time
@@ -2228,6 +1869,16 @@ def main():
                     next_check_minutes = 30
                     send_message(f"⏳ 다음 분석 체크까지 약 {next_check_minutes}분 남았습니다", level=MESSAGE_LEVEL_DEBUG)
                 
+                # 접수된 주문의 체결 반영 (미체결 주문이 있을 때만 1회 조회)
+                try:
+                    run_order_reconcile()
+                except Exception as e:
+                    send_message(f"주문 체결 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+                
+                # 이번 반복의 API 호출 요약 + 계측 파일 저장 (호출이 있었던 반복만)
+                if API_METRICS.cycle_summary()['calls']:
+                    log(API_METRICS.end_cycle(label=API_METRICS_LABEL))
+                
                 # 효율적인 대기 시간 설정
                 if is_market_open():
                     # 시장 개장 시: 30초마다 체크 (RSI 체크 시간 고려)
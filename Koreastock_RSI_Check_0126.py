@@ -1,8 +1,10 @@
 # RSI 추이 확인 스크립트
 # 각 종목별 RSI 값을 조회하고 최근 3일간의 RSI 추이를 리스트로 확인하는 스크립트
+# 261018 RSI 시계열을 행별 df.loc 루프 대신 kis_indicators.wilder_rsi_series(NumPy 배열 1회 계산)로 계산
+# 261018 분봉 조회를 당일분봉 페이지 순차 조회(period=336) 대신 주식일별분봉조회 시간 구간 동시 조회(kis_minute_bars.py)로 교체: 전체 종목 최근 5거래일 30분봉을 한 번에 조회
+# 261018 봉 로컬 저장소(kis_bars.db)를 국내 자동매매와 공유: 저장된 분봉/일봉은 파일에서 읽고 마지막 동기화 이후 봉만 조회, 20일 이동평균은 일봉 캐시 사용
 
 import requests
-import json
 import datetime
 import time
 import yaml
@@ -10,6 +12,12 @@ import pandas as pd
 import numpy as np
 from pytz import timezone
 import warnings
+from kis_indicators import wilder_rsi_series
+from kis_client import KISClient
+from kis_minute_bars import fetch_minute_bars_many, minute_bars_output2
+from market_calendar import KRX_CALENDAR_PATH, MarketCalendar
+from kis_bar_store import init_bar_store
+from kis_daily_bars import DailyBarCache
 warnings.filterwarnings('ignore')
 
 # config.yaml 파일 로드
@@ -23,6 +31,18 @@ DISCORD_WEBHOOK_URL = config['DISCORD_WEBHOOK_URL']
 URL_BASE = "https://openapi.koreainvestment.com:9443"
 ACCESS_TOKEN = None
 
+# KIS API 공용 클라이언트 (분봉 구간 동시 조회용, 토큰 캐시 파일은 자동매매 스크립트와 공유)
+TOKEN_CACHE_PATH = 'kis_token_cache.json'
+KIS_REQUESTS_PER_SECOND = 10       # 전체 스레드 합산 KIS API 초당 요청 한도
+KIS = KISClient(APP_KEY, APP_SECRET, URL_BASE, timeout=10, max_retries=2,
+                requests_per_second=KIS_REQUESTS_PER_SECOND, token_cache_path=TOKEN_CACHE_PATH)
+MARKET_CALENDAR = MarketCalendar(KRX_CALENDAR_PATH)  # 분봉 조회 거래일/정규장 시간 (market_calendar_krx.json)
+
+# 봉 로컬 저장소 (국내 자동매매와 같은 kis_bars.db 공유 - 저장된 봉은 파일에서 읽고 새 봉만 조회)
+BAR_STORE_ENABLED = True
+if BAR_STORE_ENABLED:
+    init_bar_store()
+
 # 종목 리스트
 SYMBOLS = ["005930", "000660", "069500", "449450", "466920", "360750", "0053L0"]
 
@@ -40,150 +60,52 @@ SYMBOL_NAMES = {
 # RSI 계산 기간 및 분봉 설정
 RSI_PERIOD = 14  # RSI 계산 기간
 MINUTE_CANDLE = 30  # 분봉 (30분봉 사용)
+MINUTE_FETCH_DAYS = 5  # 분봉 조회 거래일 수 (최근 1주일)
 
 def get_access_token():
-    """토큰 발급"""
+    """토큰 발급 (토큰 캐시 파일에 유효한 토큰이 있으면 재사용)"""
     global ACCESS_TOKEN
     try:
-        headers = {"content-type": "application/json"}
-        body = {
-            "grant_type": "client_credentials",
-            "appkey": APP_KEY,
-            "appsecret": APP_SECRET
-        }
-        res = requests.post(f"{URL_BASE}/oauth2/tokenP", headers=headers, data=json.dumps(body), timeout=5)
-        ACCESS_TOKEN = res.json()["access_token"]
+        ACCESS_TOKEN = KIS.refresh_token()
         return ACCESS_TOKEN
     except Exception as e:
         print(f"토큰 발급 실패: {e}")
         return None
 
-def get_minute_data(code, time_unit=MINUTE_CANDLE, period=336):
-    """분봉 데이터 조회 (최근 1주일 = 336개, 30분봉 기준)"""
-    global ACCESS_TOKEN
-    
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            print(f"❌ {code}: 토큰 발급 실패")
-            return None
-    
-    PATH = "uapi/domestic-stock/v1/quotations/inquire-time-itemchartprice"
-    URL = f"{URL_BASE}/{PATH}"
-    
-    all_data = []
-    next_key = ""
+def get_minute_data_all(codes, time_unit=MINUTE_CANDLE, days=MINUTE_FETCH_DAYS):
+    """전체 종목 분봉 데이터 조회 (최근 days거래일, 30분봉 기준 - 저장소에 없는 종목/거래일별 시간 구간만 동시에 조회)
+
+    Returns:
+        {종목코드: {"output2": 시간순 분봉 행 목록} 또는 None}
+    """
+    if not ACCESS_TOKEN and not get_access_token():
+        print("❌ 토큰 발급 실패")
+        return {code: None for code in codes}
     
+    started_at = time.time()
     try:
-        # 페이지네이션을 통한 데이터 수집
-        for page in range(10):  # 최대 10페이지까지 조회
-            headers = {
-                "Content-Type": "application/json",
-                "authorization": f"Bearer {ACCESS_TOKEN}",
-                "appKey": APP_KEY,
-                "appSecret": APP_SECRET,
-                "tr_id": "FHKST03010200",
-                "custtype": "P"
-            }
-            
-            params = {
-                "FID_ETC_CLS_CODE": "",
-                "FID_COND_MRKT_DIV_CODE": "J",
-                "FID_INPUT_ISCD": code,
-                "FID_INPUT_HOUR_1": str(time_unit),
-                "FID_PW_DATA_INCU_YN": "Y",
-                "CTX_AREA_FK100": next_key,
-                "CTX_AREA_NK100": ""
-            }
-            
-            res = requests.get(URL, headers=headers, params=params, timeout=10)
-            
-            # 응답 코드가 만료된 토큰 오류인 경우
-            if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-                print(f"⚠️ {code}: 토큰이 만료되었습니다. 새 토큰을 발급합니다.")
-                ACCESS_TOKEN = get_access_token()
-                if ACCESS_TOKEN:
-                    headers['authorization'] = f"Bearer {ACCESS_TOKEN}"
-                    res = requests.get(URL, headers=headers, params=params, timeout=10)
-                else:
-                    print(f"❌ {code}: 토큰 재발급 실패")
-                    if page == 0:
-                        return None
-                    break
-            
-            if res.status_code != 200:
-                print(f"❌ {code}: API 호출 실패. 상태 코드: {res.status_code}")
-                if page == 0:
-                    return None
-                break
-            
-            data = res.json()
-            
-            # 에러 체크
-            if "rt_cd" in data and data["rt_cd"] != "0":
-                error_msg = data.get("msg1", "알 수 없는 오류")
-                print(f"❌ {code}: API 오류 - {error_msg} (rt_cd: {data['rt_cd']})")
-                if page == 0:  # 첫 페이지에서 실패하면 종료
-                    return None
-                break
-            
-            if "output2" not in data or not data["output2"]:
-                if page == 0:
-                    print(f"❌ {code}: 분봉 데이터 없음")
-                    return None
-                break
-            
-            # 데이터 추가
-            for item in data["output2"]:
-                all_data.append({
-                    'stck_prpr': item.get('stck_prpr', '0'),
-                    'stck_stdg_prc': item.get('stck_stdg_prc', '0'),
-                    'stck_oprc': item.get('stck_oprc', '0'),
-                    'stck_hgpr': item.get('stck_hgpr', '0'),
-                    'stck_lwpr': item.get('stck_lwpr', '0'),
-                    'acml_vol': item.get('acml_vol', '0'),
-                    'stck_prpr_strt_time': item.get('stck_prpr_strt_time', '')
-                })
-            
-            # 필요한 데이터 수를 충족했거나 다음 페이지가 없으면 종료
-            if len(all_data) >= period:
-                all_data = all_data[:period]
-                break
-            
-            # 다음 페이지 키 확인
-            if "output1" in data and data["output1"]:
-                next_key = data["output1"].get("CTX_AREA_FK100", "")
-                if not next_key:
-                    # ctx_area_fk100도 확인 (소문자 키)
-                    next_key = data.get("ctx_area_fk100", "")
-                    if not next_key:
-                        break
-            else:
-                # output1이 없으면 ctx_area_fk100 확인 (소문자 키)
-                next_key = data.get("ctx_area_fk100", "")
-                if not next_key:
-                    break
-            
-            time.sleep(0.2)  # API 호출 간격
-        
-        if not all_data:
-            print(f"❌ {code}: 분봉 데이터가 없습니다")
-            return None
-        
-        print(f"✅ {code}: 분봉 데이터 {len(all_data)}개 조회 완료")
-        return {"output2": all_data}
-        
-    except requests.exceptions.RequestException as e:
-        print(f"❌ {code}: 네트워크 오류 - {e}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"❌ {code}: JSON 파싱 오류 - {e}")
-        return None
+        bars_by_code = fetch_minute_bars_many(KIS, codes, time_unit, days, MARKET_CALENDAR, started_at,
+                                              use_store=BAR_STORE_ENABLED)
     except Exception as e:
-        print(f"❌ {code}: 분봉 데이터 조회 실패 - {type(e).__name__}: {e}")
+        print(f"❌ 분봉 데이터 조회 실패 - {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        return {code: None for code in codes}
+    
+    result = {}
+    for code in codes:
+        bars = bars_by_code.get(code)
+        if bars is None:
+            print(f"❌ {code}: 분봉 데이터가 없습니다")
+            result[code] = None
+            continue
+        rows = minute_bars_output2(bars)
+        for row in rows:
+            row['stck_prpr_strt_time'] = row['stck_bsop_date'] + row['stck_cntg_hour']
+        print(f"✅ {code}: 분봉 데이터 {len(rows)}개 조회 완료")
+        result[code] = {"output2": rows}
+    print(f"⏱ 분봉 조회 완료: {len(codes)}종목 {days}거래일 {time.time() - started_at:.1f}초")
+    return result
 
 def calculate_rsi_series(data, periods=RSI_PERIOD):
     """RSI 시계열 데이터 계산 (최근 1주일)"""
@@ -220,16 +142,7 @@ def calculate_rsi_series(data, periods=RSI_PERIOD):
                 # 시간이 파싱된 경우, 시간순으로 정렬 (오래된 것부터)
                 df = df.sort_values('time').reset_index(drop=True)
                 
-                # 실제 거래 시간만 필터링 (한국 주식 시장: 평일 09:30 ~ 15:30)
-                # 9시 30분 이후, 15시 30분 이전 데이터만
-                df = df[
-                    ((df['time'].dt.hour == 9) & (df['time'].dt.minute >= 30)) |  # 9:30 이후
-                    (df['time'].dt.hour.between(10, 14)) |  # 10:00 ~ 14:59
-                    ((df['time'].dt.hour == 15) & (df['time'].dt.minute <= 30))  # 15:30 이전
-                ]
-                
-                # 주말 데이터 제거 (월요일(0) ~ 금요일(4))
-                df = df[df['time'].dt.weekday < 5]
+                # 분봉은 거래소 달력의 정규장(휴장일 제외, 지연 개장/연장 마감 반영) 봉만 조회되므로 시간대 필터 불필요
                 
                 # 데이터가 실제로 있는지 확인
                 if len(df) == 0:
@@ -243,31 +156,9 @@ def calculate_rsi_series(data, periods=RSI_PERIOD):
             end_time = datetime.datetime.now(timezone('Asia/Seoul'))
             df['time'] = pd.date_range(end=end_time, periods=len(df), freq='30min')
         
-        # 가격 변화량 계산
-        df['price_change'] = df['price'].diff()
-        
-        # 상승분과 하락분 분리
-        df['gain'] = df['price_change'].where(df['price_change'] > 0, 0)
-        df['loss'] = -df['price_change'].where(df['price_change'] < 0, 0)
-        
-        # 초기 평균 계산 (단순 평균) - Wilder's smoothing 방식
-        df['avg_gain'] = 0.0
-        df['avg_loss'] = 0.0
-        
-        # 첫 번째 EMA 계산 (periods 번째부터)
-        if len(df) >= periods + 1:
-            df.loc[periods, 'avg_gain'] = df['gain'].iloc[1:periods + 1].mean()
-            df.loc[periods, 'avg_loss'] = df['loss'].iloc[1:periods + 1].mean()
-        
-        # 이후 EMA 계산 (Wilder's smoothing: alpha = 1/periods)
-        alpha = 1.0 / periods
-        for i in range(periods + 1, len(df)):
-            df.loc[i, 'avg_gain'] = alpha * df['gain'].iloc[i] + (1 - alpha) * df['avg_gain'].iloc[i - 1]
-            df.loc[i, 'avg_loss'] = alpha * df['loss'].iloc[i] + (1 - alpha) * df['avg_loss'].iloc[i - 1]
-        
-        # RSI 계산
-        df['rs'] = df['avg_gain'] / df['avg_loss'].replace(0, np.nan)
-        df['rsi'] = 100 - (100 / (1 + df['rs']))
+        # Wilder's smoothing RSI (첫 periods개 변화량 단순 평균 후 alpha = 1/periods) - 거래 시간 필터 후 행 순서 기준으로 한 번에 계산
+        df = df.reset_index(drop=True)
+        df['rsi'] = wilder_rsi_series(df['price'].to_numpy(dtype=np.float64), periods)
         
         # 유효한 RSI 값만 필터링 (periods 이후부터)
         valid_df = df.iloc[periods:].copy()
@@ -356,8 +247,8 @@ def get_current_price(code):
         print(f"현재가 조회 실패: {e}")
         return None
 
-def get_moving_average(code, period=20):
-    """이동평균 조회"""
+def get_daily_rows(code, min_bars=None):
+    """일봉 조회 (API 응답 output2 최신순, 실패 시 None) - 일봉 캐시 조회 함수"""
     global ACCESS_TOKEN
     
     if not ACCESS_TOKEN:
@@ -387,21 +278,22 @@ def get_moving_average(code, period=20):
         res = requests.get(URL, headers=headers, params=params, timeout=5)
         data = res.json()
         
-        if "output2" not in data or not data["output2"]:
-            return None
-        
-        prices = []
-        for item in data["output2"][:period]:
-            prices.append(float(item['stck_clpr']))
-        
-        if len(prices) < period:
-            return None
-        
-        return sum(prices) / len(prices)
+        return data.get("output2") or None
     except Exception as e:
-        print(f"이동평균 조회 실패: {e}")
+        print(f"일봉 조회 실패: {e}")
         return None
 
+# 일봉 캐시 (마지막 마감 거래일까지 저장된 일봉은 재조회 없이 사용, 국내 자동매매와 저장소 공유)
+MA_PERIOD = 20  # 이동평균 기간 (일)
+DAILY_BARS = DailyBarCache(get_daily_rows,
+                           lambda: MARKET_CALENDAR.last_closed_session(time.time()).strftime('%Y%m%d'),
+                           min_bars=MA_PERIOD, use_store=BAR_STORE_ENABLED)
+
+def get_moving_average(code, period=MA_PERIOD, current_price=None):
+    """이동평균 조회 (장중이면 현재가를 당일 봉으로 포함)"""
+    live_price = current_price if MARKET_CALENDAR.is_open(time.time()) else None
+    return DAILY_BARS.sma(code, period, live_price=live_price)
+
 def print_rsi_list(all_rsi_data):
     """모든 종목의 시간대별 RSI를 리스트로 출력"""
     if not all_rsi_data:
@@ -490,13 +382,15 @@ def check_rsi_for_all_symbols():
     results = []
     all_rsi_data = []  # 모든 종목의 RSI 데이터 저장
     
+    # 분봉 데이터 조회 (전체 종목 최근 1주일, 종목별 순차 페이지 조회 대신 한 번에 동시 조회)
+    minute_data = get_minute_data_all(SYMBOLS, time_unit=MINUTE_CANDLE, days=MINUTE_FETCH_DAYS)
+    
     for symbol in SYMBOLS:
         symbol_name = SYMBOL_NAMES.get(symbol, symbol)
         print(f"\n[{symbol_name}({symbol})]")
         print("-" * 60)
         
-        # 분봉 데이터 조회 (최근 1주일)
-        data = get_minute_data(code=symbol, time_unit=MINUTE_CANDLE, period=336)
+        data = minute_data.get(symbol)
         if not data:
             print("❌ 분봉 데이터 조회 실패")
             results.append({
@@ -554,7 +448,7 @@ def check_rsi_for_all_symbols():
             continue
         
         # 이동평균 조회
-        ma_20 = get_moving_average(symbol, period=20)
+        ma_20 = get_moving_average(symbol, period=20, current_price=current_price)
         
         # 결과 출력
         print(f"✅ {symbol_name}({symbol}): 분석 완료")
@@ -0,0 +1,766 @@
+#해외주식거래코드 (asyncio 버전)
+
+# 261018 UsaStockAutoTrade_Modify_Multi_260517.py의 asyncio 버전
+# 설정값/종목별 설정/매매 판단/일일 요약 리포트는 260517 스크립트를 그대로 가져다 쓰고, KIS 조회/주문 I/O만 asyncio로 실행
+# - 전 종목 분봉/현재가/거래소별 보유 잔고를 동시에 조회 (aiohttp, 진행 중인 요청 수는 세마포어로 제한)
+# - 손절매 주기 체크, 봉 마감 RSI 분석, 미체결 주문 대사, 토큰 갱신은 각각 독립 태스크
+# - 매수/매도 판단(should_buy, should_sell, partial_profit_take_qty)은 동기 순수 함수 그대로 사용
+# - 계좌 상태를 바꾸는 판단/주문은 TRADE_LOCK으로 한 번에 하나만 (조회는 잠금 없이 동시에)
+# - 디스코드 알림은 기존 알림 서비스(notify_service.py) 큐를 그대로 사용 (send_message는 바로 반환)
+# - 실시간 체결가 웹소켓은 사용하지 않음 (손절매는 STOP_LOSS_CHECK_INTERVAL 주기 체크)
+# 261018 거래소 달력(market_calendar_us.json) 기준 개장 대기, 개장 5분 전 토큰/잔고/분봉 미리 갱신
+# 261018 이동평균은 260517과 같은 일봉 캐시(DAILY_BARS) 사용, 분봉은 RSI에 필요한 만큼만 조회
+# 실행에 aiohttp 패키지 필요 (requirements.txt)
+
+
+
+
+
+
+import asyncio
+import time
+from datetime import datetime
+
+from pytz import timezone
+
+import UsaStockAutoTrade_Modify_Multi_260517 as base
+from diagnostics import Diagnostics
+from kis_async_client import AsyncKISClient
+from kis_indicators import decode_bars
+
+send_message = base.send_message
+MESSAGE_LEVEL_CRITICAL = base.MESSAGE_LEVEL_CRITICAL
+MESSAGE_LEVEL_IMPORTANT = base.MESSAGE_LEVEL_IMPORTANT
+MESSAGE_LEVEL_INFO = base.MESSAGE_LEVEL_INFO
+MESSAGE_LEVEL_DEBUG = base.MESSAGE_LEVEL_DEBUG
+
+# ===== asyncio 실행 설정 =====
+ASYNC_MAX_IN_FLIGHT = 8            # 동시에 진행 중인 KIS 요청 수 상한 (초당 요청 한도는 KIS_REQUESTS_PER_SECOND 공유)
+ASYNC_PAGE_DELAY = 0.5             # 같은 종목 분봉 페이지 사이 대기 (초)
+RESTART_DELAY = 180                # 이벤트 루프 오류 종료 후 재시작 대기 (초)
+AKIS = AsyncKISClient(base.KIS, max_in_flight=ASYNC_MAX_IN_FLIGHT)
+TRADE_LOCK = None                  # asyncio.Lock (이벤트 루프 시작 후 생성) - 잔고 판단/주문 직렬화
+API_METRICS_LABEL = base.os.path.basename(__file__)  # 사이클별 API 호출 집계에서 동기 버전과 구분
+# 진단은 동기 버전과 같은 단계 기록(STAGE_TIMER)을 쓰되 트리거 파일은 따로 (touch usa_async_trader.diagnostics.trigger)
+DIAGNOSTICS = Diagnostics('usa_async_trader', stages=base.STAGE_TIMER, sample_seconds=base.DIAGNOSTICS_SAMPLE_SECONDS,
+                          watch=base.DIAGNOSTICS.watch, trace_from_start=base.DIAGNOSTICS_TRACE_FROM_START)
+# ===== asyncio 실행 설정 끝 =====
+
+
+def market_info_of(symbol):
+    return base.MARKET_MAP.get(symbol, {"EXCD": base.EXCD_MARKET, "MARKET": base.MARKET})
+
+
+async def sleep_until(target):
+    """epoch 시각까지 대기 (시스템 시계 변경/절전 대비 SCHEDULER_MAX_SLEEP마다 다시 확인)"""
+    while True:
+        remaining = target - time.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, base.SCHEDULER_MAX_SLEEP))
+
+
+async def wait_or_stop(stop_event, seconds):
+    """seconds 동안 대기, 그 전에 stop_event가 켜지면 True"""
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout=max(0.0, seconds))
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+#조회 파트
+
+async def fetch_minute_page(symbol, nmin, next_key="", keyb="", nrec=base.MINUTE_PAGE_SIZE):
+    """분봉 1페이지 조회 → (분봉 리스트, 다음 페이지 키) / 요청 실패 시 (None, "")"""
+    market_info = market_info_of(symbol)
+    params = {
+        "AUTH": "",
+        "EXCD": market_info["EXCD"],
+        "SYMB": symbol,
+        "NMIN": str(nmin),
+        "PINC": "1",
+        "NEXT": next_key,
+        "NREC": str(nrec),
+        "FILL": "Y",
+        "KEYB": keyb
+    }
+    try:
+        res = await AKIS.get("/uapi/overseas-price/v1/quotations/inquire-time-itemchartprice", 'HHDFS76950200', params)
+        if res is None:
+            print("토큰 발급 실패로 분봉 조회 불가")
+            return None, ""
+        if res.status_code != 200:
+            print(f"{symbol} 분봉 조회 실패. 상태 코드: {res.status_code}, 응답 내용: {res.text[:500]}")
+            return None, ""
+        data = res.json()
+        if data.get("output2"):
+            return data["output2"], data.get("output1", {}).get("next", "")
+        print(f"{symbol} 분봉 데이터 없음 (거래소: {market_info['MARKET']}): {res.text[:500]}")
+        return [], ""
+    except Exception as e:
+        print(f"{symbol} 분봉 요청 중 오류 발생: {e!r}")
+        return None, ""
+
+
+async def fetch_minute_pages(symbol, nmin, max_pages, stop_key=None, start_keyb="", nrec=base.MINUTE_PAGE_SIZE):
+    """분봉 여러 페이지 조회 (최신 → 과거 순, 규칙은 260517 fetch_minute_pages와 동일)
+    반환: (분봉 리스트, 저장분과 겹침 여부, 더 과거 데이터 존재 여부)
+    """
+    all_data = []
+    next_key = "1" if start_keyb else ""
+    keyb = start_keyb
+    overlapped = False
+    has_more = True
+
+    for page in range(max_pages):
+        rows, next_flag = await fetch_minute_page(symbol, nmin, next_key, keyb,
+                                                  nrec if page == 0 else base.MINUTE_PAGE_SIZE)
+        if rows is None:
+            break
+        if not rows:
+            has_more = False
+            break
+
+        all_data.extend(rows)
+        row_keys = [key for key in map(base.minute_bar_key, rows) if key]
+        oldest_key = min(row_keys) if row_keys else None
+        if stop_key and oldest_key and oldest_key <= stop_key:
+            overlapped = True
+            break
+        if not next_flag or not oldest_key:
+            has_more = False
+            break
+
+        next_key = next_flag
+        keyb = base.shift_bar_key(oldest_key, -nmin)
+        await asyncio.sleep(ASYNC_PAGE_DELAY)
+
+    return all_data, overlapped, has_more
+
+
+async def get_minute_data(symbol, nmin, period, required_bars=None):
+    """분봉 데이터 조회 (로컬 저장소 증분 조회 + 부족분 백필, 규칙은 260517 get_minute_data와 동일)"""
+    required_bars = required_bars or period * base.MINUTE_PAGE_SIZE
+    first_page_size = min(required_bars, base.MINUTE_PAGE_SIZE)
+    if not base.BAR_STORE_ENABLED:
+        all_data, _, _ = await fetch_minute_pages(symbol, nmin, period, nrec=first_page_size)
+        return {"output2": all_data[:required_bars]} if all_data else None
+
+    _, newest_key, _ = base.get_timestamp_range(symbol, nmin)
+
+    if newest_key:
+        # 마지막 저장 봉 이후 구간만 조회
+        new_rows, overlapped, _ = await fetch_minute_pages(
+            symbol, nmin, period, stop_key=newest_key, nrec=base.count_missing_bars(newest_key, nmin)
+        )
+        if new_rows and not overlapped:
+            print(f"{symbol} 저장된 분봉과 공백 발생, 저장소 재구성")
+            base.clear_bars(symbol, nmin)
+            base.BAR_BACKFILL_DONE.pop((symbol, nmin), None)
+    else:
+        new_rows, _, has_more = await fetch_minute_pages(symbol, nmin, period, nrec=first_page_size)
+        if new_rows and not has_more:
+            base.BAR_BACKFILL_DONE[(symbol, nmin)] = True
+
+    if not new_rows:
+        # 최신 구간 조회 실패 시 오래된 저장분으로 매매 판단하지 않음
+        print(f"{symbol} 조회된 데이터 수: 0")
+        return None
+    base.save_bars(symbol, nmin, new_rows, base.minute_bar_key)
+
+    # 필요한 봉 수보다 적으면 과거 구간 백필
+    oldest_key, _, stored_count = base.get_timestamp_range(symbol, nmin)
+    if stored_count < required_bars and not base.BAR_BACKFILL_DONE.get((symbol, nmin)):
+        backfill_pages = -(-(required_bars - stored_count) // base.MINUTE_PAGE_SIZE)
+        old_rows, _, has_more = await fetch_minute_pages(
+            symbol, nmin, backfill_pages, start_keyb=base.shift_bar_key(oldest_key, -nmin)
+        )
+        if old_rows:
+            base.save_bars(symbol, nmin, old_rows, base.minute_bar_key)
+        if not has_more:
+            base.BAR_BACKFILL_DONE[(symbol, nmin)] = True
+
+    all_data = base.load_bars(symbol, nmin, limit=required_bars)
+    print(f"{symbol} 조회된 데이터 수: {len(new_rows)} (저장소 {len(all_data)})")
+    return {"output2": all_data} if all_data else None
+
+
+async def analyze_symbol(symbol):
+    """종목 분봉 조회 + 기술적 분석 → (symbol, 분석 결과, 시작 시각, 소요 시간)"""
+    started_at = time.time()
+    analysis = None
+    try:
+        daily_bars = None
+        if base.DAILY_MA_ENABLED:
+            # 일봉은 거래일당 1회만 조회하므로 동기 캐시를 스레드에서 사용
+            daily_bars, data = await asyncio.gather(
+                asyncio.to_thread(base.get_daily_bars, symbol),
+                get_minute_data(symbol, base.MINUTE_INTERVAL, -(-base.MINUTE_RSI_BARS // base.MINUTE_PAGE_SIZE),
+                                required_bars=base.MINUTE_RSI_BARS),
+            )
+        else:
+            data = await get_minute_data(symbol, base.MINUTE_INTERVAL, base.DATA_PERIOD)
+        if data:
+            analysis = base.analyze_bars(symbol, decode_bars(data), base.RSI_PERIODS,
+                                         base.MA_SHORT_PERIOD, base.MA_LONG_PERIOD, base.MINUTE_INTERVAL, daily_bars)
+        else:
+            send_message(f"{symbol} 데이터 조회 실패, 기술적 분석 불가", symbol)
+    except Exception as e:
+        send_message(f"{symbol} 기술적 분석 중 오류: {e}", symbol)
+    return symbol, analysis, started_at, time.time() - started_at
+
+
+async def fetch_current_price(symbol):
+    """현재가 조회 (실패 시 None)"""
+    params = {"AUTH": "", "EXCD": market_info_of(symbol)["EXCD"], "SYMB": symbol}
+    try:
+        res = await AKIS.get("uapi/overseas-price/v1/quotations/price", "HHDFS00000300", params)
+        if res is None or res.status_code != 200:
+            send_message(f"{symbol} 현재가 조회 실패: 상태 코드 {res.status_code if res is not None else '토큰 없음'}", symbol)
+            return None
+        data = res.json()
+        if 'output' not in data or not data['output'].get('last'):
+            send_message(f"{symbol} 현재가 데이터 없음: {data}", symbol)
+            return None
+        return float(data['output']['last'])
+    except Exception as e:
+        send_message(f"{symbol} 현재가 조회 중 오류: {e}", symbol)
+        return None
+
+
+async def fetch_orderable_cash(symbol, price):
+    """주문 가능 금액 조회 (inquire-psamount 1회, 실패 시 0)"""
+    params = {
+        "CANO": base.CANO,
+        "ACNT_PRDT_CD": base.ACNT_PRDT_CD,
+        "ITEM_CD": symbol,
+        "OVRS_EXCG_CD": market_info_of(symbol)["MARKET"],
+        "OVRS_ORD_UNPR": str(price)
+    }
+    try:
+        res = await AKIS.get("/uapi/overseas-stock/v1/trading/inquire-psamount", "TTTS3007R", params)
+        if res is None or res.status_code != 200:
+            send_message(f"{symbol} 잔고 조회 실패: 상태 코드 {res.status_code if res is not None else '토큰 없음'}", symbol)
+            return 0
+        res_data = res.json()
+        if 'output' not in res_data:
+            send_message(f"🚨 API 응답 오류: {res_data}", symbol)
+            return 0
+        cash = res_data['output'].get('ovrs_ord_psbl_amt', '0')
+        send_message(f"주문 가능 현금 잔고: {cash}$", symbol)
+        return float(cash)
+    except Exception as e:
+        send_message(f"{symbol} 잔고 조회 중 오류: {e}", symbol)
+        return 0
+
+
+async def fetch_exchange_holdings(exchange):
+    """거래소 단위 보유 잔고 조회 → (성공 여부, 종목별 보유 정보, 평가 정보)"""
+    params = {
+        "CANO": base.CANO,
+        "ACNT_PRDT_CD": base.ACNT_PRDT_CD,
+        "OVRS_EXCG_CD": exchange,
+        "TR_CRCY_CD": "USD",
+        "CTX_AREA_FK200": "",
+        "CTX_AREA_NK200": ""
+    }
+    try:
+        res = await AKIS.get("uapi/overseas-stock/v1/trading/inquire-balance", "JTTT3012R", params)
+        if res is None or res.status_code != 200:
+            print(f"{exchange} 주식 잔고 조회 실패: 상태 코드 {res.status_code if res is not None else '토큰 없음'}")
+            return False, {}, {}
+        res_data = res.json()
+    except Exception as e:
+        print(f"{exchange} 주식 잔고 조회 중 오류: {e!r}")
+        return False, {}, {}
+    return base.parse_exchange_holdings(exchange, res_data)
+
+
+async def refresh_holdings_snapshot():
+    """거래소별 보유 잔고 동시 조회 → 계좌 보유 스냅샷 갱신 (일부 실패 시 스냅샷 저장 안 함)"""
+    now = time.time()
+    exchanges = base.get_holdings_exchanges()
+    results = await asyncio.gather(*(fetch_exchange_holdings(exchange) for exchange in exchanges))
+
+    holdings = {}
+    evaluations = {}
+    complete = True
+    for exchange, (ok, stock_dict, evaluation) in zip(exchanges, results):
+        if not ok:
+            complete = False
+            send_message(f"🚨 {exchange} 주식 잔고 조회 실패")
+            continue
+        holdings.update(stock_dict)
+        evaluations[exchange] = evaluation
+
+    if complete:
+        base.HOLDINGS_SNAPSHOT['holdings'] = holdings
+        base.HOLDINGS_SNAPSHOT['fetched_at'] = now
+    base.send_holdings_report(holdings, evaluations)
+    return holdings
+
+
+#주문 파트
+
+async def submit_order(side, code, qty, price, trade_type, reprice_count=0):
+    """지정가 주문 전송 + 체결 추적 등록 (주문 규칙은 260517 buy/sell과 동일)"""
+    side_name = '매수' if side == 'buy' else '매도'
+    market_info = market_info_of(code)
+    try:
+        price = round(float(price), 2)
+        if price < 1.00:
+            send_message(f"🚨 [{side_name} 실패] 주문 가격이 너무 낮습니다 (${price}). 1$ 이상이어야 합니다.", code)
+            return False
+        qty = str(int(float(qty)))
+    except ValueError:
+        send_message(f"🚨 [{side_name} 실패] 주문 가격 또는 수량이 잘못된 형식입니다. (price={price}, qty={qty})", code)
+        return False
+
+    data = {
+        "CANO": base.CANO,
+        "ACNT_PRDT_CD": base.ACNT_PRDT_CD,
+        "OVRS_EXCG_CD": market_info["MARKET"],
+        "PDNO": code,
+        "ORD_QTY": qty,
+        "OVRS_ORD_UNPR": f"{price:.2f}",
+        "ORD_SVR_DVSN_CD": "0",
+        "ORD_DVSN": "00"  # 지정가 주문
+    }
+    try:
+        res = await AKIS.submit_order("uapi/overseas-stock/v1/trading/order",
+                                      "TTTT1002U" if side == 'buy' else "TTTT1006U", data)
+        if res is None:
+            send_message(f"🚨 [{side_name} 실패] 토큰 또는 해시키 생성 오류", code)
+            return False
+        if res.status_code != 200:
+            send_message(f"🚨 [{side_name} 실패] API 응답 오류: {res.status_code}", code)
+            return False
+        res_data = res.json()
+        if res_data.get('rt_cd') != '0':
+            send_message(f"🚨 [{side_name} 실패] {res_data.get('msg1', '알 수 없는 오류 발생')}", code, level=MESSAGE_LEVEL_CRITICAL)
+            return False
+        send_message(f"✅ [{side_name} 접수] {code} {qty}주 @ ${price:.2f}", code, level=MESSAGE_LEVEL_CRITICAL)
+        base.ORDER_TRACKER.track(code, side, qty, price, res_data, exchange=market_info["MARKET"],
+                                 trade_type=trade_type, reprice_count=reprice_count)
+        if side == 'buy':
+            base.get_balance.cache.clear()  # 동기 버전 체결 대사의 재주문이 쓰는 주문 가능 금액 캐시
+        return True
+    except Exception as e:
+        send_message(f"🚨 [{side_name} 실패] {e!r}", code)
+        return False
+
+
+async def sell(code, qty, price, trade_type):
+    """보유 스냅샷 기준 지정가 매도 (미체결 매도 수량 제외, 보유 수량 초과 방지)"""
+    holdings = base.HOLDINGS_SNAPSHOT['holdings'] or {}
+    if code not in holdings:
+        send_message(f"🚨 {code} 종목을 보유하고 있지 않습니다", code)
+        return False
+    held_qty = int(holdings[code]['qty']) - base.ORDER_TRACKER.open_quantity(code, 'sell')
+    if held_qty <= 0:
+        send_message(f"⏳ {code} 미체결 매도 주문이 있어 추가 매도하지 않습니다", code, level=MESSAGE_LEVEL_IMPORTANT)
+        return False
+    if int(float(qty)) > held_qty:
+        send_message(f"🚨 매도 수량({qty})이 보유 수량({held_qty})을 초과합니다", code)
+        return False
+    send_message(f"💰 매도 주문: {code} {qty}주 @ ${float(price):.2f}", code)
+    return await submit_order('sell', code, qty, price, trade_type)
+
+
+async def execute_sell(intent):
+    """매도 판단 1건 실행 + 부분 익절 추적 갱신"""
+    symbol = intent['symbol']
+    if not await sell(symbol, intent['qty'], intent['price'], intent['trade_type']):
+        if intent['trade_type'] != 'sell_profit_take':
+            kind = '손절매' if intent['trade_type'] == 'sell_stop_loss' else '부분 익절'
+            send_message(f"❌ {kind} 실패: {symbol}", symbol, level=MESSAGE_LEVEL_CRITICAL)
+        return False
+
+    trade_type = intent['trade_type']
+    if trade_type == 'sell_stop_loss':
+        base.PARTIAL_PROFIT_TAKEN.pop(symbol, None)
+        send_message(f"✅ 손절매 주문 접수: {symbol} {intent['qty']}주 @ ${intent['price']:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
+    elif trade_type == 'sell_partial_profit':
+        base.PARTIAL_PROFIT_TAKEN[symbol] = True
+        send_message(f"✅ 부분 익절 주문 접수: {symbol} {intent['qty']}주 @ ${intent['price']:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
+    else:
+        send_message(f"✅ {symbol} {intent['qty']}주 매도 주문 접수 (1주 유지로 추세 확인)", symbol, level=MESSAGE_LEVEL_CRITICAL)
+        # 익절 후 1주 남음 → 부분 익절 플래그 유지/설정 (재매도 방지)
+        if intent['held_qty'] - intent['qty'] <= 1:
+            base.PARTIAL_PROFIT_TAKEN[symbol] = True
+        else:
+            base.PARTIAL_PROFIT_TAKEN.pop(symbol, None)
+    # 거래 내역은 체결 확인 시 기록 (on_order_fill)
+    return True
+
+
+async def execute_buy_allocation(candidates):
+    """매수 신호 일괄 처리: 주문 가능 금액 1회 조회 → allocate_buy_orders 배분 → 주문 동시 전송"""
+    if not candidates:
+        return
+    cash_balance = await fetch_orderable_cash(candidates[0]['symbol'], candidates[0]['price'])
+    if cash_balance <= 0:
+        for c in candidates:
+            send_message(f"주문 가능 잔고가 없습니다", c['symbol'], level=MESSAGE_LEVEL_INFO)
+            base.collect_daily_summary_data(c['symbol'], c['analysis'], True, False, c['reason'], "", "insufficient_balance")
+        return
+
+    configs = [base.get_symbol_config(c['symbol']) for c in candidates]
+    budgets, quantities, orderable = base.allocate_buy_orders(
+        cash_balance,
+        [c['price'] for c in candidates],
+        [cfg['buy_ratio'] for cfg in configs],
+        [cfg['safety_margin'] for cfg in configs],
+    )
+    send_message(f"💰 매수 배분: 신호 {len(candidates)}종목, 주문 가능 ${cash_balance:.2f}, 배정 합계 ${budgets.sum():.2f}",
+                 level=MESSAGE_LEVEL_IMPORTANT)
+
+    orders = []
+    for c, config, budget, qty, ok in zip(candidates, configs, budgets, quantities, orderable):
+        symbol = c['symbol']
+        qty = int(qty)
+        send_message(f"- 매수 가능 금액: ${budget:.2f} (비율: {config['buy_ratio']*100}%) / 주문 {qty}주 @ ${c['price']:.2f} "
+                     f"(총 ${qty * c['price']:.2f}, 장기이평 대비 {c['analysis']['price_vs_ma_long_percent']:+.2f}%)", symbol)
+        if not ok:
+            send_message(f"❌ 안전 마진 적용 후 주문 불가", symbol)
+            base.collect_daily_summary_data(symbol, c['analysis'], True, False, c['reason'], "", "insufficient_balance")
+            continue
+        orders.append((c, qty))
+
+    results = await asyncio.gather(*(submit_order('buy', c['symbol'], qty, c['price'], 'buy') for c, qty in orders))
+    for (c, qty), ok in zip(orders, results):
+        if not ok:
+            # 매수 실행 실패 (잔고 부족 등)
+            base.collect_daily_summary_data(c['symbol'], c['analysis'], True, False, c['reason'], "", "insufficient_balance")
+
+
+#매매 판단 파트
+
+def decide_symbol(symbol, analysis, holdings):
+    """종목 1개 매수/매도 판단 (조회/주문 없음)
+
+    Returns:
+        (매수 후보 dict 또는 None, 매도 판단 dict 또는 None)
+    """
+    if analysis is None:
+        send_message(f"기술적 분석 실패, 다음 종목으로 넘어갑니다", symbol, level=MESSAGE_LEVEL_DEBUG)
+        return None, None
+    current_price = analysis['current_price']
+    if current_price is None:
+        send_message(f"현재가 조회 실패", symbol, level=MESSAGE_LEVEL_DEBUG)
+        return None, None
+
+    buy_signal, buy_reason = base.should_buy(analysis, symbol)
+    base.collect_daily_summary_data(symbol, analysis, buy_signal, False, buy_reason, "")
+    dividend_month = base.is_dividend_no_trade_month(symbol)
+
+    if buy_signal:
+        if dividend_month:
+            send_message(f"⏸ {symbol} 배당락월(3·6·9·12월)이라 매수·매도 보류", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+            base.collect_daily_summary_data(symbol, analysis, True, False, buy_reason, "", "ex_dividend_month")
+            return None, None
+        print(f"🎯 {symbol} 매수 신호 감지: {buy_reason}")
+        send_message(f"✅ 매수 신호 감지", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+        return {'symbol': symbol, 'analysis': analysis, 'price': current_price, 'reason': buy_reason}, None
+
+    base.collect_daily_summary_data(symbol, analysis, False, False, buy_reason, "", "condition_not_met")
+    print(f"❌ {symbol} 매수 신호 없음: {buy_reason}")
+    if symbol not in holdings:
+        send_message(f"📊 {symbol}을 보유하고 있지 않습니다", symbol, level=MESSAGE_LEVEL_DEBUG)
+        return None, None
+
+    stock_info = holdings[symbol]
+    profit_rate = float(stock_info['profit_rate'])
+    held_qty = base.get_held_quantity(stock_info['qty'])
+    send_message(f"보유 정보 - 매입가: ${float(stock_info['purchase_price']):.2f}, 손익률: {profit_rate:.2f}%", symbol, level=MESSAGE_LEVEL_DEBUG)
+
+    sell_signal, sell_reason = base.should_sell(analysis, profit_rate, symbol)
+    send_message(f"매도 분석: {sell_reason}", symbol, level=MESSAGE_LEVEL_DEBUG)
+    base.collect_daily_summary_data(symbol, analysis, False, sell_signal, "", sell_reason)
+    if dividend_month:
+        if sell_signal:
+            send_message(f"⏸ {symbol} 배당락월이라 매도 보류 (배당 수령)", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+        return None, None
+
+    # 부분 익절 (익절 목표의 70% 도달 시 보유량의 50%) - 같은 사이클에서 매도는 1건만 (먼저 판단한 부분 익절 우선)
+    triggered, partial_qty, partial_target = base.partial_profit_take_qty(symbol, profit_rate, held_qty)
+    if triggered:
+        if partial_qty > 0:
+            send_message(f"💰 부분 익절 조건 충족: {symbol} 수익률 {profit_rate:.2f}% (목표의 70% = {partial_target:.2f}% 이상), "
+                         f"보유 {held_qty}주 중 {partial_qty}주 @ ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+            return None, {'symbol': symbol, 'qty': partial_qty, 'price': current_price,
+                          'trade_type': 'sell_partial_profit', 'held_qty': held_qty}
+        send_message(f"⚠️ {symbol} 보유 {held_qty}주 — 부분 익절 생략 (추세 확인용 1주 유지)", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+
+    if not sell_signal:
+        print(f"❌ {symbol} 매도 신호 없음: {sell_reason}")
+        return None, None
+    print(f"🎯 {symbol} 매도 신호 감지: {sell_reason}")
+    sell_qty = base.get_profit_take_sell_qty(held_qty)
+    if sell_qty <= 0:
+        send_message(f"⚠️ {symbol} 보유 {held_qty}주 — 익절 매도 생략 (추세 확인용 1주 유지)", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+        return None, None
+    send_message(f"✅ 매도 신호 감지 - {sell_qty}주 매도 (1주 유지, 보유 {held_qty}주)", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+    return None, {'symbol': symbol, 'qty': sell_qty, 'price': current_price,
+                  'trade_type': 'sell_profit_take', 'held_qty': held_qty}
+
+
+#작업 파트
+
+async def reconcile_open_orders():
+    """미체결 주문 체결 대사/취소/재주문 (동기 OrderTracker를 스레드에서 실행) - TRADE_LOCK을 잡은 상태에서 호출"""
+    if base.ORDER_TRACKER.has_open_orders():
+        await asyncio.to_thread(base.run_order_reconcile)
+
+
+async def run_order_reconcile():
+    """주기 작업: 미체결 주문 대사 (취소/재주문으로 계좌가 바뀌므로 손절매 체크/매매 사이클과 TRADE_LOCK으로 직렬화)"""
+    if not base.ORDER_TRACKER.has_open_orders():
+        return
+    async with TRADE_LOCK:
+        await reconcile_open_orders()
+
+
+async def run_stop_loss_sweep():
+    """보유 종목 손절매 체크: 잔고 1회 조회 + 보유 종목 현재가 동시 조회 → 손절 매도 동시 전송"""
+    started = time.perf_counter()
+    async with TRADE_LOCK:
+        holdings = await refresh_holdings_snapshot()
+        held = [symbol for symbol in base.SYMBOLS if symbol in holdings]
+        prices = await asyncio.gather(*(fetch_current_price(symbol) for symbol in held))
+
+        intents = []
+        for symbol, current_price in zip(held, prices):
+            if current_price is None or current_price <= 0:
+                send_message(f"⚠️ {symbol} 현재가 조회 실패로 손절매 건너뜀", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+                continue
+            info = holdings[symbol]
+            loss_percent = float(info['profit_rate'])
+            stop_loss_percent = base.get_symbol_config(symbol)['stop_loss_percent']
+            if loss_percent > -stop_loss_percent:
+                continue
+            send_message(f"⚠️ 손절매 조건 충족: {symbol} (매입가 ${float(info['purchase_price']):.2f}, 현재가 ${current_price:.2f}, "
+                         f"손실률 {loss_percent:.2f}% / 기준 -{stop_loss_percent}%)", symbol, level=MESSAGE_LEVEL_CRITICAL)
+            intents.append({'symbol': symbol, 'qty': base.get_held_quantity(info['qty']), 'price': current_price,
+                            'trade_type': 'sell_stop_loss', 'held_qty': base.get_held_quantity(info['qty'])})
+        await asyncio.gather(*(execute_sell(intent) for intent in intents))
+    base.LAST_STOP_LOSS_CHECK_TIME = time.time()
+    base.STAGE_TIMER.add('run_stop_loss_sweep', time.perf_counter() - started)
+
+
+async def run_trading_cycle():
+    """RSI + 이동평균 매매 사이클: 전 종목 동시 조회 → 종목별 판단(동기) → 매도/매수 주문 동시 전송"""
+    started = time.perf_counter()
+    async with TRADE_LOCK:
+        # 이전 사이클 주문의 체결 반영
+        try:
+            await reconcile_open_orders()
+        except Exception as e:
+            send_message(f"주문 체결 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+
+        # 보유 잔고(거래소별)와 전 종목 분봉을 한 번에 동시 조회
+        cycle_started_at = time.time()
+        with base.STAGE_TIMER.stage('analysis_gather'):
+            holdings, results = await asyncio.gather(
+                refresh_holdings_snapshot(),
+                asyncio.gather(*(analyze_symbol(symbol) for symbol in base.SYMBOLS)),
+            )
+        analysis_wall_time = time.time() - cycle_started_at
+
+        # 종목별 판단은 SYMBOLS 순서대로 (조회/주문 없음)
+        buy_candidates = []
+        sell_intents = []
+        for symbol, analysis, _, elapsed in results:
+            try:
+                buy_candidate, sell_intent = decide_symbol(symbol, analysis, holdings)
+            except Exception as e:
+                send_message(f"🚨 {symbol} 처리 중 오류: {str(e)}")
+                continue
+            if buy_candidate:
+                buy_candidates.append(buy_candidate)
+            if sell_intent:
+                sell_intents.append(sell_intent)
+
+        # 매도 먼저 동시 전송 → 매수 배분 (주문 가능 금액 1회 조회)
+        with base.STAGE_TIMER.stage('order_submit'):
+            await asyncio.gather(*(execute_sell(intent) for intent in sell_intents))
+            try:
+                await execute_buy_allocation(buy_candidates)
+            except Exception as e:
+                send_message(f"매수 배분 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+
+    slowest = max(results, key=lambda item: item[3], default=None)
+    cycle_log = (f"⏱ 분석 사이클 {time.time() - cycle_started_at:.1f}초 (동시 조회 {analysis_wall_time:.1f}초, "
+                 f"{len(base.SYMBOLS)}종목, 동시 요청 {ASYNC_MAX_IN_FLIGHT})")
+    if slowest:
+        cycle_log += f" | 최대 조회 지연 {slowest[0]} {slowest[3]:.1f}초"
+    print(cycle_log)
+    send_message(cycle_log, level=MESSAGE_LEVEL_DEBUG)
+    api_line = base.API_METRICS.end_cycle(label=API_METRICS_LABEL)
+    print(api_line)
+    send_message(api_line, level=MESSAGE_LEVEL_DEBUG)
+    base.STAGE_TIMER.add('run_trading_cycle', time.perf_counter() - started)
+
+
+async def run_job(name, job):
+    """작업 1회 실행 (오류는 알림 후 다음 회차에 다시 실행)"""
+    try:
+        await job()
+    except Exception as e:
+        send_message(f"🚨 [{name} 작업 오류] {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+        if 'access_token' in str(e).lower():
+            await asyncio.to_thread(base.get_access_token)
+
+
+async def run_periodic(name, interval, job, stop_event, first_delay=0):
+    """stop_event가 켜질 때까지 interval초마다 job 실행 (실행 중에는 중단하지 않음 - 주문 도중 취소 방지)"""
+    if await wait_or_stop(stop_event, first_delay):
+        return
+    while True:
+        await run_job(name, job)
+        if await wait_or_stop(stop_event, interval):
+            return
+
+
+async def run_rsi_checks(stop_event, initial_check):
+    """봉 마감 시각마다 매매 사이클 (initial_check면 즉시 1회 먼저)"""
+    if initial_check:
+        await run_job('rsi_initial', run_trading_cycle)
+    while True:
+        next_run = base.get_next_candle_check_time(time.time())
+        if next_run is None:
+            return
+        next_check = datetime.fromtimestamp(next_run, timezone('America/New_York'))
+        send_message(f"⏳ 다음 기술적 분석: {next_check.strftime('%H:%M:%S')} (뉴욕)", level=MESSAGE_LEVEL_DEBUG)
+        if await wait_or_stop(stop_event, next_run - time.time()):
+            return
+        await run_job('rsi_check', run_trading_cycle)
+
+
+async def run_trading_session(initial_check):
+    """장중: 손절매 주기 체크, 봉 마감 분석, 체결 대사를 독립 태스크로 실행하고 마감 시각에 정리"""
+    close_time = base.get_market_close_time(time.time())
+    stop_event = asyncio.Event()
+    tasks = [
+        asyncio.create_task(run_periodic('stop_loss', base.STOP_LOSS_CHECK_INTERVAL * 60, run_stop_loss_sweep, stop_event)),
+        asyncio.create_task(run_rsi_checks(stop_event, initial_check)),
+        asyncio.create_task(run_periodic('order_reconcile', base.ORDER_RECONCILE_INTERVAL, run_order_reconcile,
+                                         stop_event, first_delay=base.ORDER_RECONCILE_INTERVAL)),
+    ]
+    try:
+        await sleep_until(close_time)
+    finally:
+        # 진행 중인 작업은 끝까지 실행한 뒤 종료
+        stop_event.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def on_market_open():
+    print("🔔 미국 시장이 개장되었습니다!")
+    send_message("🔔 미국 시장이 개장되었습니다!", level=MESSAGE_LEVEL_CRITICAL)
+    if base.DAILY_SUMMARY_DATA:
+        print("📊 새로운 거래일 시작 - 이전 데이터 정리 중...")
+        base.DAILY_SUMMARY_DATA.clear()
+    if not await asyncio.to_thread(base.refresh_token):
+        send_message("토큰 갱신에 실패했습니다. 요청 시 다시 발급합니다.", level=MESSAGE_LEVEL_CRITICAL)
+
+
+async def on_market_close():
+    """장 마감: 남은 체결 반영/당일 주문 소멸 처리, 일일 요약 발송"""
+    async with TRADE_LOCK:
+        try:
+            await asyncio.to_thread(base.ORDER_TRACKER.reconcile)
+        except Exception as e:
+            send_message(f"주문 체결 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+        for order in base.ORDER_TRACKER.expire_all():
+            send_message(f"⌛ {order.symbol} 미체결 {order.remaining_qty}주 장 마감으로 소멸", order.symbol, level=MESSAGE_LEVEL_IMPORTANT)
+    print("🔔 미국 시장이 마감되었습니다. 다음 개장일까지 대기합니다...")
+    send_message("🔔 미국 시장이 마감되었습니다. 다음 개장일까지 대기합니다...", level=MESSAGE_LEVEL_CRITICAL)
+    if base.DAILY_SUMMARY_DATA:
+        send_message("📊 자동 매매 요약 리포트를 발송하겠습니다", level=MESSAGE_LEVEL_CRITICAL)
+    await asyncio.sleep(base.DAILY_SUMMARY_DELAY)
+    await asyncio.to_thread(base.run_daily_summary)
+
+
+async def prewarm_market_open():
+    """개장 직전 준비: 토큰 갱신, 보유 잔고 스냅샷, 전 종목 분봉 저장소/지표 상태 갱신 (260517 prewarm_market_open과 동일)"""
+    started_at = time.time()
+    if not await asyncio.to_thread(base.refresh_token):
+        send_message("개장 전 토큰 갱신 실패, 개장 시 다시 시도합니다.", level=MESSAGE_LEVEL_IMPORTANT)
+        return
+    _, results = await asyncio.gather(
+        refresh_holdings_snapshot(),
+        asyncio.gather(*(analyze_symbol(symbol) for symbol in base.SYMBOLS)),
+    )
+    ready = sum(1 for _, analysis, _, _ in results if analysis)
+    print(f"⏱ 개장 전 준비 완료: {time.time() - started_at:.1f}초 (분석 준비 {ready}/{len(base.SYMBOLS)}종목)")
+
+
+async def run_market_sessions():
+    """개장 대기 → 장중 작업 → 마감 처리 반복 (거래소 달력 기준, 시작 시 장중이면 바로 분석 1회)"""
+    calendar = base.MARKET_CALENDAR
+    initial_check = True
+    while True:
+        if not base.is_market_time():
+            open_dt, close_dt = calendar.next_session(time.time())
+            note = calendar.describe(open_dt.date())
+            send_message(f"다음 개장: {open_dt.strftime('%Y-%m-%d %H:%M')} ~ {close_dt.strftime('%H:%M')} (뉴욕)"
+                         f"{f' - {note}' if note else ''}", level=MESSAGE_LEVEL_IMPORTANT)
+            prewarm_time = open_dt.timestamp() - base.MARKET_PREWARM_MINUTES * 60
+            if base.MARKET_PREWARM_MINUTES > 0 and prewarm_time > time.time():
+                await sleep_until(prewarm_time)
+                await run_job('market_prewarm', prewarm_market_open)
+            await sleep_until(open_dt.timestamp())
+            await on_market_open()
+        else:
+            note = calendar.describe(calendar.local_date(time.time()))
+            if note:
+                send_message(f"📅 오늘 장 일정: {note}", level=MESSAGE_LEVEL_IMPORTANT)
+        await run_trading_session(initial_check)
+        initial_check = False
+        await on_market_close()
+
+
+async def run_token_refresh():
+    """토큰 갱신 (장중에만, 개장 전에는 prewarm_market_open에서 갱신)"""
+    await asyncio.to_thread(base.run_token_refresh)
+
+
+async def main_async():
+    global TRADE_LOCK
+    TRADE_LOCK = asyncio.Lock()
+    async with AKIS:
+        while not await asyncio.to_thread(base.get_access_token):
+            send_message("토큰 발급 실패, 2분 후 재시도...", level=MESSAGE_LEVEL_IMPORTANT)
+            await asyncio.sleep(120)
+
+        send_message(f"=== 자동매매 프로그램 시작 (asyncio, {base.MARKET}) ===", level=MESSAGE_LEVEL_IMPORTANT)
+        send_message(f"종목: {base.SYMBOLS} | 동시 요청 {ASYNC_MAX_IN_FLIGHT} | 초당 요청 한도 {base.KIS_REQUESTS_PER_SECOND}", level=MESSAGE_LEVEL_INFO)
+        send_message(f"RSI: {base.RSI_PERIODS}일 | 이평: {base.MA_SHORT_PERIOD}/{base.MA_LONG_PERIOD}일 | 분봉: {base.MINUTE_INTERVAL}분", level=MESSAGE_LEVEL_DEBUG)
+
+        forever = asyncio.Event()   # 토큰 갱신은 프로그램이 끝날 때까지
+        await asyncio.gather(
+            run_market_sessions(),
+            run_periodic('token_refresh', base.TOKEN_REFRESH_INTERVAL, run_token_refresh, forever,
+                         first_delay=base.TOKEN_REFRESH_INTERVAL),
+        )
+
+
+def main():
+    # 진단 트리거 등록 (이벤트 루프가 도는 메인 스레드가 샘플링 대상)
+    DIAGNOSTICS.install()
+    while True:
+        try:
+            asyncio.run(main_async())
+        except KeyboardInterrupt:
+            send_message("🛑 자동매매 프로그램 수동 중지", level=MESSAGE_LEVEL_CRITICAL)
+            break
+        except Exception as main_error:
+            send_message(f"🚨 [메인 루프 오류 발생] {str(main_error)}")
+            send_message(f"{RESTART_DELAY // 60}분 후 프로그램을 재시작합니다...")
+            time.sleep(RESTART_DELAY)
+
+
+if __name__ == "__main__":
+    main()
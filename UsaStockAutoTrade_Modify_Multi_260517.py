@@ -37,6 +37,26 @@
 # KEYB 오류 수정 
 # 260517 익절/과매수 매도 시 1주 유지 로직 통합, 부분익절·손절 중복매도 수정
 # 260517 RKLB(로켓랩), XE(엑스에너지) 종목 추가 / MSFT·NFLX 매수비율 0.1%
+# 261018 분봉 로컬 저장소(kis_bars.db) 추가: 마지막 저장 봉 이후만 조회하고 부족한 과거 구간은 필요 시 백필
+# 261018 종목별 증분 RSI/이동평균 상태 추가: 새로 마감된 봉만 반영하고 매 체크마다 DataFrame 재생성 제거
+# 261018 분봉 응답을 decode_bars()로 한 번만 열 배열(BarArray)로 변환해 RSI/이동평균 계산에서 공유
+# 261018 계좌 보유 스냅샷 추가: 종목별 get_stock_balance 호출 대신 NASD/NYSE/AMEX 거래소별 1회 병렬 조회, 매수/매도 성공 시 무효화
+# 261018 종목별 기술적 분석 병렬화: 분석은 스레드 풀(전역 초당 요청 한도 적용)에서 동시에, 매수/매도 판단·주문은 메인 스레드에서 순서대로 실행, 사이클/종목별 지연 시간 로그
+# 261018 공용 KIS 클라이언트(kis_client.py)로 전환: Session 연결 재사용, 타임아웃/재시도 통일, 토큰 재발급은 스레드 간 1회만 수행
+# 261018 토큰 캐시 파일(kis_token_cache.json) 추가: 재시작 시 저장된 토큰 재사용, 만료 1시간 전부터만 재발급
+# 261018 메인 루프 폴링을 이벤트 스케줄러(event_scheduler.py)로 교체: 장 개장/마감, 손절매, 봉 마감 분석, 토큰 갱신, 일일 요약을 마감 시각에 실행
+# 261018 cache_1min 대신 크기 제한 TTL 캐시(ttl_cache.py): 함수별 TTL, 실패 결과 5초만 보관, 동시 조회 1회, 매수/매도 시 주문 가능 금액 캐시 삭제
+# 261018 KIS 실시간 체결가 웹소켓(kis_realtime.py) 구독: 틱마다 손절/부분 익절 확인, 현재가는 실시간 체결가 우선 사용 (끊기면 5분 폴링으로 대체)
+# 261018 주문 전 해시키 발급 왕복 제거(ORDER_USE_HASHKEY), 주문별 전송 지연 기록
+# 261018 주문 체결 추적(kis_orders.py): 거래 기록/보유 스냅샷은 실제 체결 기준, 미체결 주문은 제한 시간 후 취소·매도는 현재가로 재주문
+# 261018 매수 배분 단계 추가: 사이클의 매수 신호를 모은 뒤 주문 가능 금액 1회 조회 → buy_ratio/safety_margin으로 한 번에 수량 계산 (종목 순서와 무관)
+# 261018 디스코드 발송을 알림 서비스(notify_service.py)로 이전: send_message는 큐에 넣고 바로 반환 (발송 전후 2초 대기 제거)
+# 261018 일일 요약 리포트를 전체 종목 Markdown 문서 1개 + 요약 embed로 웹훅 1회 발송 (종목별 분할 발송/대기 제거)
+# 261018 KIS API 호출 계측(kis_metrics.py): tr_id별 지연/상태 코드/재시도/바이트, 사이클마다 호출 예산 한 줄 로그, Prometheus textfile/SQLite 저장
+# 261018 실행 중 진단(diagnostics.py): SIGUSR1 또는 usa_trader.diagnostics.trigger 파일로 스택 샘플링 + 메모리 스냅샷 저장, 작업/단계별 실행 시간 상시 기록
+# 261018 잔고 응답 파싱(parse_exchange_holdings), 분봉 분석(analyze_bars), 부분 익절 수량 계산(partial_profit_take_qty)을 조회/주문과 분리 (asyncio 버전 UsaStockAutoTrade_Async_261018.py와 공유)
+# 261018 거래소 달력(market_calendar.py, market_calendar_us.json): 휴장일/조기 마감 반영한 개장·마감 시각, 개장 5분 전 토큰/잔고/분봉 미리 갱신, 휴장일 토큰 갱신 생략
+# 261018 이동평균을 실제 일봉(kis_daily_bars.py, 거래일당 1회 조회·로컬 저장, 누적 합 O(1))으로 계산, 분봉은 RSI에 필요한 MINUTE_RSI_BARS개만 조회
 
 
 
@@ -45,15 +65,26 @@
 
 # 1파트
 
-import pandas as pd
 import numpy as np
-import requests
 import json
+import os
 import time
 from datetime import datetime, timedelta
 from pytz import timezone
 import yaml
-from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from kis_bar_store import init_bar_store, load_bars, save_bars, get_timestamp_range, clear_bars
+from kis_indicators import IndicatorState, decode_bars, rolling_rsi_last, sma_last
+from kis_client import KISClient
+from event_scheduler import EventScheduler, MISFIRE_SKIP, SCHEDULER_MAX_SLEEP
+from kis_realtime import KISRealtimeFeed, default_ws_url, overseas_subscription
+from ttl_cache import ttl_cache, format_cache_stats
+from kis_orders import OrderTracker, MARKET_OVERSEAS
+from notify_service import create_notifier, build_attachment
+from kis_metrics import APIMetrics
+from diagnostics import Diagnostics, StageTimer
+from market_calendar import MarketCalendar, US_CALENDAR_PATH
+from kis_daily_bars import DailyBarCache, daily_bar_key
 
 # 설정 파일 로드
 with open('config.yaml', encoding='UTF-8') as f:
@@ -284,19 +315,146 @@ SAFETY_MARGIN = DEFAULT_CONFIG['safety_margin']
 MINUTE_INTERVAL = 30               # 분봉 데이터 간격 (분)
 DATA_PERIOD = 3                    # 데이터 수집 기간 (분봉 단위)
 
+# ===== 분봉 로컬 저장소 설정 =====
+# 한 번 받은 분봉은 kis_bars.db에 저장하고, 다음 조회부터는 마지막 저장 봉 이후만 조회
+BAR_STORE_ENABLED = True           # 분봉 로컬 저장소 사용 여부
+MINUTE_PAGE_SIZE = 120             # 분봉 1회 조회 최대 건수 (NREC)
+BAR_BACKFILL_DONE = {}             # 과거 데이터가 더 없어 백필이 끝난 종목 {(symbol, nmin): True}
+if BAR_STORE_ENABLED:
+    init_bar_store()
+# ===== 분봉 로컬 저장소 설정 끝 =====
+
+# ===== 증분 지표 상태 설정 =====
+# 종목별로 RSI/이동평균 누적 상태를 유지하고 새로 마감된 봉만 반영 (진행 중인 마지막 봉은 조회 시에만 반영)
+INDICATOR_STATE_ENABLED = True     # 증분 지표 상태 사용 여부 (False면 기존 전체 재계산)
+INDICATOR_STATE_VERIFY = False     # True면 매 체크마다 기존 전체 재계산 결과와 비교해 불일치 출력
+INDICATOR_STATES = {}              # {(symbol, nmin, rsi_periods, ma_short, ma_long): IndicatorState}
+# ===== 증분 지표 상태 설정 끝 =====
+
 # 체크 주기 설정
-RSI_CHECK_INTERVAL = 19            # RSI 체크 간격 (분)
+RSI_CHECK_ALIGN_MINUTES = 60       # 기술적 분석 간격 (분, 뉴욕 시각 정시 기준 봉 마감에 맞춤 / MINUTE_INTERVAL로 두면 매 분봉 마감마다)
 STOP_LOSS_CHECK_INTERVAL = 5       # 손절매 체크 간격 (분)
 TOKEN_REFRESH_INTERVAL = 10800     # 토큰 갱신 간격 (초, 3시간 = 10800초)
 
+# ===== 이벤트 스케줄러 설정 =====
+# 메인 루프 30초 폴링 대신 다음 작업 마감 시각까지 대기 (장 개장/마감, 손절매, 봉 마감 분석, 토큰 갱신, 일일 요약)
+CANDLE_CLOSE_DELAY = 5             # 봉 마감 후 분석 시작까지 여유 (초, 마감 봉이 조회에 반영되는 시간)
+RSI_CHECK_MISFIRE_GRACE = 300      # 분석 시각을 이 시간(초) 넘게 놓치면 해당 회차는 건너뛰고 다음 봉 마감에 실행
+DAILY_SUMMARY_DELAY = 2            # 장 마감 메시지 후 일일 요약 발송까지 대기 (초)
+LAST_STOP_LOSS_CHECK_TIME = 0      # 마지막 손절매 전체 체크 시각 (epoch 초, 분석 사이클의 중복 손절 체크 방지용)
+SCHEDULER = EventScheduler()
+# ===== 이벤트 스케줄러 설정 끝 =====
+
+# ===== 거래소 달력 설정 =====
+# 정규장 개장/마감 시각은 연도별 휴장일·조기 마감이 들어 있는 달력 파일 기준 (휴장일에는 API 호출 없이 다음 개장까지 대기)
+# 새 연도 추가: python market_calendar.py us 2028
+MARKET_CALENDAR_PATH = US_CALENDAR_PATH    # 미국 거래소 달력 파일 (market_calendar_us.json)
+MARKET_CALENDAR = MarketCalendar(MARKET_CALENDAR_PATH)
+MARKET_PREWARM_MINUTES = 5         # 개장 몇 분 전에 토큰/보유 잔고/분봉 저장소를 미리 갱신할지 (0이면 안 함)
+# ===== 거래소 달력 설정 끝 =====
+
+# ===== 일봉 이동평균 설정 =====
+# 단기/장기 이동평균(MA_SHORT_PERIOD/MA_LONG_PERIOD일)은 분봉 근사 대신 실제 일봉 종가로 계산
+# 일봉은 거래일당 1회 조회해 kis_bars.db에 저장 (재시작해도 재조회 안 함), 장중 당일 봉은 현재가로 반영
+# 분봉은 RSI 계산에 필요한 만큼(MINUTE_RSI_BARS)만 조회 (DATA_PERIOD 페이지 조회는 DAILY_MA_ENABLED = False일 때만)
+DAILY_MA_ENABLED = True            # 일봉 이동평균 사용 여부 (False면 기존 분봉 이동평균)
+DAILY_PAGE_SIZE = 100              # 해외 일봉 1회 조회 최대 건수 (dailyprice)
+MINUTE_RSI_BARS = RSI_PERIODS * 2  # 분봉 조회/보관 봉 수 (RSI 기간 + 1 이상, 증분 상태 재구성 여유 포함)
+DAILY_BARS = DailyBarCache(lambda symbol, min_bars: get_daily_history(symbol, min_bars),
+                           lambda: MARKET_CALENDAR.last_closed_session(time.time()).strftime('%Y%m%d'),
+                           min_bars=MA_LONG_PERIOD, use_store=BAR_STORE_ENABLED)
+# ===== 일봉 이동평균 설정 끝 =====
+
+# ===== 실시간 시세 설정 =====
+# KIS 웹소켓 실시간 체결가(HDFSCNT0)를 구독해 틱마다 손절/부분 익절 확인 (연결이 끊기면 STOP_LOSS_CHECK_INTERVAL 폴링으로 대체)
+REALTIME_ENABLED = True            # 실시간 시세 사용 여부 (websocket-client 패키지 필요)
+REALTIME_WS_URL = default_ws_url(URL_BASE)
+REALTIME_TR_KEY_PREFIX = 'D'       # 구독 키 접두어 ('D': 정규장, 'R': 주간거래)
+REALTIME_PRICE_MAX_AGE = 60        # 실시간 체결가를 현재가로 사용할 최대 경과 시간 (초, 넘으면 REST 조회)
+REALTIME_CHECK_COOLDOWN = 30       # 같은 종목 틱 기반 손절/부분 익절 확인 최소 간격 (초, 틱마다 잔고 조회 방지)
+REALTIME_NOOP_COOLDOWN = 300       # 직전 확인에서 주문하지 않은 종목의 다음 확인까지 간격 (초, 조건 구간에 머무는 동안 반복 확인 방지)
+REALTIME_FEED = None               # 장중에만 실행되는 KISRealtimeFeed
+REALTIME_LAST_CHECK = {}           # {symbol: 마지막 틱 기반 확인 시각}
+REALTIME_NOOP_SYMBOLS = set()      # 직전 틱 기반 확인에서 주문하지 않은 종목 (REALTIME_NOOP_COOLDOWN 적용)
+# ===== 실시간 시세 설정 끝 =====
+
+# ===== 조회 캐시 설정 =====
+# 함수별 TTL, 최대 항목 수(LRU 제거), 실패 결과(None/0)는 짧게 보관 후 재조회, 동시 조회는 1회만 호출
+PRICE_CACHE_TTL = 30               # 현재가 REST 조회 결과 유지 시간 (초, 실시간 체결가가 있으면 그쪽 우선)
+BALANCE_CACHE_TTL = 60             # 주문 가능 금액 유지 시간 (초, 매수/매도 성공 시 즉시 삭제)
+CACHE_FAILURE_TTL = 5              # 조회 실패 결과 유지 시간 (초, 0이면 저장 안 함)
+CACHE_MAX_ENTRIES = 256            # 캐시별 최대 항목 수
+# ===== 조회 캐시 설정 끝 =====
+
 # ===== 일일 거래 요약 데이터 수집 설정 =====
 DAILY_SUMMARY_DATA = {}  # 종목별 일일 분석 데이터 저장
+DAILY_SUMMARY_GZIP = False  # 요약 리포트 첨부 파일 gzip 압축 (디스코드 미리보기는 압축하지 않은 .md만 가능)
 # ===== 일일 거래 요약 데이터 수집 설정 끝 =====
 
 # ===== 부분 익절 추적 설정 =====
 PARTIAL_PROFIT_TAKEN = {}  # 종목별 부분 익절 실행 여부 추적 {symbol: True/False}
 # ===== 부분 익절 추적 설정 끝 =====
 
+# ===== 계좌 보유 스냅샷 설정 =====
+# 보유 잔고(inquire-balance)는 거래소 전체 보유 목록을 반환하므로 거래소별 1회만 조회해 공유
+# 사이클 시작 시 새로 조회하고, 매수/매도 성공 시 무효화
+HOLDINGS_SNAPSHOT_TTL = STOP_LOSS_CHECK_INTERVAL * 60  # 스냅샷 최대 사용 시간 (초)
+HOLDINGS_SNAPSHOT = {'holdings': None, 'fetched_at': 0}  # {'holdings': {pdno: 보유 정보}, 'fetched_at': 조회 시각}
+# ===== 계좌 보유 스냅샷 설정 끝 =====
+
+# ===== 분석 병렬 처리 설정 =====
+# 종목별 분봉 조회+지표 계산은 스레드 풀에서 동시에 실행하고, 주문 판단은 메인 스레드에서 SYMBOLS 순서대로 처리
+ANALYSIS_MAX_WORKERS = 4           # 동시에 분석할 최대 종목 수
+KIS_REQUESTS_PER_SECOND = 10       # 전체 스레드 합산 KIS API 초당 요청 한도 (모의투자 계좌는 낮게 설정)
+# ===== 분석 병렬 처리 설정 끝 =====
+
+# ===== API 호출 계측 설정 =====
+# 모든 KIS 호출을 tr_id별로 기록 (지연 히스토그램, 상태 코드, 재시도, 바이트) → 매매 사이클마다 한 줄 요약
+# 누적 집계는 Prometheus textfile, 사이클별 tr_id 집계는 SQLite(api_cycle_metrics, 스크립트 파일명 포함)로 저장
+API_METRICS_PROM_PATH = 'kis_metrics_us.prom'  # Prometheus textfile (None이면 저장 안 함)
+API_METRICS_DB_PATH = 'kis_metrics.db'     # 주기별 집계 DB (미국/국내 트레이더 공유, None이면 저장 안 함)
+KIS_API_RATE_LIMIT = 20                    # KIS 초당 호출 한도 (실전 계좌 기준, 예산 사용률 표시용)
+API_METRICS_LABEL = os.path.basename(__file__)  # 버전(날짜)별 스크립트 구분
+API_METRICS = APIMetrics('US', rate_limit_per_second=KIS_API_RATE_LIMIT,
+                         prom_path=API_METRICS_PROM_PATH, db_path=API_METRICS_DB_PATH)
+# ===== API 호출 계측 설정 끝 =====
+
+# ===== 실행 중 진단 설정 =====
+# kill -USR1 <pid> 또는 touch usa_trader.diagnostics.trigger → 메인 스레드 스택 샘플링 + tracemalloc 상위 할당을 diagnostics/ 폴더에 저장
+# tracemalloc은 캡처 때만 추적 (config.yaml DIAGNOSTICS_TRACE_FROM_START: true면 시작부터 추적 - 메모리 누수 조사용)
+# 스케줄러 작업/사이클 단계별 실행 시간은 상시 기록 (일일 요약 발송 시 로그 출력 후 초기화)
+DIAGNOSTICS_SAMPLE_SECONDS = 30    # 스택 샘플링 시간 (초)
+DIAGNOSTICS_TRACE_FROM_START = bool(_cfg.get('DIAGNOSTICS_TRACE_FROM_START', False))  # 시작부터 할당 추적 (기본 끔)
+STAGE_TIMER = StageTimer()
+DIAGNOSTICS = Diagnostics('usa_trader', stages=STAGE_TIMER, sample_seconds=DIAGNOSTICS_SAMPLE_SECONDS,
+                          trace_from_start=DIAGNOSTICS_TRACE_FROM_START,
+                          watch={'DAILY_SUMMARY_DATA': lambda: len(DAILY_SUMMARY_DATA),
+                                 'INDICATOR_STATES': lambda: len(INDICATOR_STATES),
+                                 'ORDER_TRACKER 미체결': lambda: len(ORDER_TRACKER.open_orders())})
+# ===== 실행 중 진단 설정 끝 =====
+
+# ===== KIS API 클라이언트 =====
+# 연결 재사용, 타임아웃/재시도, 토큰 재발급(동시 호출 시 1회), 초당 요청 한도를 공용 클라이언트에서 처리
+TOKEN_CACHE_PATH = 'kis_token_cache.json'  # 토큰 캐시 파일 (국내 트레이더와 공유, 소유자만 읽기/쓰기)
+TOKEN_REFRESH_MARGIN = 3600                # 만료까지 남은 시간이 이보다 짧으면 재발급 (초)
+ORDER_USE_HASHKEY = False                  # 주문 전 해시키 발급 여부 (선택 항목, 끄면 주문당 API 왕복 1회 절약)
+KIS = KISClient(APP_KEY, APP_SECRET, URL_BASE, timeout=10, max_retries=2,
+                requests_per_second=KIS_REQUESTS_PER_SECOND,
+                token_cache_path=TOKEN_CACHE_PATH, token_refresh_margin=TOKEN_REFRESH_MARGIN,
+                order_hashkey=ORDER_USE_HASHKEY, metrics=API_METRICS)
+# ===== KIS API 클라이언트 끝 =====
+
+# ===== 주문 체결 추적 설정 =====
+# 접수된 주문을 추적하고 체결 조회 1회로 미체결 주문 전체를 대사 → 거래 기록/보유 스냅샷은 실제 체결 기준으로 반영
+ORDER_RECONCILE_INTERVAL = 60      # 미체결 주문 체결 조회 간격 (초, 미체결 주문이 없으면 조회 안 함)
+ORDER_FILL_TIMEOUT = 120           # 접수 후 이 시간(초)까지 미체결이면 취소
+ORDER_MAX_REPRICES = 2             # 취소 후 현재가로 재주문하는 최대 횟수
+ORDER_REPRICE_BUY = False          # 매수 미체결도 재주문할지 여부 (False면 취소만 하고 다음 분석에서 다시 판단)
+ORDER_TRACKER = OrderTracker(KIS, CANO, ACNT_PRDT_CD, MARKET_OVERSEAS,
+                             on_fill=lambda order, qty, price: on_order_fill(order, qty, price),
+                             fill_timeout=ORDER_FILL_TIMEOUT)
+# ===== 주문 체결 추적 설정 끝 =====
+
 # 익절/과매수 매도 시 최소 1주 유지 (손절매는 전량 매도)
 def get_held_quantity(qty):
     """보유 수량을 정수로 변환"""
@@ -340,29 +498,32 @@ MESSAGE_LEVEL_DEBUG = 4       # 상세 디버그 정보
 # 전송할 메시지 레벨 (1=중요한 것만, 4=모든 메시지)
 MESSAGE_SEND_LEVEL = MESSAGE_LEVEL_IMPORTANT
 
-# 반복 메시지 필터링
+# 반복 메시지 필터링 (알림 서비스에서 처리)
 MESSAGE_COOLDOWN = 300        # 같은 메시지 재전송 방지 시간 (초)
-MESSAGE_HISTORY = {}          # 메시지 히스토리 저장
 
-# 배치 발송 설정
+# 배치 발송 설정 (알림 서비스에서 처리)
 ENABLE_BATCH_SEND = True      # 배치 발송 활성화
 BATCH_SEND_INTERVAL = 60      # 배치 발송 간격 (초)
 MAX_BATCH_SIZE = 10           # 최대 배치 크기
-MESSAGE_BATCH = []            # 배치 메시지 저장
-LAST_BATCH_SEND = 0           # 마지막 배치 발송 시간
 
 # AWS 환경에서 메시지 압축
 ENABLE_MESSAGE_COMPRESSION = True  # 메시지 압축 활성화
 # ===== 메시지 최적화 설정 끝 =====
 
-# ===== 전역 전송 레이트 리미터 설정 =====
-LAST_DISCORD_SEND_TIME = 0
+# ===== 알림 서비스 설정 =====
+# 디스코드 발송(레이트 리밋, 429 retry_after, 중복 제거, 배치, 재시도)은 notify_service.py 백그라운드 스레드/서버가 담당
+# send_message는 큐에 넣고 바로 반환 → 매매 스레드가 디스코드 응답을 기다리지 않음
 MIN_DISCORD_SEND_INTERVAL = 2  # 초 단위 최소 간격
+NOTIFY_SERVER_ADDRESS = tuple(_cfg['NOTIFY_SERVER_ADDRESS']) if _cfg.get('NOTIFY_SERVER_ADDRESS') else None  # 로컬 알림 서버 (없으면 프로세스 안에서 직접 발송)
+NOTIFY_AUTHKEY = _cfg.get('NOTIFY_AUTHKEY')  # 알림 서버와 공유하는 비밀값 (없으면 알림 서버를 쓰지 않고 직접 발송)
+NOTIFY_SOURCE = 'US'          # 중복 제거 키 구분 (같은 알림 서버를 쓰는 다른 봇과 구분)
+NOTIFIER = create_notifier(DISCORD_WEBHOOK_URL, address=NOTIFY_SERVER_ADDRESS, authkey=NOTIFY_AUTHKEY,
+                           min_interval=MIN_DISCORD_SEND_INTERVAL, batch_interval=BATCH_SEND_INTERVAL,
+                           max_batch_size=MAX_BATCH_SIZE, dedup_window=MESSAGE_COOLDOWN)
+# ===== 알림 서비스 설정 끝 =====
 
 def send_message(msg, symbol=None, level=MESSAGE_LEVEL_INFO):
-    """디스코드 메시지 전송 (최적화된 버전)"""
-    global MESSAGE_HISTORY, MESSAGE_BATCH, LAST_BATCH_SEND
-    
+    """디스코드 메시지 전송 (알림 서비스 큐에 넣고 바로 반환, 스레드 안전)"""
     # 메시지 레벨 필터링
     if level > MESSAGE_SEND_LEVEL:
         return  # 설정된 레벨보다 낮은 중요도면 전송하지 않음
@@ -381,26 +542,15 @@ def send_message(msg, symbol=None, level=MESSAGE_LEVEL_INFO):
             msg = compress_message(str(msg))
         full_message = f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] {symbol_info}{str(msg)}"
     
-    # 반복 메시지 필터링
-    msg_hash = hash(f"{symbol}_{msg}")
-    current_time = time.time()
-    
-    if msg_hash in MESSAGE_HISTORY:
-        if current_time - MESSAGE_HISTORY[msg_hash] < MESSAGE_COOLDOWN:
-            return  # 쿨다운 시간 내 같은 메시지는 전송하지 않음
-    
-    MESSAGE_HISTORY[msg_hash] = current_time
-    
-    # 배치 발송 처리
+    # 반복 메시지 필터링/배치 발송은 알림 서비스에서 처리 (쿨다운 시간 내 같은 메시지는 전송하지 않음)
+    dedup_key = f"{NOTIFY_SOURCE}_{symbol}_{msg}"
     if ENABLE_BATCH_SEND and level > MESSAGE_LEVEL_CRITICAL:
-        MESSAGE_BATCH.append(full_message)
-        
-        # 배치가 가득 찼거나 시간이 지났으면 발송
-        if len(MESSAGE_BATCH) >= MAX_BATCH_SIZE or (current_time - LAST_BATCH_SEND) >= BATCH_SEND_INTERVAL:
-            send_batch_messages()
+        queued = NOTIFIER.add_to_batch(full_message, dedup_key)
     else:
         # 중요한 메시지는 즉시 발송
-        send_immediate_message(full_message)
+        queued = NOTIFIER.send(full_message, dedup_key)
+    if not queued:
+        return
     
     # 콘솔 출력 (로컬 디버깅용)
     print(f"[Level {level}] {full_message}")
@@ -420,52 +570,6 @@ def compress_message(msg):
     
     return compressed.strip()
 
-def send_immediate_message(message):
-    """즉시 메시지 발송 (레이트 리미터 적용)"""
-    global LAST_DISCORD_SEND_TIME
-    try:
-        # 전송 간 최소 간격 보장 (2초)
-        now = time.time()
-        elapsed = now - LAST_DISCORD_SEND_TIME
-        if elapsed < MIN_DISCORD_SEND_INTERVAL:
-            time.sleep(MIN_DISCORD_SEND_INTERVAL - elapsed)
-        message_data = {"content": message}
-        requests.post(DISCORD_WEBHOOK_URL, data=message_data, timeout=5)
-        LAST_DISCORD_SEND_TIME = time.time()
-        # 추가 안전장치: 발송 후 2초 대기
-        time.sleep(2)
-    except Exception as e:
-        print(f"메시지 발송 실패: {e}")
-
-def send_batch_messages():
-    """배치 메시지 발송 (레이트 리미터 적용)"""
-    global MESSAGE_BATCH, LAST_BATCH_SEND, LAST_DISCORD_SEND_TIME
-    
-    if not MESSAGE_BATCH:
-        return
-    
-    try:
-        # 배치 메시지를 하나로 합치기
-        batch_content = "\n".join(MESSAGE_BATCH[-MAX_BATCH_SIZE:])  # 최대 크기 제한
-        message_data = {"content": f"📊 **배치 업데이트**\n```\n{batch_content}\n```"}
-        
-        # 전송 간 최소 간격 보장 (2초)
-        now = time.time()
-        elapsed = now - LAST_DISCORD_SEND_TIME
-        if elapsed < MIN_DISCORD_SEND_INTERVAL:
-            time.sleep(MIN_DISCORD_SEND_INTERVAL - elapsed)
-        requests.post(DISCORD_WEBHOOK_URL, data=message_data, timeout=10)
-        LAST_DISCORD_SEND_TIME = time.time()
-        MESSAGE_BATCH.clear()
-        LAST_BATCH_SEND = time.time()
-        
-        # 추가 안전장치: 발송 후 2초 대기
-        time.sleep(2)
-        
-        print(f"배치 메시지 발송 완료: {len(MESSAGE_BATCH)} 건")
-    except Exception as e:
-        print(f"배치 메시지 발송 실패: {e}")
-
 def collect_daily_summary_data(symbol, analysis_result, buy_signal, sell_signal, buy_reason, sell_reason, trade_failure_reason=None):
     """일일 거래 요약 데이터 수집
     trade_failure_reason: 거래 미진행 사유 ('insufficient_balance': 잔고 부족, 'condition_not_met': 조건 미충족, None: 정상)
@@ -810,61 +914,58 @@ def generate_daily_summary_messages(symbol):
     
     return messages
 
+def render_daily_summary_report(current_date):
+    """전체 종목 일일 요약을 Markdown 문서 1개로 생성 (종목별 generate_daily_summary_messages 결과를 이어 붙임)"""
+    sections = [f"# 미국 자동 매매 일일 요약 ({current_date})"]
+    for symbol in DAILY_SUMMARY_DATA:
+        messages = generate_daily_summary_messages(symbol)
+        if not messages:
+            print(f"❌ {symbol} 메시지 생성 실패")
+            continue
+        sections.append("---")
+        sections.extend(message.strip() for message in messages)
+    return "\n\n".join(sections) + "\n"
+
+def build_daily_summary_embed(current_date):
+    """요약 embed (종목 수, 신호/거래 건수, 거래 내역 최대 10건)"""
+    buy_signals = sum(len(data['buy_signals']) for data in DAILY_SUMMARY_DATA.values())
+    sell_signals = sum(len(data['sell_signals']) for data in DAILY_SUMMARY_DATA.values())
+    trades = [(symbol, trade) for symbol, data in DAILY_SUMMARY_DATA.items() for trade in data['trades']]
+    trade_lines = [f"{trade['time']} {symbol} {trade['type']} {trade['qty']}주 @ ${trade['price']:.2f}"
+                   for symbol, trade in trades[:10]]
+    if len(trades) > 10:
+        trade_lines.append(f"... 외 {len(trades) - 10}건 (첨부 리포트 참고)")
+    return {
+        "title": f"📊 미국 자동 매매 일일 요약 ({current_date})",
+        "description": (f"종목 {len(DAILY_SUMMARY_DATA)}개 | 매수 신호 {buy_signals}회 · 매도 신호 {sell_signals}회 | 거래 {len(trades)}건\n"
+                        "종목별 상세 내용은 첨부 리포트 참고"),
+        "fields": [{"name": "거래 내역", "value": "\n".join(trade_lines) or "거래 없음", "inline": False}],
+    }
+
 def send_daily_summary():
-    """일일 요약 메시지 발송 (분할 발송)"""
-    global DAILY_SUMMARY_DATA
-    
-    # DAILY_SUMMARY_DATA가 비어있는 경우 처리
+    """일일 요약 리포트 발송 (전체 종목 리포트 첨부 파일 + 요약 embed, 웹훅 요청 1회)"""
     if not DAILY_SUMMARY_DATA:
         send_message("📊 오늘은 거래 데이터가 없어 요약 리포트를 발송하지 않습니다", level=MESSAGE_LEVEL_CRITICAL)
         return
-    
-    # 디스코드 연속 발송 오류 예방: 요약 시작 전 2초 대기
-    time.sleep(2)
-    
-    for symbol_index, symbol in enumerate(DAILY_SUMMARY_DATA.keys()):
-        messages = generate_daily_summary_messages(symbol)
-        if messages:
-            for i, message in enumerate(messages):
-                if i == 0:
-                    # 심볼 간 구분을 위해 심볼 위에 구분선과 빈 줄 2줄 추가
-                    send_message("***************************************", level=MESSAGE_LEVEL_CRITICAL)
-                    send_message("", level=MESSAGE_LEVEL_CRITICAL)
-                    send_message("", level=MESSAGE_LEVEL_CRITICAL)
-                    # 첫 번째 메시지에 종목명 포함
-                    send_message(message, symbol, level=MESSAGE_LEVEL_CRITICAL)
-                else:
-                    # 나머지 메시지는 종목명 없이 발송
-                    send_message(message, level=MESSAGE_LEVEL_CRITICAL)
-                # 메시지 간 2초 간격 (send_message 내부에서 추가 2초 대기 포함)
-                time.sleep(2)
-    
-    # 오래된 메시지 히스토리 정리
-    global MESSAGE_HISTORY
-    current_time = time.time()
-    MESSAGE_HISTORY = {k: v for k, v in MESSAGE_HISTORY.items() 
-                      if current_time - v < MESSAGE_COOLDOWN * 2}
+
+    started_at = time.time()
+    current_date = datetime.now(timezone('Asia/Seoul')).strftime('%Y-%m-%d')
+    report = render_daily_summary_report(current_date)
+    filename, data = build_attachment(report, f"daily_summary_US_{current_date}.md", compress=DAILY_SUMMARY_GZIP)
+    # 발송은 알림 서비스 스레드에서 처리 (여기서는 큐에 넣고 바로 반환)
+    NOTIFIER.send_file(filename, data, embeds=[build_daily_summary_embed(current_date)])
+    print(f"📊 일일 요약 리포트 발송 요청: {filename} ({len(data):,} bytes, 종목 {len(DAILY_SUMMARY_DATA)}개, {time.time() - started_at:.2f}초)")
 
 
 def get_access_token():
-    """토큰 발급 (오류 처리 추가)"""
+    """토큰 발급 (공용 KIS 클라이언트 - 여러 스레드가 동시에 호출해도 1회만 발급)"""
     global ACCESS_TOKEN
     try:
-        headers = {"content-type":"application/json"}
-        body = {"grant_type":"client_credentials",
-        "appkey":APP_KEY, 
-        "appsecret":APP_SECRET}
-        PATH = "oauth2/tokenP"
-        URL = f"{URL_BASE}/{PATH}"
-        res = requests.post(URL, headers=headers, data=json.dumps(body))
-        
-        # 응답 확인
-        if res.status_code != 200:
-            send_message(f"토큰 발급 실패: 상태 코드 {res.status_code}", level=MESSAGE_LEVEL_CRITICAL)
+        token = KIS.refresh_token()
+        if not token:
+            send_message("토큰 발급 실패", level=MESSAGE_LEVEL_CRITICAL)
             return None
-            
-        ACCESS_TOKEN = res.json()["access_token"]
-        print(f"새로운 토큰 발급")
+        ACCESS_TOKEN = token
         return ACCESS_TOKEN
     except Exception as e:
         send_message(f"🚨 토큰 발급 중 오류 발생: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
@@ -885,110 +986,174 @@ def refresh_token():
         send_message(f"🚨 토큰 갱신 중 오류 발생: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
         return False
 
-def hashkey(datas):
-    """암호화"""
-    try:
-        PATH = "uapi/hashkey"
-        URL = f"{URL_BASE}/{PATH}"
-        headers = {
-        'content-Type' : 'application/json',
-        'appKey' : APP_KEY,
-        'appSecret' : APP_SECRET,
-        }
-        res = requests.post(URL, headers=headers, data=json.dumps(datas))
-        hashkey = res.json()["HASH"]
-        return hashkey
-    except Exception as e:
-        send_message(f"🚨 해시키 생성 중 오류 발생: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
-        return None
-
 def is_market_time():
-    """미국 시장 시간 체크"""
+    """미국 시장 시간 체크 (거래소 달력 기준 - 휴장일/조기 마감 반영)"""
     try:
-        NAS_time = datetime.now(timezone('America/New_York'))
-        # print(f"현재 미국시간: {NAS_time.strftime('%Y-%m-%d %H:%M:%S')}")  # 로그 스팸 방지
-        
-        if NAS_time.weekday() >= 5:
-            print("주말 - 시장 닫힘")
-            return False
-            
-        market_start = NAS_time.replace(hour=9, minute=30, second=0, microsecond=0)
-        market_end = NAS_time.replace(hour=16, minute=0, second=0, microsecond=0)
-        is_market_open = market_start <= NAS_time <= market_end
-        
-        # print(f"시장 개장 상태: {'열림' if is_market_open else '닫힘'}")  # 로그 스팸 방지
-        return is_market_open
+        return MARKET_CALENDAR.is_open(time.time())
     except Exception as e:
         send_message(f"🚨 시장 시간 확인 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
         # 오류 발생 시 기본적으로 닫힘으로 처리
         return False
 
 
-def wait_for_market_open():
-    """시장 개장 대기 (주말 처리 개선)"""
-    try:
-        send_message("미국 시장이 닫혀 있습니다. 개장까지 대기합니다...", level=MESSAGE_LEVEL_IMPORTANT)
-        
-        while not is_market_time():
-            # 현재 미국 시간 확인
-            nas_time = datetime.now(timezone('America/New_York'))
-            
-            # 다음 체크 시간 결정
-            next_check = 60  # 기본 대기 시간 60분
-            
-            # 개장일(월~금) 확인
-            weekday = nas_time.weekday()  # 0=월요일, 6=일요일
-            is_weekend = weekday >= 5  # 주말 여부
-            
-            if is_weekend:
-                # 일요일 && 15시 이후 - 개장 임박
-                if weekday == 6 and nas_time.hour >= 15:
-                    next_check = 180
-                # 토요일 또는 일요일 오전 - 여전히 많은 시간 남음
-                else:
-                    next_check = 240  # 주말에는 4시간 간격으로 체크
-            else:
-                # 평일
-                # 16시 이후 또는 00시~08시까지는 240분 단위 대기 120
-                if nas_time.hour >= 16 or nas_time.hour < 8:
-                    next_check = 240
-                # 08시~09시 - 개장 준비 시간
-                elif nas_time.hour == 8:
-                    next_check = 15  # 15분 간격으로 체크
-                # 09시 이후부터 개장 전(09:30 전)까지는 5분 단위 대기
-                elif nas_time.hour == 9 and nas_time.minute < 30:
-                    next_check = 5
-                else:
-                    next_check = 30  # 다른 평일 시간대
-            
-            #send_message(f"다음 확인까지 {next_check}분 대기... (미국시간: {nas_time.strftime('%Y-%m-%d %H:%M')} {['월','화','수','목','금','토','일'][weekday]}요일)")
-            time.sleep(next_check * 60)
-        
-        send_message("미국 시장이 개장되었습니다!", level=MESSAGE_LEVEL_IMPORTANT)
-        if not refresh_token():  # 시장 개장 시 토큰 갱신
-            send_message("토큰 갱신에 실패했습니다. 1.5분 후 다시 시도합니다.", level=MESSAGE_LEVEL_CRITICAL)
-            time.sleep(90)
-            refresh_token()
-    except Exception as e:
-        send_message(f"🚨 시장 개장 대기 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
-        time.sleep(60)  # 오류 발생 시 1분 대기 후 재시도
+def get_market_session(day):
+    """해당 일자(뉴욕)의 정규장 (개장, 마감) 시각 - 주말/휴장일이면 None, 조기 마감일은 실제 마감 시각"""
+    return MARKET_CALENDAR.session(day)
+
+
+def get_next_market_open_time(now):
+    """now(epoch 초) 이후 첫 개장 시각 (epoch 초, 휴장일 건너뜀)"""
+    return MARKET_CALENDAR.next_open(now)
+
+
+def get_market_close_time(now):
+    """now(epoch 초)가 속한 거래일의 마감 시각 (epoch 초)"""
+    day = datetime.fromtimestamp(now, timezone('America/New_York')).date()
+    session = get_market_session(day)
+    if session is None:
+        return now
+    return session[1].timestamp()
+
+
+def get_next_candle_check_time(now):
+    """now 이후 다음 기술적 분석 시각 (RSI_CHECK_ALIGN_MINUTES 봉 마감 + CANDLE_CLOSE_DELAY, 장 마감 이후면 None)"""
+    ny_now = datetime.fromtimestamp(now, timezone('America/New_York'))
+    session = get_market_session(ny_now.date())
+    if session is None:
+        return None
+    open_dt, close_dt = session
+    align = RSI_CHECK_ALIGN_MINUTES * 60
+    midnight = open_dt.replace(hour=0, minute=0)
+    boundary = open_dt.timestamp() - (open_dt.timestamp() - midnight.timestamp()) % align + align
+    while boundary + CANDLE_CLOSE_DELAY <= now:
+        boundary += align
+    # 마감 시각 봉은 장이 끝난 뒤라 주문할 수 없으므로 제외
+    if boundary >= close_dt.timestamp():
+        return None
+    return boundary + CANDLE_CLOSE_DELAY
 
 #2파트
 
-def get_minute_data(symbol, nmin=30, period=2, access_token=""):
-    """분봉 데이터 조회 (다중 심볼 대응 + 토큰 오류 처리)"""
-    global ACCESS_TOKEN
-    
-    # print(f"분봉 데이터 조회 시작 - 종목: {symbol}, 시간간격: {nmin}분")  # 로그 스팸 방지
+def minute_bar_key(row):
+    """분봉 행의 저장 키 (거래소 현지 일자+시각, YYYYMMDDHHMMSS)"""
+    xymd = row.get('xymd', '')
+    xhms = row.get('xhms', '')
+    if not xymd or not xhms:
+        return None
+    return f"{xymd}{xhms}"
+
+def shift_bar_key(bar_key, minutes):
+    """저장 키 시각을 분 단위로 이동 (다음 페이지 KEYB 계산용)"""
+    shifted = datetime.strptime(bar_key, '%Y%m%d%H%M%S') + timedelta(minutes=minutes)
+    return shifted.strftime('%Y%m%d%H%M%S')
+
+def count_missing_bars(last_bar_key, nmin):
+    """마지막 저장 봉 이후 새로 생겼을 봉 수 (진행 중이던 마지막 봉 재조회 포함)"""
+    try:
+        now = datetime.now(timezone('America/New_York')).replace(tzinfo=None)
+        last_bar = datetime.strptime(last_bar_key, '%Y%m%d%H%M%S')
+        elapsed_minutes = (now - last_bar).total_seconds() / 60
+        return int(min(MINUTE_PAGE_SIZE, max(2, elapsed_minutes // nmin + 2)))
+    except ValueError:
+        return MINUTE_PAGE_SIZE
+
+def fetch_minute_page(symbol, nmin, access_token, next_key="", keyb="", nrec=MINUTE_PAGE_SIZE):
+    """분봉 1페이지 조회 (만료 토큰 재발급/재시도는 KIS 클라이언트에서 처리)
+    반환: (분봉 리스트, 다음 페이지 키) / 요청 실패 시 (None, "")
+    """
     PATH = "/uapi/overseas-price/v1/quotations/inquire-time-itemchartprice"
-    URL = f"{URL_BASE}/{PATH}"
-    
+
     # 해당 심볼의 거래소 정보 가져오기 (전역 MARKET_MAP 사용)
     market_info = MARKET_MAP.get(symbol, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
-    
+
+    params = {
+        "AUTH": "",
+        "EXCD": market_info["EXCD"],
+        "SYMB": symbol,
+        "NMIN": str(nmin),
+        "PINC": "1",
+        "NEXT": next_key,
+        "NREC": str(nrec),
+        "FILL": "Y",
+        "KEYB": keyb
+    }
+
+    try:
+        # 토큰 만료 시 재발급/재시도는 KIS 클라이언트에서 처리
+        res = KIS.get(PATH, 'HHDFS76950200', params)
+        if res is None:
+            print("토큰 발급 실패로 분봉 조회 불가")
+            return None, ""
+
+        if res.status_code == 200:
+            data = res.json()
+            if "output2" in data and data["output2"]:
+                return data["output2"], data.get("output1", {}).get("next", "")
+            # 데이터가 없을 때 API 응답 전체 출력 (원인 파악용)
+            print(f" 요청 코드: {symbol}, 거래소: {market_info['MARKET']}")
+            try:
+                print("  → API 응답(원문):", json.dumps(data, ensure_ascii=False, indent=2))
+            except Exception:
+                print("  → API 응답(원문):", res.text[:2000] if res.text else "(없음)")
+            return [], ""
+
+        print(f"API 호출 실패. 상태 코드: {res.status_code}, 응답 내용: {res.text}")
+        return None, ""
+    except Exception as e:
+        print(f"데이터 요청 중 오류 발생: {e}")
+        time.sleep(1)
+        return None, ""
+
+def fetch_minute_pages(symbol, nmin, access_token, max_pages, stop_key=None, start_keyb="", nrec=MINUTE_PAGE_SIZE):
+    """분봉 여러 페이지 조회 (최신 → 과거 순)
+    stop_key: 이 시각 이하의 봉이 나오면(저장분과 겹치면) 중단
+    start_keyb: 지정 시 해당 시각부터 과거로 조회 (백필용)
+    반환: (분봉 리스트, 저장분과 겹침 여부, 더 과거 데이터 존재 여부)
+    """
     all_data = []
-    next_key = ""
-    
+    next_key = "1" if start_keyb else ""
+    keyb = start_keyb
+    overlapped = False
+    has_more = True
+
+    for page in range(max_pages):
+        rows, next_flag = fetch_minute_page(
+            symbol, nmin, access_token, next_key, keyb,
+            nrec if page == 0 else MINUTE_PAGE_SIZE
+        )
+        access_token = ACCESS_TOKEN or access_token  # 조회 중 재발급된 토큰 반영
+        if rows is None:
+            break
+        if not rows:
+            has_more = False
+            break
+
+        all_data.extend(rows)
+        row_keys = [key for key in map(minute_bar_key, rows) if key]
+        oldest_key = min(row_keys) if row_keys else None
+        if stop_key and oldest_key and oldest_key <= stop_key:
+            overlapped = True
+            break
+        if not next_flag or not oldest_key:
+            has_more = False
+            break
+
+        next_key = next_flag
+        keyb = shift_bar_key(oldest_key, -nmin)
+        time.sleep(0.5)
+
+    return all_data, overlapped, has_more
+
+def get_minute_data(symbol, nmin=30, period=2, access_token="", required_bars=None):
+    """분봉 데이터 조회 (다중 심볼 대응 + 토큰 오류 처리 + 로컬 저장소 증분 조회)
+
+    저장소에 분봉이 있으면 마지막 저장 봉 이후만 조회하고, 필요한 봉 수(required_bars, 기본 period 페이지)보다
+    적으면 과거 구간을 백필한 뒤 저장소에서 최신순으로 돌려줌
+    """
+    global ACCESS_TOKEN
+
+    # print(f"분봉 데이터 조회 시작 - 종목: {symbol}, 시간간격: {nmin}분")  # 로그 스팸 방지
+
     # 토큰 체크
     if not access_token:
         ACCESS_TOKEN = get_access_token()
@@ -999,157 +1164,72 @@ def get_minute_data(symbol, nmin=30, period=2, access_token=""):
             if not ACCESS_TOKEN:
                 return None
         access_token = ACCESS_TOKEN
-        
-    for _ in range(period):
-        params = {
-            "AUTH": "",
-            "EXCD": market_info["EXCD"],
-            "SYMB": symbol,
-            "NMIN": str(nmin),
-            "PINC": "1",
-            "NEXT": next_key,
-            "NREC": "120",
-            "FILL": "Y",
-            "KEYB": ""
-        }
-     
-        headers = {
-            'content-type': 'application/json',
-            'authorization': f'Bearer {access_token}',
-            'appkey': APP_KEY,
-            'appsecret': APP_SECRET,
-            'tr_id': 'HHDFS76950200',
-            'custtype': 'P'
-        }
-        
-        try:
-            res = requests.get(URL, headers=headers, params=params)
-            
-            # 응답 코드가 만료된 토큰 오류인 경우
-            if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-                print("토큰이 만료되었습니다. 새 토큰을 발급합니다.")
-                ACCESS_TOKEN = get_access_token()
-                if ACCESS_TOKEN:
-                    # 새 토큰으로 다시 시도
-                    headers['authorization'] = f'Bearer {ACCESS_TOKEN}'
-                    res = requests.get(URL, headers=headers, params=params)
-                else:
-                    print("토큰 재발급 실패, 1분 후 다시 시도합니다.")
-                    time.sleep(60)
-                    continue
-            
-            if res.status_code == 200:
-                data = res.json()
-                if "output2" in data and data["output2"]:
-                    all_data.extend(data["output2"])
-                    next_key = data.get("output1", {}).get("next", "")
-                    if not next_key:
-                        break
-                else:
-                    # 데이터가 없을 때 API 응답 전체 출력 (원인 파악용)
-                    print(f" 요청 코드: {symbol}, 거래소: {market_info['MARKET']}")
-                    try:
-                        print("  → API 응답(원문):", json.dumps(data, ensure_ascii=False, indent=2))
-                    except Exception:
-                        print("  → API 응답(원문):", res.text[:2000] if res.text else "(없음)")
-                    break
-            else:
-                print(f"API 호출 실패. 상태 코드: {res.status_code}, 응답 내용: {res.text}")
-                break
-        except Exception as e:
-            print(f"데이터 요청 중 오류 발생: {e}")
-            time.sleep(1)
-            break
-            
-        time.sleep(0.5)
-    
-    print(f"{symbol} 조회된 데이터 수: {len(all_data)}")
+
+    required_bars = required_bars or period * MINUTE_PAGE_SIZE
+    first_page_size = min(required_bars, MINUTE_PAGE_SIZE)
+    if not BAR_STORE_ENABLED:
+        all_data, _, _ = fetch_minute_pages(symbol, nmin, access_token, period, nrec=first_page_size)
+        print(f"{symbol} 조회된 데이터 수: {len(all_data)}")
+        return {"output2": all_data[:required_bars]} if all_data else None
+
+    _, newest_key, _ = get_timestamp_range(symbol, nmin)
+
+    if newest_key:
+        # 마지막 저장 봉 이후 구간만 조회
+        new_rows, overlapped, _ = fetch_minute_pages(
+            symbol, nmin, access_token, period,
+            stop_key=newest_key, nrec=count_missing_bars(newest_key, nmin)
+        )
+        if new_rows and not overlapped:
+            # 저장분과 이어지지 않는 공백 → 새로 받은 구간부터 다시 쌓음
+            print(f"{symbol} 저장된 분봉과 공백 발생, 저장소 재구성")
+            clear_bars(symbol, nmin)
+            BAR_BACKFILL_DONE.pop((symbol, nmin), None)
+    else:
+        new_rows, _, has_more = fetch_minute_pages(symbol, nmin, access_token, period, nrec=first_page_size)
+        if new_rows and not has_more:
+            BAR_BACKFILL_DONE[(symbol, nmin)] = True
+
+    if not new_rows:
+        # 최신 구간 조회 실패 시 오래된 저장분으로 매매 판단하지 않음
+        print(f"{symbol} 조회된 데이터 수: 0")
+        return None
+    save_bars(symbol, nmin, new_rows, minute_bar_key)
+
+    # 필요한 봉 수보다 적으면 과거 구간 백필
+    oldest_key, _, stored_count = get_timestamp_range(symbol, nmin)
+    if stored_count < required_bars and not BAR_BACKFILL_DONE.get((symbol, nmin)):
+        backfill_pages = -(-(required_bars - stored_count) // MINUTE_PAGE_SIZE)
+        old_rows, _, has_more = fetch_minute_pages(
+            symbol, nmin, ACCESS_TOKEN or access_token, backfill_pages,
+            start_keyb=shift_bar_key(oldest_key, -nmin)
+        )
+        if old_rows:
+            save_bars(symbol, nmin, old_rows, minute_bar_key)
+        if not has_more:
+            BAR_BACKFILL_DONE[(symbol, nmin)] = True
+
+    all_data = load_bars(symbol, nmin, limit=required_bars)
+    print(f"{symbol} 조회된 데이터 수: {len(new_rows)} (저장소 {len(all_data)})")
     return {"output2": all_data} if all_data else None
 
 def calculate_rsi(data, periods=RSI_PERIODS):
-    """RSI 계산 (강화된 다중 심볼 대응 버전)"""
+    """RSI 계산 (분봉 응답 dict 또는 decode_bars()로 변환한 BarArray 모두 허용)"""
     try:
-        # 데이터 유효성 확인
-        if "output2" not in data or not data["output2"]:
+        # 응답 변환 (이미 BarArray면 그대로 사용)
+        bars = decode_bars(data)
+        if len(bars) == 0:
             print("RSI 계산을 위한 데이터가 부족합니다")
             return 50
-
-        # 데이터프레임 생성
-        df = pd.DataFrame(data["output2"])
-        # print(f"RSI 계산을 위한 데이터 프레임 생성 완료: {len(df)} 행")  # 로그 스팸 방지
-        
-        # 가격 컬럼 동적 탐색 및 처리
-        price_columns = ['stck_prpr', 'ovrs_nmix_prpr', 'close', 'last', 'stck_clpr']
-        
-        # 가격 컬럼 찾기 및 데이터 정제
-        price_col = None
-        for col in price_columns:
-            if col in df.columns:
-                # 숫자가 아닌 값 제거, 빈 문자열 처리
-                df[col] = pd.to_numeric(df[col].replace('', np.nan), errors='coerce')
-                if not df[col].isnull().all():  # Series 조건문 오류 수정
-                    price_col = col
-                    break
-        
-        if not price_col:
-            print("가격 데이터 컬럼을 찾을 수 없습니다:", df.columns)
-            return 50
-        
-        # 가격 데이터 숫자 변환 및 결측값 처리
-        df['price'] = df[price_col]
-        df = df.dropna(subset=['price'])
-        
-        # 날짜/시간 컬럼 처리
-        datetime_cols = [
-            ('xymd', 'xhms', '%Y%m%d%H%M%S'),
-            ('date', 'time', '%Y-%m-%d %H:%M:%S')
-        ]
-        
-        datetime_col_found = False
-        for date_col, time_col, date_format in datetime_cols:
-            if date_col in df.columns and time_col in df.columns:
-                try:
-                    df['datetime'] = pd.to_datetime(df[date_col] + df[time_col], format=date_format)
-                    datetime_col_found = True
-                    break
-                except:
-                    continue
-        
-        if not datetime_col_found:
-            print("datetime 컬럼 생성 실패")
-            # 인덱스를 datetime으로 사용
-            df['datetime'] = pd.date_range(end=pd.Timestamp.now(), periods=len(df))
-        
-        # 데이터 정렬
-        df = df.sort_values(by='datetime').reset_index(drop=True)
         
         # 데이터 충분성 확인
-        if len(df) < periods:
-            print(f"데이터 부족 (필요: {periods}, 현재: {len(df)})")
+        if len(bars) < periods:
+            print(f"데이터 부족 (필요: {periods}, 현재: {len(bars)})")
             return 50
         
-        # RSI 계산 로직
-        delta = df['price'].diff()
-        gain = (delta.where(delta > 0, 0)).fillna(0)
-        loss = (-delta.where(delta < 0, 0)).fillna(0)
-        
-        avg_gain = gain.rolling(window=periods, min_periods=periods).mean()
-        avg_loss = loss.rolling(window=periods, min_periods=periods).mean()
-        
-        rs = avg_gain / avg_loss
-        rsi = 100 - (100 / (1 + rs))
-        
-        # 최신 RSI 값 추출 및 반올림
-        # iloc 오류 수정: rsi가 Series, ndarray, float 모두 처리
-        latest_rsi = None
-        if hasattr(rsi, 'iloc'):
-            latest_rsi = round(rsi.iloc[-1], 2)
-        elif isinstance(rsi, np.ndarray):
-            latest_rsi = round(rsi[-1], 2)
-        elif isinstance(rsi, float):
-            latest_rsi = round(rsi, 2)
-        else:
-            latest_rsi = 50
+        # RSI 계산 (최근 periods개 변화량의 단순 평균)
+        latest_rsi = rolling_rsi_last(bars.close, periods)
+        latest_rsi = 50 if latest_rsi is None else round(latest_rsi, 2)
         print(f"RSI 계산 완료: {latest_rsi}")
         return latest_rsi
     
@@ -1203,57 +1283,71 @@ def get_current_rsi(symbol, periods=RSI_PERIODS, nmin=MINUTE_INTERVAL):
             send_message(f"{symbol} RSI 조회 중 오류: {e}", symbol)
         return 50
 
-# 1분 캐시 데코레이터
-def cache_1min(func):
-    cache = {}
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        key = (func.__name__, args, tuple(sorted(kwargs.items())))
-        now = time.time()
-        if key in cache:
-            value, timestamp = cache[key]
-            if now - timestamp < 60:
-                return value
-        value = func(*args, **kwargs)
-        cache[key] = (value, now)
-        return value
-    return wrapper
-
-@cache_1min
+def get_daily_history(symbol, min_bars):
+    """해외 일봉 조회 (최신순, min_bars개 이상이 될 때까지 과거 페이지 조회 - 실패 시 None)"""
+    PATH = "uapi/overseas-price/v1/quotations/dailyprice"
+    market_info = MARKET_MAP.get(symbol, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
+    rows = []
+    bymd = ""
+    while len(rows) < min_bars:
+        params = {
+            "AUTH": "",
+            "EXCD": market_info["EXCD"],
+            "SYMB": symbol,
+            "GUBN": "0",    # 일봉
+            "BYMD": bymd,   # 기준일 (빈 값이면 오늘부터)
+            "MODP": "1"     # 수정주가 반영
+        }
+        try:
+            res = KIS.get(PATH, "HHDFS76240000", params)
+            if res is None or res.status_code != 200:
+                print(f"{symbol} 일봉 조회 실패: 상태 코드 {res.status_code if res is not None else '토큰 없음'}")
+                break
+            page = [row for row in res.json().get('output2') or [] if daily_bar_key(row) and row.get('clos')]
+        except Exception as e:
+            print(f"{symbol} 일봉 조회 중 오류: {e!r}")
+            break
+        if not page:
+            break
+        rows.extend(page)
+        if len(page) < DAILY_PAGE_SIZE:
+            break
+        oldest = min(daily_bar_key(row) for row in page)
+        bymd = (datetime.strptime(oldest, '%Y%m%d') - timedelta(days=1)).strftime('%Y%m%d')
+    print(f"{symbol} 일봉 조회: {len(rows)}개")
+    return rows or None
+
+def get_daily_bars(symbol):
+    """종목 일봉 (DailyBars, 거래일당 1회 조회 - 실패 시 None)"""
+    try:
+        return DAILY_BARS.get(symbol)
+    except Exception as e:
+        print(f"{symbol} 일봉 로드 중 오류: {e!r}")
+        return None
+
 def get_current_price(symbol, market=MARKET):
-    global ACCESS_TOKEN
+    """현재가 (실시간 체결가가 REALTIME_PRICE_MAX_AGE 이내면 사용, 아니면 REST 조회)"""
+    if REALTIME_FEED is not None:
+        price = REALTIME_FEED.get_last_price(symbol, max_age=REALTIME_PRICE_MAX_AGE)
+        if price:
+            return price
+    return fetch_current_price(symbol, market)
+
+@ttl_cache('price', ttl=PRICE_CACHE_TTL, maxsize=CACHE_MAX_ENTRIES, failure_ttl=CACHE_FAILURE_TTL)
+def fetch_current_price(symbol, market=MARKET):
     # 해당 심볼의 거래소 정보 가져오기 (전역 MARKET_MAP 사용)
     market_info = MARKET_MAP.get(symbol, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
     PATH = "uapi/overseas-price/v1/quotations/price"
-    URL = f"{URL_BASE}/{PATH}"
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message(f"{symbol} 현재가 조회 실패: 토큰 없음", symbol)
-            return None
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "HHDFS00000300"
-    }
     params = {
         "AUTH": "",
         "EXCD": market_info["EXCD"],
         "SYMB": symbol,
     }
     try:
-        res = requests.get(URL, headers=headers, params=params)
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message(f"{symbol} 현재가 조회 중 토큰 오류. 토큰 갱신 중...", symbol)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                res = requests.get(URL, headers=headers, params=params)
-            else:
-                send_message(f"{symbol} 토큰 갱신 실패", symbol)
-                return None
+        res = KIS.get(PATH, "HHDFS00000300", params)
+        if res is None:
+            send_message(f"{symbol} 현재가 조회 실패: 토큰 없음", symbol)
+            return None
         if res.status_code != 200:
             send_message(f"{symbol} 현재가 조회 실패: 상태 코드 {res.status_code}", symbol)
             return None
@@ -1263,37 +1357,14 @@ def get_current_price(symbol, market=MARKET):
             return None
         return float(data['output']['last'])
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg:
-            send_message(f"{symbol} 현재가 조회 중 토큰 오류: {e}", symbol)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                return get_current_price(symbol, market)
-        else:
-            send_message(f"{symbol} 현재가 조회 중 오류: {e}", symbol)
+        send_message(f"{symbol} 현재가 조회 중 오류: {e}", symbol)
         return None
 
-@cache_1min
-def get_balance(symbol, retry_count=0):
-    MAX_RETRIES = 2
-    global ACCESS_TOKEN
+@ttl_cache('balance', ttl=BALANCE_CACHE_TTL, maxsize=CACHE_MAX_ENTRIES, failure_ttl=CACHE_FAILURE_TTL)
+def get_balance(symbol):
     # 해당 심볼의 거래소 정보 가져오기 (전역 MARKET_MAP 사용)
     market_info = MARKET_MAP.get(symbol, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
     PATH = "/uapi/overseas-stock/v1/trading/inquire-psamount"
-    URL = f"{URL_BASE}/{PATH}"
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message(f"{symbol} 잔고 조회 실패: 토큰 없음", symbol)
-            return 0
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "TTTS3007R",
-        "custtype": "P",
-    }
     current_price = get_current_price(symbol)
     if current_price is None:
         send_message(f"{symbol} 잔고 조회를 위한 현재가 조회 실패", symbol)
@@ -1306,16 +1377,10 @@ def get_balance(symbol, retry_count=0):
         "OVRS_ORD_UNPR": str(current_price)
     }
     try:
-        res = requests.get(URL, headers=headers, params=params)
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message(f"{symbol} 잔고 조회 중 토큰 오류. 토큰 갱신 중...", symbol)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN and retry_count < MAX_RETRIES:
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                return get_balance(symbol, retry_count + 1)
-            else:
-                send_message(f"{symbol} 토큰 갱신 실패", symbol)
-                return 0
+        res = KIS.get(PATH, "TTTS3007R", params)
+        if res is None:
+            send_message(f"{symbol} 잔고 조회 실패: 토큰 없음", symbol)
+            return 0
         if res.status_code != 200:
             send_message(f"{symbol} 잔고 조회 실패: 상태 코드 {res.status_code}", symbol)
             return 0
@@ -1327,201 +1392,153 @@ def get_balance(symbol, retry_count=0):
         send_message(f"주문 가능 현금 잔고: {cash}$", symbol)
         return float(cash)
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg and retry_count < MAX_RETRIES:
-            send_message(f"{symbol} 잔고 조회 중 토큰 오류: {e}", symbol)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                return get_balance(symbol, retry_count + 1)
-        else:
-            send_message(f"{symbol} 잔고 조회 중 오류: {e}", symbol)
+        send_message(f"{symbol} 잔고 조회 중 오류: {e}", symbol)
         return 0
 
-@cache_1min
-def get_stock_balance(symbol):
-    """주식 잔고조회 (심볼 인자 추가 + 토큰 오류 처리 + 손절매용 손익률 정보 추가)"""
-    global ACCESS_TOKEN
-    
-    # 해당 심볼의 거래소 정보 가져오기 (전역 MARKET_MAP 사용)
-    market_info = MARKET_MAP.get(symbol, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
+def get_holdings_exchanges():
+    """보유 잔고를 조회할 거래소 목록 (SYMBOLS가 속한 거래소, 중복 제거)"""
+    exchanges = []
+    for symbol in SYMBOLS:
+        exchange = MARKET_MAP.get(symbol, {"MARKET": MARKET})["MARKET"]
+        if exchange not in exchanges:
+            exchanges.append(exchange)
+    return exchanges
+
+def fetch_exchange_holdings(exchange):
+    """거래소 단위 보유 잔고 조회 (inquire-balance 1회)
 
+    Returns:
+        (성공 여부, 종목별 보유 정보, 평가 정보)
+    """
     PATH = "uapi/overseas-stock/v1/trading/inquire-balance"
-    URL = f"{URL_BASE}/{PATH}"
-    
-    # 토큰 확인
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message(f"{symbol} 주식 잔고 조회 실패: 토큰 없음", symbol)
-            return {}
-    
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "JTTT3012R",
-        "custtype": "P"
-    }
     params = {
         "CANO": CANO,
         "ACNT_PRDT_CD": ACNT_PRDT_CD,
-        "OVRS_EXCG_CD": market_info["MARKET"],
+        "OVRS_EXCG_CD": exchange,
         "TR_CRCY_CD": "USD",
         "CTX_AREA_FK200": "",
         "CTX_AREA_NK200": ""
     }
-    
     try:
-        res = requests.get(URL, headers=headers, params=params)
-        
-        # 토큰 오류 처리
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message(f"{symbol} 주식 잔고 조회 중 토큰 오류. 토큰 갱신 중...", symbol)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                res = requests.get(URL, headers=headers, params=params)
-            else:
-                send_message(f"{symbol} 토큰 갱신 실패", symbol)
-                return {}
-                
-        if res.status_code != 200:
-            send_message(f"{symbol} 주식 잔고 조회 실패: 상태 코드 {res.status_code}", symbol)
-            return {}
-            
+        res = KIS.get(PATH, "JTTT3012R", params)
+        if res is None or res.status_code != 200:
+            print(f"{exchange} 주식 잔고 조회 실패: 상태 코드 {res.status_code if res is not None else '토큰 없음'}")
+            return False, {}, {}
         res_data = res.json()
-        if 'output1' not in res_data or 'output2' not in res_data:
-            send_message(f"🚨 API 응답 오류: {res_data}", symbol)
-            return {}
-        
-        stock_list = res_data['output1']
-        evaluation = res_data['output2']
-        stock_dict = {}
-        
-        send_message(f"====주식 보유잔고====", symbol)
-        for stock in stock_list:
-            if int(stock['ovrs_cblc_qty']) > 0:
-                # 🔹 수정된 부분: 현재가 처리 개선
-                current_price_str = stock.get('ovrs_now_pric', '0')
-                if current_price_str == '' or current_price_str == 'N/A':
-                    current_price_str = '0'
-                
-                current_price = float(current_price_str) if current_price_str != '0' else 0.0
-                
-                # 손절매를 위한 추가 정보 포함
-                stock_dict[stock['ovrs_pdno']] = {
-                    'qty': stock['ovrs_cblc_qty'],
-                    'current_price': current_price,  # 🔹 수정: N/A 처리 개선
-                    'purchase_price': float(stock.get('pchs_avg_pric', '0')),
-                    'profit_rate': float(stock.get('evlu_pfls_rt', '0')),
-                    'profit_amount': float(stock.get('evlu_pfls_amt', '0'))
-                }
-                
-                send_message(f"{stock['ovrs_item_name']}({stock['ovrs_pdno']}): {stock['ovrs_cblc_qty']}주", symbol)
-                send_message(f"  - 매입가: ${stock.get('pchs_avg_pric', 'N/A')}", symbol)
-                # 🔹 수정된 부분: 현재가 표시 개선
-                current_price_display = f"${current_price:.2f}" if current_price > 0 else "조회 필요"
-                send_message(f"  - 현재가: {current_price_display}", symbol)
-                send_message(f"  - 손익률: {stock.get('evlu_pfls_rt', 'N/A')}%", symbol)
-                time.sleep(0.1)
-        
-        send_message(f"주식 평가 금액: ${evaluation['tot_evlu_pfls_amt']}", symbol)
-        time.sleep(0.1)
-        send_message(f"평가 손익 합계: ${evaluation['ovrs_tot_pfls']}", symbol)
-        time.sleep(0.1)
-        #send_message(f"=================", symbol)
-        
-        return stock_dict
-        
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg:
-            send_message(f"{symbol} 주식 잔고 조회 중 토큰 오류: {e}", symbol)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                return get_stock_balance(symbol)
-        else:
-            send_message(f"{symbol} 주식 잔고 조회 중 오류: {e}", symbol)
-        return {}
+        print(f"{exchange} 주식 잔고 조회 중 오류: {e}")
+        return False, {}, {}
+    return parse_exchange_holdings(exchange, res_data)
+
+def parse_exchange_holdings(exchange, res_data):
+    """inquire-balance 응답 → (성공 여부, 종목별 보유 정보, 평가 정보)"""
+    if 'output1' not in res_data or 'output2' not in res_data:
+        print(f"🚨 {exchange} 잔고 API 응답 오류: {res_data}")
+        return False, {}, {}
+
+    stock_dict = {}
+    for stock in res_data['output1']:
+        if int(stock['ovrs_cblc_qty']) > 0:
+            # 현재가 N/A, 빈 값 처리
+            current_price_str = stock.get('ovrs_now_pric', '0')
+            if current_price_str == '' or current_price_str == 'N/A':
+                current_price_str = '0'
+            current_price = float(current_price_str) if current_price_str != '0' else 0.0
+
+            # 손절매를 위한 추가 정보 포함
+            stock_dict[stock['ovrs_pdno']] = {
+                'qty': stock['ovrs_cblc_qty'],
+                'current_price': current_price,
+                'purchase_price': float(stock.get('pchs_avg_pric', '0')),
+                'profit_rate': float(stock.get('evlu_pfls_rt', '0')),
+                'profit_amount': float(stock.get('evlu_pfls_amt', '0')),
+                'name': stock.get('ovrs_item_name', stock['ovrs_pdno']),
+                'exchange': exchange,
+            }
+    return True, stock_dict, res_data['output2']
+
+def send_holdings_report(holdings, evaluations):
+    """보유 잔고 스냅샷을 한 번만 발송 (종목별 반복 발송 방지)"""
+    send_message(f"====주식 보유잔고====")
+    for pdno, info in holdings.items():
+        send_message(f"{info['name']}({pdno}): {info['qty']}주", pdno)
+        send_message(f"  - 매입가: ${info['purchase_price']}", pdno)
+        current_price_display = f"${info['current_price']:.2f}" if info['current_price'] > 0 else "조회 필요"
+        send_message(f"  - 현재가: {current_price_display}", pdno)
+        send_message(f"  - 손익률: {info['profit_rate']}%", pdno)
+    for exchange, evaluation in evaluations.items():
+        send_message(f"[{exchange}] 주식 평가 금액: ${evaluation.get('tot_evlu_pfls_amt', 'N/A')}")
+        send_message(f"[{exchange}] 평가 손익 합계: ${evaluation.get('ovrs_tot_pfls', 'N/A')}")
+
+def get_holdings_snapshot(force=False):
+    """계좌 보유 잔고 스냅샷 (거래소별 1회씩 병렬 조회 후 병합)
+
+    force=True면 유효 시간과 관계없이 새로 조회 (사이클 시작 시).
+    일부 거래소 조회에 실패하면 결과는 반환하되 스냅샷으로 저장하지 않아 다음 호출에서 다시 조회한다.
+    """
+    now = time.time()
+    if (not force and HOLDINGS_SNAPSHOT['holdings'] is not None
+            and now - HOLDINGS_SNAPSHOT['fetched_at'] < HOLDINGS_SNAPSHOT_TTL):
+        return HOLDINGS_SNAPSHOT['holdings']
+
+    # 거래소별 병렬 조회 (토큰 만료 시 재발급은 KIS 클라이언트가 1회만 수행)
+    exchanges = get_holdings_exchanges()
+    with ThreadPoolExecutor(max_workers=len(exchanges)) as executor:
+        results = dict(zip(exchanges, executor.map(fetch_exchange_holdings, exchanges)))
+
+    holdings = {}
+    evaluations = {}
+    complete = True
+    for exchange in exchanges:
+        ok, stock_dict, evaluation = results[exchange]
+        if not ok:
+            complete = False
+            send_message(f"🚨 {exchange} 주식 잔고 조회 실패")
+            continue
+        holdings.update(stock_dict)
+        evaluations[exchange] = evaluation
+
+    if complete:
+        HOLDINGS_SNAPSHOT['holdings'] = holdings
+        HOLDINGS_SNAPSHOT['fetched_at'] = now
+    send_holdings_report(holdings, evaluations)
+    return holdings
+
+def invalidate_holdings_snapshot():
+    """매수/매도 체결 후 보유 잔고 스냅샷 무효화"""
+    HOLDINGS_SNAPSHOT['holdings'] = None
+    HOLDINGS_SNAPSHOT['fetched_at'] = 0
+
+def get_stock_balance(symbol=None):
+    """주식 잔고조회 (계좌 보유 스냅샷 사용, 전체 거래소 보유 종목 반환)
+
+    symbol 인자는 기존 호출부 호환용이며 조회 결과에는 영향을 주지 않는다.
+    """
+    return get_holdings_snapshot()
 
 # RSI + 이동평균선 조합 매매 전략 - 복사 붙여넣기용
 
 # 1. 이동평균선 계산 함수 추가 (기존 코드에 추가)
 def calculate_moving_averages(data, short_period=MA_SHORT_PERIOD, long_period=MA_LONG_PERIOD):
-    """이동평균선 계산 (20일, 50일 이동평균)"""
+    """이동평균선 계산 (20일, 50일 이동평균, 분봉 응답 dict 또는 BarArray 모두 허용)"""
     try:
-        # 데이터 유효성 확인
-        if "output2" not in data or not data["output2"]:
+        # 응답 변환 (이미 BarArray면 그대로 사용)
+        bars = decode_bars(data)
+        if len(bars) == 0:
             print("이동평균 계산을 위한 데이터가 부족합니다")
             return None, None, None
-
-        # 데이터프레임 생성
-        df = pd.DataFrame(data["output2"])
-        # print(f"이동평균 계산을 위한 데이터 프레임 생성 완료: {len(df)} 행")  # 로그 스팸 방지
-        
-        # 가격 컬럼 동적 탐색 및 처리
-        price_columns = ['stck_prpr', 'ovrs_nmix_prpr', 'close', 'last', 'stck_clpr']
-        
-        # 가격 컬럼 찾기 및 데이터 정제
-        price_col = None
-        for col in price_columns:
-            if col in df.columns:
-                # 숫자가 아닌 값 제거, 빈 문자열 처리
-                df[col] = pd.to_numeric(df[col].replace('', np.nan), errors='coerce')
-                if not df[col].isnull().all():  # Series 조건문 오류 수정
-                    price_col = col
-                    break
-        
-        if not price_col:
-            print("가격 데이터 컬럼을 찾을 수 없습니다:", df.columns)
-            return None, None, None
-        
-        # 가격 데이터 숫자 변환 및 결측값 처리
-        df['price'] = df[price_col]
-        df = df.dropna(subset=['price'])
-        
-        # 날짜/시간 컬럼 처리
-        datetime_cols = [
-            ('xymd', 'xhms', '%Y%m%d%H%M%S'),
-            ('date', 'time', '%Y-%m-%d %H:%M:%S')
-        ]
-        
-        datetime_col_found = False
-        for date_col, time_col, date_format in datetime_cols:
-            if date_col in df.columns and time_col in df.columns:
-                try:
-                    df['datetime'] = pd.to_datetime(df[date_col] + df[time_col], format=date_format)
-                    datetime_col_found = True
-                    break
-                except:
-                    continue
-        
-        if not datetime_col_found:
-            print("datetime 컬럼 생성 실패")
-            # 인덱스를 datetime으로 사용
-            df['datetime'] = pd.date_range(end=pd.Timestamp.now(), periods=len(df))
-        
-        # 데이터 정렬
-        df = df.sort_values(by='datetime').reset_index(drop=True)
         
         # 데이터 충분성 확인
-        if len(df) < long_period:
-            print(f"이동평균 계산을 위한 데이터 부족 (필요: {long_period}, 현재: {len(df)})")
+        if len(bars) < long_period:
+            print(f"이동평균 계산을 위한 데이터 부족 (필요: {long_period}, 현재: {len(bars)})")
             return None, None, None
         
-        # 이동평균선 계산
-        df['ma_short'] = df['price'].rolling(window=short_period).mean()
-        df['ma_long'] = df['price'].rolling(window=long_period).mean()
-        
         # 최신 값들 추출
-        current_price = df['price'].iloc[-1]
-        current_ma_short = df['ma_short'].iloc[-1]
-        current_ma_long = df['ma_long'].iloc[-1]
+        current_price = float(bars.close[-1])
+        current_ma_short = sma_last(bars.close, short_period)
+        current_ma_long = sma_last(bars.close, long_period)
         
         print(f"현재가: {current_price:.2f}")
-        # print(f"{short_period}일 이동평균: {current_ma_short:.2f}")  # 로그 스팸 방지
-        # print(f"{long_period}일 이동평균: {current_ma_long:.2f}")  # 로그 스팸 방지
         
         return current_price, current_ma_short, current_ma_long
     
@@ -1529,6 +1546,68 @@ def calculate_moving_averages(data, short_period=MA_SHORT_PERIOD, long_period=MA
         print(f"이동평균 계산 중 오류 발생: {e}")
         return None, None, None
 
+def get_indicator_state(symbol, nmin, rsi_periods, ma_short, ma_long):
+    """종목/설정별 증분 지표 상태 조회 (없으면 생성)"""
+    key = (symbol, nmin, rsi_periods, ma_short, ma_long)
+    state = INDICATOR_STATES.get(key)
+    if state is None:
+        state = IndicatorState(rsi_periods, ma_short, ma_long)
+        INDICATOR_STATES[key] = state
+    return state
+
+def update_indicator_state(state, bars):
+    """BarArray(시간순)에서 마지막 누적 봉 이후만 골라 상태에 반영
+
+    응답이 상태의 마지막 누적 봉까지 이어지지 않으면(재시작 후 공백, 저장소 재구성 등)
+    응답 전체로 상태를 다시 만든다.
+    """
+    start = 0
+    continuous = True
+    if state.last_key is not None:
+        start = int(np.searchsorted(bars.ts, state.last_key, side='right'))
+        if start == 0:
+            continuous = False
+    new_bars = list(zip(bars.ts[start:].tolist(), bars.close[start:].tolist()))
+    state.update(new_bars, continuous=continuous)
+
+def get_streaming_indicators(symbol, bars, rsi_periods, ma_short, ma_long, nmin, need_ma=True):
+    """증분 상태로 (RSI, 현재가, 단기 이평, 장기 이평) 계산 (calculate_rsi/calculate_moving_averages와 같은 규칙)
+    need_ma: False면 분봉 이동평균은 계산하지 않음 (일봉 이동평균 사용 시 - RSI와 현재가만)
+    """
+    state = get_indicator_state(symbol, nmin, rsi_periods, ma_short, ma_long)
+    update_indicator_state(state, bars)
+
+    bar_count = state.bar_count()
+    if bar_count < rsi_periods:
+        print(f"데이터 부족 (필요: {rsi_periods}, 현재: {bar_count})")
+        rsi_value = 50
+    else:
+        rsi_value = state.rsi_value()
+        rsi_value = 50 if rsi_value is None else round(rsi_value, 2)
+
+    if not need_ma:
+        return rsi_value, (state.current_price() if bar_count else None), None, None
+    if bar_count < max(ma_short, ma_long):
+        print(f"이동평균 계산을 위한 데이터 부족 (필요: {ma_long}, 현재: {bar_count})")
+        return rsi_value, None, None, None
+
+    current_price = state.current_price()
+    ma_short_value, ma_long_value = state.moving_averages()
+    return rsi_value, current_price, ma_short_value, ma_long_value
+
+def verify_streaming_indicators(symbol, bars, streaming_result, rsi_periods, ma_short, ma_long):
+    """증분 지표를 기존 전체 재계산 결과와 비교 (INDICATOR_STATE_VERIFY 사용 시)"""
+    rsi_value = calculate_rsi(bars, rsi_periods)
+    current_price, ma_short_value, ma_long_value = calculate_moving_averages(bars, ma_short, ma_long)
+    expected = (rsi_value, current_price, ma_short_value, ma_long_value)
+    for name, got, want in zip(('rsi', 'current_price', 'ma_short', 'ma_long'), streaming_result, expected):
+        if got is None or want is None:
+            matched = got is None and want is None
+        else:
+            matched = abs(float(got) - float(want)) <= 1e-6
+        if not matched:
+            print(f"⚠️ {symbol} 증분 지표 불일치 ({name}): 증분={got}, 전체계산={want}")
+
 # 2. RSI + 이동평균 조합 분석 함수 (기존 코드에 추가)
 def get_technical_analysis(symbol, rsi_periods=RSI_PERIODS, ma_short=MA_SHORT_PERIOD, ma_long=MA_LONG_PERIOD, nmin=MINUTE_INTERVAL):
     """RSI와 이동평균을 함께 분석하는 함수"""
@@ -1546,62 +1625,32 @@ def get_technical_analysis(symbol, rsi_periods=RSI_PERIODS, ma_short=MA_SHORT_PE
                 if not ACCESS_TOKEN:
                     return None
         
-        # 더 많은 데이터 조회 (이동평균 계산을 위해)
-        data = get_minute_data(
-            symbol=symbol, 
-            nmin=nmin, 
-            period=DATA_PERIOD,  # 더 많은 데이터 조회
-            access_token=ACCESS_TOKEN
-        )
+        daily_bars = None
+        if DAILY_MA_ENABLED:
+            # 이동평균은 일봉(거래일당 1회 조회), 분봉은 RSI에 필요한 만큼만
+            daily_bars = get_daily_bars(symbol)
+            data = get_minute_data(
+                symbol=symbol,
+                nmin=nmin,
+                period=-(-MINUTE_RSI_BARS // MINUTE_PAGE_SIZE),
+                access_token=ACCESS_TOKEN,
+                required_bars=MINUTE_RSI_BARS
+            )
+        else:
+            # 더 많은 데이터 조회 (이동평균 계산을 위해)
+            data = get_minute_data(
+                symbol=symbol, 
+                nmin=nmin, 
+                period=DATA_PERIOD,  # 더 많은 데이터 조회
+                access_token=ACCESS_TOKEN
+            )
         
         if not data:
             send_message(f"{symbol} 데이터 조회 실패, 기술적 분석 불가", symbol)
             return None
             
-        # RSI 계산
-        rsi_value = calculate_rsi(data, rsi_periods)
-        
-        # 이동평균선 계산
-        current_price, ma_short_value, ma_long_value = calculate_moving_averages(
-            data, ma_short, ma_long
-        )
-        
-        if ma_short_value is None or ma_long_value is None:
-            send_message(f"{symbol} 이동평균 계산 실패", symbol)
-            return {
-                'rsi': rsi_value,
-                'current_price': current_price,
-                'ma_short': None,
-                'ma_long': None,
-                'price_vs_ma_long_percent': None,
-                'ma_trend': None
-            }
-        
-        # 현재가와 장기 이동평균 대비 비율 계산
-        price_vs_ma_long_percent = ((current_price - ma_long_value) / ma_long_value) * 100
-        
-        # 이동평균선 추세 판단 (단기 > 장기 = 상승 추세)
-        ma_trend = "상승" if ma_short_value > ma_long_value else "하락"
-        
-        analysis_result = {
-            'rsi': rsi_value,
-            'current_price': current_price,
-            'ma_short': ma_short_value,
-            'ma_long': ma_long_value,
-            'price_vs_ma_long_percent': price_vs_ma_long_percent,
-            'ma_trend': ma_trend
-        }
-        
-        # 기술적 분석 결과와 결론을 함께 출력
-        print(f"📊 {symbol} 기술적 분석:")
-        print(f"  - RSI: {rsi_value:.2f}")
-        print(f"  - 현재가: ${current_price:.2f}")
-        print(f"  - {ma_short}일 이평: ${ma_short_value:.2f}")
-        print(f"  - {ma_long}일 이평: ${ma_long_value:.2f}")
-        print(f"  - 장기이평 대비: {price_vs_ma_long_percent:+.2f}%")
-        print(f"  - 이평 추세: {ma_trend}")
-        
-        return analysis_result
+        # 응답을 한 번만 열 배열로 변환해 모든 지표 계산에서 공유
+        return analyze_bars(symbol, decode_bars(data), rsi_periods, ma_short, ma_long, nmin, daily_bars)
     
     except Exception as e:
         error_msg = str(e).lower()
@@ -1615,6 +1664,103 @@ def get_technical_analysis(symbol, rsi_periods=RSI_PERIODS, ma_short=MA_SHORT_PE
             send_message(f"{symbol} 기술적 분석 중 오류: {e}", symbol)
         return None
 
+def analyze_bars(symbol, bars, rsi_periods=RSI_PERIODS, ma_short=MA_SHORT_PERIOD, ma_long=MA_LONG_PERIOD, nmin=MINUTE_INTERVAL,
+                 daily_bars=None):
+    """분봉(BarArray) → 기술적 분석 결과 (조회 없이 계산만, 동기/asyncio 버전 공용)
+    daily_bars: DailyBars (DAILY_MA_ENABLED일 때 이동평균은 일봉 종가 + 장중 현재가로 계산)
+    """
+    if DAILY_MA_ENABLED:
+        if INDICATOR_STATE_ENABLED:
+            rsi_value, current_price, _, _ = get_streaming_indicators(
+                symbol, bars, rsi_periods, ma_short, ma_long, nmin, need_ma=False
+            )
+        else:
+            rsi_value = calculate_rsi(bars, rsi_periods)
+            current_price = float(bars.close[-1]) if len(bars) else None
+        ma_short_value = ma_long_value = None
+        if daily_bars is not None and current_price is not None:
+            # 장중이면 현재가를 당일 봉으로 포함 (장 마감 후/개장 전에는 마감 일봉만)
+            live_price = current_price if is_market_time() else None
+            ma_short_value = daily_bars.sma(ma_short, live_price)
+            ma_long_value = daily_bars.sma(ma_long, live_price)
+    elif INDICATOR_STATE_ENABLED:
+        # 새로 마감된 봉만 반영한 증분 상태로 계산
+        rsi_value, current_price, ma_short_value, ma_long_value = get_streaming_indicators(
+            symbol, bars, rsi_periods, ma_short, ma_long, nmin
+        )
+        if INDICATOR_STATE_VERIFY:
+            verify_streaming_indicators(
+                symbol, bars, (rsi_value, current_price, ma_short_value, ma_long_value),
+                rsi_periods, ma_short, ma_long
+            )
+    else:
+        # RSI 계산
+        rsi_value = calculate_rsi(bars, rsi_periods)
+        
+        # 이동평균선 계산
+        current_price, ma_short_value, ma_long_value = calculate_moving_averages(
+            bars, ma_short, ma_long
+        )
+    
+    if ma_short_value is None or ma_long_value is None:
+        send_message(f"{symbol} 이동평균 계산 실패", symbol)
+        return {
+            'rsi': rsi_value,
+            'current_price': current_price,
+            'ma_short': None,
+            'ma_long': None,
+            'price_vs_ma_long_percent': None,
+            'ma_trend': None
+        }
+    
+    # 현재가와 장기 이동평균 대비 비율 계산
+    price_vs_ma_long_percent = ((current_price - ma_long_value) / ma_long_value) * 100
+    
+    # 이동평균선 추세 판단 (단기 > 장기 = 상승 추세)
+    ma_trend = "상승" if ma_short_value > ma_long_value else "하락"
+    
+    analysis_result = {
+        'rsi': rsi_value,
+        'current_price': current_price,
+        'ma_short': ma_short_value,
+        'ma_long': ma_long_value,
+        'price_vs_ma_long_percent': price_vs_ma_long_percent,
+        'ma_trend': ma_trend
+    }
+    
+    # 기술적 분석 결과와 결론을 함께 출력
+    print(f"📊 {symbol} 기술적 분석:")
+    print(f"  - RSI: {rsi_value:.2f}")
+    print(f"  - 현재가: ${current_price:.2f}")
+    print(f"  - {ma_short}일 이평: ${ma_short_value:.2f}")
+    print(f"  - {ma_long}일 이평: ${ma_long_value:.2f}")
+    print(f"  - 장기이평 대비: {price_vs_ma_long_percent:+.2f}%")
+    print(f"  - 이평 추세: {ma_trend}")
+    
+    return analysis_result
+
+def analyze_symbol(symbol):
+    """분석 스레드 작업: 종목 분봉 조회 + 기술적 분석 (주문/잔고 변경 없음)"""
+    started_at = time.time()
+    try:
+        analysis = get_technical_analysis(symbol, RSI_PERIODS, MA_SHORT_PERIOD, MA_LONG_PERIOD, MINUTE_INTERVAL)
+    except Exception as e:
+        print(f"{symbol} 분석 스레드 오류: {e}")
+        analysis = None
+    return symbol, analysis, started_at, time.time() - started_at
+
+def run_analysis_pool(symbols):
+    """전체 종목 기술적 분석을 스레드 풀에서 동시에 실행
+
+    Returns:
+        {symbol: {'analysis': 분석 결과, 'started_at': 분석 시작 시각, 'elapsed': 분석 소요 시간}}
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=ANALYSIS_MAX_WORKERS) as executor:
+        for symbol, analysis, started_at, elapsed in executor.map(analyze_symbol, symbols):
+            results[symbol] = {'analysis': analysis, 'started_at': started_at, 'elapsed': elapsed}
+    return results
+
 # 3. 개선된 매수 조건 판단 함수 (종목별 설정 적용)
 def should_buy(analysis, symbol=None, max_price_above_ma_percent=None, rsi_buy_threshold=None):
     """
@@ -1718,6 +1864,23 @@ def should_sell(analysis, profit_rate, symbol=None, rsi_sell_threshold=None, pro
 
 
 # 5. 부분 익절 함수 추가 (종목별 설정 적용)
+def partial_profit_take_qty(symbol, profit_rate, quantity, profit_take_percent=None):
+    """
+    부분 익절 판단 (주문 없이 판단만 - 동기/asyncio 버전 공용)
+    익절 목표 수익의 70% 이상이고 아직 부분 익절하지 않았으면 보유량의 50%
+
+    Returns:
+        (조건 충족 여부, 매도 수량(1주 유지로 0일 수 있음), 부분 익절 목표 수익률)
+    """
+    if profit_take_percent is None:
+        profit_take_percent = get_symbol_config(symbol)['profit_take_percent']
+    partial_profit_target = profit_take_percent * 0.7
+
+    # 이미 부분 익절 실행됨 / 손실 상태(손절매 목표치 도달 시까지 보유) / 목표 미달
+    if PARTIAL_PROFIT_TAKEN.get(symbol) or profit_rate < 0 or profit_rate < partial_profit_target:
+        return False, 0, partial_profit_target
+    return True, get_partial_profit_sell_qty(get_held_quantity(quantity)), partial_profit_target
+
 def check_partial_profit_take(symbol, profit_rate, current_price, quantity, profit_take_percent=None):
     """
     부분 익절 조건 확인 및 실행
@@ -1741,21 +1904,10 @@ def check_partial_profit_take(symbol, profit_rate, current_price, quantity, prof
         if profit_take_percent is None:
             profit_take_percent = config['profit_take_percent']
         
-        # 부분 익절 목표 수익률 계산 (익절 목표의 70%)
-        partial_profit_target = profit_take_percent * 0.7
-        
-        # 부분 익절이 이미 실행되었는지 확인
-        if symbol in PARTIAL_PROFIT_TAKEN and PARTIAL_PROFIT_TAKEN[symbol]:
-            return False  # 이미 부분 익절 실행됨
-        
-        # 손실 상태에서는 부분 익절 실행하지 않음 (손절매 목표치 도달 시까지 보유)
-        if profit_rate < 0:
-            return False  # 손실 상태에서는 부분 익절 미실행
-        
-        # 부분 익절 조건 확인: 수익률이 익절 목표의 70% 이상 (수익 상태일 때만)
-        if profit_rate >= partial_profit_target:
+        # 부분 익절 조건 확인: 수익률이 익절 목표의 70% 이상 (수익 상태, 미실행 종목만)
+        triggered, sell_qty, partial_profit_target = partial_profit_take_qty(symbol, profit_rate, quantity, profit_take_percent)
+        if triggered:
             quantity_int = get_held_quantity(quantity)
-            sell_qty = get_partial_profit_sell_qty(quantity_int)
             if sell_qty <= 0:
                 send_message(
                     f"⚠️ {symbol} 보유 {quantity_int}주 — 부분 익절 생략 (추세 확인용 1주 유지)",
@@ -1771,13 +1923,12 @@ def check_partial_profit_take(symbol, profit_rate, current_price, quantity, prof
             send_message(f"- 매도 가격: ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_IMPORTANT)
             
             # 부분 익절 실행
-            sell_result = sell(code=symbol, qty=str(sell_qty), price=str(current_price))
+            sell_result = sell(code=symbol, qty=str(sell_qty), price=str(current_price), trade_type='sell_partial_profit')
             
             if sell_result:
                 PARTIAL_PROFIT_TAKEN[symbol] = True  # 부분 익절 완료 플래그 설정
-                send_message(f"✅ 부분 익절 완료: {symbol} {sell_qty}주 @ ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
-                # 거래 내역 추가 (부분익절매 구분)
-                add_trade_record(symbol, 'sell_partial_profit', sell_qty, current_price)
+                send_message(f"✅ 부분 익절 주문 접수: {symbol} {sell_qty}주 @ ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
+                # 거래 내역은 체결 확인 시 기록 (부분익절매 구분, on_order_fill)
                 return True
             else:
                 send_message(f"❌ 부분 익절 실패: {symbol}", symbol, level=MESSAGE_LEVEL_CRITICAL)
@@ -1791,11 +1942,12 @@ def check_partial_profit_take(symbol, profit_rate, current_price, quantity, prof
         return False
 
 
-def buy(market=MARKET, code="", qty="1", price="0"): 
-    """미국 주식 지정가 매수 (토큰 오류 처리 추가)"""
-    global ACCESS_TOKEN
+def buy(market=MARKET, code="", qty="1", price="0", trade_type='buy', reprice_count=0): 
+    """미국 주식 지정가 매수 (토큰 만료 재발급/재시도는 KIS 클라이언트에서 처리)
+
+    접수된 주문은 ORDER_TRACKER로 체결을 추적하고, 거래 기록은 체결 확인 시 trade_type으로 남김
+    """
     PATH = "uapi/overseas-stock/v1/trading/order"
-    URL = f"{URL_BASE}/{PATH}"
 
     # 해당 심볼의 거래소 정보 가져오기 (전역 MARKET_MAP 사용)
     market_info = MARKET_MAP.get(code, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
@@ -1816,13 +1968,6 @@ def buy(market=MARKET, code="", qty="1", price="0"):
         send_message(f"🚨 [매수 실패] 주문 가격 또는 수량이 잘못된 형식입니다. (price={price}, qty={qty})", code)
         return False
 
-    # 토큰 확인
-    if not ACCESS_TOKEN:
-        ACCESS_TOKEN = get_access_token()
-        if not ACCESS_TOKEN:
-            send_message(f"🚨 [매수 실패] 토큰이 없습니다.", code)
-            return False
-
     # 🔹 주문 데이터 구성
     data = {
         "CANO": CANO,
@@ -1835,43 +1980,12 @@ def buy(market=MARKET, code="", qty="1", price="0"):
         "ORD_DVSN": "00"  # 지정가 주문
     }
 
-    # 해시키 생성
-    hash_key = hashkey(data)
-    if not hash_key:
-        send_message(f"🚨 [매수 실패] 해시키 생성 오류", code)
-        return False
-
-    headers = {
-        "Content-Type": "application/json", 
-        "authorization": f"Bearer {ACCESS_TOKEN}",
-        "appKey": APP_KEY,
-        "appSecret": APP_SECRET,
-        "tr_id": "TTTT1002U",  # 미국 매수 주문
-        "custtype": "P",
-        "hashkey": hash_key
-    }
-
-    # 🔹 API 요청 실행
+    # 🔹 API 요청 실행 (미국 매수 주문, 해시키는 ORDER_USE_HASHKEY 설정 시에만)
     try:
-        res = requests.post(URL, headers=headers, data=json.dumps(data))
-        
-        # 토큰 오류 처리
-        if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-            send_message(f"🚨 [매수 중 토큰 오류] 토큰 갱신 중...", code)
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 새 토큰으로 다시 시도
-                headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                hash_key = hashkey(data)  # 해시키 재생성
-                if hash_key:
-                    headers["hashkey"] = hash_key
-                    res = requests.post(URL, headers=headers, data=json.dumps(data))
-                else:
-                    send_message(f"🚨 [매수 실패] 해시키 재생성 오류", code)
-                    return False
-            else:
-                send_message(f"🚨 [매수 실패] 토큰 갱신 실패", code)
-                return False
+        res = KIS.submit_order(PATH, "TTTT1002U", data)
+        if res is None:
+            send_message(f"🚨 [매수 실패] 토큰 또는 해시키 생성 오류", code)
+            return False
         
         # 🔹 주문 결과 확인
         if res.status_code != 200:
@@ -1880,35 +1994,30 @@ def buy(market=MARKET, code="", qty="1", price="0"):
             
         res_data = res.json()
         if res_data['rt_cd'] == '0':
-            send_message(f"✅ [매수 성공] {code} {qty}주 @${price:.2f}", code, level=MESSAGE_LEVEL_CRITICAL)
+            send_message(f"✅ [매수 접수] {code} {qty}주 @${price:.2f}", code, level=MESSAGE_LEVEL_CRITICAL)
+            ORDER_TRACKER.track(code, 'buy', qty, price, res_data, exchange=market_info["MARKET"],
+                                trade_type=trade_type, reprice_count=reprice_count)
+            invalidate_holdings_snapshot()
+            get_balance.cache.clear()  # 주문 가능 금액은 접수 즉시 줄어듦 (보유 수량은 체결 시 반영)
             return True
         else:
             send_message(f"🚨 [매수 실패] {res_data.get('msg1', '알 수 없는 오류 발생')}", code, level=MESSAGE_LEVEL_CRITICAL)
             return False
             
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'access_token' in error_msg:
-            send_message(f"🚨 [매수 중 토큰 오류] {str(e)}", code)
-            # 토큰 갱신 시도
-            ACCESS_TOKEN = get_access_token()
-            if ACCESS_TOKEN:
-                # 재귀적으로 다시 시도 (무한 루프 방지 필요)
-                return buy(market, code, qty, str(price))  # float -> str 변환
-        else:
-            send_message(f"🚨 [매수 실패] {str(e)}", code)
+        send_message(f"🚨 [매수 실패] {str(e)}", code)
         return False
      ## 달러가 있어야 하는데 없으면 잔고 부족으로 나옴
 
-def sell(market=MARKET, code="", qty="all", price="0"):
-    """미국 주식 지정가 매도 (보유 수량을 자동으로 설정 가능 + 토큰 오류 처리)"""
-    global ACCESS_TOKEN
+def sell(market=MARKET, code="", qty="all", price="0", trade_type='sell', reprice_count=0):
+    """미국 주식 지정가 매도 (보유 수량을 자동으로 설정 가능, 토큰 만료 재발급/재시도는 KIS 클라이언트에서 처리)
 
+    접수된 주문은 ORDER_TRACKER로 체결을 추적하고, 거래 기록은 체결 확인 시 trade_type으로 남김
+    """
     # 해당 심볼의 거래소 정보 가져오기 (전역 MARKET_MAP 사용)
     market_info = MARKET_MAP.get(code, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
 
     PATH = "uapi/overseas-stock/v1/trading/order"
-    URL = f"{URL_BASE}/{PATH}"
     
     # 보유 주식 확인
     try:
@@ -1917,7 +2026,11 @@ def sell(market=MARKET, code="", qty="all", price="0"):
             send_message(f"🚨 {code} 종목을 보유하고 있지 않습니다", code)
             return False
 
-        held_qty = int(stock_dict[code]['qty'])
+        # 이미 접수된 매도 주문의 미체결 수량은 제외 (중복 매도 방지)
+        held_qty = int(stock_dict[code]['qty']) - ORDER_TRACKER.open_quantity(code, 'sell')
+        if held_qty <= 0:
+            send_message(f"⏳ {code} 미체결 매도 주문이 있어 추가 매도하지 않습니다", code, level=MESSAGE_LEVEL_IMPORTANT)
+            return False
 
         # 💡 "all" 입력 시 보유 수량 전량 매도
         if qty == "all":
@@ -1944,13 +2057,6 @@ def sell(market=MARKET, code="", qty="all", price="0"):
             send_message(f"🚨 매도 수량({qty})이 보유 수량({held_qty})을 초과합니다", code)
             return False
 
-        # 토큰 확인
-        if not ACCESS_TOKEN:
-            ACCESS_TOKEN = get_access_token()
-            if not ACCESS_TOKEN:
-                send_message(f"🚨 [매도 실패] 토큰이 없습니다.", code)
-                return False
-
         send_message(f"💰 매도 주문: {code} {qty}주 @ ${price:.2f}", code)
 
         data = {
@@ -1964,42 +2070,12 @@ def sell(market=MARKET, code="", qty="all", price="0"):
             "ORD_DVSN": "00"
         }
         
-        # 해시키 생성
-        hash_key = hashkey(data)
-        if not hash_key:
-            send_message(f"🚨 [매도 실패] 해시키 생성 오류", code)
-            return False
-        
-        headers = {
-            "Content-Type": "application/json", 
-            "authorization": f"Bearer {ACCESS_TOKEN}",
-            "appKey": APP_KEY,
-            "appSecret": APP_SECRET,
-            "tr_id": "TTTT1006U",  # 미국 매도 주문
-            "custtype": "P",
-            "hashkey": hash_key
-        }
-        
         try:
-            res = requests.post(URL, headers=headers, data=json.dumps(data))
-            
-            # 토큰 오류 처리
-            if res.status_code == 401 or (res.status_code == 200 and 'access_token' in res.text.lower()):
-                send_message(f"🚨 [매도 중 토큰 오류] 토큰 갱신 중...", code)
-                ACCESS_TOKEN = get_access_token()
-                if ACCESS_TOKEN:
-                    # 새 토큰으로 다시 시도
-                    headers["authorization"] = f"Bearer {ACCESS_TOKEN}"
-                    hash_key = hashkey(data)  # 해시키 재생성
-                    if hash_key:
-                        headers["hashkey"] = hash_key
-                        res = requests.post(URL, headers=headers, data=json.dumps(data))
-                    else:
-                        send_message(f"🚨 [매도 실패] 해시키 재생성 오류", code)
-                        return False
-                else:
-                    send_message(f"🚨 [매도 실패] 토큰 갱신 실패", code)
-                    return False
+            # 미국 매도 주문 (해시키는 ORDER_USE_HASHKEY 설정 시에만)
+            res = KIS.submit_order(PATH, "TTTT1006U", data)
+            if res is None:
+                send_message(f"🚨 [매도 실패] 토큰 또는 해시키 생성 오류", code)
+                return False
             
             # 주문 결과 확인
             if res.status_code != 200:
@@ -2008,23 +2084,17 @@ def sell(market=MARKET, code="", qty="all", price="0"):
                 
             res_data = res.json()
             if res_data['rt_cd'] == '0':
-                send_message(f"✅ [매도 성공] {code} {qty}주 @ ${price:.2f}", code, level=MESSAGE_LEVEL_CRITICAL)
+                send_message(f"✅ [매도 접수] {code} {qty}주 @ ${price:.2f}", code, level=MESSAGE_LEVEL_CRITICAL)
+                ORDER_TRACKER.track(code, 'sell', qty, price, res_data, exchange=market_info["MARKET"],
+                                    trade_type=trade_type, reprice_count=reprice_count)
+                invalidate_holdings_snapshot()
                 return True
             else:
                 send_message(f"🚨 [매도 실패] {res_data.get('msg1', '알 수 없는 오류 발생')}", code, level=MESSAGE_LEVEL_CRITICAL)
                 return False
                 
         except Exception as e:
-            error_msg = str(e).lower()
-            if 'access_token' in error_msg:
-                send_message(f"🚨 [매도 중 토큰 오류] {str(e)}", code)
-                # 토큰 갱신 시도
-                ACCESS_TOKEN = get_access_token()
-                if ACCESS_TOKEN:
-                    # 재귀적으로 다시 시도 (무한 루프 방지 필요)
-                    return sell(market, code, qty, str(price))  # float -> str 변환
-            else:
-                send_message(f"🚨 [매도 실패] {str(e)}", code)
+            send_message(f"🚨 [매도 실패] {str(e)}", code)
             return False
             
     except Exception as e:
@@ -2061,11 +2131,10 @@ def check_stop_loss(symbol, stop_loss_percent=None, max_retries=3):
             send_message(f"- 현재가: ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_IMPORTANT)
             send_message(f"- 손실률: {loss_percent:.2f}%", symbol, level=MESSAGE_LEVEL_IMPORTANT)
             send_message(f"- 손절매 기준: -{stop_loss_percent}% (종목별 설정)", symbol, level=MESSAGE_LEVEL_INFO)
-            sell_result = sell(code=symbol, qty=str(quantity), price=str(current_price))
+            sell_result = sell(code=symbol, qty=str(quantity), price=str(current_price), trade_type='sell_stop_loss')
             if sell_result:
-                send_message(f"✅ 손절매 완료: {symbol} {quantity}주 @ ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
-                # 손절매 거래 내역 기록
-                add_trade_record(symbol, 'sell_stop_loss', quantity, current_price)
+                send_message(f"✅ 손절매 주문 접수: {symbol} {quantity}주 @ ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
+                # 손절매 거래 내역은 체결 확인 시 기록 (on_order_fill)
                 # 손절매 시 부분 익절 추적 데이터 초기화 (전량 매도)
                 global PARTIAL_PROFIT_TAKEN
                 if symbol in PARTIAL_PROFIT_TAKEN:
@@ -2086,6 +2155,562 @@ def check_stop_loss(symbol, stop_loss_percent=None, max_retries=3):
 #3파트
 
 
+@STAGE_TIMER.timed()
+def run_stop_loss_sweep():
+    """손절매 전체 체크 (스케줄러 주기 작업)"""
+    global LAST_STOP_LOSS_CHECK_TIME
+    started_at = time.time()
+    # 거래소별 1회 조회한 계좌 스냅샷으로 전체 종목 손절매 체크
+    all_holdings = {}
+    try:
+        holdings = get_holdings_snapshot(force=True)
+        all_holdings = {symbol: holdings[symbol] for symbol in SYMBOLS if symbol in holdings}
+    except Exception as e:
+        send_message(f"잔고 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+
+    # 보유 종목에 대해서만 손절매 체크
+    for symbol, holding_info in all_holdings.items():
+        try:
+            # 손절매 확인 메시지 제거 (너무 빈번함)
+
+            # 이미 조회한 잔고 정보를 활용
+            loss_percent = float(holding_info['profit_rate'])
+            quantity = holding_info['qty']
+
+            # 현재가를 별도로 조회
+            current_price = get_current_price(symbol)
+            if current_price is None or current_price <= 0:
+                send_message(f"⚠️ {symbol} 현재가 조회 실패로 손절매 건너뜀", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+                continue
+
+            purchase_price = float(holding_info['purchase_price'])
+
+            # 손절매 조건 확인 (종목별 설정 적용)
+            if check_stop_loss(symbol):
+                send_message(f"✅ 손절매 완료: {symbol} {quantity}주 @ ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
+                # 손절매 거래 내역 기록 (check_stop_loss 내부에서 이미 기록되지만, 중복 방지를 위해 여기서는 기록하지 않음)
+
+        except Exception as e:
+            send_message(f"{symbol} 손절매 체크 중 오류: {str(e)}", symbol, level=MESSAGE_LEVEL_CRITICAL)
+
+    LAST_STOP_LOSS_CHECK_TIME = started_at
+
+def on_order_fill(order, fill_qty, fill_price):
+    """체결 확인 (ORDER_TRACKER 콜백): 거래 기록, 보유 스냅샷/주문 가능 금액 캐시 무효화
+
+    잔고 조회(손절매 점검/사이클 시작/실시간 확인)가 대사보다 먼저 체결을 반영했을 수 있으므로
+    스냅샷에 체결분을 더하지 않고 무효화해 다음 사용 시 계좌 기준으로 다시 조회한다.
+    """
+    side_name = '매수' if order.side == 'buy' else '매도'
+    send_message(f"✅ [{side_name} 체결] {order.symbol} {fill_qty}주 @ ${fill_price:.2f} (누적 {order.filled_qty}/{order.qty}주)",
+                 order.symbol, level=MESSAGE_LEVEL_CRITICAL)
+    add_trade_record(order.symbol, order.trade_type, fill_qty, fill_price)
+    invalidate_holdings_snapshot()
+    get_balance.cache.clear()
+
+@STAGE_TIMER.timed()
+def run_order_reconcile():
+    """미체결 주문 체결 대사 + 제한 시간 지난 주문 취소/재주문 (스케줄러 주기 작업, 매매 사이클 시작 시에도 실행)
+
+    취소는 요청만 하고, 다음 대사에서 취소가 확인된 주문만 확인된 미체결 수량으로 재주문한다
+    (취소 요청과 경합한 일부 체결만큼 재주문이 커지지 않도록).
+    """
+    if not ORDER_TRACKER.has_open_orders():
+        return
+    ORDER_TRACKER.reconcile()
+    for order in ORDER_TRACKER.take_cancelled():
+        remaining = order.remaining_qty
+        if remaining <= 0 or order.reprice_count >= ORDER_MAX_REPRICES or (order.side == 'buy' and not ORDER_REPRICE_BUY):
+            continue
+        new_price = get_current_price(order.symbol)
+        if not new_price:
+            continue
+        order_func = buy if order.side == 'buy' else sell
+        order_func(code=order.symbol, qty=str(remaining), price=str(new_price),
+                   trade_type=order.trade_type, reprice_count=order.reprice_count + 1)
+    for order in ORDER_TRACKER.expired_orders():
+        side_name = '매수' if order.side == 'buy' else '매도'
+        if not ORDER_TRACKER.cancel(order):
+            continue
+        send_message(f"⌛ {order.symbol} {side_name} 미체결 {order.remaining_qty}주 취소 요청 ({ORDER_FILL_TIMEOUT}초 경과)", order.symbol, level=MESSAGE_LEVEL_IMPORTANT)
+
+def on_realtime_tick(symbol, price, received_at):
+    """실시간 체결가 틱 (수신 스레드): 보유 스냅샷 기준 손절/부분 익절 구간이면 메인 스레드 작업으로 확인 예약"""
+    holdings = HOLDINGS_SNAPSHOT['holdings']
+    if not holdings or symbol not in holdings:
+        return
+    cooldown = REALTIME_NOOP_COOLDOWN if symbol in REALTIME_NOOP_SYMBOLS else REALTIME_CHECK_COOLDOWN
+    if received_at - REALTIME_LAST_CHECK.get(symbol, 0) < cooldown:
+        return
+    purchase_price = float(holdings[symbol]['purchase_price'])
+    if purchase_price <= 0:
+        return
+    config = get_symbol_config(symbol)
+    profit_rate = (price / purchase_price - 1) * 100
+    stop_loss_hit = profit_rate <= -config['stop_loss_percent']
+    # 부분 익절은 매도 수량이 있을 때만 (1주 보유 등 수량 0이면 확인해도 주문하지 않음)
+    triggered, sell_qty, _ = partial_profit_take_qty(symbol, profit_rate, holdings[symbol]['qty'],
+                                                     config['profit_take_percent'])
+    partial_hit = triggered and sell_qty > 0
+    if not (stop_loss_hit or partial_hit):
+        return
+    REALTIME_LAST_CHECK[symbol] = received_at
+    # 주문은 스케줄러(메인 스레드)에서 실행 - 분석 사이클과 동시에 주문하지 않도록
+    SCHEDULER.add_oneshot(f'realtime_check_{symbol}', time.time(),
+                          lambda: run_realtime_check(symbol, price, stop_loss_hit))
+
+@STAGE_TIMER.timed()
+def run_realtime_check(symbol, price, stop_loss_hit):
+    """틱 기반 손절/부분 익절 확인 (계좌 손익률로 최종 판단)
+
+    손절은 스냅샷을 새로 조회해 판단하고, 부분 익절은 유효한 스냅샷을 그대로 사용한다.
+    주문하지 않고 끝나면 REALTIME_NOOP_COOLDOWN 동안 같은 종목을 다시 확인하지 않는다.
+    """
+    print(f"⚡ {symbol} 실시간 체결가 ${price:.2f} - {'손절' if stop_loss_hit else '부분 익절'} 조건 확인")
+    ordered = False
+    if stop_loss_hit:
+        invalidate_holdings_snapshot()
+        ordered = check_stop_loss(symbol)
+    elif not is_dividend_no_trade_month(symbol):
+        stock_dict = get_stock_balance(symbol)
+        if symbol in stock_dict:
+            stock_info = stock_dict[symbol]
+            ordered = check_partial_profit_take(symbol, float(stock_info['profit_rate']), price,
+                                                get_held_quantity(stock_info['qty']))
+    if ordered:
+        REALTIME_NOOP_SYMBOLS.discard(symbol)
+    else:
+        REALTIME_NOOP_SYMBOLS.add(symbol)
+
+def start_realtime_feed():
+    """장중 실시간 체결가 구독 시작 (websocket-client 없거나 비활성이면 폴링만 사용)"""
+    global REALTIME_FEED
+    if not REALTIME_ENABLED or REALTIME_FEED is not None:
+        return
+    subscriptions = {}
+    for symbol in SYMBOLS:
+        market_info = MARKET_MAP.get(symbol, {"EXCD": EXCD_MARKET, "MARKET": MARKET})
+        subscriptions[symbol] = overseas_subscription(market_info["EXCD"], symbol, REALTIME_TR_KEY_PREFIX)
+    feed = KISRealtimeFeed(REALTIME_WS_URL, KIS.get_approval_key, subscriptions, on_tick=on_realtime_tick)
+    if feed.start():
+        REALTIME_FEED = feed
+        send_message(f"📡 실시간 체결가 구독 시작 ({len(subscriptions)}종목)", level=MESSAGE_LEVEL_INFO)
+
+def stop_realtime_feed():
+    global REALTIME_FEED
+    if REALTIME_FEED is not None:
+        REALTIME_FEED.stop()
+        REALTIME_FEED = None
+
+def allocate_buy_orders(cash, prices, buy_ratios, safety_margins):
+    """주문 가능 금액을 매수 신호 전체에 배분 (벡터 연산, 종목 순서와 무관)
+
+    종목별 배정액 = 주문 가능 금액 × buy_ratio (합계가 주문 가능 금액을 넘으면 비율대로 축소)
+    수량 = 배정액 / (가격 × (1 + safety_margin)) 내림 (최소 1주), 주문 금액이 배정액 × (1 - safety_margin) 이내인 종목만 주문
+
+    Returns:
+        (배정액 배열, 수량 배열, 주문 가능 여부 배열)
+    """
+    prices = np.asarray(prices, dtype=float)
+    ratios = np.asarray(buy_ratios, dtype=float)
+    margins = np.asarray(safety_margins, dtype=float)
+
+    budgets = cash * ratios
+    total = budgets.sum()
+    if total > cash > 0:
+        budgets *= cash / total
+    qty = np.maximum(1, np.floor(budgets / (prices * (1 + margins)))).astype(int)
+    orderable = (cash > 0) & (qty * prices <= budgets * (1 - margins))
+    return budgets, qty, orderable
+
+def execute_buy_allocation(candidates, bought_list):
+    """매수 신호 일괄 처리: 주문 가능 금액 1회 조회 → allocate_buy_orders 배분 → 주문 전송"""
+    global ACCESS_TOKEN
+    if not candidates:
+        return
+
+    # 주문 가능 금액 1회 조회 (종목마다 inquire-psamount를 호출하지 않음)
+    try:
+        cash_balance = get_balance(candidates[0]['symbol'])
+    except Exception as e:
+        if 'access_token' in str(e).lower():
+            send_message(f"토큰 오류 감지, 토큰 갱신 후 다음 사이클에서 재시도합니다")
+            ACCESS_TOKEN = get_access_token()
+        else:
+            send_message(f"잔고 조회 중 오류: {str(e)}")
+        return
+    if cash_balance <= 0:
+        for c in candidates:
+            send_message(f"주문 가능 잔고가 없습니다", c['symbol'], level=MESSAGE_LEVEL_INFO)
+            # 잔고 부족으로 거래 실패 기록
+            collect_daily_summary_data(c['symbol'], c['analysis'], True, False, c['reason'], "", "insufficient_balance")
+        return
+
+    configs = [get_symbol_config(c['symbol']) for c in candidates]
+    budgets, quantities, orderable = allocate_buy_orders(
+        cash_balance,
+        [c['price'] for c in candidates],
+        [cfg['buy_ratio'] for cfg in configs],
+        [cfg['safety_margin'] for cfg in configs],
+    )
+    send_message(f"💰 매수 배분: 신호 {len(candidates)}종목, 주문 가능 ${cash_balance:.2f}, 배정 합계 ${budgets.sum():.2f}",
+                 level=MESSAGE_LEVEL_IMPORTANT)
+
+    for c, config, budget, qty, ok in zip(candidates, configs, budgets, quantities, orderable):
+        symbol = c['symbol']
+        current_price = c['price']
+        qty = int(qty)
+        total_cost = qty * current_price
+
+        send_message(f"- 매수 가능 금액: ${budget:.2f} (비율: {config['buy_ratio']*100}%)", symbol)
+        send_message(f"- 주문 수량: {qty}주", symbol)
+        send_message(f"- 주문 가격: ${current_price:.2f}", symbol)
+        send_message(f"- 총 주문 금액: ${total_cost:.2f}", symbol)
+        send_message(f"- 장기이평 대비: {c['analysis']['price_vs_ma_long_percent']:+.2f}%", symbol)
+
+        if not ok:
+            send_message(f"❌ 안전 마진 적용 후 주문 불가", symbol)
+            # 안전 마진으로 인한 거래 실패 기록
+            collect_daily_summary_data(symbol, c['analysis'], True, False, c['reason'], "", "insufficient_balance")
+            continue
+        try:
+            buy_result = buy(code=symbol, qty=str(qty), price=str(current_price), trade_type='buy')
+            if buy_result:
+                bought_list.append(symbol)
+                send_message(f"✅ {symbol} {qty}주 매수 주문 접수", symbol)
+                # 거래 내역은 체결 확인 시 기록 (on_order_fill)
+            else:
+                # 매수 실행 실패 (잔고 부족 등)
+                collect_daily_summary_data(symbol, c['analysis'], True, False, c['reason'], "", "insufficient_balance")
+        except Exception as e:
+            if 'access_token' in str(e).lower():
+                send_message(f"매수 중 토큰 오류, 토큰 갱신 후 재시도합니다", symbol)
+                ACCESS_TOKEN = get_access_token()
+            else:
+                send_message(f"매수 중 오류: {str(e)}", symbol)
+
+@STAGE_TIMER.timed()
+def run_trading_cycle():
+    """RSI + 이동평균 기반 매매 사이클 (스케줄러 봉 마감 작업)"""
+    global ACCESS_TOKEN
+    bought_list = []  # 매수 완료된 종목 리스트
+
+    # 이전 사이클 주문의 체결 반영 (미체결 주문 1회 조회)
+    try:
+        run_order_reconcile()
+    except Exception as e:
+        send_message(f"주문 체결 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+
+    # 사이클 시작 시 계좌 스냅샷 1회 갱신 (이후 종목별 잔고 확인은 스냅샷 사용)
+    try:
+        with STAGE_TIMER.stage('holdings_snapshot'):
+            get_holdings_snapshot(force=True)
+    except Exception as e:
+        send_message(f"잔고 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+
+    # 기술적 분석은 전체 종목 동시 실행 (주문 판단은 아래에서 순서대로)
+    buy_candidates = []  # 매수 신호 종목 (루프 후 배분 단계에서 일괄 주문)
+    cycle_started_at = time.time()
+    with STAGE_TIMER.stage('analysis_pool'):
+        analysis_results = run_analysis_pool(SYMBOLS)
+    analysis_wall_time = time.time() - cycle_started_at
+    decision_latencies = {}
+
+    # 각 심볼에 대한 처리 (메인 스레드에서 순차 실행 - 현금/보유 수량 판단 일관성 유지)
+    for symbol in SYMBOLS:
+        try:
+            KST_time = datetime.now(timezone('Asia/Seoul'))
+
+            # RSI 매매 전 손절매 우선 체크 (중복 잔고 조회 방지)
+            # 최근 설정된 시간 이내에 손절매 체크를 했다면 건너뜀
+            recent_stop_loss_check = (time.time() - LAST_STOP_LOSS_CHECK_TIME) < (STOP_LOSS_CHECK_INTERVAL * 60)
+
+            if not recent_stop_loss_check:
+                # 개별 종목 손절매 체크 (설정된 간격마다 체크를 하지 않았을 때만)
+                try:
+                    stock_dict = get_stock_balance(symbol)
+                    if symbol in stock_dict:
+                        # 손절매 조건 확인 (종목별 설정 적용)
+                        loss_percent = float(stock_dict[symbol]['profit_rate'])
+                        if check_stop_loss(symbol):
+                            send_message(
+                                f"⚠️ RSI 체크 중 손절매 조건 발견: {symbol} (손실률: {loss_percent:.2f}%)",
+                                symbol,
+                            )
+                            continue
+                except Exception as e:
+                    send_message(f"{symbol} 손절매 사전 체크 중 오류: {str(e)}", symbol)
+
+            # RSI + 이동평균 기반 기술적 분석 (분석 풀 결과 사용)
+            technical_analysis = analysis_results[symbol]['analysis']
+            if technical_analysis is None:
+                send_message(f"기술적 분석 실패, 다음 종목으로 넘어갑니다", symbol, level=MESSAGE_LEVEL_DEBUG)
+                continue
+
+            # 현재가 정보 (technical_analysis에서 가져옴)
+            current_price = technical_analysis['current_price']
+            if current_price is None:
+                send_message(f"현재가 조회 실패", symbol, level=MESSAGE_LEVEL_DEBUG)
+                continue
+
+            # 개선된 매수 조건 판단 (RSI + 이동평균 조합, 종목별 설정 적용)
+            buy_signal, buy_reason = should_buy(technical_analysis, symbol)
+            # 매수 분석 메시지는 DEBUG 레벨로 (너무 빈번함) - 주석 처리로 로그 스팸 방지
+            # send_message(f"매수 분석: {buy_reason}", symbol, level=MESSAGE_LEVEL_DEBUG)
+
+            # 일일 요약 데이터 수집
+            collect_daily_summary_data(symbol, technical_analysis, buy_signal, False, buy_reason, "")
+
+            if buy_signal:
+                # 배당주 3·6·9·12월: 매수·매도 모두 보류 (배당 수령 위해)
+                if is_dividend_no_trade_month(symbol):
+                    send_message(f"⏸ {symbol} 배당락월(3·6·9·12월)이라 매수·매도 보류", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+                    collect_daily_summary_data(symbol, technical_analysis, True, False, buy_reason, "", "ex_dividend_month")
+                    continue
+                print(f"🎯 {symbol} 매수 신호 감지: {buy_reason}")
+                send_message(f"✅ 매수 신호 감지", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+
+                # 매수 수량은 전체 신호를 모은 뒤 배분 단계에서 한 번에 계산 (주문 가능 금액 1회 조회)
+                buy_candidates.append({'symbol': symbol, 'analysis': technical_analysis,
+                                       'price': current_price, 'reason': buy_reason})
+
+            else:
+                # 매수 조건 미충족
+                collect_daily_summary_data(symbol, technical_analysis, False, False, buy_reason, "", "condition_not_met")
+                print(f"❌ {symbol} 매수 신호 없음: {buy_reason}")
+                # 기존 매도 조건 확인 (보유 종목이 있을 때만)
+                try:
+                    stock_dict = get_stock_balance(symbol)
+                    if symbol in stock_dict:
+                        stock_info = stock_dict[symbol]
+                        profit_rate = float(stock_info['profit_rate'])
+                        purchase_price = float(stock_info['purchase_price'])
+                        qty = stock_info['qty']
+
+                        send_message(f"보유 정보 - 매입가: ${purchase_price:.2f}, 손익률: {profit_rate:.2f}%", symbol, level=MESSAGE_LEVEL_DEBUG)
+
+                        # 부분 익절 체크 (익절 목표의 70% 도달 시 보유량의 50% 매도)
+                        # 현재가를 technical_analysis에서 가져옴
+                        if current_price and current_price > 0 and not is_dividend_no_trade_month(symbol):
+                            # 수익률이 부분 익절 목표 이상이면 체크 (함수 내부에서 조건 확인). 배당월에는 부분 익절도 보류
+                            check_partial_profit_take(symbol, profit_rate, current_price, get_held_quantity(qty))
+
+                        # 매도 조건: RSI 설정값 이상 + 수익률 목표 이상일 때 (종목별 설정 적용)
+                        sell_signal, sell_reason = should_sell(technical_analysis, profit_rate, symbol)
+                        # 매도 분석 메시지를 DEBUG 레벨로 (너무 빈번함)
+                        send_message(f"매도 분석: {sell_reason}", symbol, level=MESSAGE_LEVEL_DEBUG)
+
+                        # 일일 요약 데이터 수집 (매도 신호)
+                        collect_daily_summary_data(symbol, technical_analysis, False, sell_signal, "", sell_reason)
+
+                        if sell_signal:
+                            # 배당주 3·6·9·12월: 매도 보류 (배당 수령 위해)
+                            if is_dividend_no_trade_month(symbol):
+                                send_message(f"⏸ {symbol} 배당락월이라 매도 보류 (배당 수령)", symbol, level=MESSAGE_LEVEL_IMPORTANT)
+                            else:
+                                print(f"🎯 {symbol} 매도 신호 감지: {sell_reason}")
+                                held_qty = get_held_quantity(qty)
+                                sell_qty = get_profit_take_sell_qty(held_qty)
+                                if sell_qty <= 0:
+                                    send_message(
+                                        f"⚠️ {symbol} 보유 {held_qty}주 — 익절 매도 생략 (추세 확인용 1주 유지)",
+                                        symbol,
+                                        level=MESSAGE_LEVEL_IMPORTANT,
+                                    )
+                                else:
+                                    send_message(
+                                        f"✅ 매도 신호 감지 - {sell_qty}주 매도 (1주 유지, 보유 {held_qty}주)",
+                                        symbol,
+                                        level=MESSAGE_LEVEL_IMPORTANT,
+                                    )
+                                    try:
+                                        sell_result = sell(code=symbol, qty=str(sell_qty), price=str(current_price), trade_type='sell_profit_take')
+                                        if sell_result:
+                                            send_message(f"✅ {symbol} {sell_qty}주 매도 주문 접수 (1주 유지로 추세 확인)", symbol, level=MESSAGE_LEVEL_CRITICAL)
+                                            # 거래 내역은 체결 확인 시 기록 (익절매 구분, on_order_fill)
+                                            # 익절 후 1주 남음 → 부분 익절 플래그 유지/설정 (재매도 방지)
+                                            if held_qty - sell_qty <= 1:
+                                                PARTIAL_PROFIT_TAKEN[symbol] = True
+                                            elif symbol in PARTIAL_PROFIT_TAKEN:
+                                                del PARTIAL_PROFIT_TAKEN[symbol]
+                                                print(f"✅ {symbol} 익절 매도 완료 - 부분 익절 추적 데이터 초기화")
+                                    except Exception as e:
+                                        if 'access_token' in str(e).lower():
+                                            send_message(f"매도 중 토큰 오류, 토큰 갱신 후 재시도합니다", symbol)
+                                            ACCESS_TOKEN = get_access_token()
+                                            continue
+                                        else:
+                                            send_message(f"매도 중 오류: {str(e)}", symbol)
+                        else:
+                            print(f"❌ {symbol} 매도 신호 없음: {sell_reason}")
+                            # 매도 조건 미충족 메시지 제거 (너무 빈번함)
+                            pass
+                            # 참고용으로만 장기이평 대비 위치 표시 (DEBUG 레벨로)
+                            if technical_analysis['price_vs_ma_long_percent'] is not None:
+                                send_message(f"- 장기이평 대비: {technical_analysis['price_vs_ma_long_percent']:+.2f}% (참고용)", symbol, level=MESSAGE_LEVEL_DEBUG)
+                    else:
+                        # 미보유 종목 메시지를 DEBUG 레벨로 (너무 빈번함)
+                        send_message(f"📊 {symbol}을 보유하고 있지 않습니다", symbol, level=MESSAGE_LEVEL_DEBUG)
+                except Exception as e:
+                    if 'access_token' in str(e).lower():
+                        send_message(f"주식 잔고 조회 중 토큰 오류, 토큰 갱신 후 재시도합니다", symbol)
+                        ACCESS_TOKEN = get_access_token()
+                        continue
+                    else:
+                        send_message(f"주식 잔고 조회 중 오류: {str(e)}", symbol)
+                        continue
+
+        except Exception as symbol_error:
+            send_message(f"🚨 {symbol} 처리 중 오류: {str(symbol_error)}")
+            continue
+        finally:
+            # 종목별 판단 지연 시간 (분석 시작 ~ 주문 판단 완료)
+            decision_latencies[symbol] = time.time() - analysis_results[symbol]['started_at']
+            print(f"⏱ {symbol} 분석 {analysis_results[symbol]['elapsed']:.1f}초 / 판단 완료까지 {decision_latencies[symbol]:.1f}초")
+
+    # 매수 배분 단계: 주문 가능 금액 1회 조회 → 신호 전체에 한 번에 배분 → 일괄 주문
+    try:
+        with STAGE_TIMER.stage('buy_allocation'):
+            execute_buy_allocation(buy_candidates, bought_list)
+    except Exception as e:
+        send_message(f"매수 배분 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+
+    cycle_wall_time = time.time() - cycle_started_at
+    slowest_symbol = max(decision_latencies, key=decision_latencies.get) if decision_latencies else None
+    cycle_log = (f"⏱ 분석 사이클 {cycle_wall_time:.1f}초 (분석 {analysis_wall_time:.1f}초, {len(SYMBOLS)}종목, 워커 {ANALYSIS_MAX_WORKERS})")
+    if slowest_symbol:
+        cycle_log += f" | 최대 판단 지연 {slowest_symbol} {decision_latencies[slowest_symbol]:.1f}초"
+    print(cycle_log)
+    send_message(cycle_log, level=MESSAGE_LEVEL_DEBUG)
+    print(f"🗂 조회 캐시: {format_cache_stats()}")
+    # 이번 사이클(이전 사이클 종료 이후)의 API 호출 요약 + 계측 파일 저장
+    api_line = API_METRICS.end_cycle(label=API_METRICS_LABEL)
+    print(api_line)
+    send_message(api_line, level=MESSAGE_LEVEL_DEBUG)
+
+def run_token_refresh():
+    """토큰 갱신 (스케줄러 주기 작업 - 장중에만, 개장 전에는 prewarm_market_open에서 갱신)"""
+    if not is_market_time():
+        return
+    refresh_token()
+
+def prewarm_market_open():
+    """개장 직전 준비 (스케줄러 1회 작업): 토큰 갱신, 보유 잔고 스냅샷, 분봉 저장소/지표 상태 갱신"""
+    started_at = time.time()
+    if not refresh_token():
+        send_message("개장 전 토큰 갱신 실패, 개장 시 다시 시도합니다.", level=MESSAGE_LEVEL_IMPORTANT)
+        return
+    try:
+        get_holdings_snapshot(force=True)
+    except Exception as e:
+        send_message(f"개장 전 잔고 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_IMPORTANT)
+    # 전 거래일 분봉을 저장소에 반영해 두면 개장 후 첫 분석은 새 봉만 조회
+    results = run_analysis_pool(SYMBOLS)
+    ready = sum(1 for r in results.values() if r['analysis'])
+    print(f"⏱ 개장 전 준비 완료: {time.time() - started_at:.1f}초 (분석 준비 {ready}/{len(SYMBOLS)}종목)")
+
+def run_daily_summary():
+    """일일 요약 리포트 발송 (장 마감 후 1회 작업)"""
+    latency = KIS.order_latency_summary()
+    if latency['count']:
+        print(f"⏱ 주문 전송 지연: {latency['count']}건 평균 {latency['avg'] * 1000:.0f}ms / p95 {latency['p95'] * 1000:.0f}ms / 최대 {latency['max'] * 1000:.0f}ms")
+    if DAILY_SUMMARY_DATA:
+        send_daily_summary()
+    else:
+        send_message("📊 오늘은 거래 데이터가 없어 요약 리포트를 발송하지 않습니다", level=MESSAGE_LEVEL_CRITICAL)
+    # 당일 작업/단계별 실행 시간 (다음 거래일은 새로 집계)
+    print(f"⏱ {STAGE_TIMER.format_summary()}")
+    STAGE_TIMER.reset()
+
+def start_trading_session(initial_check=False):
+    """장중 작업 등록: 손절매 주기 체크, 봉 마감 분석, 장 마감 (initial_check면 즉시 분석 1회)"""
+    now = time.time()
+    # 조기 마감일은 달력의 실제 마감 시각에 마감 처리/일일 요약
+    SCHEDULER.add_oneshot('market_close', get_market_close_time(now), on_market_close)
+    note = MARKET_CALENDAR.describe(MARKET_CALENDAR.local_date(now))
+    if note:
+        send_message(f"📅 오늘 장 일정: {note}", level=MESSAGE_LEVEL_IMPORTANT)
+    start_realtime_feed()
+    SCHEDULER.add_interval('stop_loss', STOP_LOSS_CHECK_INTERVAL * 60, run_stop_loss_sweep, start_at=now)
+    SCHEDULER.add_interval('order_reconcile', ORDER_RECONCILE_INTERVAL, run_order_reconcile)
+    if initial_check:
+        SCHEDULER.add_oneshot('rsi_initial', now, run_trading_cycle)
+    rsi_job = SCHEDULER.add_deadline_job('rsi_check', get_next_candle_check_time, run_trading_cycle,
+                                         misfire=MISFIRE_SKIP, grace=RSI_CHECK_MISFIRE_GRACE)
+    if rsi_job.next_run:
+        next_check = datetime.fromtimestamp(rsi_job.next_run, timezone('America/New_York'))
+        send_message(f"⏳ 다음 기술적 분석: {next_check.strftime('%H:%M:%S')} (뉴욕)", level=MESSAGE_LEVEL_DEBUG)
+
+def on_market_open(initial_check=False):
+    """장 개장 (스케줄러 1회 작업)"""
+    print("🔔 미국 시장이 개장되었습니다!")
+    send_message("🔔 미국 시장이 개장되었습니다!", level=MESSAGE_LEVEL_CRITICAL)
+
+    # 시장 개장 시 이전 데이터 정리 (새로운 거래일 시작)
+    if DAILY_SUMMARY_DATA:
+        print("📊 새로운 거래일 시작 - 이전 데이터 정리 중...")
+        DAILY_SUMMARY_DATA.clear()
+        print("✅ 이전 거래일 데이터 정리 완료")
+    # 부분 익절 추적 데이터는 초기화하지 않음 (한 번 실행된 후 목표 수익까지 대기해야 하므로)
+    # PARTIAL_PROFIT_TAKEN은 전체 매도 시 또는 프로그램 재시작 시에만 초기화됨
+
+    if not refresh_token():  # 시장 개장 시 토큰 갱신 (개장 전 준비에서 갱신했으면 캐시된 토큰 그대로 사용)
+        send_message("토큰 갱신에 실패했습니다. 1.5분 후 다시 시도합니다.", level=MESSAGE_LEVEL_CRITICAL)
+        SCHEDULER.add_oneshot('token_retry', time.time() + 90, refresh_token)
+    start_trading_session(initial_check)
+
+def on_market_close():
+    """장 마감 (스케줄러 1회 작업): 장중 작업 취소, 요약 리포트 예약, 다음 개장 예약"""
+    SCHEDULER.cancel('stop_loss', 'rsi_initial', 'rsi_check', 'order_reconcile')
+    stop_realtime_feed()
+    # 마감 전 체결분 반영 후 남은 당일 주문은 소멸 처리
+    try:
+        ORDER_TRACKER.reconcile()
+    except Exception as e:
+        send_message(f"주문 체결 조회 중 오류: {str(e)}", level=MESSAGE_LEVEL_CRITICAL)
+    for order in ORDER_TRACKER.expire_all():
+        send_message(f"⌛ {order.symbol} 미체결 {order.remaining_qty}주 장 마감으로 소멸", order.symbol, level=MESSAGE_LEVEL_IMPORTANT)
+    print("🔔 미국 시장이 마감되었습니다. 다음 개장일까지 대기합니다...")
+    send_message("🔔 미국 시장이 마감되었습니다. 다음 개장일까지 대기합니다...", level=MESSAGE_LEVEL_CRITICAL)
+
+    now = time.time()
+    if DAILY_SUMMARY_DATA:
+        send_message("📊 자동 매매 요약 리포트를 발송하겠습니다", level=MESSAGE_LEVEL_CRITICAL)
+    SCHEDULER.add_oneshot('daily_summary', now + DAILY_SUMMARY_DELAY, run_daily_summary)
+    schedule_market_open(now)
+
+def schedule_market_open(now, initial_check=False):
+    """다음 개장 시각에 on_market_open 예약 (거래소 달력 기준, MARKET_PREWARM_MINUTES 전에 개장 전 준비)"""
+    open_dt, close_dt = MARKET_CALENDAR.next_session(now)
+    open_time = open_dt.timestamp()
+    SCHEDULER.add_oneshot('market_open', open_time, lambda: on_market_open(initial_check))
+    prewarm_time = open_time - MARKET_PREWARM_MINUTES * 60
+    if MARKET_PREWARM_MINUTES > 0 and prewarm_time > now:
+        SCHEDULER.add_oneshot('market_prewarm', prewarm_time, prewarm_market_open)
+    note = MARKET_CALENDAR.describe(open_dt.date())
+    send_message(f"다음 개장: {open_dt.strftime('%Y-%m-%d %H:%M')} ~ {close_dt.strftime('%H:%M')} (뉴욕){f' - {note}' if note else ''}",
+                 level=MESSAGE_LEVEL_IMPORTANT)
+
+def on_scheduler_error(job_name, error):
+    """스케줄러 작업 오류 (작업은 다음 마감 시각에 다시 실행)"""
+    global ACCESS_TOKEN
+    send_message(f"🚨 [{job_name} 작업 오류] {str(error)}", level=MESSAGE_LEVEL_CRITICAL)
+    if 'access_token' in str(error).lower():
+        ACCESS_TOKEN = get_access_token()
+
+def schedule_trading_jobs():
+    """스케줄러 초기화: 토큰 갱신 주기 작업 + 현재 장 상태에 맞는 작업 등록 (시작 시 첫 분석은 즉시 또는 개장 직후)"""
+    SCHEDULER.clear()
+    SCHEDULER.on_error = on_scheduler_error
+    now = time.time()
+    SCHEDULER.add_interval('token_refresh', TOKEN_REFRESH_INTERVAL, run_token_refresh)
+    if is_market_time():
+        start_trading_session(initial_check=True)
+    else:
+        holiday = MARKET_CALENDAR.holiday_name(MARKET_CALENDAR.local_date(now))
+        send_message(f"미국 시장이 닫혀 있습니다{f' ({holiday})' if holiday else ''}. 개장까지 대기합니다...", level=MESSAGE_LEVEL_IMPORTANT)
+        schedule_market_open(now, initial_check=True)
+
 def main():
     global ACCESS_TOKEN, PARTIAL_PROFIT_TAKEN
     
@@ -2098,6 +2723,9 @@ def main():
     # 이동평균: MA_SHORT_PERIOD, MA_LONG_PERIOD
     # 장기이평 대비 최대 허용 상승률: MAX_PRICE_ABOVE_MA_PERCENT
     # 분봉 간격: MINUTE_INTERVAL
+
+    # 진단 트리거 등록 (스케줄러가 도는 메인 스레드가 샘플링 대상)
+    DIAGNOSTICS.install()
     
     while True:  # 메인 무한 루프
         try:
@@ -2115,10 +2743,6 @@ def main():
                     continue
                 token_retry_count = 0
                 
-            bought_list = []  # 매수 완료된 종목 리스트
-            
-            # 매수 비율은 파일 상단의 BUY_RATIO 변수에서 가져옴
-
             send_message(f"=== 자동매매 프로그램 시작 ({MARKET}) ===", level=MESSAGE_LEVEL_IMPORTANT)
             send_message(f"종목: {SYMBOLS} | 기본 설정: 매수비율 {BUY_RATIO*100}% | 손절 {STOP_LOSS_PERCENT}% | 익절 {PROFIT_TAKE_PERCENT}%", level=MESSAGE_LEVEL_INFO)
             send_message(f"RSI: {RSI_PERIODS}일 | 이평: {MA_SHORT_PERIOD}/{MA_LONG_PERIOD}일 | 분봉: {MINUTE_INTERVAL}분", level=MESSAGE_LEVEL_DEBUG)
@@ -2129,362 +2753,9 @@ def main():
                 config = get_symbol_config(symbol)
                 send_message(f"  {symbol}: RSI매수 {config['rsi_buy_threshold']} | RSI매도 {config['rsi_sell_threshold']} | 손절 {config['stop_loss_percent']}% | 익절 {config['profit_take_percent']}% | 매수비율 {config['buy_ratio']*100}%", level=MESSAGE_LEVEL_INFO)
             
-            # 시간대 설정
-            tz = timezone('America/New_York')
-            last_token_refresh = datetime.now(tz)
-            
-            # 초기 실행 설정
-            force_first_check = True
-            last_check_time = datetime.now(tz) - timedelta(minutes=31)
-            last_stop_loss_check_time = datetime.now(tz) - timedelta(minutes=6)  # 손절매 체크 타이머 추가
-            
-            # 초기 시장 체크
-            market_open = is_market_time()
-            if not market_open:
-                wait_for_market_open()
-            
-            # 시장 상태 추적 변수
-            last_market_status = None
-            
-            # 내부 루프 - 정상 실행
-            while True:
-                current_time = datetime.now(tz)
-                NAS_time = datetime.now(timezone('America/New_York'))
-                
-                # 토큰 갱신 (설정된 간격마다)
-                if (current_time - last_token_refresh).total_seconds() >= TOKEN_REFRESH_INTERVAL:
-                    refresh_token()
-                    last_token_refresh = current_time
-                    
-                    # 메시지 히스토리 정리 (토큰 갱신 시마다)
-                    # 오래된 메시지 히스토리 정리
-                    current_time = time.time()
-                    MESSAGE_HISTORY = {k: v for k, v in MESSAGE_HISTORY.items() 
-                                      if current_time - v < MESSAGE_COOLDOWN * 2}
-                
-                # 시장 상태 확인 (상태 변경 시에만 메시지 발송 및 로그 기록)
-                current_market_status = is_market_time()
-                if current_market_status != last_market_status:
-                    if current_market_status:
-                        print("🔔 미국 시장이 개장되었습니다!")
-                        send_message("🔔 미국 시장이 개장되었습니다!", level=MESSAGE_LEVEL_CRITICAL)
-                        
-                        # 시장 개장 시 이전 데이터 정리 (새로운 거래일 시작)
-                        if DAILY_SUMMARY_DATA:
-                            print("📊 새로운 거래일 시작 - 이전 데이터 정리 중...")
-                            DAILY_SUMMARY_DATA.clear()
-                            print("✅ 이전 거래일 데이터 정리 완료")
-                        # 부분 익절 추적 데이터는 초기화하지 않음 (한 번 실행된 후 목표 수익까지 대기해야 하므로)
-                        # PARTIAL_PROFIT_TAKEN은 전체 매도 시 또는 프로그램 재시작 시에만 초기화됨
-                    else:
-                        print("🔔 미국 시장이 마감되었습니다. 다음 개장일까지 대기합니다...")
-                        send_message("🔔 미국 시장이 마감되었습니다. 다음 개장일까지 대기합니다...", level=MESSAGE_LEVEL_CRITICAL)
-                        
-                        # 일일 요약 메시지 발송
-                        if DAILY_SUMMARY_DATA:
-                            send_message("📊 자동 매매 요약 리포트를 발송하겠습니다", level=MESSAGE_LEVEL_CRITICAL)
-                            # 요약 발송 전 추가 2초 대기
-                            time.sleep(2)
-                            send_daily_summary()
-                        else:
-                            send_message("📊 오늘은 거래 데이터가 없어 요약 리포트를 발송하지 않습니다", level=MESSAGE_LEVEL_CRITICAL)
-                        
-                        wait_for_market_open()
-                        continue
-                    last_market_status = current_market_status
-                elif not current_market_status:
-                    # 시장이 닫혀있으면 대기
-                    wait_for_market_open()
-                    continue
-                
-                # RSI 체크 조건
-                minutes_elapsed = (current_time - last_check_time).total_seconds() / 60
-                time_to_check = (NAS_time.minute == 0 or (NAS_time.minute == 1 and NAS_time.second <= 30))
-
-                # 손절매 체크 조건 (설정된 간격마다)
-                stop_loss_minutes_elapsed = (current_time - last_stop_loss_check_time).total_seconds() / 60
-                
-                # 손절매 체크 로직 (설정된 간격마다)
-                if is_market_time() and stop_loss_minutes_elapsed >= STOP_LOSS_CHECK_INTERVAL:
-                    # send_message("손절매 조건 확인 중...", level=MESSAGE_LEVEL_DEBUG)  # 로그 스팸 방지
-                    
-                    # 한 번만 전체 잔고를 조회하여 효율성 향상
-                    all_holdings = {}
-                    for symbol in SYMBOLS:
-                        try:
-                            stock_dict = get_stock_balance(symbol)
-                            if symbol in stock_dict:
-                                all_holdings[symbol] = stock_dict[symbol]
-                        except Exception as e:
-                            send_message(f"{symbol} 잔고 조회 중 오류: {str(e)}", symbol, level=MESSAGE_LEVEL_CRITICAL)
-                    
-                    # 보유 종목에 대해서만 손절매 체크
-                    for symbol, holding_info in all_holdings.items():
-                        try:
-                            # 손절매 확인 메시지 제거 (너무 빈번함)
-                            
-                            # 이미 조회한 잔고 정보를 활용
-                            loss_percent = float(holding_info['profit_rate'])
-                            quantity = holding_info['qty']
-                            
-                            # 현재가를 별도로 조회
-                            current_price = get_current_price(symbol)
-                            if current_price is None or current_price <= 0:
-                                send_message(f"⚠️ {symbol} 현재가 조회 실패로 손절매 건너뜀", symbol, level=MESSAGE_LEVEL_IMPORTANT)
-                                continue
-                                
-                            purchase_price = float(holding_info['purchase_price'])
-                            
-                            # 손절매 조건 확인 (종목별 설정 적용)
-                            if check_stop_loss(symbol):
-                                send_message(f"✅ 손절매 완료: {symbol} {quantity}주 @ ${current_price:.2f}", symbol, level=MESSAGE_LEVEL_CRITICAL)
-                                # 손절매 거래 내역 기록 (check_stop_loss 내부에서 이미 기록되지만, 중복 방지를 위해 여기서는 기록하지 않음)
-                                
-                        except Exception as e:
-                            send_message(f"{symbol} 손절매 체크 중 오류: {str(e)}", symbol, level=MESSAGE_LEVEL_CRITICAL)
-                    
-                    # 미보유 종목 메시지 제거 (불필요함)
-                    
-                    last_stop_loss_check_time = current_time
-                    # 손절매 완료 메시지 제거 (너무 빈번함)
-
-                # RSI + 이동평균 기반 매매 로직
-                if force_first_check or (minutes_elapsed >= RSI_CHECK_INTERVAL and time_to_check):
-                    # 시장 상태 확인
-                    market_open = is_market_time()
-                    if not market_open:
-                        wait_for_market_open()
-                        last_check_time = current_time
-                        force_first_check = False
-                        continue
-                    
-                    # 각 심볼에 대한 처리
-                    for symbol in SYMBOLS:
-                        try:
-                            KST_time = datetime.now(timezone('Asia/Seoul'))
-                            
-                            # RSI 매매 전 손절매 우선 체크 (중복 잔고 조회 방지)
-                            # 최근 설정된 시간 이내에 손절매 체크를 했다면 건너뜀
-                            recent_stop_loss_check = (current_time - last_stop_loss_check_time).total_seconds() < (STOP_LOSS_CHECK_INTERVAL * 60)
-                            
-                            if not recent_stop_loss_check:
-                                # 개별 종목 손절매 체크 (설정된 간격마다 체크를 하지 않았을 때만)
-                                try:
-                                    stock_dict = get_stock_balance(symbol)
-                                    if symbol in stock_dict:
-                                        # 손절매 조건 확인 (종목별 설정 적용)
-                                        loss_percent = float(stock_dict[symbol]['profit_rate'])
-                                        if check_stop_loss(symbol):
-                                            send_message(
-                                                f"⚠️ RSI 체크 중 손절매 조건 발견: {symbol} (손실률: {loss_percent:.2f}%)",
-                                                symbol,
-                                            )
-                                            continue
-                                except Exception as e:
-                                    send_message(f"{symbol} 손절매 사전 체크 중 오류: {str(e)}", symbol)
-                            
-                            # RSI + 이동평균 기반 기술적 분석
-                            #send_message(f"기술적 분석 시작 (RSI + 이동평균)", symbol)
-                            technical_analysis = get_technical_analysis(symbol, RSI_PERIODS, MA_SHORT_PERIOD, MA_LONG_PERIOD, MINUTE_INTERVAL)
-                            if technical_analysis is None:
-                                send_message(f"기술적 분석 실패, 다음 종목으로 넘어갑니다", symbol, level=MESSAGE_LEVEL_DEBUG)
-                                continue
-
-                            # 현재가 정보 (technical_analysis에서 가져옴)
-                            current_price = technical_analysis['current_price']
-                            if current_price is None:
-                                send_message(f"현재가 조회 실패", symbol, level=MESSAGE_LEVEL_DEBUG)
-                                continue
-
-                            # 개선된 매수 조건 판단 (RSI + 이동평균 조합, 종목별 설정 적용)
-                            buy_signal, buy_reason = should_buy(technical_analysis, symbol)
-                            # 매수 분석 메시지는 DEBUG 레벨로 (너무 빈번함) - 주석 처리로 로그 스팸 방지
-                            # send_message(f"매수 분석: {buy_reason}", symbol, level=MESSAGE_LEVEL_DEBUG)
-
-                            # 일일 요약 데이터 수집
-                            collect_daily_summary_data(symbol, technical_analysis, buy_signal, False, buy_reason, "")
-
-                            if buy_signal:
-                                # 배당주 3·6·9·12월: 매수·매도 모두 보류 (배당 수령 위해)
-                                if is_dividend_no_trade_month(symbol):
-                                    send_message(f"⏸ {symbol} 배당락월(3·6·9·12월)이라 매수·매도 보류", symbol, level=MESSAGE_LEVEL_IMPORTANT)
-                                    collect_daily_summary_data(symbol, technical_analysis, True, False, buy_reason, "", "ex_dividend_month")
-                                    continue
-                                print(f"🎯 {symbol} 매수 신호 감지: {buy_reason}")
-                                send_message(f"✅ 매수 신호 감지", symbol, level=MESSAGE_LEVEL_IMPORTANT)
-                                
-                                # 현재 잔고 조회
-                                try:
-                                    cash_balance = get_balance(symbol)
-                                    if cash_balance <= 0:
-                                        send_message(f"주문 가능 잔고가 없습니다", symbol, level=MESSAGE_LEVEL_INFO)
-                                        # 잔고 부족으로 거래 실패 기록
-                                        collect_daily_summary_data(symbol, technical_analysis, True, False, buy_reason, "", "insufficient_balance")
-                                        continue
-                                except Exception as e:
-                                    if 'access_token' in str(e).lower():
-                                        send_message(f"토큰 오류 감지, 토큰 갱신 후 재시도합니다", symbol)
-                                        ACCESS_TOKEN = get_access_token()
-                                        continue
-                                    else:
-                                        send_message(f"잔고 조회 중 오류: {str(e)}", symbol)
-                                        continue
-                                
-                                # 매수 로직 (종목별 설정 적용)
-                                config = get_symbol_config(symbol)
-                                usd_balance = cash_balance
-                                available_usd = usd_balance * config['buy_ratio']
-                                share_price_with_margin = current_price * (1 + config['safety_margin'])
-                                qty = max(1, int(available_usd / share_price_with_margin))
-                                
-                                if qty > 0:
-                                    total_cost = qty * current_price
-                                    
-                                    send_message(f"- 매수 가능 금액: ${available_usd:.2f} (비율: {config['buy_ratio']*100}%)", symbol)
-                                    send_message(f"- 주문 수량: {qty}주", symbol)
-                                    send_message(f"- 주문 가격: ${current_price:.2f}", symbol)
-                                    send_message(f"- 총 주문 금액: ${total_cost:.2f}", symbol)
-                                    send_message(f"- 장기이평 대비: {technical_analysis['price_vs_ma_long_percent']:+.2f}%", symbol)
-                                    
-                                    if total_cost <= (available_usd * (1 - config['safety_margin'])):
-                                        try:
-                                            buy_result = buy(code=symbol, qty=str(qty), price=str(current_price))
-                                            if buy_result:
-                                                bought_list.append(symbol)
-                                                send_message(f"✅ {symbol} {qty}주 매수 완료", symbol)
-                                                # 거래 내역 추가
-                                                add_trade_record(symbol, 'buy', qty, current_price)
-                                            else:
-                                                # 매수 실행 실패 (잔고 부족 등)
-                                                collect_daily_summary_data(symbol, technical_analysis, True, False, buy_reason, "", "insufficient_balance")
-                                        except Exception as e:
-                                            if 'access_token' in str(e).lower():
-                                                send_message(f"매수 중 토큰 오류, 토큰 갱신 후 재시도합니다", symbol)
-                                                ACCESS_TOKEN = get_access_token()
-                                                continue
-                                            else:
-                                                send_message(f"매수 중 오류: {str(e)}", symbol)
-                                    else:
-                                        send_message(f"❌ 안전 마진 적용 후 주문 불가", symbol)
-                                        # 안전 마진으로 인한 거래 실패 기록
-                                        collect_daily_summary_data(symbol, technical_analysis, True, False, buy_reason, "", "insufficient_balance")
-                                else:
-                                    send_message(f"❌ 계산된 매수 수량이 0입니다 (잔고 부족)", symbol)
-                                    # 잔고 부족으로 거래 실패 기록
-                                    collect_daily_summary_data(symbol, technical_analysis, True, False, buy_reason, "", "insufficient_balance")
-
-                            else:
-                                # 매수 조건 미충족
-                                collect_daily_summary_data(symbol, technical_analysis, False, False, buy_reason, "", "condition_not_met")
-                                print(f"❌ {symbol} 매수 신호 없음: {buy_reason}")
-                                # 기존 매도 조건 확인 (보유 종목이 있을 때만)
-                                try:
-                                    stock_dict = get_stock_balance(symbol)
-                                    if symbol in stock_dict:
-                                        stock_info = stock_dict[symbol]
-                                        profit_rate = float(stock_info['profit_rate'])
-                                        purchase_price = float(stock_info['purchase_price'])
-                                        qty = stock_info['qty']
-                                        
-                                        send_message(f"보유 정보 - 매입가: ${purchase_price:.2f}, 손익률: {profit_rate:.2f}%", symbol, level=MESSAGE_LEVEL_DEBUG)
-                                        
-                                        # 부분 익절 체크 (익절 목표의 70% 도달 시 보유량의 50% 매도)
-                                        # 현재가를 technical_analysis에서 가져옴
-                                        if current_price and current_price > 0 and not is_dividend_no_trade_month(symbol):
-                                            # 수익률이 부분 익절 목표 이상이면 체크 (함수 내부에서 조건 확인). 배당월에는 부분 익절도 보류
-                                            check_partial_profit_take(symbol, profit_rate, current_price, get_held_quantity(qty))
-                                        
-                                        # 매도 조건: RSI 설정값 이상 + 수익률 목표 이상일 때 (종목별 설정 적용)
-                                        sell_signal, sell_reason = should_sell(technical_analysis, profit_rate, symbol)
-                                        # 매도 분석 메시지를 DEBUG 레벨로 (너무 빈번함)
-                                        send_message(f"매도 분석: {sell_reason}", symbol, level=MESSAGE_LEVEL_DEBUG)
-                                        
-                                        # 일일 요약 데이터 수집 (매도 신호)
-                                        collect_daily_summary_data(symbol, technical_analysis, False, sell_signal, "", sell_reason)
-                                        
-                                        if sell_signal:
-                                            # 배당주 3·6·9·12월: 매도 보류 (배당 수령 위해)
-                                            if is_dividend_no_trade_month(symbol):
-                                                send_message(f"⏸ {symbol} 배당락월이라 매도 보류 (배당 수령)", symbol, level=MESSAGE_LEVEL_IMPORTANT)
-                                            else:
-                                                print(f"🎯 {symbol} 매도 신호 감지: {sell_reason}")
-                                                held_qty = get_held_quantity(qty)
-                                                sell_qty = get_profit_take_sell_qty(held_qty)
-                                                if sell_qty <= 0:
-                                                    send_message(
-                                                        f"⚠️ {symbol} 보유 {held_qty}주 — 익절 매도 생략 (추세 확인용 1주 유지)",
-                                                        symbol,
-                                                        level=MESSAGE_LEVEL_IMPORTANT,
-                                                    )
-                                                else:
-                                                    send_message(
-                                                        f"✅ 매도 신호 감지 - {sell_qty}주 매도 (1주 유지, 보유 {held_qty}주)",
-                                                        symbol,
-                                                        level=MESSAGE_LEVEL_IMPORTANT,
-                                                    )
-                                                    try:
-                                                        sell_result = sell(code=symbol, qty=str(sell_qty), price=str(current_price))
-                                                        if sell_result:
-                                                            send_message(f"✅ {symbol} {sell_qty}주 매도 완료 (1주 유지로 추세 확인)", symbol, level=MESSAGE_LEVEL_CRITICAL)
-                                                            # 거래 내역 추가 (익절매 구분)
-                                                            add_trade_record(symbol, 'sell_profit_take', sell_qty, current_price)
-                                                            # 익절 후 1주 남음 → 부분 익절 플래그 유지/설정 (재매도 방지)
-                                                            if held_qty - sell_qty <= 1:
-                                                                PARTIAL_PROFIT_TAKEN[symbol] = True
-                                                            elif symbol in PARTIAL_PROFIT_TAKEN:
-                                                                del PARTIAL_PROFIT_TAKEN[symbol]
-                                                                print(f"✅ {symbol} 익절 매도 완료 - 부분 익절 추적 데이터 초기화")
-                                                    except Exception as e:
-                                                        if 'access_token' in str(e).lower():
-                                                            send_message(f"매도 중 토큰 오류, 토큰 갱신 후 재시도합니다", symbol)
-                                                            ACCESS_TOKEN = get_access_token()
-                                                            continue
-                                                        else:
-                                                            send_message(f"매도 중 오류: {str(e)}", symbol)
-                                        else:
-                                            print(f"❌ {symbol} 매도 신호 없음: {sell_reason}")
-                                            # 매도 조건 미충족 메시지 제거 (너무 빈번함)
-                                            pass
-                                            # 참고용으로만 장기이평 대비 위치 표시 (DEBUG 레벨로)
-                                            if technical_analysis['price_vs_ma_long_percent'] is not None:
-                                                send_message(f"- 장기이평 대비: {technical_analysis['price_vs_ma_long_percent']:+.2f}% (참고용)", symbol, level=MESSAGE_LEVEL_DEBUG)
-                                    else:
-                                        # 미보유 종목 메시지를 DEBUG 레벨로 (너무 빈번함)
-                                        send_message(f"📊 {symbol}을 보유하고 있지 않습니다", symbol, level=MESSAGE_LEVEL_DEBUG)
-                                except Exception as e:
-                                    if 'access_token' in str(e).lower():
-                                        send_message(f"주식 잔고 조회 중 토큰 오류, 토큰 갱신 후 재시도합니다", symbol)
-                                        ACCESS_TOKEN = get_access_token()
-                                        continue
-                                    else:
-                                        send_message(f"주식 잔고 조회 중 오류: {str(e)}", symbol)
-                                        continue
-
-                        except Exception as symbol_error:
-                            send_message(f"🚨 {symbol} 처리 중 오류: {str(symbol_error)}")
-                            continue
-                    
-                    last_check_time = current_time
-                    force_first_check = False
-                    
-                    # 다음 체크 시간 계산
-                    next_check_minutes = 60 - (NAS_time.minute % 60)
-                    if next_check_minutes == 0:
-                        next_check_minutes = 60
-                    # 다음 체크 시간 메시지를 DEBUG 레벨로 (너무 빈번함)
-                    send_message(f"⏳ 다음 기술적 분석까지 약 {next_check_minutes}분 남았습니다", level=MESSAGE_LEVEL_DEBUG)
-                    
-                    # 정확히 다음 체크까지 대기
-                    time.sleep(next_check_minutes * 60)
-
-                # 장 마감 체크 (시장 상태 변경 감지에서 이미 처리되므로 여기서는 제거)
-                # 시장 상태 변경 감지 로직에서 이미 마감 처리 및 요약 발송을 수행함
-                
-                # AWS 사용량 저감을 위한 대기 시간 최적화
-                if is_market_time():
-                    time.sleep(30)  # 시장 개장 시: 30초마다 체크
-                else:
-                    time.sleep(300)  # 시장 마감 시: 5분마다 체크
+            # 작업 등록 후 다음 마감 시각까지 대기 → 실행 반복 (장 개장/마감, 손절매, 봉 마감 분석, 토큰 갱신, 일일 요약)
+            schedule_trading_jobs()
+            SCHEDULER.run_forever(max_sleep=SCHEDULER_MAX_SLEEP)
                 
         except Exception as main_error:
             error_msg = str(main_error).lower()
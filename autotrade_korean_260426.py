@@ -11,6 +11,8 @@
 #260426 이동평균 대비 최대 가격 초과율 조정
 #260426 최소 수익률 조정
 #260426 매도 조건 조정
+#261018 디스코드 발송을 알림 서비스(notify_service.py)로 이전: 메시지는 큐에 넣고 바로 반환 (매매 루프가 웹훅 응답을 기다리지 않음)
+#261018 실행 중 진단(diagnostics.py): SIGUSR1 또는 upbit_bot.diagnostics.trigger 파일로 스택 샘플링 + 메모리 스냅샷 저장, 거래 단계별 실행 시간 상시 기록
 
      
 
@@ -24,11 +26,12 @@ import time
 import sqlite3
 import yaml
 import schedule
-import requests
 from datetime import datetime
 from dotenv import load_dotenv
 import pyupbit
 import ta
+from notify_service import create_notifier
+from diagnostics import Diagnostics, StageTimer
 
 # 환경 변수 로드
 load_dotenv()
@@ -89,9 +92,24 @@ try:
     with open('config.yaml', encoding='UTF-8') as f:
         _cfg = yaml.safe_load(f)
     DISCORD_WEBHOOK_URL = _cfg.get('DISCORD_WEBHOOK_URL', '')
+    NOTIFY_SERVER_ADDRESS = tuple(_cfg['NOTIFY_SERVER_ADDRESS']) if _cfg.get('NOTIFY_SERVER_ADDRESS') else None
+    NOTIFY_AUTHKEY = _cfg.get('NOTIFY_AUTHKEY')
+    DIAGNOSTICS_TRACE_FROM_START = bool(_cfg.get('DIAGNOSTICS_TRACE_FROM_START', False))
 except Exception as e:
     logger.error(f"설정 파일 로드 오류: {e}")
     DISCORD_WEBHOOK_URL = ''
+    NOTIFY_SERVER_ADDRESS = None
+    NOTIFY_AUTHKEY = None
+    DIAGNOSTICS_TRACE_FROM_START = False
+
+# 디스코드 발송은 알림 서비스가 담당 (로컬 알림 서버가 있으면 다른 봇과 레이트 리밋 공유, 없으면 프로세스 안에서 발송)
+NOTIFIER = create_notifier(DISCORD_WEBHOOK_URL, address=NOTIFY_SERVER_ADDRESS, authkey=NOTIFY_AUTHKEY)
+
+# 실행 중 진단: kill -USR1 <pid> 또는 touch upbit_bot.diagnostics.trigger → 스택 샘플링 + 메모리 스냅샷을 diagnostics/ 폴더에 저장
+# tracemalloc은 캡처 때만 추적 (config.yaml DIAGNOSTICS_TRACE_FROM_START: true면 시작부터 추적 - 메모리 누수 조사용)
+# 거래 단계별(데이터 수집/평가/주문) 실행 시간은 상시 기록해 스케줄 정보 로그와 함께 출력
+STAGE_TIMER = StageTimer()
+DIAGNOSTICS = Diagnostics('upbit_bot', stages=STAGE_TIMER, sample_seconds=30, trace_from_start=DIAGNOSTICS_TRACE_FROM_START)
 
 # 메시지 발송 제어를 위한 전역 변수
 last_hold_message_time = None
@@ -142,8 +160,8 @@ def send_discord_message(msg, force_send=False):
                     return
             last_error_message_time = current_time
         
-        message = {"content": f"[{current_time.strftime('%H:%M')}] {str(msg)}"}
-        requests.post(DISCORD_WEBHOOK_URL, json=message, timeout=10)
+        # 큐에 넣고 바로 반환 (레이트 리밋/429/재시도는 알림 서비스에서 처리)
+        NOTIFIER.send(f"[{current_time.strftime('%H:%M')}] {str(msg)}")
         # print 제거 (콘솔 출력 최소화)
         
     except Exception as e:
@@ -320,6 +338,7 @@ cache_timestamp = None
 CACHE_DURATION = 180  # 3분 캐시 (기존 1분에서 증가)
 
 # 시장 데이터 수집 및 분석 함수
+@STAGE_TIMER.timed()
 def collect_market_data():
     """시장 데이터 수집 및 기술적 지표 계산 (캐싱 적용)"""
     global cached_market_data, cache_timestamp
@@ -444,6 +463,7 @@ def calculate_trend(df):
         logger.error(f"추세 분석 중 오류: {e}")
         return "알 수 없음"
 
+@STAGE_TIMER.timed()
 def evaluate_trade_possibility(market_data):
     """거래 가능성 평가 (개선된 조건)"""
     try:
@@ -518,6 +538,7 @@ def evaluate_trade_possibility(market_data):
         return {'signal': 'hold', 'reason': '평가 오류'}
 
 # 거래 실행 함수들
+@STAGE_TIMER.timed()
 def execute_trade(signal, percentage, market_data):
     """실제 거래 실행"""
     try:
@@ -734,6 +755,7 @@ def get_database_connection():
         return None
 
 # 메인 트레이딩 봇 함수
+@STAGE_TIMER.timed()
 def trading_bot():
     """메인 트레이딩 로직"""
     try:
@@ -805,6 +827,7 @@ def run_scheduled_trading():
         trading_bot()
         if should_log('schedule_info'):
             logger.info("거래 완료")
+            logger.info(STAGE_TIMER.format_summary())
     except Exception as e:
         logger.error(f"거래 오류: {e}")
 
@@ -833,6 +856,9 @@ def main():
             f"• 연속 손실 제한: {TRADING_CONFIG['CONSECUTIVE_LOSS_LIMIT']}회"
         )
         send_discord_message(start_message, force_send=True)
+
+        # 진단 트리거 등록 (스케줄 루프가 도는 메인 스레드가 샘플링 대상)
+        DIAGNOSTICS.install()
         
         # 1시간마다 트레이딩 봇 실행 (데이터 조회 빈도 저감)
         schedule.every(1).hours.do(run_scheduled_trading)
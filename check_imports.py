@@ -0,0 +1,76 @@
+# 자동매매 스크립트 import 점검 (모듈 최상위 코드의 정의 순서 오류 등 확인용)
+# 임시 폴더에 더미 config.yaml과 거래소 달력 파일을 두고 각 스크립트를 import만 해 본다 (main()은 실행하지 않음)
+# - 모듈 최상위에서 네트워크 호출이 없어야 통과 (토큰 발급/조회는 main() 이후)
+# - 설치되지 않은 외부 패키지 때문에 import할 수 없는 스크립트는 건너뜀으로 표시
+# 사용법: python check_imports.py [스크립트.py ...] (생략하면 CHECK_SCRIPTS 전체)
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECK_SCRIPTS = [
+    'UsaStockAutoTrade_Modify_Multi_260517.py',
+    'UsaStockAutoTrade_Async_261018.py',
+    'KoreaStockAutoTrade_260426.py',
+    'Koreastock_RSI_Check_0126.py',
+]
+CALENDAR_FILES = ['market_calendar_us.json', 'market_calendar_krx.json']
+DUMMY_CONFIG = """APP_KEY: dummy-app-key
+APP_SECRET: dummy-app-secret
+CANO: '00000000'
+ACNT_PRDT_CD: '01'
+DISCORD_WEBHOOK_URL: ''
+URL_BASE: https://127.0.0.1:9
+"""
+
+
+def check_script(filename):
+    """스크립트 1개 import → ('ok' | 'skip' | 'fail', 메시지)"""
+    module_name = os.path.splitext(filename)[0]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except ModuleNotFoundError as e:
+        # 저장소 안의 모듈을 못 찾은 경우는 실패, 외부 패키지 미설치는 건너뜀
+        if e.name and os.path.exists(os.path.join(REPO_DIR, f"{e.name}.py")):
+            return 'fail', traceback.format_exc()
+        return 'skip', f"외부 패키지 미설치: {e.name}"
+    except Exception:
+        return 'fail', traceback.format_exc()
+    finally:
+        sys.modules.pop(module_name, None)
+    return 'ok', ''
+
+
+def main(scripts):
+    work_dir = tempfile.mkdtemp(prefix='check_imports_')
+    cwd = os.getcwd()
+    sys.path.insert(0, REPO_DIR)
+    failed = 0
+    try:
+        with open(os.path.join(work_dir, 'config.yaml'), 'w', encoding='utf-8') as f:
+            f.write(DUMMY_CONFIG)
+        for name in CALENDAR_FILES:
+            shutil.copy(os.path.join(REPO_DIR, name), work_dir)
+        os.chdir(work_dir)
+        for filename in scripts:
+            status, message = check_script(filename)
+            mark = {'ok': '✅', 'skip': '⏭', 'fail': '❌'}[status]
+            print(f"{mark} {filename}" + (f" ({message})" if status == 'skip' else ''))
+            if status == 'fail':
+                failed += 1
+                print(message)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(sys.argv[1:] or CHECK_SCRIPTS) else 0)
@@ -0,0 +1,270 @@
+# 장기 실행 봇 진단 (재시작 없이 프로파일링/메모리 확인)
+# - 트리거: SIGUSR1 시그널(kill -USR1 <pid>) 또는 제어 파일 생성(touch <이름>.diagnostics.trigger - 봇마다 따로)
+# - 캡처: 메인 스레드 스택을 N초 동안 샘플링 + tracemalloc 상위 할당 스냅샷(직전 스냅샷 대비 증가분 포함)
+#         → diagnostics/<이름>_<시각>.txt (스택은 flamegraph용 collapsed 형식 포함)
+# - 캡처는 별도 스레드에서 실행 (매매 루프는 멈추지 않음, 샘플링 중에만 약간의 오버헤드)
+# - 상시 모드: StageTimer로 루프 단계별 실행 시간(횟수/합계/최대) 기록 → 캡처 파일과 일일 로그에 포함
+
+import gc
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+DIAGNOSTICS_DIR = 'diagnostics'                 # 캡처 파일 저장 폴더
+DIAGNOSTICS_TRIGGER_FILE = '{name}.diagnostics.trigger'  # 이 파일이 생기면 캡처 1회 후 삭제 ({name}: 진단 이름)
+DIAGNOSTICS_SAMPLE_SECONDS = 30                 # 스택 샘플링 시간 (초)
+DIAGNOSTICS_SAMPLE_INTERVAL = 0.01              # 스택 샘플링 간격 (초)
+DIAGNOSTICS_TOP_N = 25                          # 상위 항목 출력 개수
+TRACEMALLOC_FRAMES = 10                         # 할당 위치 추적 프레임 수 (캡처 때만 켜는 경우)
+TRACEMALLOC_START_FRAMES = 1                    # 시작부터 추적할 때 프레임 수 (상시 오버헤드 최소화)
+
+
+class StageTimer:
+    """루프 단계별 실행 시간 누적 (상시 사용 - 호출당 perf_counter 2회 + 락 1회)"""
+
+    def __init__(self):
+        self._stats = {}        # {단계 이름: [횟수, 합계(초), 최대(초), 마지막(초)]}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def add(self, name, elapsed):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                self._stats[name] = [1, elapsed, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+                stats[3] = elapsed
+
+    @contextmanager
+    def stage(self, name):
+        """with STAGES.stage('이름'): ... 블록 실행 시간 기록 (예외가 나도 기록)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def timed(self, name=None):
+        """함수 실행 시간 기록 데코레이터 (name 없으면 함수 이름)"""
+        def decorator(func):
+            stage_name = name or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            return {name: tuple(stats) for name, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.time()
+
+    def format_summary(self):
+        """단계별 한 줄씩 (합계 시간 큰 순서)"""
+        rows = sorted(self.snapshot().items(), key=lambda kv: -kv[1][1])
+        if not rows:
+            return "단계 실행 기록 없음"
+        lines = [f"단계별 실행 시간 ({datetime.fromtimestamp(self.started_at):%Y-%m-%d %H:%M:%S} 이후)"]
+        for name, (count, total, max_elapsed, last) in rows:
+            lines.append(f"  {name}: {count}회, 합계 {total:.1f}초, 평균 {total / count * 1000:.0f}ms, "
+                         f"최대 {max_elapsed * 1000:.0f}ms, 마지막 {last * 1000:.0f}ms")
+        return "\n".join(lines)
+
+
+def _frame_stack(frame):
+    """프레임 → 'file:func:line' 목록 (바깥 → 안쪽 순서)"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class Diagnostics:
+    """진단 캡처 (시그널/제어 파일 트리거, 캡처는 백그라운드 스레드)"""
+
+    def __init__(self, name, stages=None, watch=None, output_dir=DIAGNOSTICS_DIR,
+                 trigger_file=DIAGNOSTICS_TRIGGER_FILE, sample_seconds=DIAGNOSTICS_SAMPLE_SECONDS,
+                 sample_interval=DIAGNOSTICS_SAMPLE_INTERVAL, top_n=DIAGNOSTICS_TOP_N,
+                 trace_from_start=False):
+        """
+        name: 파일 이름 앞부분 (예: 'usa_trader')
+        trigger_file: 제어 파일 경로 ({name}은 진단 이름으로 바뀜 - 같은 폴더의 여러 봇이 서로의 트리거를 가져가지 않음)
+        stages: StageTimer (캡처 파일에 단계별 실행 시간 포함)
+        watch: {이름: 크기 반환 함수} - 캡처 시 크기 기록 (예: {'DAILY_SUMMARY_DATA': lambda: len(DAILY_SUMMARY_DATA)})
+        trace_from_start: True면 install 시점부터 tracemalloc 추적 (메모리 증가 원인 추적용 - 모든 할당에 상시 오버헤드라
+                          기본은 False, 캡처 때만 추적)
+        """
+        self.name = name
+        self.stages = stages
+        self.watch = watch or {}
+        self.output_dir = output_dir
+        self.trigger_file = trigger_file.format(name=name) if trigger_file else None
+        self.sample_seconds = sample_seconds
+        self.sample_interval = sample_interval
+        self.top_n = top_n
+        self.trace_from_start = trace_from_start
+        self.target_thread_id = None
+        self._capture_lock = threading.Lock()
+        self._last_snapshot = None
+        self._watcher = None
+
+    def install(self, signal_num=getattr(signal, 'SIGUSR1', None), poll_interval=5):
+        """트리거 등록 (메인 스레드에서 호출 - 이 스레드가 샘플링 대상)"""
+        self.target_thread_id = threading.get_ident()
+        if self.trace_from_start and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_START_FRAMES)
+        if signal_num is not None:
+            try:
+                signal.signal(signal_num, lambda signum, frame: self.trigger('signal'))
+            except (ValueError, OSError) as e:
+                print(f"진단 시그널 등록 실패: {e}")
+        if self.trigger_file and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_trigger_file, args=(poll_interval,),
+                                             name='diagnostics-trigger', daemon=True)
+            self._watcher.start()
+        print(f"🩺 진단 훅 등록: kill -USR1 {os.getpid()} 또는 touch {self.trigger_file}")
+
+    def trigger(self, source='manual'):
+        """캡처 시작 (이미 캡처 중이면 무시, 바로 반환)"""
+        if self._capture_lock.locked():
+            print("🩺 진단 캡처가 이미 진행 중입니다")
+            return False
+        threading.Thread(target=self.capture, args=(source,), name='diagnostics-capture', daemon=True).start()
+        return True
+
+    def _watch_trigger_file(self, poll_interval):
+        while True:
+            time.sleep(poll_interval)
+            if os.path.exists(self.trigger_file):
+                try:
+                    os.remove(self.trigger_file)
+                except OSError:
+                    pass
+                self.trigger('file')
+
+    # ===== 캡처 =====
+
+    def sample_stacks(self, seconds, interval, thread_id=None):
+        """thread_id 스레드 스택을 seconds 동안 interval마다 샘플링 → Counter({collapsed 스택: 횟수})"""
+        thread_id = thread_id or self.target_thread_id or threading.main_thread().ident
+        samples = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                samples[";".join(_frame_stack(frame))] += 1
+            del frame
+            time.sleep(interval)
+        return samples
+
+    def capture(self, source='manual'):
+        """스택 샘플 + 메모리 스냅샷을 파일 1개로 저장 (저장 경로 반환)"""
+        with self._capture_lock:
+            started_at = datetime.now()
+            print(f"🩺 진단 캡처 시작 ({source}): 스택 {self.sample_seconds}초 샘플링")
+            tracing_started_here = not tracemalloc.is_tracing()
+            if tracing_started_here:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+
+            samples = self.sample_stacks(self.sample_seconds, self.sample_interval)
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+
+            lines = [f"# 진단 캡처: {self.name} pid {os.getpid()} ({source})",
+                     f"# 시작 {started_at:%Y-%m-%d %H:%M:%S}, 스택 샘플 {sum(samples.values())}개 "
+                     f"({self.sample_seconds}초, {self.sample_interval * 1000:.0f}ms 간격)", ""]
+            lines += self._format_stage_section()
+            lines += self._format_watch_section()
+            lines += self._format_stack_section(samples)
+            lines += self._format_memory_section(snapshot, current, peak, tracing_started_here)
+            lines += self._format_gc_section()
+            lines += ["## 스택 샘플 (collapsed, flamegraph.pl / speedscope 입력용)"]
+            lines += [f"{stack} {count}" for stack, count in samples.most_common()]
+
+            # 추적을 계속 유지할 때만 다음 캡처에서 증가분 비교 (중간에 끈 스냅샷끼리는 비교 의미 없음)
+            if tracing_started_here and not self.trace_from_start:
+                tracemalloc.stop()
+                self._last_snapshot = None
+            else:
+                self._last_snapshot = snapshot
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{self.name}_{started_at:%Y%m%d_%H%M%S}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            print(f"🩺 진단 캡처 저장: {path}")
+            return path
+
+    def _format_stage_section(self):
+        if self.stages is None:
+            return []
+        return ["## " + self.stages.format_summary(), ""]
+
+    def _format_watch_section(self):
+        if not self.watch:
+            return []
+        lines = ["## 주요 객체 크기"]
+        for name, size_func in self.watch.items():
+            try:
+                lines.append(f"  {name}: {size_func()}")
+            except Exception as e:
+                lines.append(f"  {name}: 조회 실패 ({e})")
+        return lines + [""]
+
+    def _format_stack_section(self, samples):
+        total = sum(samples.values())
+        lines = [f"## 함수별 샘플 비율 (상위 {self.top_n}, self = 가장 안쪽 프레임 / total = 스택에 포함)"]
+        if not total:
+            return lines + ["  샘플 없음 (대상 스레드 없음)", ""]
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in samples.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for func in set(f.rsplit(":", 1)[0] for f in frames):
+                total_counts[func] += count
+        for frame, count in self_counts.most_common(self.top_n):
+            func = frame.rsplit(":", 1)[0]
+            lines.append(f"  self {count / total * 100:5.1f}% total {total_counts[func] / total * 100:5.1f}%  {frame}")
+        return lines + [""]
+
+    def _format_memory_section(self, snapshot, current, peak, tracing_started_here):
+        lines = [f"## 메모리 (tracemalloc 현재 {current / 1024 / 1024:.1f}MB, 최대 {peak / 1024 / 1024:.1f}MB)"]
+        if tracing_started_here:
+            lines.append("  ※ 추적을 이번 캡처 시작 시점에 켰으므로 샘플링 구간 동안의 할당만 포함 (trace_from_start=True면 전체 추적)")
+        lines.append(f"### 상위 할당 위치 (상위 {self.top_n})")
+        for stat in snapshot.statistics('lineno')[:self.top_n]:
+            lines.append(f"  {stat.size / 1024:9.1f}KB {stat.count:7d}개  {stat.traceback[0]}")
+        if self._last_snapshot is not None:
+            lines.append(f"### 직전 캡처 대비 증가 (상위 {self.top_n})")
+            for stat in snapshot.compare_to(self._last_snapshot, 'lineno')[:self.top_n]:
+                lines.append(f"  {stat.size_diff / 1024:+9.1f}KB {stat.count_diff:+7d}개  {stat.traceback[0]}")
+        return lines + [""]
+
+    def _format_gc_section(self):
+        counts = Counter(type(obj).__name__ for obj in gc.get_objects())
+        lines = [f"## GC 추적 객체 수 (총 {sum(counts.values()):,}개, 상위 {self.top_n})"]
+        lines += [f"  {name}: {count:,}" for name, count in counts.most_common(self.top_n)]
+        return lines + [""]
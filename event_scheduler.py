@@ -0,0 +1,199 @@
+# 마감 시각(deadline) 기반 이벤트 스케줄러
+# 메인 루프가 일정 간격으로 시계를 확인하는 대신, 다음 작업의 마감 시각까지 정확히 대기했다가 실행하기 위한 모듈
+# - 이름이 있는 주기 작업 / 다음 시각 계산 함수 작업 / 1회 작업 (같은 이름으로 다시 등록하면 기존 작업 교체)
+# - 마감 시각을 놓쳤을 때(앞 작업이 오래 걸린 경우 등) 처리 정책: MISFIRE_RUN_ONCE / MISFIRE_SKIP
+# - 시각은 time.time() 기준 (봉 마감, 장 개장/마감 같은 벽시계 시각에 맞추기 위해)
+
+import heapq
+import itertools
+import threading
+import time
+
+MISFIRE_RUN_ONCE = 'run_once'   # 늦었어도 1회만 실행 (밀린 회차를 몰아서 반복 실행하지 않음)
+MISFIRE_SKIP = 'skip'           # 허용 지연(grace)을 넘기면 이번 회차는 건너뛰고 다음 마감 시각으로
+
+SCHEDULER_MAX_SLEEP = 300       # 한 번에 최대 대기 시간 (초, 시스템 시계 변경/절전 후 마감 시각 재확인)
+LATE_LOG_THRESHOLD = 1.0        # 이 시간(초) 이상 늦게 실행되면 지연 로그 출력
+
+
+class Job:
+    """스케줄러 작업 (interval, next_time_func 둘 다 없으면 1회 작업)"""
+
+    __slots__ = ('name', 'func', 'next_run', 'interval', 'next_time_func',
+                 'misfire', 'grace', 'cancelled', 'run_count', 'miss_count')
+
+    def __init__(self, name, func, next_run, interval=None, next_time_func=None,
+                 misfire=MISFIRE_RUN_ONCE, grace=None):
+        self.name = name
+        self.func = func
+        self.next_run = next_run
+        self.interval = interval
+        self.next_time_func = next_time_func
+        self.misfire = misfire
+        self.grace = grace
+        self.cancelled = False
+        self.run_count = 0
+        self.miss_count = 0
+
+    def following_run(self, deadline, now):
+        """이번 회차(deadline) 다음 마감 시각 (None이면 작업 종료)"""
+        if self.interval:
+            next_run = deadline + self.interval
+            if next_run <= now:
+                # 밀린 회차는 건너뛰고 주기(위상)는 유지
+                next_run += (int((now - next_run) // self.interval) + 1) * self.interval
+            return next_run
+        if self.next_time_func:
+            return self.next_time_func(now)
+        return None
+
+
+class EventScheduler:
+    """힙(heap) 기반 이벤트 스케줄러 (작업 추가/취소는 다른 스레드나 작업 안에서도 가능)"""
+
+    def __init__(self, on_error=None, clock=time.time):
+        """
+        on_error: 작업 예외 처리 함수 on_error(job_name, exception) (None이면 출력만 하고 계속 실행)
+        clock: 현재 시각 함수 (epoch 초)
+        """
+        self.on_error = on_error
+        self.clock = clock
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()   # 같은 마감 시각은 등록 순서대로 실행
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    # ===== 작업 등록 =====
+
+    def _schedule(self, job):
+        with self._lock:
+            old = self._jobs.get(job.name)
+            if old is not None:
+                old.cancelled = True
+            self._jobs[job.name] = job
+            if job.next_run is None:
+                del self._jobs[job.name]
+                return job
+            heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+        self._wakeup.set()
+        return job
+
+    def add_interval(self, name, interval, func, start_at=None, misfire=MISFIRE_RUN_ONCE, grace=None):
+        """주기 작업 (start_at부터 interval초마다, start_at 없으면 지금부터 interval초 뒤 첫 실행)"""
+        if start_at is None:
+            start_at = self.clock() + interval
+        return self._schedule(Job(name, func, start_at, interval=interval, misfire=misfire, grace=grace))
+
+    def add_deadline_job(self, name, next_time_func, func, misfire=MISFIRE_RUN_ONCE, grace=None):
+        """다음 마감 시각을 함수로 계산하는 작업 (봉 마감 등, next_time_func(now)가 None이면 작업 종료)"""
+        return self._schedule(Job(name, func, next_time_func(self.clock()), next_time_func=next_time_func,
+                                  misfire=misfire, grace=grace))
+
+    def add_oneshot(self, name, run_at, func, misfire=MISFIRE_RUN_ONCE, grace=None):
+        """1회 작업 (run_at 시각에 한 번 실행)"""
+        return self._schedule(Job(name, func, run_at, misfire=misfire, grace=grace))
+
+    def cancel(self, *names):
+        """작업 취소 (힙에서는 실행 시점에 버림)"""
+        with self._lock:
+            for name in names:
+                job = self._jobs.pop(name, None)
+                if job is not None:
+                    job.cancelled = True
+
+    def clear(self):
+        """전체 작업 취소"""
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._jobs.clear()
+            self._heap.clear()
+
+    def has_job(self, name):
+        with self._lock:
+            return name in self._jobs
+
+    def next_deadline(self):
+        """가장 가까운 마감 시각 (작업이 없으면 None)"""
+        with self._lock:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    # ===== 실행 =====
+
+    def _pop_due(self, now):
+        """마감 시각이 지난 작업 1개 (없으면 None)"""
+        with self._lock:
+            while self._heap:
+                deadline, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                if deadline > now:
+                    return None
+                heapq.heappop(self._heap)
+                return deadline, job
+        return None
+
+    def _reschedule(self, job, deadline, now):
+        try:
+            next_run = job.following_run(deadline, now)
+        except Exception as e:
+            print(f"⚠️ 작업 다음 시각 계산 오류 ({job.name}): {e}")
+            next_run = None
+        with self._lock:
+            if job.cancelled or self._jobs.get(job.name) is not job:
+                return
+            if next_run is None:
+                del self._jobs[job.name]
+                return
+            job.next_run = next_run
+            heapq.heappush(self._heap, (next_run, next(self._seq), job))
+
+    def run_pending(self):
+        """마감 시각이 지난 작업 실행 (실행한 작업 수)"""
+        executed = 0
+        while True:
+            now = self.clock()
+            due = self._pop_due(now)
+            if due is None:
+                return executed
+            deadline, job = due
+            late = now - deadline
+
+            if job.misfire == MISFIRE_SKIP and job.grace is not None and late > job.grace:
+                job.miss_count += 1
+                print(f"⏭ 작업 건너뜀 ({job.name}): 마감 시각보다 {late:.0f}초 늦음 (허용 {job.grace}초)")
+                self._reschedule(job, deadline, now)
+                continue
+            if late >= LATE_LOG_THRESHOLD:
+                print(f"⏱ 작업 지연 실행 ({job.name}): {late:.1f}초 늦음")
+
+            try:
+                job.func()
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(job.name, e)
+                else:
+                    print(f"🚨 작업 실행 오류 ({job.name}): {e}")
+            job.run_count += 1
+            executed += 1
+            self._reschedule(job, deadline, self.clock())
+
+    def run_forever(self, max_sleep=SCHEDULER_MAX_SLEEP):
+        """stop() 호출 전까지 다음 마감 시각까지 대기 → 실행 반복"""
+        self._stopped = False
+        while not self._stopped:
+            self.run_pending()
+            deadline = self.next_deadline()
+            timeout = max_sleep if deadline is None else min(max(deadline - self.clock(), 0), max_sleep)
+            # 작업이 새로 등록되거나 stop() 되면 즉시 깨어남
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
@@ -0,0 +1,186 @@
+# KIS(한국투자증권) REST API asyncio 클라이언트
+# 동기 KISClient(kis_client.py)와 토큰/초당 요청 한도/호출 계측을 공유하고 HTTP 요청만 aiohttp로 처리
+# - 동시에 진행 중인 요청 수는 세마포어로 제한 (종목 수가 많아도 KIS 서버에 한꺼번에 몰리지 않음)
+# - 초당 요청 한도는 KISClient.reserve_budget()으로 동기 스레드(체결 대사 등)와 합산
+# - 토큰 발급/재발급은 KISClient(single-flight, 토큰 캐시 파일)에 위임 - 이벤트 루프를 막지 않도록 스레드에서 실행
+# - 재시도 규칙(GET만 재시도, 토큰 오류 1회 재발급, 5xx/초당 건수 초과 백오프)은 KISClient.request와 동일
+
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from kis_client import KISClient, RATE_LIMIT_CODES, RETRY_STATUS_CODES
+
+
+class AsyncResponse:
+    """aiohttp 응답 본문을 읽어 둔 결과 (requests.Response처럼 status_code/text/json() 제공)"""
+
+    __slots__ = ('status_code', 'content')
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncKISClient:
+    """KIS REST API asyncio 클라이언트 (이벤트 루프 1개에서 사용)"""
+
+    def __init__(self, client, max_in_flight=8, timeout=None):
+        """
+        client: 동기 KISClient (앱키, 토큰, 초당 요청 한도, 계측, 주문 전송 지연 기록 공유)
+        max_in_flight: 동시에 진행 중인 요청 수 상한
+        timeout: 요청별 타임아웃 (초, None이면 client.timeout)
+        """
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout or client.timeout
+        self._session = None
+        self._semaphore = None
+        self._token_lock = None
+
+    async def start(self):
+        """세션 생성 (실행 중인 이벤트 루프 안에서 호출)"""
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._token_lock = asyncio.Lock()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ===== 토큰 =====
+
+    async def get_token(self):
+        """현재 토큰 (없거나 만료 임박이면 발급 - 동시에 기다리는 태스크는 1회 발급 결과를 함께 사용)"""
+        if not self.client.token_needs_refresh():
+            return self.client.access_token
+        async with self._token_lock:
+            return await asyncio.to_thread(self.client.refresh_token)
+
+    async def refresh_token(self, stale_token):
+        """서버가 거부한 토큰 재발급 (다른 태스크가 이미 바꿨으면 새 토큰 그대로 사용)"""
+        async with self._token_lock:
+            return await asyncio.to_thread(self.client.refresh_token, stale_token)
+
+    # ===== 요청 =====
+
+    async def acquire_budget(self):
+        """동기 클라이언트와 합산한 초당 요청 수 제한"""
+        wait = self.client.reserve_budget()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _send(self, method, url, headers, params, data, timeout):
+        """요청 1회 (세마포어로 동시 요청 수 제한, 본문까지 읽고 연결 반환)"""
+        async with self._semaphore:
+            async with self._session.request(
+                method, url, headers=headers, params=params, data=data,
+                timeout=aiohttp.ClientTimeout(total=timeout or self.timeout),
+            ) as res:
+                return AsyncResponse(res.status, await res.read())
+
+    async def request(self, method, path, tr_id, params=None, body=None, extra_headers=None,
+                      retries=None, timeout=None):
+        """KIS API 요청 (재시도/토큰 재발급 규칙은 KISClient.request와 동일)
+
+        Returns:
+            AsyncResponse (토큰 발급 실패 시에도 마지막 응답 또는 None)
+        """
+        method = method.upper()
+        client = self.client
+        url = f"{client.url_base}/{path.lstrip('/')}"
+        if retries is None:
+            retries = client.max_retries if method == 'GET' else 0
+
+        token = await self.get_token()
+        if not token:
+            return None
+
+        data = json.dumps(body) if body is not None else None
+        attempt = 0
+        token_retried = False
+        started = time.perf_counter()
+        res = None
+        try:
+            while True:
+                await self.acquire_budget()
+                try:
+                    res = await self._send(method, url, client.build_headers(tr_id, token, extra_headers),
+                                           params, data, timeout)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    res = None
+                    if attempt < retries:
+                        attempt += 1
+                        print(f"KIS 요청 재시도 {attempt}/{retries} ({tr_id}): {e!r}")
+                        await asyncio.sleep(client.backoff * (2 ** (attempt - 1)))
+                        continue
+                    raise
+
+                if KISClient.is_token_error(res) and not token_retried:
+                    token_retried = True
+                    print(f"토큰 오류 응답 ({tr_id}), 토큰 재발급 후 재시도")
+                    new_token = await self.refresh_token(token)
+                    if not new_token:
+                        return res
+                    token = new_token
+                    continue
+
+                retryable = (res.status_code in RETRY_STATUS_CODES
+                             or any(code in res.text for code in RATE_LIMIT_CODES))
+                if retryable and attempt < retries:
+                    attempt += 1
+                    print(f"KIS 요청 재시도 {attempt}/{retries} ({tr_id}): 상태 코드 {res.status_code}")
+                    await asyncio.sleep(client.backoff * (2 ** (attempt - 1)))
+                    continue
+                return res
+        finally:
+            client._record(tr_id, started, res, retries=attempt + int(token_retried),
+                           bytes_sent=len(data.encode()) if data else 0)
+
+    async def submit_order(self, path, tr_id, body):
+        """주문 전송 (재시도 없음) - 전송 지연은 동기 클라이언트의 order_latencies에 함께 기록"""
+        client = self.client
+        started_at = time.time()
+        started = time.perf_counter()
+        res = None
+        extra_headers = None
+        try:
+            if client.order_hashkey:
+                hash_key = await asyncio.to_thread(client.hashkey, body)
+                if not hash_key:
+                    return None
+                extra_headers = {"hashkey": hash_key}
+            res = await self.request('POST', path, tr_id, body=body, extra_headers=extra_headers, retries=0)
+            return res
+        finally:
+            elapsed = time.perf_counter() - started
+            status = res.status_code if res is not None else None
+            client.order_latencies.append((started_at, tr_id, elapsed, status))
+            print(f"⏱ 주문 전송 {tr_id}: {elapsed * 1000:.0f}ms (상태 {status}, 해시키 {'사용' if client.order_hashkey else '생략'})")
+
+    async def get(self, path, tr_id, params=None, **kwargs):
+        return await self.request('GET', path, tr_id, params=params, **kwargs)
+
+    async def post(self, path, tr_id, body=None, **kwargs):
+        return await self.request('POST', path, tr_id, body=body, **kwargs)
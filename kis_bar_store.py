@@ -0,0 +1,171 @@
+# KIS 봉 데이터 로컬 저장소 (SQLite)
+# 종목/봉 단위별로 API 원본 행(output2)을 타임스탬프 키로 저장해 두고
+# 재조회 시 마지막 저장 시점 이후의 봉만 받아오도록 하기 위한 모듈
+# - (종목, 봉 단위, 타임스탬프) 기본 키가 곧 클러스터 인덱스 (WITHOUT ROWID) - 기간 조회는 인덱스 범위 검색
+# - 거래일별 동기화 완료 시각(bar_sync)을 함께 기록해 중간에 실패한 거래일(공백)은 다음 조회 때 다시 받음
+
+import json
+import sqlite3
+
+BAR_STORE_PATH = 'kis_bars.db'     # 봉 데이터 저장 파일 (지우면 다음 실행 시 전체 재조회)
+BAR_STORE_MAX_ROWS = 3000          # 종목/봉 단위별 최대 보관 행 수
+
+
+def get_bar_store_connection(db_path=BAR_STORE_PATH):
+    """저장소 연결 (스레드별로 새 연결을 사용)"""
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+def init_bar_store(db_path=BAR_STORE_PATH):
+    """저장소 테이블 생성"""
+    conn = get_bar_store_connection(db_path)
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                ts TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (symbol, timeframe, ts)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS bar_sync (
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                day TEXT NOT NULL,
+                synced_until REAL NOT NULL,
+                PRIMARY KEY (symbol, timeframe, day)
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_bars(symbol, timeframe, limit=None, db_path=BAR_STORE_PATH):
+    """저장된 봉 조회 (API 응답과 같은 최신순 리스트)"""
+    conn = get_bar_store_connection(db_path)
+    try:
+        query = 'SELECT payload FROM bars WHERE symbol = ? AND timeframe = ? ORDER BY ts DESC'
+        params = [symbol, str(timeframe)]
+        if limit:
+            query += ' LIMIT ?'
+            params.append(int(limit))
+        return [json.loads(row[0]) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+
+def load_bars_range(symbol, timeframe, start_ts=None, end_ts=None, db_path=BAR_STORE_PATH):
+    """저장된 봉 기간 조회 (start_ts <= ts <= end_ts, 시간순 리스트)"""
+    conn = get_bar_store_connection(db_path)
+    try:
+        query = 'SELECT payload FROM bars WHERE symbol = ? AND timeframe = ?'
+        params = [symbol, str(timeframe)]
+        if start_ts:
+            query += ' AND ts >= ?'
+            params.append(start_ts)
+        if end_ts:
+            query += ' AND ts <= ?'
+            params.append(end_ts)
+        query += ' ORDER BY ts'
+        return [json.loads(row[0]) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+
+def get_timestamp_range(symbol, timeframe, db_path=BAR_STORE_PATH):
+    """저장된 봉의 (가장 오래된, 가장 최근) 타임스탬프와 행 수"""
+    conn = get_bar_store_connection(db_path)
+    try:
+        row = conn.execute(
+            'SELECT MIN(ts), MAX(ts), COUNT(*) FROM bars WHERE symbol = ? AND timeframe = ?',
+            (symbol, str(timeframe)),
+        ).fetchone()
+        return row[0], row[1], row[2]
+    finally:
+        conn.close()
+
+
+def save_bars(symbol, timeframe, rows, key_func, db_path=BAR_STORE_PATH, max_rows=BAR_STORE_MAX_ROWS):
+    """봉 저장 (같은 타임스탬프는 최신 값으로 덮어씀 - 진행 중인 마지막 봉 갱신용)
+
+    key_func: 행(dict)에서 정렬 가능한 타임스탬프 문자열(YYYYMMDDHHMMSS)을 만드는 함수
+    """
+    records = []
+    for row in rows:
+        ts = key_func(row)
+        if ts:
+            records.append((symbol, str(timeframe), ts, json.dumps(row, ensure_ascii=False)))
+    if not records:
+        return 0
+
+    conn = get_bar_store_connection(db_path)
+    try:
+        conn.executemany(
+            'INSERT OR REPLACE INTO bars (symbol, timeframe, ts, payload) VALUES (?, ?, ?, ?)',
+            records,
+        )
+        if max_rows:
+            # 오래된 봉 정리 (최근 max_rows개만 유지)
+            trimmed = conn.execute(
+                '''DELETE FROM bars WHERE symbol = ? AND timeframe = ? AND ts < (
+                       SELECT ts FROM bars WHERE symbol = ? AND timeframe = ?
+                       ORDER BY ts DESC LIMIT 1 OFFSET ?)''',
+                (symbol, str(timeframe), symbol, str(timeframe), int(max_rows) - 1),
+            )
+            # 정리로 일부만 남은 거래일과 그 이전 거래일은 동기화 기록도 삭제 (다시 필요하면 새로 받음)
+            if trimmed.rowcount > 0:
+                conn.execute(
+                    '''DELETE FROM bar_sync WHERE symbol = ? AND timeframe = ? AND day <= (
+                           SELECT substr(MIN(ts), 1, 8) FROM bars WHERE symbol = ? AND timeframe = ?)''',
+                    (symbol, str(timeframe), symbol, str(timeframe)),
+                )
+        conn.commit()
+        return len(records)
+    finally:
+        conn.close()
+
+
+def get_sync_marks(symbol, timeframe, days, db_path=BAR_STORE_PATH):
+    """거래일별 동기화 완료 시각 {일자(YYYYMMDD): epoch 초} (기록이 없는 거래일은 빠짐 - 아직 받지 않았거나 공백)"""
+    days = [str(day) for day in days]
+    if not days:
+        return {}
+    conn = get_bar_store_connection(db_path)
+    try:
+        rows = conn.execute(
+            f'SELECT day, synced_until FROM bar_sync WHERE symbol = ? AND timeframe = ? '
+            f'AND day IN ({",".join("?" * len(days))})',
+            [symbol, str(timeframe)] + days,
+        ).fetchall()
+        return {day: synced_until for day, synced_until in rows}
+    finally:
+        conn.close()
+
+
+def set_sync_mark(symbol, timeframe, day, synced_until, db_path=BAR_STORE_PATH):
+    """거래일의 봉을 synced_until(epoch 초)까지 빠짐없이 저장했음을 기록"""
+    conn = get_bar_store_connection(db_path)
+    try:
+        conn.execute(
+            'INSERT OR REPLACE INTO bar_sync (symbol, timeframe, day, synced_until) VALUES (?, ?, ?, ?)',
+            (symbol, str(timeframe), str(day), float(synced_until)),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def clear_bars(symbol, timeframe, db_path=BAR_STORE_PATH):
+    """종목/봉 단위 저장 데이터 삭제 (메울 수 없는 공백이 생겼을 때 재구성용)"""
+    conn = get_bar_store_connection(db_path)
+    try:
+        conn.execute('DELETE FROM bars WHERE symbol = ? AND timeframe = ?', (symbol, str(timeframe)))
+        conn.execute('DELETE FROM bar_sync WHERE symbol = ? AND timeframe = ?', (symbol, str(timeframe)))
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,419 @@
+# KIS(한국투자증권) REST API 공용 클라이언트
+# 미국/국내 자동매매 스크립트가 함께 사용하는 모듈
+# - requests.Session 연결 재사용 (매 요청 TLS 핸드셰이크 제거)
+# - 요청별 타임아웃, 재시도/백오프 정책 통일
+# - 토큰 만료 시 스레드 간 1회만 재발급 (동시 호출자는 같은 oauth2/tokenP 결과를 기다림)
+# - 전체 스레드 합산 초당 요청 수 제한
+# - 토큰 캐시 파일(소유자만 읽기/쓰기)로 재시작 시 기존 토큰 재사용, 만료 임박 시에만 재발급
+# - 실시간(웹소켓) 접속키 발급
+# - 주문 전송: 해시키(선택 항목) 왕복 생략 기본, 주문별 전송 지연 기록
+# - 호출 계측: metrics(kis_metrics.APIMetrics)를 넘기면 모든 호출을 tr_id별로 기록 (지연, 상태 코드, 재시도, 바이트)
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TOKEN_ERROR_CODES = ('EGW00123', 'EGW00121')   # 기간이 만료된 토큰 / 유효하지 않은 토큰
+RATE_LIMIT_CODES = ('EGW00201',)               # 초당 거래건수 초과
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+KST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+class KISClient:
+    """KIS REST API 클라이언트 (스레드 안전)"""
+
+    def __init__(self, app_key, app_secret, url_base, timeout=10, max_retries=2, backoff=0.5,
+                 requests_per_second=None, pool_size=10, min_reissue_interval=60,
+                 token_cache_path=None, token_refresh_margin=3600, order_hashkey=False, metrics=None):
+        """
+        timeout: 요청별 타임아웃 (초)
+        max_retries: 조회(GET) 요청의 네트워크 오류/5xx/초당 건수 초과 재시도 횟수 (주문 POST는 기본 재시도 없음)
+        backoff: 재시도 대기 시간 기준 (초, 재시도마다 2배)
+        requests_per_second: 전체 스레드 합산 초당 요청 한도 (None이면 제한 없음)
+        min_reissue_interval: 이 시간(초) 안에 발급된 토큰이 있으면 재발급 대신 그대로 사용 (KIS 발급 제한 1분 1회)
+        token_cache_path: 토큰 캐시 파일 경로 (None이면 캐시 사용 안 함, 앱키별로 구분해 저장)
+        token_refresh_margin: 만료까지 남은 시간이 이 값(초) 미만이면 재발급
+        order_hashkey: 주문 전 uapi/hashkey 호출 여부 (KIS에서 선택 항목 - 끄면 주문당 왕복 1회 절약)
+        metrics: 호출 계측 객체 (record(tr_id, elapsed, status, retries, bytes_sent, bytes_received), None이면 기록 안 함)
+        """
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.url_base = url_base.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.requests_per_second = requests_per_second
+        self.min_reissue_interval = min_reissue_interval
+        self.token_cache_path = token_cache_path
+        self.token_refresh_margin = token_refresh_margin
+        self.order_hashkey = order_hashkey
+        self.order_latencies = deque(maxlen=500)    # [(주문 시각, tr_id, 전송 지연(초), 상태 코드)]
+        self.metrics = metrics
+
+        self.access_token = ""
+        self.token_issued_at = 0.0
+        self.token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._approval_key = ""
+        self._approval_issued_at = 0.0
+
+        self._budget_lock = threading.Lock()
+        self._budget_next_time = 0.0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        if self.token_cache_path:
+            self.load_cached_token()
+
+    def _record(self, tr_id, started, res, retries=0, bytes_sent=0):
+        """호출 1건 계측 기록 (res None = 응답 없음)"""
+        if self.metrics is None:
+            return
+        self.metrics.record(tr_id, time.perf_counter() - started,
+                            status=res.status_code if res is not None else None, retries=retries,
+                            bytes_sent=bytes_sent, bytes_received=len(res.content) if res is not None else 0)
+
+    # ===== 토큰 관리 =====
+
+    def _cache_key(self):
+        """캐시 항목 키 (앱키 원문 대신 해시, 실전/모의 서버 구분)"""
+        return hashlib.sha256(f"{self.app_key}|{self.url_base}".encode()).hexdigest()[:16]
+
+    def _read_token_cache(self):
+        try:
+            with open(self.token_cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"토큰 캐시 읽기 실패: {e}")
+            return {}
+
+    def load_cached_token(self):
+        """캐시 파일의 토큰이 만료 임박 전이면 불러와서 사용 (불러오면 True)"""
+        entry = self._read_token_cache().get(self._cache_key())
+        if not entry:
+            return False
+        expires_at = float(entry.get('expires_at', 0))
+        if expires_at - time.time() < self.token_refresh_margin:
+            return False
+        self.access_token = entry['access_token']
+        self.token_issued_at = float(entry.get('issued_at', 0))
+        self.token_expires_at = expires_at
+        print(f"캐시된 토큰 사용 (만료: {datetime.datetime.fromtimestamp(expires_at, KST):%Y-%m-%d %H:%M:%S} KST)")
+        return True
+
+    def _save_token_cache(self):
+        """토큰 캐시 저장 (소유자만 읽기/쓰기 0600, 임시 파일 교체로 원자적 저장)"""
+        cache = self._read_token_cache()
+        cache[self._cache_key()] = {
+            'access_token': self.access_token,
+            'issued_at': self.token_issued_at,
+            'expires_at': self.token_expires_at,
+        }
+        tmp_path = f"{self.token_cache_path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.token_cache_path)
+        except OSError as e:
+            print(f"토큰 캐시 저장 실패: {e}")
+
+    def token_needs_refresh(self):
+        """토큰이 없거나 만료 임박 여부"""
+        if not self.access_token:
+            return True
+        return self.token_expires_at - time.time() < self.token_refresh_margin
+
+    @staticmethod
+    def _parse_expiry(data, now):
+        """발급 응답의 만료 시각 (access_token_token_expired(KST) 우선, 없으면 expires_in)"""
+        expired = data.get("access_token_token_expired")
+        if expired:
+            try:
+                return datetime.datetime.strptime(expired, '%Y-%m-%d %H:%M:%S').replace(tzinfo=KST).timestamp()
+            except ValueError:
+                pass
+        return now + float(data.get("expires_in", 86400))
+
+    def _issue_token(self):
+        """oauth2/tokenP 호출 (토큰 락 안에서만 호출)"""
+        started = time.perf_counter()
+        res = None
+        try:
+            res = self.session.post(
+                f"{self.url_base}/oauth2/tokenP",
+                headers={"content-type": "application/json"},
+                data=json.dumps({
+                    "grant_type": "client_credentials",
+                    "appkey": self.app_key,
+                    "appsecret": self.app_secret,
+                }),
+                timeout=self.timeout,
+            )
+            self._record('tokenP', started, res)
+            if res.status_code != 200:
+                print(f"토큰 발급 실패: 상태 코드 {res.status_code}, 응답: {res.text[:200]}")
+                return None
+            data = res.json()
+            token = data.get("access_token")
+            if not token:
+                print(f"토큰 발급 응답 오류: {data}")
+                return None
+            now = time.time()
+            self.access_token = token
+            self.token_issued_at = now
+            self.token_expires_at = self._parse_expiry(data, now)
+            if self.token_cache_path:
+                self._save_token_cache()
+            print("새로운 토큰 발급")
+            return token
+        except Exception as e:
+            if res is None:
+                self._record('tokenP', started, None)
+            print(f"토큰 발급 중 오류 발생: {e}")
+            return None
+
+    def get_token(self):
+        """현재 토큰 (없거나 만료 임박이면 발급)"""
+        if not self.token_needs_refresh():
+            return self.access_token
+        return self.refresh_token()
+
+    def refresh_token(self, stale_token=None):
+        """토큰 재발급 (single-flight)
+
+        stale_token 없이 호출하면 만료 임박일 때만 새로 발급하고, 아니면 현재 토큰을 그대로 반환한다.
+        stale_token: 서버가 거부한 토큰 - 락을 기다리는 동안 다른 스레드가 이미 바꿨다면 새로 발급하지 않음
+        min_reissue_interval 안에 발급된 토큰이 있으면 어느 경우든 그대로 사용한다.
+        """
+        with self._token_lock:
+            if self.access_token:
+                if stale_token is None and not self.token_needs_refresh():
+                    return self.access_token
+                if stale_token is not None and self.access_token != stale_token:
+                    return self.access_token
+                if stale_token is not None and self.token_cache_path:
+                    # 다른 프로세스(미국/국내 트레이더)가 이미 새 토큰을 발급해 캐시에 저장했으면 그대로 사용
+                    if self.load_cached_token() and self.access_token != stale_token:
+                        return self.access_token
+                if time.time() - self.token_issued_at < self.min_reissue_interval:
+                    return self.access_token
+            return self._issue_token()
+
+    def get_approval_key(self, max_age=43200):
+        """실시간(웹소켓) 접속키 발급 (oauth2/Approval, max_age초 동안은 발급받은 키 재사용)"""
+        with self._token_lock:
+            if self._approval_key and time.time() - self._approval_issued_at < max_age:
+                return self._approval_key
+            started = time.perf_counter()
+            res = None
+            try:
+                res = self.session.post(
+                    f"{self.url_base}/oauth2/Approval",
+                    headers={"content-type": "application/json; utf-8"},
+                    data=json.dumps({
+                        "grant_type": "client_credentials",
+                        "appkey": self.app_key,
+                        "secretkey": self.app_secret,
+                    }),
+                    timeout=self.timeout,
+                )
+                self._record('Approval', started, res)
+                key = res.json().get("approval_key") if res.status_code == 200 else None
+                if not key:
+                    print(f"실시간 접속키 발급 실패: 상태 코드 {res.status_code}, 응답: {res.text[:200]}")
+                    return None
+                self._approval_key = key
+                self._approval_issued_at = time.time()
+                return key
+            except Exception as e:
+                if res is None:
+                    self._record('Approval', started, None)
+                print(f"실시간 접속키 발급 중 오류 발생: {e}")
+                return None
+
+    @staticmethod
+    def is_token_error(res):
+        """만료/무효 토큰 응답 여부"""
+        if res.status_code == 401:
+            return True
+        text = res.text
+        if any(code in text for code in TOKEN_ERROR_CODES):
+            return True
+        return 'access_token' in text.lower()
+
+    # ===== 요청 =====
+
+    def reserve_budget(self):
+        """초당 요청 한도에서 다음 요청 자리 1개 예약 → 요청 전 기다릴 시간(초) 반환 (asyncio 클라이언트와 공유)"""
+        if not self.requests_per_second:
+            return 0.0
+        interval = 1.0 / self.requests_per_second
+        with self._budget_lock:
+            now = time.monotonic()
+            wait = self._budget_next_time - now
+            self._budget_next_time = max(now, self._budget_next_time) + interval
+        return wait
+
+    def acquire_budget(self):
+        """전체 스레드 합산 초당 요청 수 제한"""
+        wait = self.reserve_budget()
+        if wait > 0:
+            time.sleep(wait)
+
+    def build_headers(self, tr_id, token, extra_headers=None):
+        headers = {
+            "content-type": "application/json; charset=utf-8",
+            "authorization": f"Bearer {token}",
+            "appkey": self.app_key,
+            "appsecret": self.app_secret,
+            "tr_id": tr_id,
+            "custtype": "P",
+        }
+        if extra_headers:
+            headers.update(extra_headers)
+        return headers
+
+    def hashkey(self, body):
+        """주문 본문 해시키 생성 (실패 시 None)"""
+        self.acquire_budget()
+        started = time.perf_counter()
+        res = None
+        data = json.dumps(body)
+        try:
+            res = self.session.post(
+                f"{self.url_base}/uapi/hashkey",
+                headers={
+                    "content-type": "application/json",
+                    "appkey": self.app_key,
+                    "appsecret": self.app_secret,
+                },
+                data=data,
+                timeout=self.timeout,
+            )
+            self._record('hashkey', started, res, bytes_sent=len(data))
+            return res.json()["HASH"]
+        except Exception as e:
+            if res is None:
+                self._record('hashkey', started, None, bytes_sent=len(data))
+            print(f"해시키 생성 중 오류 발생: {e}")
+            return None
+
+    def request(self, method, path, tr_id, params=None, body=None, extra_headers=None,
+                use_hashkey=False, retries=None, timeout=None):
+        """KIS API 요청
+
+        - 토큰 오류 응답은 토큰을 1회 재발급(single-flight) 후 다시 요청
+        - 네트워크 오류/5xx/초당 건수 초과는 retries만큼 백오프 후 재시도
+          (retries 기본값: GET은 max_retries, POST(주문)는 중복 주문 방지를 위해 0)
+        - 재시도 후에도 네트워크 오류면 예외를 그대로 올림
+        - metrics가 있으면 재시도를 포함한 호출 1건을 tr_id로 기록 (지연은 첫 시도부터 최종 응답까지)
+
+        Returns:
+            requests.Response (토큰 발급 실패 시에도 마지막 응답 또는 None)
+        """
+        method = method.upper()
+        url = f"{self.url_base}/{path.lstrip('/')}"
+        if retries is None:
+            retries = self.max_retries if method == 'GET' else 0
+
+        token = self.get_token()
+        if not token:
+            return None
+
+        headers = dict(extra_headers or {})
+        data = json.dumps(body) if body is not None else None
+        if use_hashkey and body is not None:
+            hash_key = self.hashkey(body)
+            if not hash_key:
+                return None
+            headers["hashkey"] = hash_key
+
+        attempt = 0
+        token_retried = False
+        started = time.perf_counter()
+        res = None
+        try:
+            while True:
+                self.acquire_budget()
+                try:
+                    res = self.session.request(
+                        method, url,
+                        headers=self.build_headers(tr_id, token, headers),
+                        params=params, data=data,
+                        timeout=timeout or self.timeout,
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    res = None
+                    if attempt < retries:
+                        attempt += 1
+                        print(f"KIS 요청 재시도 {attempt}/{retries} ({tr_id}): {e}")
+                        time.sleep(self.backoff * (2 ** (attempt - 1)))
+                        continue
+                    raise
+
+                if self.is_token_error(res) and not token_retried:
+                    token_retried = True
+                    print(f"토큰 오류 응답 ({tr_id}), 토큰 재발급 후 재시도")
+                    new_token = self.refresh_token(stale_token=token)
+                    if not new_token:
+                        return res
+                    token = new_token
+                    continue
+
+                retryable = (res.status_code in RETRY_STATUS_CODES
+                             or any(code in res.text for code in RATE_LIMIT_CODES))
+                if retryable and attempt < retries:
+                    attempt += 1
+                    print(f"KIS 요청 재시도 {attempt}/{retries} ({tr_id}): 상태 코드 {res.status_code}")
+                    time.sleep(self.backoff * (2 ** (attempt - 1)))
+                    continue
+                return res
+        finally:
+            self._record(tr_id, started, res, retries=attempt + int(token_retried),
+                         bytes_sent=len(data.encode()) if data else 0)
+
+    def submit_order(self, path, tr_id, body):
+        """주문 전송 (재시도 없음, order_hashkey가 꺼져 있으면 해시키 없이 바로 전송) - 전송 지연 기록"""
+        started_at = time.time()
+        started = time.perf_counter()
+        res = None
+        try:
+            res = self.request('POST', path, tr_id, body=body, use_hashkey=self.order_hashkey, retries=0)
+            return res
+        finally:
+            elapsed = time.perf_counter() - started
+            status = res.status_code if res is not None else None
+            self.order_latencies.append((started_at, tr_id, elapsed, status))
+            print(f"⏱ 주문 전송 {tr_id}: {elapsed * 1000:.0f}ms (상태 {status}, 해시키 {'사용' if self.order_hashkey else '생략'})")
+
+    def order_latency_summary(self):
+        """기록된 주문 전송 지연 요약 (건수/평균/최대/p95, 초)"""
+        latencies = sorted(item[2] for item in self.order_latencies)
+        if not latencies:
+            return {'count': 0, 'avg': 0.0, 'max': 0.0, 'p95': 0.0}
+        return {
+            'count': len(latencies),
+            'avg': sum(latencies) / len(latencies),
+            'max': latencies[-1],
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        }
+
+    def get(self, path, tr_id, params=None, **kwargs):
+        return self.request('GET', path, tr_id, params=params, **kwargs)
+
+    def post(self, path, tr_id, body=None, **kwargs):
+        return self.request('POST', path, tr_id, body=body, **kwargs)
@@ -0,0 +1,138 @@
+# 일봉 캐시 (거래일당 1회 조회 + 로컬 저장소)
+# 일 단위 이동평균을 분봉으로 근사하지 않고 실제 일봉 종가로 계산하기 위한 모듈
+# - 마감된 일봉은 kis_bars.db(timeframe 'D')에 저장, 마지막 마감 거래일까지 저장돼 있으면 API 호출 없이 사용
+# - 진행 중인 당일 봉은 저장하지 않고 조회 시 현재가를 마지막 봉으로 임시 반영
+# - 기간별 이동평균은 누적 합(CumulativeSMA)으로 O(1)
+# 조회 함수(해외/국내 일봉 API)와 마지막 마감 거래일 계산은 트레이더 스크립트에서 주입
+
+import threading
+
+from kis_bar_store import BAR_STORE_PATH, get_timestamp_range, load_bars, save_bars
+from kis_indicators import CumulativeSMA, decode_bars
+
+DAILY_TIMEFRAME = 'D'              # 저장소 봉 단위 키
+DAILY_DATE_COLUMNS = ('xymd', 'stck_bsop_date')  # 해외/국내 일봉 응답의 일자 컬럼
+
+
+def daily_bar_key(row):
+    """일봉 행의 저장 키 (거래소 현지 일자, YYYYMMDD)"""
+    for col in DAILY_DATE_COLUMNS:
+        value = row.get(col)
+        if value:
+            return str(value)
+    return None
+
+
+class DailyBars:
+    """종목 1개의 마감된 일봉 종가 (마지막 마감 거래일 기준)"""
+
+    __slots__ = ('symbol', 'session_key', 'closes', 'last_key', 'sma_source')
+
+    def __init__(self, symbol, session_key, closes, last_key):
+        self.symbol = symbol
+        self.session_key = session_key   # 이 데이터가 기준으로 삼은 마지막 마감 거래일 (YYYYMMDD)
+        self.closes = closes             # 시간순 종가 (float64 배열)
+        self.last_key = last_key         # 마지막 마감 봉 일자
+        self.sma_source = CumulativeSMA(closes)
+
+    def __len__(self):
+        return len(self.closes)
+
+    def sma(self, period, live_price=None):
+        """period일 단순이동평균 (live_price: 장중 현재가 - 당일 봉으로 포함, 데이터 부족 시 None)"""
+        return self.sma_source.value(period, live_price)
+
+
+class DailyBarCache:
+    """종목별 일봉 캐시 (스레드 안전)"""
+
+    def __init__(self, fetch_history, closed_session_key, min_bars, use_store=True,
+                 db_path=BAR_STORE_PATH, max_bars=None):
+        """
+        fetch_history: fetch_history(symbol, min_bars) → 일봉 행 리스트 (API 응답 output2, 실패 시 None)
+        closed_session_key: closed_session_key() → 마지막으로 마감된 거래일 (YYYYMMDD)
+        min_bars: 필요한 마감 일봉 수 (저장분이 이보다 적으면 다시 조회)
+        use_store: 로컬 저장소(kis_bars.db) 사용 여부
+        max_bars: 메모리에 올릴 최대 일봉 수 (None이면 min_bars의 2배)
+        """
+        self.fetch_history = fetch_history
+        self.closed_session_key = closed_session_key
+        self.min_bars = min_bars
+        self.use_store = use_store
+        self.db_path = db_path
+        self.max_bars = max_bars or min_bars * 2
+        self._entries = {}               # {symbol: DailyBars}
+        self._live = {}                  # {symbol: (진행 중인 거래일 YYYYMMDD, 현재가)}
+        self._lock = threading.Lock()
+        self.fetch_count = 0             # API 조회 횟수 (세션당 종목 수 이하인지 확인용)
+
+    def get(self, symbol):
+        """마지막 마감 거래일 기준 일봉 (조회 실패 시 이전 데이터 또는 None)"""
+        session_key = self.closed_session_key()
+        with self._lock:
+            entry = self._entries.get(symbol)
+        if entry is not None and entry.session_key == session_key:
+            return entry
+
+        rows = self._load_stored(symbol, session_key)
+        if rows is None:
+            fetched = self.fetch_history(symbol, self.min_bars)
+            self.fetch_count += 1
+            if not fetched:
+                return entry
+            # 진행 중인 당일 봉은 종가가 아니므로 저장/누적하지 않음
+            closed_rows = [row for row in fetched if (daily_bar_key(row) or '') <= session_key]
+            if self.use_store:
+                save_bars(symbol, DAILY_TIMEFRAME, closed_rows, daily_bar_key, db_path=self.db_path)
+                rows = load_bars(symbol, DAILY_TIMEFRAME, limit=self.max_bars, db_path=self.db_path)
+            else:
+                rows = closed_rows[:self.max_bars]
+
+        bars = decode_bars({'output2': rows})
+        if len(bars) == 0:
+            return entry
+        entry = DailyBars(symbol, session_key, bars.close, str(int(bars.ts[-1])))
+        if len(entry) < self.min_bars:
+            print(f"⚠️ {symbol} 일봉 {len(entry)}개 (필요 {self.min_bars}개) - 이동평균 일부 계산 불가")
+        with self._lock:
+            self._entries[symbol] = entry
+        return entry
+
+    def update_live_price(self, symbol, price, day_key):
+        """장중 현재가 기록 (day_key: 진행 중인 거래일 YYYYMMDD) - sma()에서 당일 봉 임시 종가로 사용"""
+        with self._lock:
+            self._live[symbol] = (day_key, float(price))
+
+    def live_price(self, symbol):
+        """아직 마감되지 않은 거래일의 최근 현재가 (없거나 이미 마감된 거래일이면 None)"""
+        with self._lock:
+            live = self._live.get(symbol)
+        if live and live[0] > self.closed_session_key():
+            return live[1]
+        return None
+
+    def sma(self, symbol, period, live_price=None):
+        """period일 이동평균 (live_price 생략 시 update_live_price로 기록한 장중 현재가 사용, 실패 시 None)"""
+        entry = self.get(symbol)
+        if entry is None:
+            return None
+        if live_price is None:
+            live_price = self.live_price(symbol)
+        return entry.sma(period, live_price)
+
+    def _load_stored(self, symbol, session_key):
+        """저장소에 마지막 마감 거래일까지 충분히 있으면 저장분 반환 (없으면 None)"""
+        if not self.use_store:
+            return None
+        _, newest_key, count = get_timestamp_range(symbol, DAILY_TIMEFRAME, db_path=self.db_path)
+        if not newest_key or newest_key < session_key or count < self.min_bars:
+            return None
+        return load_bars(symbol, DAILY_TIMEFRAME, limit=self.max_bars, db_path=self.db_path)
+
+    def invalidate(self, symbol=None):
+        """메모리 캐시 삭제 (symbol None이면 전체, 다음 조회 시 저장소/API에서 다시 로드)"""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(symbol, None)
@@ -0,0 +1,517 @@
+# 기술적 지표 계산 모듈
+# 매 체크마다 전체 봉으로 DataFrame을 다시 만들지 않도록 종목별 지표 상태를 유지하고
+# 새로 마감된 봉만 반영해 최신 값을 상수 시간에 조회하기 위한 클래스 모음
+# KIS 차트 응답(output2)은 decode_bars()로 한 번만 열 배열(BarArray)로 변환해 모든 지표 함수에서 공유
+# Wilder 평활 RSI(국내 트레이더/RSI 확인 도구)는 행별 루프 대신 NumPy 배열 전체를 한 번에 계산
+
+import math
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+# ===== 차트 응답 컬럼 설정 =====
+# 필드별 후보 컬럼 (앞에 있는 컬럼 우선, 해외/국내 분봉·일봉 응답 공통)
+BAR_FIELD_COLUMNS = {
+    'close': ['stck_prpr', 'ovrs_nmix_prpr', 'close', 'last', 'stck_clpr', 'clos'],
+    'open': ['open', 'stck_oprc', 'ovrs_nmix_oprc'],
+    'high': ['high', 'stck_hgpr', 'ovrs_nmix_hgpr'],
+    'low': ['low', 'stck_lwpr', 'ovrs_nmix_lwpr'],
+    'volume': ['evol', 'cntg_vol', 'acml_vol', 'volume', 'tvol'],
+}
+# 시각 키 컬럼 (일자, 시각) - 시각 컬럼이 없는 일봉은 일자만 사용
+BAR_TIME_COLUMNS = [
+    ('xymd', 'xhms'),
+    ('stck_bsop_date', 'stck_cntg_hour'),
+    ('date', 'time'),
+    ('stck_bsop_date', None),
+    ('xymd', None),
+]
+# ===== 차트 응답 컬럼 설정 끝 =====
+
+
+class BarArray:
+    """시간순으로 정렬된 열 기반 봉 데이터
+
+    ts: 시각 키 (YYYYMMDDHHMMSS 또는 YYYYMMDD 정수, int64)
+    open/high/low/close/volume: float64 (응답에 없는 필드는 NaN)
+    price_column: 종가로 사용한 응답 컬럼명
+    """
+
+    __slots__ = ('ts', 'open', 'high', 'low', 'close', 'volume', 'price_column')
+
+    def __init__(self, ts, open_, high, low, close, volume, price_column=None):
+        self.ts = ts
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.price_column = price_column
+
+    def __len__(self):
+        return len(self.close)
+
+    @classmethod
+    def empty(cls, price_column=None):
+        nan = np.empty(0, dtype=np.float64)
+        return cls(np.empty(0, dtype=np.int64), nan, nan, nan, nan, nan, price_column)
+
+
+def _float_column(rows, col):
+    """행 목록의 컬럼을 float64 배열로 변환 (빈 값/숫자가 아닌 값은 NaN)"""
+    values = [row.get(col) or 'nan' for row in rows]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        result = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                result[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return result
+
+
+def _time_keys(rows, date_col, time_col):
+    """행 목록의 시각 키 배열 (숫자만 남긴 일자+시각, 변환 실패 시 -1)"""
+    keys = np.full(len(rows), -1, dtype=np.int64)
+    for i, row in enumerate(rows):
+        raw = str(row.get(date_col) or '')
+        if time_col:
+            raw += str(row.get(time_col) or '')
+        digits = ''.join(ch for ch in raw if ch.isdigit())
+        if digits:
+            keys[i] = int(digits)
+    return keys
+
+
+def decode_bars(data):
+    """KIS 차트 응답(dict, output2 최신순)을 BarArray로 변환
+
+    가격 컬럼 탐색과 숫자 변환을 한 번만 수행하고 가격이 없는 행은 제외한다.
+    시각 컬럼이 없으면 응답 순서(최신순)를 뒤집어 시간순으로 사용한다.
+    """
+    if isinstance(data, BarArray):
+        return data
+    rows = (data or {}).get('output2') or []
+    if not rows:
+        return BarArray.empty()
+
+    columns = set(rows[0].keys())
+
+    close = None
+    price_column = None
+    for col in BAR_FIELD_COLUMNS['close']:
+        if col in columns:
+            values = _float_column(rows, col)
+            if not np.isnan(values).all():
+                close, price_column = values, col
+                break
+    if close is None:
+        return BarArray.empty()
+
+    fields = {}
+    for field in ('open', 'high', 'low', 'volume'):
+        col = next((c for c in BAR_FIELD_COLUMNS[field] if c in columns), None)
+        fields[field] = _float_column(rows, col) if col else np.full(len(rows), np.nan)
+
+    ts = None
+    for date_col, time_col in BAR_TIME_COLUMNS:
+        if date_col in columns and (time_col is None or time_col in columns):
+            ts = _time_keys(rows, date_col, time_col)
+            break
+    if ts is None:
+        ts = np.arange(len(rows) - 1, -1, -1, dtype=np.int64)
+
+    mask = ~np.isnan(close) & (ts >= 0)
+    order = np.argsort(ts[mask], kind='stable')
+    return BarArray(
+        ts[mask][order],
+        fields['open'][mask][order],
+        fields['high'][mask][order],
+        fields['low'][mask][order],
+        close[mask][order],
+        fields['volume'][mask][order],
+        price_column,
+    )
+
+
+def sma_last(values, period):
+    """마지막 봉 기준 단순이동평균 (데이터 부족 시 None)"""
+    if len(values) < period:
+        return None
+    return float(values[-period:].mean())
+
+
+def rolling_rsi_last(close, periods):
+    """마지막 봉 기준 단순 이동평균 방식 RSI (pandas rolling mean 방식과 동일, 데이터 부족 시 None)
+
+    첫 봉은 변화량이 없으므로 0으로 채운 뒤 최근 periods개 변화량의 평균을 사용한다.
+    """
+    if len(close) < periods:
+        return None
+    window = close[-(periods + 1):]
+    delta = np.diff(window)
+    if len(window) == periods:
+        # 전체 봉 수가 periods와 같으면 첫 변화량(0)이 창에 포함됨
+        delta = np.concatenate(([0.0], delta))
+    avg_gain = np.where(delta > 0, delta, 0.0).mean()
+    avg_loss = np.where(delta < 0, -delta, 0.0).mean()
+    if avg_loss == 0:
+        return 100.0 if avg_gain > 0 else float('nan')
+    rs = avg_gain / avg_loss
+    return float(100 - (100 / (1 + rs)))
+
+
+class RingBufferSMA:
+    """고정 길이 링버퍼 단순이동평균 (추가/조회 O(1))"""
+
+    def __init__(self, period):
+        self.period = period
+        self.values = deque(maxlen=period)
+        self.total = 0.0
+        self._pushes = 0
+
+    def reset(self):
+        self.values.clear()
+        self.total = 0.0
+        self._pushes = 0
+
+    def push(self, value):
+        """마감된 값 추가"""
+        if len(self.values) == self.period:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        self._pushes += 1
+        # 누적 합의 부동소수점 오차가 쌓이지 않도록 창 길이마다 다시 합산
+        if self._pushes % self.period == 0:
+            self.total = math.fsum(self.values)
+
+    def value(self, provisional=None):
+        """현재 평균 (창이 다 차지 않았으면 None)
+        provisional: 아직 마감되지 않은 마지막 값 (창에 임시로 포함해 계산)
+        """
+        if provisional is None:
+            if len(self.values) < self.period:
+                return None
+            return self.total / self.period
+
+        if len(self.values) + 1 < self.period:
+            return None
+        total = self.total + provisional
+        if len(self.values) == self.period:
+            total -= self.values[0]
+        return total / self.period
+
+
+# ===== Wilder RSI 설정 =====
+WILDER_BLOCK_SIZE = 4096           # 평활 계산 블록 길이 (블록 안에서 누적 합 닫힌 식, 블록 사이는 마지막 값으로 이어감)
+WILDER_MAX_EXPONENT = 600.0        # 블록 안 감쇠 계수 거듭제곱의 최대 지수 (float64 오버/언더플로 방지)
+# ===== Wilder RSI 설정 끝 =====
+
+
+def wilder_smooth(seed, values, alpha):
+    """Wilder 평활 (지수 이동평균) 배열 계산
+
+    avg[0] = seed, avg[k] = alpha * values[k-1] + (1 - alpha) * avg[k-1] 일 때 avg[1:]를 반환한다.
+    블록마다 avg[k] = d^k * (start + alpha * Σ values[j] / d^j) 닫힌 식(d = 1 - alpha)을 누적 합 1회로 계산하므로
+    Python 루프는 블록 수만큼만 돈다.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty(len(values), dtype=np.float64)
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        out[:] = values
+        return out
+    block = int(min(WILDER_BLOCK_SIZE, max(1, WILDER_MAX_EXPONENT // -math.log(decay))))
+    start = float(seed)
+    for begin in range(0, len(values), block):
+        chunk = values[begin:begin + block]
+        powers = decay ** np.arange(1, len(chunk) + 1, dtype=np.float64)
+        smoothed = powers * (start + alpha * np.cumsum(chunk / powers))
+        out[begin:begin + len(chunk)] = smoothed
+        start = smoothed[-1]
+    return out
+
+
+def wilder_averages(close, periods):
+    """Wilder 방식 평균 상승/하락 (행별 배열)
+
+    기존 pandas 루프와 같은 배치: periods번째 행에 1~periods번째 변화량의 단순 평균을 두고
+    이후 행은 alpha = 1/periods 평활, 그 이전 행은 0.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    avg_gain = np.zeros(n, dtype=np.float64)
+    avg_loss = np.zeros(n, dtype=np.float64)
+    if periods < 1 or n < periods + 1:
+        return avg_gain, avg_loss
+
+    delta = np.diff(close)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    alpha = 1.0 / periods
+    avg_gain[periods] = gain[:periods].mean()
+    avg_loss[periods] = loss[:periods].mean()
+    avg_gain[periods + 1:] = wilder_smooth(avg_gain[periods], gain[periods:], alpha)
+    avg_loss[periods + 1:] = wilder_smooth(avg_loss[periods], loss[periods:], alpha)
+    return avg_gain, avg_loss
+
+
+def wilder_rsi_series(close, periods, averages=None):
+    """Wilder RSI 전체 시계열 (계산 불가 구간/평균 하락 0인 행은 NaN)
+    averages: wilder_averages() 결과를 이미 계산했으면 전달 (중복 계산 방지)
+    """
+    avg_gain, avg_loss = averages if averages is not None else wilder_averages(close, periods)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / np.where(avg_loss == 0, np.nan, avg_loss)
+        return 100 - (100 / (1 + rs))
+
+
+def wilder_rsi_last(close, periods):
+    """마지막 유효 Wilder RSI (기존 df['rsi'].dropna().iloc[-1]과 같음, 없으면 None)"""
+    rsi = wilder_rsi_series(close, periods)
+    valid = np.flatnonzero(~np.isnan(rsi))
+    if len(valid) == 0:
+        return None
+    return float(rsi[valid[-1]])
+
+
+class CumulativeSMA:
+    """누적 합(prefix sum) 기반 단순이동평균 - 마감된 값 목록으로 한 번 만들고 임의 기간을 O(1)로 조회"""
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.count = len(values)
+        self.prefix = np.concatenate(([0.0], np.cumsum(values)))
+
+    def value(self, period, provisional=None):
+        """최근 period개 평균 (데이터 부족 시 None)
+        provisional: 아직 마감되지 않은 마지막 값 (창의 마지막 칸으로 포함해 계산)
+        """
+        if period <= 0:
+            return None
+        if provisional is None:
+            if self.count < period:
+                return None
+            return float((self.prefix[self.count] - self.prefix[self.count - period]) / period)
+
+        if self.count + 1 < period:
+            return None
+        closed = period - 1
+        total = self.prefix[self.count] - self.prefix[self.count - closed] + provisional
+        return float(total / period)
+
+
+class RollingRSI:
+    """단순 이동평균 방식 RSI (pandas rolling(window=periods).mean() 계산과 동일)"""
+
+    def __init__(self, periods):
+        self.periods = periods
+        self.gains = RingBufferSMA(periods)
+        self.losses = RingBufferSMA(periods)
+        self.last_price = None
+
+    def reset(self):
+        self.gains.reset()
+        self.losses.reset()
+        self.last_price = None
+
+    @staticmethod
+    def _split(delta):
+        """가격 변화량을 (상승분, 하락분)으로 분리"""
+        return (delta if delta > 0 else 0.0), (-delta if delta < 0 else 0.0)
+
+    def push(self, price):
+        """마감된 봉 가격 추가 (첫 봉은 diff가 없으므로 0으로 채움)"""
+        if self.last_price is None:
+            gain, loss = 0.0, 0.0
+        else:
+            gain, loss = self._split(price - self.last_price)
+        self.gains.push(gain)
+        self.losses.push(loss)
+        self.last_price = price
+
+    def value(self, provisional=None):
+        """최신 RSI (데이터 부족 시 None)"""
+        if provisional is None:
+            avg_gain = self.gains.value()
+            avg_loss = self.losses.value()
+        else:
+            if self.last_price is None:
+                gain, loss = 0.0, 0.0
+            else:
+                gain, loss = self._split(provisional - self.last_price)
+            avg_gain = self.gains.value(gain)
+            avg_loss = self.losses.value(loss)
+
+        if avg_gain is None or avg_loss is None:
+            return None
+        if avg_loss == 0:
+            # pandas와 동일: x/0 = inf → RSI 100, 0/0 = NaN
+            return 100.0 if avg_gain > 0 else float('nan')
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+
+class IndicatorState:
+    """종목별 증분 지표 상태
+
+    마감된 봉만 누적하고, 마지막(진행 중인) 봉은 조회 시에만 임시로 반영한다.
+    봉은 (정렬 가능한 시각 키, 가격) 튜플로 전달한다.
+    """
+
+    def __init__(self, rsi_periods, ma_short_period, ma_long_period):
+        self.rsi = RollingRSI(rsi_periods)
+        self.ma_short = RingBufferSMA(ma_short_period)
+        self.ma_long = RingBufferSMA(ma_long_period)
+        self.last_key = None         # 마지막으로 누적한(마감된) 봉의 시각 키
+        self.closed_count = 0        # 누적한 마감 봉 수
+        self.provisional = None      # 진행 중인 마지막 봉 (키, 가격)
+
+    def reset(self):
+        self.rsi.reset()
+        self.ma_short.reset()
+        self.ma_long.reset()
+        self.last_key = None
+        self.closed_count = 0
+        self.provisional = None
+
+    def update(self, new_bars, continuous=True):
+        """새 봉 반영
+        new_bars: last_key 이후의 봉 (시간순), 마지막 원소는 진행 중인 봉으로 취급
+        continuous: False면 기존 상태와 이어지지 않는 구간이므로 초기화 후 다시 누적
+        """
+        if not continuous:
+            self.reset()
+        if not new_bars:
+            return
+
+        for key, price in new_bars[:-1]:
+            if self.last_key is not None and key <= self.last_key:
+                continue
+            self.rsi.push(price)
+            self.ma_short.push(price)
+            self.ma_long.push(price)
+            self.last_key = key
+            self.closed_count += 1
+
+        last_bar = new_bars[-1]
+        if self.last_key is None or last_bar[0] > self.last_key:
+            self.provisional = last_bar
+
+    def bar_count(self):
+        """진행 중인 봉을 포함한 전체 봉 수"""
+        return self.closed_count + (1 if self.provisional else 0)
+
+    def current_price(self):
+        if self.provisional:
+            return self.provisional[1]
+        return self.rsi.last_price
+
+    def rsi_value(self):
+        price = self.provisional[1] if self.provisional else None
+        return self.rsi.value(price)
+
+    def moving_averages(self):
+        """(단기 이평, 장기 이평) - 데이터 부족 시 None"""
+        price = self.provisional[1] if self.provisional else None
+        return self.ma_short.value(price), self.ma_long.value(price)
+
+
+def _benchmark_decode(row_counts=(360, 3000), repeat=20):
+    """분봉 응답 변환 비용 비교: 기존(지표마다 DataFrame 2회 생성) vs decode_bars 1회"""
+    import pandas as pd
+    from datetime import datetime, timedelta
+
+    def legacy_decode(data):
+        df = pd.DataFrame(data["output2"])
+        for col in ['stck_prpr', 'ovrs_nmix_prpr', 'close', 'last', 'stck_clpr']:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col].replace('', np.nan), errors='coerce')
+                if not df[col].isnull().all():
+                    df['price'] = df[col]
+                    break
+        df = df.dropna(subset=['price'])
+        df['datetime'] = pd.to_datetime(df['xymd'] + df['xhms'], format='%Y%m%d%H%M%S')
+        return df.sort_values(by='datetime').reset_index(drop=True)
+
+    for count in row_counts:
+        start = datetime(2026, 1, 5, 9, 30)
+        rows = []
+        for i in range(count):
+            key = (start + timedelta(minutes=30 * i)).strftime('%Y%m%d%H%M%S')
+            price = f"{100 + (i % 37) * 0.25:.4f}"
+            rows.append({'xymd': key[:8], 'xhms': key[8:], 'open': price, 'high': price,
+                         'low': price, 'last': price, 'evol': str(1000 + i)})
+        data = {'output2': rows[::-1]}
+
+        begin = time.perf_counter()
+        for _ in range(repeat):
+            legacy_decode(data)  # calculate_rsi
+            legacy_decode(data)  # calculate_moving_averages
+        legacy = (time.perf_counter() - begin) / repeat
+
+        begin = time.perf_counter()
+        for _ in range(repeat):
+            decode_bars(data)
+        shared = (time.perf_counter() - begin) / repeat
+
+        print(f"{count:>6}봉  기존(DataFrame x2): {legacy * 1000:8.2f}ms  "
+              f"decode_bars x1: {shared * 1000:8.2f}ms  ({legacy / shared:.1f}배)")
+
+
+def _benchmark_wilder_rsi(bar_counts=(1000, 10000, 100000), periods=14, legacy_limit=100000):
+    """Wilder RSI 계산 비용 비교: 기존 pandas 행별 루프(df.loc) vs wilder_rsi_series
+    legacy_limit: 이보다 긴 데이터는 기존 루프 측정 생략 (수 분 걸림)
+    """
+    import pandas as pd
+
+    def legacy_rsi_series(prices):
+        df = pd.DataFrame({'price': prices})
+        df['price_change'] = df['price'].diff()
+        df['gain'] = df['price_change'].where(df['price_change'] > 0, 0)
+        df['loss'] = -df['price_change'].where(df['price_change'] < 0, 0)
+        df['avg_gain'] = 0.0
+        df['avg_loss'] = 0.0
+        df.loc[periods, 'avg_gain'] = df['gain'].iloc[1:periods + 1].mean()
+        df.loc[periods, 'avg_loss'] = df['loss'].iloc[1:periods + 1].mean()
+        alpha = 1.0 / periods
+        for i in range(periods + 1, len(df)):
+            df.loc[i, 'avg_gain'] = alpha * df['gain'].iloc[i] + (1 - alpha) * df['avg_gain'].iloc[i - 1]
+            df.loc[i, 'avg_loss'] = alpha * df['loss'].iloc[i] + (1 - alpha) * df['avg_loss'].iloc[i - 1]
+        df['rs'] = df['avg_gain'] / df['avg_loss'].replace(0, np.nan)
+        return (100 - (100 / (1 + df['rs']))).to_numpy()
+
+    rng = np.random.default_rng(0)
+    for count in bar_counts:
+        prices = 50000 + np.cumsum(rng.normal(0, 100, count)).round()
+
+        begin = time.perf_counter()
+        repeat = max(1, 100000 // count)
+        for _ in range(repeat):
+            fast = wilder_rsi_series(prices, periods)
+        fast_time = (time.perf_counter() - begin) / repeat
+
+        if count > legacy_limit:
+            print(f"{count:>7}봉  wilder_rsi_series: {fast_time * 1000:9.2f}ms  (기존 루프 측정 생략)")
+            continue
+        begin = time.perf_counter()
+        legacy = legacy_rsi_series(prices)
+        legacy_time = time.perf_counter() - begin
+        both = ~np.isnan(legacy)
+        max_diff = float(np.max(np.abs(legacy[both] - fast[both]))) if both.any() else 0.0
+        nan_match = bool(np.array_equal(np.isnan(legacy), np.isnan(fast)))
+        print(f"{count:>7}봉  기존 루프: {legacy_time * 1000:10.1f}ms  wilder_rsi_series: {fast_time * 1000:8.2f}ms  "
+              f"({legacy_time / fast_time:,.0f}배)  최대 차이 {max_diff:.2e}, NaN 위치 일치 {nan_match}")
+
+
+if __name__ == "__main__":
+    # python kis_indicators.py rsi → Wilder RSI 벤치마크, 인자 없으면 분봉 응답 변환 벤치마크
+    if len(sys.argv) > 1 and sys.argv[1] == 'rsi':
+        _benchmark_wilder_rsi()
+    else:
+        _benchmark_decode()
@@ -0,0 +1,234 @@
+# KIS API 호출 계측 (tr_id별 지연 히스토그램, 상태 코드, 재시도, 전송 바이트)
+# KISClient(metrics=...)에 연결하면 모든 호출을 tr_id 단위로 집계하고
+# 매매 주기마다 한 줄 요약(호출 수, 초당 최대 호출 수 / 한도)과 파일 내보내기를 제공
+# - 누적 집계: Prometheus textfile 형식 (node_exporter textfile collector로 수집 가능)
+# - 주기별 집계: SQLite api_cycle_metrics 테이블 (스크립트 버전별 호출 수 비교용)
+
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)   # 지연 히스토그램 구간 상한 (초)
+
+
+class EndpointStats:
+    """tr_id 1개의 집계"""
+
+    __slots__ = ('count', 'errors', 'retries', 'latency_sum', 'latency_max', 'buckets',
+                 'status_codes', 'bytes_sent', 'bytes_received')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0                 # 응답 없음(네트워크 오류) 또는 4xx/5xx
+        self.retries = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)     # 마지막 칸은 +Inf
+        self.status_codes = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def add(self, elapsed, status, retries, bytes_sent, bytes_received):
+        self.count += 1
+        self.retries += retries
+        self.latency_sum += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        for i, upper in enumerate(LATENCY_BUCKETS):
+            if elapsed <= upper:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.status_codes[str(status) if status is not None else 'error'] += 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+
+    def quantile(self, q):
+        """히스토그램 기준 분위수 근사값 (해당 구간 상한, 초)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.latency_max
+        return self.latency_max
+
+
+class APIMetrics:
+    """API 호출 집계 (스레드 안전, 누적 + 현재 주기)"""
+
+    def __init__(self, source, rate_limit_per_second=None, prom_path=None, db_path=None):
+        """
+        source: 스크립트 구분 (예: 'US', 'KR' - 내보내기 라벨/테이블 컬럼)
+        rate_limit_per_second: KIS 초당 호출 한도 (주기 요약의 예산 사용률 계산용, None이면 생략)
+        prom_path: Prometheus textfile 경로 (None이면 저장 안 함)
+        db_path: 주기별 집계 SQLite 경로 (None이면 저장 안 함)
+        """
+        self.source = source
+        self.rate_limit_per_second = rate_limit_per_second
+        self.prom_path = prom_path
+        self.db_path = db_path
+        self.started_at = time.time()
+        self.totals = {}                # {tr_id: EndpointStats} (프로세스 시작 이후 누적)
+        self.cycle = {}                 # {tr_id: EndpointStats} (현재 주기)
+        self.cycle_started_at = time.time()
+        self._cycle_seconds = Counter() # {epoch 초: 호출 수} (현재 주기 초당 최대 호출 수 계산용)
+        self._lock = threading.Lock()
+        if self.db_path:
+            self._init_db()
+
+    def record(self, tr_id, elapsed, status=None, retries=0, bytes_sent=0, bytes_received=0):
+        """호출 1건 기록 (status None = 응답 없음)"""
+        with self._lock:
+            for table in (self.totals, self.cycle):
+                stats = table.get(tr_id)
+                if stats is None:
+                    stats = table[tr_id] = EndpointStats()
+                stats.add(elapsed, status, retries, bytes_sent, bytes_received)
+            self._cycle_seconds[int(time.time())] += 1 + retries   # 재시도도 한도에 포함
+
+    # ===== 주기 집계 =====
+
+    def cycle_summary(self):
+        """현재 주기 요약 dict"""
+        with self._lock:
+            calls = sum(s.count for s in self.cycle.values())
+            return {
+                'elapsed': time.time() - self.cycle_started_at,
+                'calls': calls,
+                'errors': sum(s.errors for s in self.cycle.values()),
+                'retries': sum(s.retries for s in self.cycle.values()),
+                'latency_sum': sum(s.latency_sum for s in self.cycle.values()),
+                'bytes': sum(s.bytes_sent + s.bytes_received for s in self.cycle.values()),
+                'peak_per_second': max(self._cycle_seconds.values(), default=0),
+                'by_tr_id': {tr_id: s.count for tr_id, s in sorted(self.cycle.items(), key=lambda kv: -kv[1].count)},
+            }
+
+    def format_cycle_line(self, summary=None):
+        """주기 요약 한 줄 (호출 수, tr_id별 건수, 평균 지연, 재시도/오류, 초당 최대 호출 / 한도)"""
+        s = summary or self.cycle_summary()
+        if not s['calls']:
+            return f"📡 API 호출 없음 ({s['elapsed']:.0f}초)"
+        by_tr_id = ", ".join(f"{tr_id} {n}" for tr_id, n in s['by_tr_id'].items())
+        line = (f"📡 API {s['calls']}건 / {s['elapsed']:.0f}초 ({by_tr_id}) | 평균 {s['latency_sum'] / s['calls'] * 1000:.0f}ms"
+                f" | 재시도 {s['retries']} 오류 {s['errors']} | {s['bytes'] / 1024:.0f}KB")
+        if self.rate_limit_per_second:
+            line += (f" | 초당 최대 {s['peak_per_second']}건 / 한도 {self.rate_limit_per_second}건"
+                     f" ({s['peak_per_second'] / self.rate_limit_per_second * 100:.0f}%)")
+        return line
+
+    def end_cycle(self, label=None):
+        """현재 주기 마감: 요약 한 줄 반환, 파일 내보내기, 다음 주기 시작"""
+        summary = self.cycle_summary()
+        line = self.format_cycle_line(summary)
+        if self.db_path:
+            self._write_cycle_rows(label)
+        if self.prom_path:
+            self.write_prometheus()
+        with self._lock:
+            self.cycle = {}
+            self._cycle_seconds = Counter()
+            self.cycle_started_at = time.time()
+        return line
+
+    # ===== 내보내기 =====
+
+    def write_prometheus(self, path=None):
+        """누적 집계를 Prometheus textfile 형식으로 저장 (임시 파일 교체로 원자적 저장)"""
+        path = path or self.prom_path
+        src = self.source
+        lines = [
+            "# HELP kis_api_request_duration_seconds KIS API call latency by tr_id",
+            "# TYPE kis_api_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            totals = list(self.totals.items())
+            for tr_id, s in totals:
+                labels = f'source="{src}",tr_id="{tr_id}"'
+                cumulative = 0
+                for upper, n in zip(LATENCY_BUCKETS, s.buckets):
+                    cumulative += n
+                    lines.append(f'kis_api_request_duration_seconds_bucket{{{labels},le="{upper}"}} {cumulative}')
+                lines.append(f'kis_api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {s.count}')
+                lines.append(f'kis_api_request_duration_seconds_sum{{{labels}}} {s.latency_sum:.6f}')
+                lines.append(f'kis_api_request_duration_seconds_count{{{labels}}} {s.count}')
+            lines += ["# HELP kis_api_responses_total KIS API responses by tr_id and status code",
+                      "# TYPE kis_api_responses_total counter"]
+            for tr_id, s in totals:
+                for status, n in sorted(s.status_codes.items()):
+                    lines.append(f'kis_api_responses_total{{source="{src}",tr_id="{tr_id}",status="{status}"}} {n}')
+            for name, attr, help_text in (
+                ('kis_api_retries_total', 'retries', 'KIS API retries by tr_id'),
+                ('kis_api_errors_total', 'errors', 'KIS API failed calls (no response or 4xx/5xx) by tr_id'),
+                ('kis_api_sent_bytes_total', 'bytes_sent', 'KIS API request body bytes by tr_id'),
+                ('kis_api_received_bytes_total', 'bytes_received', 'KIS API response body bytes by tr_id'),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for tr_id, s in totals:
+                    lines.append(f'{name}{{source="{src}",tr_id="{tr_id}"}} {getattr(s, attr)}')
+        lines += ["# HELP kis_api_metrics_start_time_seconds Process start time",
+                  "# TYPE kis_api_metrics_start_time_seconds gauge",
+                  f'kis_api_metrics_start_time_seconds{{source="{src}"}} {self.started_at:.0f}']
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"API 계측 파일 저장 실패: {e}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS api_cycle_metrics (
+                    cycle_start REAL NOT NULL,
+                    cycle_end REAL NOT NULL,
+                    source TEXT NOT NULL,
+                    label TEXT,
+                    tr_id TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    errors INTEGER NOT NULL,
+                    retries INTEGER NOT NULL,
+                    latency_sum REAL NOT NULL,
+                    latency_max REAL NOT NULL,
+                    latency_p95 REAL NOT NULL,
+                    bytes_sent INTEGER NOT NULL,
+                    bytes_received INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_api_cycle_metrics_start ON api_cycle_metrics (source, cycle_start)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _write_cycle_rows(self, label=None):
+        """현재 주기 tr_id별 집계를 1행씩 저장 (label: 스크립트 파일명 등 버전 구분)"""
+        now = time.time()
+        with self._lock:
+            rows = [(self.cycle_started_at, now, self.source, label, tr_id, s.count, s.errors, s.retries,
+                     s.latency_sum, s.latency_max, s.quantile(0.95), s.bytes_sent, s.bytes_received)
+                    for tr_id, s in self.cycle.items()]
+        if not rows:
+            return
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany('INSERT INTO api_cycle_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"API 계측 DB 저장 실패: {e}")
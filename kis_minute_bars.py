@@ -0,0 +1,219 @@
+# 국내 주식 분봉 조회 (시간 구간 분할 + 동시 조회)
+# 당일분봉조회(inquire-time-itemchartprice)는 CTX_AREA_FK100 페이지를 순차로 넘겨야 해서 1주일 분봉에 수 분이 걸리므로
+# 일자/시각을 직접 지정할 수 있는 주식일별분봉조회(FHKST03010230)로 여러 거래일 분봉을 받는 모듈
+# - 조회 구간(최근 N거래일 정규장, 거래소 달력 기준)을 응답 1회 최대 건수(120분) 단위 구간으로 나눠 스레드 풀에서 동시 조회
+# - 초당 요청 한도는 KISClient(requests_per_second)가 전체 스레드 합산으로 적용
+# - 구간 경계에서 겹친 1분봉은 시각 키로 중복 제거 후 time_unit분봉으로 합쳐 시간순 BarArray 하나로 반환
+# - use_store=True면 1분봉 원본을 kis_bars.db(timeframe 'M1')에 저장하고 거래일별 동기화 완료 시각 이후 구간만 조회
+#   (마감된 거래일은 재조회 없음, 구간 조회가 실패한 거래일은 동기화 기록을 남기지 않아 다음 조회 때 다시 받음)
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from kis_bar_store import BAR_STORE_PATH, get_sync_marks, load_bars_range, save_bars, set_sync_mark
+from kis_indicators import BarArray, decode_bars
+
+MINUTE_PATH = "uapi/domestic-stock/v1/quotations/inquire-time-dailychartprice"
+MINUTE_TR_ID = "FHKST03010230"     # 주식일별분봉조회 (입력 일자/시각 이전 1분봉 최대 120건)
+MINUTE_SLICE_MINUTES = 120         # 구간 1개 길이 (응답 1회 최대 건수와 같게 - 구간 사이 빈틈 없음)
+MINUTE_FETCH_WORKERS = 8           # 동시에 진행할 구간 조회 수
+MINUTE_TIMEFRAME = 'M1'            # 저장소 봉 단위 키 (1분봉 원본 행)
+MINUTE_STORE_MAX_ROWS = 390 * 30   # 종목별 저장소 보관 1분봉 수 (약 30거래일)
+
+
+def minute_bar_key(row):
+    """1분봉 행의 저장 키 (YYYYMMDDHHMMSS)"""
+    day, hour = row.get('stck_bsop_date'), row.get('stck_cntg_hour')
+    return f"{day}{hour}" if day and hour else None
+
+
+def minute_sessions(calendar, days, now):
+    """최근 days거래일 정규장 {일자(date): (개장, 마감) datetime} (이미 개장한 거래일만, 오래된 순)"""
+    sessions = {}
+    day = calendar.local_date(now)
+    for _ in range(days * 3 + 10):
+        if len(sessions) >= days:
+            break
+        session = calendar.session(day)
+        if session and session[0].timestamp() <= now:
+            sessions[day] = session
+        day -= timedelta(days=1)
+    return dict(sorted(sessions.items()))
+
+
+def slice_ends(start_ts, end_ts):
+    """start_ts 이후 ~ end_ts 구간을 덮는 조회 구간 끝 시각 목록 (epoch 초, 최신부터 MINUTE_SLICE_MINUTES 간격)"""
+    ends = []
+    while end_ts > start_ts:
+        ends.append(end_ts)
+        end_ts -= MINUTE_SLICE_MINUTES * 60
+    return ends
+
+
+def fetch_minute_slice(client, code, end_dt):
+    """구간 1개 조회 (end_dt 이전 1분봉 최대 120건, 최신순) - 실패 시 None"""
+    params = {
+        "FID_COND_MRKT_DIV_CODE": "J",
+        "FID_INPUT_ISCD": code,
+        "FID_INPUT_HOUR_1": end_dt.strftime('%H%M%S'),
+        "FID_INPUT_DATE_1": end_dt.strftime('%Y%m%d'),
+        "FID_PW_DATA_INCU_YN": "Y",
+        "FID_FAKE_TICK_INCU_YN": "",
+    }
+    try:
+        res = client.get(MINUTE_PATH, MINUTE_TR_ID, params)
+    except Exception as e:
+        print(f"❌ {code} 분봉 구간 조회 오류 ({end_dt.strftime('%Y-%m-%d %H:%M')}): {e}")
+        return None
+    if res is None or res.status_code != 200:
+        status = res.status_code if res is not None else None
+        print(f"❌ {code} 분봉 구간 조회 실패 ({end_dt.strftime('%Y-%m-%d %H:%M')}): 상태 코드 {status}")
+        return None
+    data = res.json()
+    if data.get('rt_cd', '0') != '0':
+        print(f"❌ {code} 분봉 구간 조회 오류 ({end_dt.strftime('%Y-%m-%d %H:%M')}): {data.get('msg1', '알 수 없는 오류')}")
+        return None
+    return data.get('output2') or []
+
+
+def resample_minutes(bars, time_unit, sessions):
+    """1분봉 BarArray → time_unit분봉 BarArray (거래일별 개장 시각 기준으로 묶음, 정규장 밖 봉은 제외)
+
+    봉 시각 키는 묶음 시작 시각 (YYYYMMDDHHMM00), 마감 동시호가/종가 봉은 마지막 묶음에 포함
+    """
+    if len(bars) == 0:
+        return bars
+    day_keys = bars.ts // 1000000
+    hhmmss = bars.ts % 1000000
+    minutes = (hhmmss // 10000) * 60 + (hhmmss // 100) % 100
+
+    bucket_keys = np.full(len(bars), -1, dtype=np.int64)
+    for day, (open_dt, close_dt) in sessions.items():
+        day_key = int(day.strftime('%Y%m%d'))
+        in_day = day_keys == day_key
+        if not in_day.any():
+            continue
+        open_min = open_dt.hour * 60 + open_dt.minute
+        close_min = close_dt.hour * 60 + close_dt.minute
+        last_bucket = max((close_min - open_min + time_unit - 1) // time_unit - 1, 0)
+        in_session = in_day & (minutes >= open_min) & (minutes <= close_min)
+        bucket = np.minimum((minutes[in_session] - open_min) // time_unit, last_bucket)
+        start_min = open_min + bucket * time_unit
+        bucket_keys[in_session] = day_key * 1000000 + (start_min // 60) * 10000 + (start_min % 60) * 100
+
+    mask = bucket_keys >= 0
+    if not mask.any():
+        return BarArray.empty(bars.price_column)
+    keys = bucket_keys[mask]
+    # 입력이 시간순이므로 같은 묶음은 연속 구간 - 구간 시작/끝 인덱스로 한 번에 집계
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    volume = bars.volume[mask]
+    return BarArray(
+        keys[starts],
+        bars.open[mask][starts],
+        np.maximum.reduceat(bars.high[mask], starts),
+        np.minimum.reduceat(bars.low[mask], starts),
+        bars.close[mask][ends],
+        np.add.reduceat(np.nan_to_num(volume), starts),
+        bars.price_column,
+    )
+
+
+def fetch_minute_bars_many(client, codes, time_unit, days, calendar, now, max_workers=MINUTE_FETCH_WORKERS,
+                           use_store=False, db_path=BAR_STORE_PATH):
+    """여러 종목의 최근 days거래일 time_unit분봉 (모든 종목의 구간을 스레드 풀 하나에서 동시 조회)
+
+    use_store: 저장소 사용 여부 (True면 저장소에 없는 구간만 조회하고 결과는 저장소에서 읽음)
+    Returns:
+        {종목코드: BarArray (시간순, 봉이 하나도 없으면 None)}
+    """
+    sessions = minute_sessions(calendar, days, now)
+    day_keys = {day: day.strftime('%Y%m%d') for day in sessions}
+
+    # 종목/거래일별로 아직 받지 않은 구간만 조회 대상 (저장소 미사용이면 전체)
+    tasks = []                     # [(종목코드, 일자, 구간 끝 datetime)]
+    for code in codes:
+        marks = get_sync_marks(code, MINUTE_TIMEFRAME, day_keys.values(), db_path=db_path) if use_store else {}
+        for day, (open_dt, close_dt) in sessions.items():
+            start_ts = max(open_dt.timestamp(), marks.get(day_keys[day], 0))
+            for end_ts in slice_ends(start_ts, min(close_dt.timestamp(), now)):
+                tasks.append((code, day, datetime.fromtimestamp(end_ts, calendar.tz)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = list(executor.map(lambda task: fetch_minute_slice(client, task[0], task[2]), tasks))
+
+    rows_by_code = {code: [] for code in codes}
+    failed = {}                    # {(종목코드, 일자): 실패 구간 수}
+    fetched = set()                # 조회한 (종목코드, 일자)
+    for (code, day, _), rows in zip(tasks, responses):
+        fetched.add((code, day))
+        if rows is None:
+            failed[(code, day)] = failed.get((code, day), 0) + 1
+        else:
+            rows_by_code[code].extend(rows)
+    for (code, day), count in sorted(failed.items()):
+        print(f"⚠️ {code} {day} 분봉 구간 {count}개 조회 실패 - 받은 구간만 사용")
+
+    if use_store:
+        for code in codes:
+            save_bars(code, MINUTE_TIMEFRAME, rows_by_code[code], minute_bar_key,
+                      db_path=db_path, max_rows=MINUTE_STORE_MAX_ROWS)
+        # 구간이 모두 성공한 거래일만 동기화 기록 (진행 중인 거래일은 현재 분봉이 아직 바뀌므로 1분 전까지)
+        for code, day in sorted(fetched):
+            if (code, day) in failed:
+                continue
+            close_ts = sessions[day][1].timestamp()
+            set_sync_mark(code, MINUTE_TIMEFRAME, day_keys[day], close_ts if close_ts <= now else now - 60,
+                          db_path=db_path)
+        first_key = day_keys[next(iter(sessions))] if sessions else None
+        for code in codes:
+            rows_by_code[code] = load_bars_range(code, MINUTE_TIMEFRAME, start_ts=first_key and f"{first_key}000000",
+                                                 db_path=db_path)
+
+    result = {}
+    for code in codes:
+        minute_bars = decode_bars({'output2': rows_by_code[code]})
+        if len(minute_bars) == 0:
+            result[code] = None
+            continue
+        # 구간 경계에서 겹친 1분봉 제거 (시간순 정렬 상태 유지)
+        _, first = np.unique(minute_bars.ts, return_index=True)
+        minute_bars = BarArray(minute_bars.ts[first], minute_bars.open[first], minute_bars.high[first],
+                               minute_bars.low[first], minute_bars.close[first], minute_bars.volume[first],
+                               minute_bars.price_column)
+        bars = resample_minutes(minute_bars, time_unit, sessions)
+        result[code] = bars if len(bars) else None
+    return result
+
+
+def fetch_minute_bars(client, code, time_unit, days, calendar, now, max_workers=MINUTE_FETCH_WORKERS,
+                      use_store=False, db_path=BAR_STORE_PATH):
+    """종목 1개의 최근 days거래일 time_unit분봉 BarArray (실패 시 None)"""
+    return fetch_minute_bars_many(client, [code], time_unit, days, calendar, now, max_workers,
+                                  use_store=use_store, db_path=db_path)[code]
+
+
+def _format_number(value):
+    """응답 문자열 형식 숫자 (정수면 소수점 없이, NaN이면 빈 문자열)"""
+    if np.isnan(value):
+        return ''
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def minute_bars_output2(bars):
+    """BarArray → KIS 분봉 응답 형식 행 목록 (시간순, DataFrame 기반 기존 계산 함수용)"""
+    rows = []
+    for i in range(len(bars)):
+        key = f"{int(bars.ts[i]):014d}"
+        rows.append({
+            'stck_bsop_date': key[:8],
+            'stck_cntg_hour': key[8:],
+            'stck_prpr': _format_number(bars.close[i]),
+            'stck_oprc': _format_number(bars.open[i]),
+            'stck_hgpr': _format_number(bars.high[i]),
+            'stck_lwpr': _format_number(bars.low[i]),
+            'cntg_vol': _format_number(bars.volume[i]),
+        })
+    return rows
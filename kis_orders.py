@@ -0,0 +1,305 @@
+# KIS 주문 추적 / 체결 대사
+# 접수된 주문번호를 메모리에 보관하고, 일별 주문체결 조회를 한 번(페이지 단위) 호출해 미체결 주문 전체의 체결 수량을 갱신
+# - 체결 증가분마다 on_fill(order, 체결 수량, 체결 단가) 호출 → 거래 기록/보유 스냅샷은 실제 체결 기준으로 반영
+# - 제한 시간이 지난 미체결 주문은 취소 요청 → 체결 조회에서 취소가 확인되면 take_cancelled()로 넘김
+#   (재주문 여부/가격은 호출 측에서 결정, 수량은 취소 확인 시점의 미체결 수량)
+# - 해외주식(inquire-ccnl / order-rvsecncl), 국내주식(inquire-daily-ccld / order-rvsecncl) 지원
+
+import threading
+import time
+from datetime import datetime
+
+from pytz import timezone
+
+ORDER_OPEN = 'open'                     # 미체결(일부 체결 포함)
+ORDER_CANCEL_REQUESTED = 'cancel_requested'
+ORDER_FILLED = 'filled'
+ORDER_CANCELLED = 'cancelled'
+ORDER_EXPIRED = 'expired'               # 장 마감까지 미체결 (당일 주문 소멸)
+
+MARKET_OVERSEAS = {
+    'name': 'overseas',
+    'inquiry_path': 'uapi/overseas-stock/v1/trading/inquire-ccnl',
+    'inquiry_tr_id': 'TTTS3035R',
+    'cancel_path': 'uapi/overseas-stock/v1/trading/order-rvsecncl',
+    'cancel_tr_id': 'TTTT1004U',
+    'timezone': 'America/New_York',     # 주문일자는 현지 일자 기준
+    'ctx_suffix': '200',
+}
+MARKET_DOMESTIC = {
+    'name': 'domestic',
+    'inquiry_path': 'uapi/domestic-stock/v1/trading/inquire-daily-ccld',
+    'inquiry_tr_id': 'TTTC8001R',
+    'cancel_path': 'uapi/domestic-stock/v1/trading/order-rvsecncl',
+    'cancel_tr_id': 'TTTC0803U',
+    'timezone': 'Asia/Seoul',
+    'ctx_suffix': '100',
+}
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def normalize_order_no(odno):
+    """주문번호 비교용 (조회 응답과 주문 응답의 앞자리 0 개수가 다를 수 있음)"""
+    return str(odno or '').lstrip('0')
+
+
+def parse_order_row(row, market):
+    """체결 조회 행 → {'odno', 'symbol', 'filled_qty', 'avg_price', 'remaining_qty', 'cancelled'}"""
+    if market['name'] == 'overseas':
+        return {
+            'odno': normalize_order_no(row.get('odno')),
+            'symbol': row.get('pdno', ''),
+            'filled_qty': int(_to_float(row.get('ft_ccld_qty'))),
+            'avg_price': _to_float(row.get('ft_ccld_unpr3')),
+            'remaining_qty': int(_to_float(row.get('nccs_qty'))),
+            'cancelled': '취소' in row.get('prcs_stat_name', '') or row.get('rvse_cncl_dvsn') == '02',
+        }
+    return {
+        'odno': normalize_order_no(row.get('odno')),
+        'symbol': row.get('pdno', ''),
+        'filled_qty': int(_to_float(row.get('tot_ccld_qty'))),
+        'avg_price': _to_float(row.get('avg_prvs')),
+        'remaining_qty': int(_to_float(row.get('rmn_qty'))),
+        'cancelled': row.get('cncl_yn') == 'Y',
+    }
+
+
+class TrackedOrder:
+    """접수된 주문 1건"""
+
+    __slots__ = ('odno', 'org_no', 'symbol', 'side', 'qty', 'price', 'exchange', 'trade_type',
+                 'submitted_at', 'filled_qty', 'avg_price', 'status', 'reprice_count')
+
+    def __init__(self, odno, org_no, symbol, side, qty, price, exchange=None, trade_type=None, reprice_count=0):
+        self.odno = odno
+        self.org_no = org_no
+        self.symbol = symbol
+        self.side = side                # 'buy' / 'sell'
+        self.qty = qty
+        self.price = price
+        self.exchange = exchange
+        self.trade_type = trade_type or side
+        self.submitted_at = time.time()
+        self.filled_qty = 0
+        self.avg_price = 0.0
+        self.status = ORDER_OPEN
+        self.reprice_count = reprice_count
+
+    @property
+    def remaining_qty(self):
+        return self.qty - self.filled_qty
+
+
+class OrderTracker:
+    """미체결 주문 추적 (스레드 안전)"""
+
+    def __init__(self, client, cano, acnt_prdt_cd, market=MARKET_OVERSEAS, on_fill=None,
+                 fill_timeout=120, max_pages=5):
+        """
+        client: KISClient
+        on_fill: 체결 증가분 콜백 on_fill(order, fill_qty, fill_price)
+        fill_timeout: 접수 후 이 시간(초)이 지나도 미체결 수량이 남으면 expired_orders()에 포함
+        max_pages: 체결 조회 최대 페이지 수 (연속 조회)
+        """
+        self.client = client
+        self.cano = cano
+        self.acnt_prdt_cd = acnt_prdt_cd
+        self.market = market
+        self.on_fill = on_fill
+        self.fill_timeout = fill_timeout
+        self.max_pages = max_pages
+        self._orders = {}               # {정규화 주문번호: TrackedOrder}
+        self._cancelled = []            # 취소 요청 후 체결 조회로 취소가 확인된 주문 (take_cancelled()로 가져감)
+        self._lock = threading.Lock()
+        self.inquiry_count = 0
+
+    # ===== 주문 등록/조회 =====
+
+    def track(self, symbol, side, qty, price, res_data, exchange=None, trade_type=None, reprice_count=0):
+        """주문 응답(rt_cd '0')의 주문번호로 추적 시작 (주문번호가 없으면 None)"""
+        output = res_data.get('output') or {}
+        odno = output.get('ODNO') or output.get('odno')
+        if not odno:
+            print(f"⚠️ {symbol} 주문번호 없음 - 체결 추적 불가: {res_data}")
+            return None
+        order = TrackedOrder(odno, output.get('KRX_FWDG_ORD_ORGNO', ''), symbol, side, int(qty), float(price),
+                             exchange=exchange, trade_type=trade_type, reprice_count=reprice_count)
+        with self._lock:
+            self._orders[normalize_order_no(odno)] = order
+        return order
+
+    def open_orders(self, symbol=None, side=None):
+        with self._lock:
+            return [o for o in self._orders.values()
+                    if (symbol is None or o.symbol == symbol) and (side is None or o.side == side)]
+
+    def open_quantity(self, symbol, side):
+        """종목/방향별 미체결 수량 합계 (중복 주문 방지용, 취소 요청한 주문 제외)"""
+        return sum(o.remaining_qty for o in self.open_orders(symbol, side) if o.status == ORDER_OPEN)
+
+    def has_open_orders(self):
+        with self._lock:
+            return bool(self._orders)
+
+    # ===== 체결 대사 =====
+
+    def fetch_order_rows(self, start_date, end_date):
+        """일별 주문체결 조회 (연속 조회 포함) → {정규화 주문번호: 행}"""
+        suffix = self.market['ctx_suffix']
+        params = {
+            "CANO": self.cano,
+            "ACNT_PRDT_CD": self.acnt_prdt_cd,
+            "PDNO": "",
+            f"CTX_AREA_FK{suffix}": "",
+            f"CTX_AREA_NK{suffix}": "",
+        }
+        if self.market['name'] == 'overseas':
+            params.update({
+                "ORD_STRT_DT": start_date, "ORD_END_DT": end_date,
+                "SLL_BUY_DVSN": "00", "CCLD_NCCS_DVSN": "00", "OVRS_EXCG_CD": "",
+                "SORT_SQN": "DS", "ORD_DT": "", "ORD_GNO_BRNO": "", "ODNO": "",
+            })
+        else:
+            params.update({
+                "INQR_STRT_DT": start_date, "INQR_END_DT": end_date,
+                "SLL_BUY_DVSN_CD": "00", "INQR_DVSN": "00", "CCLD_DVSN": "00",
+                "ORD_GNO_BRNO": "", "ODNO": "", "INQR_DVSN_3": "00", "INQR_DVSN_1": "",
+            })
+
+        rows = {}
+        tr_cont = ""
+        for _ in range(self.max_pages):
+            res = self.client.get(self.market['inquiry_path'], self.market['inquiry_tr_id'], params,
+                                  extra_headers={"tr_cont": tr_cont} if tr_cont else None)
+            self.inquiry_count += 1
+            if res is None or res.status_code != 200:
+                raise RuntimeError(f"주문체결 조회 실패: 상태 코드 {res.status_code if res is not None else '토큰 없음'}")
+            data = res.json()
+            if data.get('rt_cd') != '0':
+                raise RuntimeError(f"주문체결 조회 실패: {data.get('msg1')}")
+            output = data.get('output') if self.market['name'] == 'overseas' else data.get('output1')
+            for row in output or []:
+                parsed = parse_order_row(row, self.market)
+                rows[parsed['odno']] = parsed
+            if res.headers.get('tr_cont') not in ('F', 'M'):
+                break
+            tr_cont = "N"
+            params[f"CTX_AREA_FK{suffix}"] = data.get(f"ctx_area_fk{suffix}", "")
+            params[f"CTX_AREA_NK{suffix}"] = data.get(f"ctx_area_nk{suffix}", "")
+        return rows
+
+    def reconcile(self):
+        """미체결 주문 전체를 체결 조회 1회로 갱신 (추적 중인 주문이 없으면 조회하지 않음)
+
+        Returns:
+            [(order, fill_qty, fill_price)] 이번에 새로 확인된 체결
+        """
+        orders = self.open_orders()
+        if not orders:
+            return []
+        tz = timezone(self.market['timezone'])
+        start_date = datetime.fromtimestamp(min(o.submitted_at for o in orders), tz).strftime('%Y%m%d')
+        end_date = datetime.now(tz).strftime('%Y%m%d')
+        rows = self.fetch_order_rows(start_date, end_date)
+
+        fills = []
+        for order in orders:
+            row = rows.get(normalize_order_no(order.odno))
+            if row is None:
+                continue    # 아직 조회에 반영되지 않음
+            new_qty = row['filled_qty'] - order.filled_qty
+            if new_qty > 0:
+                # 평균 체결가에서 이번 증가분의 단가 계산
+                total = row['avg_price'] * row['filled_qty'] - order.avg_price * order.filled_qty
+                fill_price = total / new_qty if total > 0 else row['avg_price']
+                order.filled_qty = row['filled_qty']
+                order.avg_price = row['avg_price']
+                fills.append((order, new_qty, fill_price))
+            cancel_requested = order.status == ORDER_CANCEL_REQUESTED
+            if order.filled_qty >= order.qty:
+                order.status = ORDER_FILLED
+            elif row['remaining_qty'] <= 0 or row['cancelled']:
+                order.status = ORDER_CANCELLED
+            if order.status in (ORDER_FILLED, ORDER_CANCELLED):
+                with self._lock:
+                    self._orders.pop(normalize_order_no(order.odno), None)
+                    if cancel_requested and order.status == ORDER_CANCELLED:
+                        self._cancelled.append(order)
+
+        for order, fill_qty, fill_price in fills:
+            if self.on_fill:
+                try:
+                    self.on_fill(order, fill_qty, fill_price)
+                except Exception as e:
+                    print(f"체결 처리 오류 ({order.symbol} {order.odno}): {e}")
+        return fills
+
+    # ===== 취소/만료 =====
+
+    def expired_orders(self, now=None):
+        """접수 후 fill_timeout이 지났는데 미체결 수량이 남은 주문 (취소 요청한 주문 제외)"""
+        now = now or time.time()
+        return [o for o in self.open_orders()
+                if o.status == ORDER_OPEN and o.remaining_qty > 0 and now - o.submitted_at > self.fill_timeout]
+
+    def cancel(self, order):
+        """미체결 수량 취소 요청 (성공하면 True, 체결 조회에서 잔량 0 확인 후 추적 종료)
+
+        요청과 경합한 일부 체결이 있을 수 있으므로 재주문은 take_cancelled()로 취소가 확인된 뒤
+        order.remaining_qty(확인된 미체결 수량)로 한다.
+        """
+        if self.market['name'] == 'overseas':
+            body = {
+                "CANO": self.cano,
+                "ACNT_PRDT_CD": self.acnt_prdt_cd,
+                "OVRS_EXCG_CD": order.exchange,
+                "PDNO": order.symbol,
+                "ORGN_ODNO": order.odno,
+                "RVSE_CNCL_DVSN_CD": "02",
+                "ORD_QTY": str(order.remaining_qty),
+                "OVRS_ORD_UNPR": "0",
+                "ORD_SVR_DVSN_CD": "0",
+            }
+        else:
+            body = {
+                "CANO": self.cano,
+                "ACNT_PRDT_CD": self.acnt_prdt_cd,
+                "KRX_FWDG_ORD_ORGNO": order.org_no,
+                "ORGN_ODNO": order.odno,
+                "ORD_DVSN": "00",
+                "RVSE_CNCL_DVSN_CD": "02",
+                "ORD_QTY": "0",
+                "ORD_UNPR": "0",
+                "QTY_ALL_ORD_YN": "Y",
+            }
+        res = self.client.submit_order(self.market['cancel_path'], self.market['cancel_tr_id'], body)
+        if res is None or res.status_code != 200:
+            return False
+        data = res.json()
+        if data.get('rt_cd') != '0':
+            print(f"주문 취소 실패 ({order.symbol} {order.odno}): {data.get('msg1')}")
+            return False
+        order.status = ORDER_CANCEL_REQUESTED
+        return True
+
+    def take_cancelled(self):
+        """취소 요청 후 체결 조회로 취소가 확인된 주문 목록 (가져간 주문은 목록에서 제거)"""
+        with self._lock:
+            orders, self._cancelled = self._cancelled, []
+        return orders
+
+    def expire_all(self):
+        """장 마감 후 남은 주문 추적 종료 (당일 주문은 소멸) - 종료된 주문 목록 반환"""
+        with self._lock:
+            orders = list(self._orders.values())
+            self._orders.clear()
+            self._cancelled.clear()
+        for order in orders:
+            order.status = ORDER_EXPIRED
+        return orders
@@ -0,0 +1,466 @@
+# KIS(한국투자증권) 실시간 체결가 웹소켓 피드
+# 설정된 종목의 실시간 체결가 채널을 구독해 종목별 마지막 체결가를 메모리에 유지하고 틱마다 콜백 호출
+# - 해외주식 실시간 체결가 HDFSCNT0 (tr_key 예: DNASAAPL), 국내주식 실시간 체결가 H0STCNT0 (tr_key: 종목코드)
+# - 연결이 끊기면 백오프 후 재접속 (그 동안은 호출 측이 REST 폴링으로 대체)
+# - MockKISRealtimeServer: 로컬 테스트용 KIS 웹소켓 대체 서버 (표준 라이브러리만 사용)
+#
+# 웹소켓 클라이언트는 websocket-client 패키지 사용 (pip install websocket-client)
+# 로컬 동작 확인: python kis_realtime.py
+
+import base64
+import hashlib
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+OVERSEAS_TRADE_TR_ID = 'HDFSCNT0'   # 해외주식 실시간 체결가
+DOMESTIC_TRADE_TR_ID = 'H0STCNT0'   # 국내주식 실시간 체결가
+PRICE_FIELD_INDEX = {OVERSEAS_TRADE_TR_ID: 11, DOMESTIC_TRADE_TR_ID: 2}   # 체결 레코드 내 현재가(LAST / STCK_PRPR) 위치
+REAL_WS_URL = 'ws://ops.koreainvestment.com:21000'     # 실전투자
+MOCK_WS_URL = 'ws://ops.koreainvestment.com:31000'     # 모의투자
+
+
+def default_ws_url(url_base):
+    """REST 주소(실전/모의)에 맞는 웹소켓 주소"""
+    return MOCK_WS_URL if 'openapivts' in url_base else REAL_WS_URL
+
+
+def overseas_subscription(excd, symbol, prefix='D'):
+    """해외주식 체결가 구독 (tr_id, tr_key) - prefix 'D': 정규장, 'R': 주간거래"""
+    return OVERSEAS_TRADE_TR_ID, f"{prefix}{excd}{symbol}"
+
+
+def domestic_subscription(code):
+    """국내주식 체결가 구독 (tr_id, tr_key)"""
+    return DOMESTIC_TRADE_TR_ID, code
+
+
+def build_subscribe_message(approval_key, tr_id, tr_key, subscribe=True):
+    """구독/해제 요청 메시지"""
+    return json.dumps({
+        "header": {
+            "approval_key": approval_key,
+            "custtype": "P",
+            "tr_type": "1" if subscribe else "2",
+            "content-type": "utf-8",
+        },
+        "body": {"input": {"tr_id": tr_id, "tr_key": tr_key}},
+    })
+
+
+def parse_trade_message(message):
+    """실시간 데이터 메시지 → [(tr_id, 레코드 필드 리스트)] (제어용 JSON 메시지면 None)
+
+    형식: 암호화여부|tr_id|레코드 수|필드1^필드2^... (레코드 여러 개면 필드가 이어서 붙음)
+    """
+    if not message or message[0] not in '01':
+        return None
+    parts = message.split('|', 3)
+    if len(parts) < 4 or parts[0] == '1':
+        # 암호화 데이터는 체결통보에만 사용 (체결가 채널은 평문)
+        return []
+    tr_id, count, payload = parts[1], parts[2], parts[3]
+    fields = payload.split('^')
+    try:
+        count = max(int(count), 1)
+    except ValueError:
+        count = 1
+    size = len(fields) // count
+    if size == 0:
+        return []
+    return [(tr_id, fields[i * size:(i + 1) * size]) for i in range(count)]
+
+
+class KISRealtimeFeed:
+    """실시간 체결가 피드 (백그라운드 스레드에서 수신, 마지막 체결가 조회는 스레드 안전)"""
+
+    def __init__(self, ws_url, approval_key_func, subscriptions, on_tick=None,
+                 reconnect_delay=5, max_reconnect_delay=60, stale_timeout=120, recv_timeout=1.0):
+        """
+        approval_key_func: 실시간 접속키를 반환하는 함수 (접속할 때마다 호출, 예: KISClient.get_approval_key)
+        subscriptions: {종목: (tr_id, tr_key)}
+        on_tick: 틱 콜백 on_tick(symbol, price, received_at) - 수신 스레드에서 호출되므로 오래 걸리는 작업은 넘겨서 처리
+        reconnect_delay / max_reconnect_delay: 재접속 대기 (초, 실패할 때마다 2배)
+        stale_timeout: 이 시간(초) 동안 아무 메시지(PINGPONG 포함)도 없으면 끊긴 것으로 보고 재접속
+        """
+        self.ws_url = ws_url
+        self.approval_key_func = approval_key_func
+        self.subscriptions = dict(subscriptions)
+        self.on_tick = on_tick
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.stale_timeout = stale_timeout
+        self.recv_timeout = recv_timeout
+
+        self._symbol_by_key = {(tr_id, tr_key): symbol for symbol, (tr_id, tr_key) in self.subscriptions.items()}
+        self._prices = {}           # {symbol: (price, received_at)}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._ws = None
+        self.connected = False
+        self.tick_count = 0
+        self.connect_count = 0
+
+    # ===== 조회 =====
+
+    def get_last_price(self, symbol, max_age=None):
+        """마지막 체결가 (없거나 max_age초보다 오래됐으면 None)"""
+        with self._lock:
+            entry = self._prices.get(symbol)
+        if entry is None:
+            return None
+        price, received_at = entry
+        if max_age is not None and time.time() - received_at > max_age:
+            return None
+        return price
+
+    def is_connected(self):
+        return self.connected
+
+    # ===== 실행 =====
+
+    def start(self):
+        if websocket is None:
+            print("websocket-client 패키지가 없어 실시간 시세를 사용하지 않습니다 (pip install websocket-client)")
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='kis-realtime', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.connected = False
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                self._connect_and_receive()
+                delay = self.reconnect_delay
+            except Exception as e:
+                print(f"실시간 시세 연결 오류: {e}")
+            self.connected = False
+            if self._stop.is_set():
+                break
+            print(f"실시간 시세 연결 끊김, {delay}초 후 재접속")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _connect_and_receive(self):
+        approval_key = self.approval_key_func()
+        if not approval_key:
+            raise RuntimeError("실시간 접속키 없음")
+        ws = websocket.create_connection(self.ws_url, timeout=10)
+        self._ws = ws
+        try:
+            ws.settimeout(self.recv_timeout)
+            for tr_id, tr_key in self.subscriptions.values():
+                ws.send(build_subscribe_message(approval_key, tr_id, tr_key))
+            self.connected = True
+            self.connect_count += 1
+            last_message_at = time.time()
+            while not self._stop.is_set():
+                try:
+                    message = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    if time.time() - last_message_at > self.stale_timeout:
+                        raise RuntimeError(f"{self.stale_timeout}초 동안 수신 없음")
+                    continue
+                if not message:
+                    raise RuntimeError("서버가 연결을 닫음")
+                last_message_at = time.time()
+                self._handle_message(ws, message)
+        finally:
+            self._ws = None
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _handle_message(self, ws, message):
+        if isinstance(message, bytes):
+            message = message.decode('utf-8', errors='replace')
+        records = parse_trade_message(message)
+        if records is None:
+            self._handle_control(ws, message)
+            return
+        received_at = time.time()
+        for tr_id, fields in records:
+            index = PRICE_FIELD_INDEX.get(tr_id)
+            if index is None or len(fields) <= index:
+                continue
+            symbol = self._symbol_by_key.get((tr_id, fields[0]))
+            if symbol is None and tr_id == OVERSEAS_TRADE_TR_ID:
+                # 해외 레코드의 첫 필드(RSYM)가 구독 키와 다르면 종목코드(SYMB)로 찾음
+                symbol = fields[1] if fields[1] in self.subscriptions else None
+            if symbol is None:
+                continue
+            try:
+                price = float(fields[index])
+            except ValueError:
+                continue
+            if price <= 0:
+                continue
+            with self._lock:
+                self._prices[symbol] = (price, received_at)
+                self.tick_count += 1
+            if self.on_tick:
+                try:
+                    self.on_tick(symbol, price, received_at)
+                except Exception as e:
+                    print(f"실시간 틱 처리 오류 ({symbol}): {e}")
+
+    def _handle_control(self, ws, message):
+        """JSON 제어 메시지 (PINGPONG 응답, 구독 결과 확인)"""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        header = data.get('header', {})
+        if header.get('tr_id') == 'PINGPONG':
+            ws.pong(message)
+            return
+        body = data.get('body', {})
+        if body.get('rt_cd') not in (None, '0'):
+            print(f"실시간 구독 실패 ({header.get('tr_id')} {header.get('tr_key')}): {body.get('msg1')}")
+
+
+# ===== 로컬 테스트용 대체 서버 =====
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def _encode_frame(payload, opcode=0x1):
+    """서버 → 클라이언트 프레임 (마스크 없음)"""
+    data = payload.encode('utf-8') if isinstance(payload, str) else payload
+    header = bytes([0x80 | opcode])
+    length = len(data)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack('!H', length)
+    else:
+        header += bytes([127]) + struct.pack('!Q', length)
+    return header + data
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("연결 종료")
+        data += chunk
+    return data
+
+
+def _read_frame(sock):
+    """클라이언트 → 서버 프레임 (opcode, payload)"""
+    first, second = _recv_exact(sock, 2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _recv_exact(sock, 8))[0]
+    mask = _recv_exact(sock, 4) if second & 0x80 else None
+    payload = _recv_exact(sock, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class MockKISRealtimeServer:
+    """KIS 실시간 웹소켓 대체 서버 (구독 요청 기록, push_trade로 체결 레코드 전송, drop_connections로 끊김 재현)"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server._handle_client(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address
+        self.url = f"ws://{self.host}:{self.port}"
+        self._clients = {}          # {socket: set((tr_id, tr_key))}
+        self._lock = threading.Lock()
+        self.subscribe_requests = []
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.drop_connections()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle_client(self, sock):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            request += chunk
+        headers = {}
+        for line in request.decode('latin-1').split('\r\n')[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((headers.get('sec-websocket-key', '') + WS_GUID).encode()).digest()).decode()
+        sock.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+
+        with self._lock:
+            self._clients[sock] = set()
+        try:
+            while True:
+                opcode, payload = _read_frame(sock)
+                if opcode == 0x8:       # close
+                    break
+                if opcode == 0x9:       # ping
+                    self._send(sock, payload, opcode=0xA)
+                    continue
+                if opcode != 0x1:
+                    continue
+                data = json.loads(payload.decode('utf-8'))
+                if data.get('header', {}).get('tr_id') == 'PINGPONG':
+                    continue
+                body = data['body']['input']
+                key = (body['tr_id'], body['tr_key'])
+                with self._lock:
+                    self.subscribe_requests.append(key)
+                    if data['header'].get('tr_type') == '2':
+                        self._clients[sock].discard(key)
+                    else:
+                        self._clients[sock].add(key)
+                self._send(sock, json.dumps({
+                    "header": {"tr_id": key[0], "tr_key": key[1], "encrypt": "N"},
+                    "body": {"rt_cd": "0", "msg_cd": "OPSP0000", "msg1": "SUBSCRIBE SUCCESS"},
+                }))
+        except (ConnectionError, OSError, ValueError, KeyError):
+            pass
+        finally:
+            with self._lock:
+                self._clients.pop(sock, None)
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _send(self, sock, payload, opcode=0x1):
+        try:
+            sock.sendall(_encode_frame(payload, opcode))
+        except OSError:
+            pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._clients)
+
+    def push_trade(self, tr_id, tr_key, price, symbol=None):
+        """구독 중인 클라이언트에 체결 레코드 전송 (KIS 형식으로 현재가 위치에 price 기록)"""
+        index = PRICE_FIELD_INDEX[tr_id]
+        fields = ['0'] * (26 if tr_id == OVERSEAS_TRADE_TR_ID else 46)
+        fields[0] = tr_key
+        if tr_id == OVERSEAS_TRADE_TR_ID:
+            fields[1] = symbol or tr_key[4:]
+        fields[index] = str(price)
+        message = f"0|{tr_id}|001|{'^'.join(fields)}"
+        with self._lock:
+            targets = [sock for sock, keys in self._clients.items() if (tr_id, tr_key) in keys]
+        for sock in targets:
+            self._send(sock, message)
+        return len(targets)
+
+    def send_pingpong(self):
+        message = json.dumps({"header": {"tr_id": "PINGPONG", "datetime": time.strftime('%Y%m%d%H%M%S')}})
+        with self._lock:
+            targets = list(self._clients)
+        for sock in targets:
+            self._send(sock, message)
+
+    def drop_connections(self):
+        """연결 강제 종료 (끊김/재접속 확인용)"""
+        with self._lock:
+            targets = list(self._clients)
+        for sock in targets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _demo_mock_feed():
+    """대체 서버로 구독 → 틱 수신 지연 → 끊김 후 재접속 확인"""
+    server = MockKISRealtimeServer().start()
+    received = {}
+
+    def on_tick(symbol, price, received_at):
+        received[symbol] = (price, received_at)
+
+    subscriptions = {
+        'AAPL': overseas_subscription('NAS', 'AAPL'),
+        '005930': domestic_subscription('005930'),
+    }
+    feed = KISRealtimeFeed(server.url, lambda: 'mock-approval-key', subscriptions, on_tick=on_tick,
+                           reconnect_delay=0.2, recv_timeout=0.1)
+    if not feed.start():
+        server.stop()
+        return
+
+    def wait_for(condition, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return True
+            time.sleep(0.01)
+        return False
+
+    wait_for(lambda: server.subscriber_count() == 1 and len(server.subscribe_requests) >= 2)
+    latencies = []
+    for i in range(20):
+        sent_at = time.time()
+        server.push_trade(OVERSEAS_TRADE_TR_ID, subscriptions['AAPL'][1], 190 + i * 0.01)
+        wait_for(lambda: received.get('AAPL', (0, 0))[1] >= sent_at)
+        latencies.append(received['AAPL'][1] - sent_at)
+    server.push_trade(DOMESTIC_TRADE_TR_ID, '005930', 71900)
+    wait_for(lambda: '005930' in received)
+    print(f"틱 수신 지연: 평균 {sum(latencies) / len(latencies) * 1000:.2f}ms, 최대 {max(latencies) * 1000:.2f}ms")
+    print(f"마지막 체결가: AAPL {feed.get_last_price('AAPL')}, 005930 {feed.get_last_price('005930')}")
+
+    server.drop_connections()
+    reconnected = wait_for(lambda: feed.connect_count >= 2 and server.subscriber_count() == 1)
+    print(f"끊김 후 재접속: {'성공' if reconnected else '실패'} (접속 {feed.connect_count}회)")
+    feed.stop()
+    server.stop()
+
+
+if __name__ == '__main__':
+    _demo_mock_feed()
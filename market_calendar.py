@@ -0,0 +1,318 @@
+# 거래소 정규장 달력 (휴장일/조기 마감/지연 개장 포함)
+# 연도별 휴장일과 특별 거래 시간을 JSON 파일(market_calendar_us.json, market_calendar_krx.json)에 미리 계산해 두고
+# 해당 일자의 개장/마감 시각, 다음 개장 시각을 파일 기준으로 계산하기 위한 모듈
+# - 일자별 조회는 딕셔너리 조회 1회 (주말/휴장일/조기 마감/지연 개장/연장 마감)
+# - 파일에 없는 연도는 주말만 제외하는 정규 시간으로 대체하고 연도별 1회 경고
+# - python market_calendar.py us 2027 2028 → NYSE 규칙으로 해당 연도 계산 후 파일에 병합 저장
+# - python market_calendar.py krx 2027 → KRX 규칙(양력 공휴일, 음력 공휴일 표, 대체공휴일, 연말 휴장, 수능일)으로 계산
+#   (임시 휴장 같은 규칙 밖 일정은 파일에 직접 추가, 재계산해도 유지됨)
+
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from pytz import timezone
+
+US_CALENDAR_PATH = 'market_calendar_us.json'
+US_EARLY_CLOSE = '13:00'           # NYSE 조기 마감 (뉴욕 시각)
+KRX_CALENDAR_PATH = 'market_calendar_krx.json'
+KRX_LATE_OPEN = '10:00'            # KRX 새해 첫 거래일/수능일 개장 (한국 시각)
+KRX_EXAM_CLOSE = '16:30'           # KRX 수능일 마감 (개장이 1시간 늦어지는 만큼 마감도 연장)
+
+
+def _parse_hhmm(value):
+    hour, minute = value.split(':')
+    return int(hour), int(minute)
+
+
+class MarketCalendar:
+    """거래소 1개의 정규장 달력 (JSON 파일 기준)"""
+
+    def __init__(self, path):
+        """
+        path: 달력 파일 경로
+            {"exchange": "XNYS", "timezone": "America/New_York", "open": "09:30", "close": "16:00",
+             "years": {"2026": {"holidays": {"2026-01-01": "New Year's Day", ...},
+                                "early_closes": {"2026-11-27": "13:00", ...},
+                                "late_opens": {}, "late_closes": {}}}}
+        """
+        self.path = path
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.exchange = data.get('exchange', '')
+        self.tz = timezone(data['timezone'])
+        self.open_time = _parse_hhmm(data['open'])
+        self.close_time = _parse_hhmm(data['close'])
+        self.holidays = {}          # {date: 휴장 사유}
+        self.early_closes = {}      # {date: (시, 분)}
+        self.late_opens = {}        # {date: (시, 분)}
+        self.late_closes = {}       # {date: (시, 분)}
+        self.years = set()
+        for year, entries in data.get('years', {}).items():
+            self.years.add(int(year))
+            for day, name in entries.get('holidays', {}).items():
+                self.holidays[date.fromisoformat(day)] = name
+            for day, hhmm in entries.get('early_closes', {}).items():
+                self.early_closes[date.fromisoformat(day)] = _parse_hhmm(hhmm)
+            for day, hhmm in entries.get('late_opens', {}).items():
+                self.late_opens[date.fromisoformat(day)] = _parse_hhmm(hhmm)
+            for day, hhmm in entries.get('late_closes', {}).items():
+                self.late_closes[date.fromisoformat(day)] = _parse_hhmm(hhmm)
+        self._warned_years = set()
+
+    def _check_year(self, day):
+        if day.year not in self.years and day.year not in self._warned_years:
+            self._warned_years.add(day.year)
+            print(f"⚠️ {self.exchange} 달력에 {day.year}년 데이터가 없어 주말만 제외합니다 ({self.path} 갱신 필요)")
+
+    def holiday_name(self, day):
+        """휴장 사유 (휴장일이 아니면 None, 주말은 'Weekend')"""
+        if day.weekday() >= 5:
+            return 'Weekend'
+        self._check_year(day)
+        return self.holidays.get(day)
+
+    def session(self, day):
+        """해당 일자(거래소 현지)의 정규장 (개장, 마감) datetime - 휴장일이면 None"""
+        if self.holiday_name(day):
+            return None
+        open_hm = self.late_opens.get(day, self.open_time)
+        close_hm = self.early_closes.get(day) or self.late_closes.get(day, self.close_time)
+        open_dt = self.tz.localize(datetime(day.year, day.month, day.day, *open_hm))
+        close_dt = self.tz.localize(datetime(day.year, day.month, day.day, *close_hm))
+        return open_dt, close_dt
+
+    def local_date(self, now):
+        """epoch 초 → 거래소 현지 일자"""
+        return datetime.fromtimestamp(now, self.tz).date()
+
+    def is_open(self, now):
+        """now(epoch 초)가 정규장 시간인지"""
+        session = self.session(self.local_date(now))
+        return session is not None and session[0].timestamp() <= now <= session[1].timestamp()
+
+    def close_time_of(self, now):
+        """now(epoch 초)가 속한 거래일의 마감 시각 (epoch 초, 휴장일이면 None)"""
+        session = self.session(self.local_date(now))
+        return session[1].timestamp() if session else None
+
+    def next_session(self, now, max_days=30):
+        """now(epoch 초) 이후 처음 개장하는 정규장 (개장, 마감) datetime"""
+        day = self.local_date(now)
+        for offset in range(max_days):
+            session = self.session(day + timedelta(days=offset))
+            if session and session[0].timestamp() > now:
+                return session
+        raise RuntimeError(f"{max_days}일 안에 {self.exchange} 개장일이 없습니다")
+
+    def next_open(self, now):
+        """now(epoch 초) 이후 첫 개장 시각 (epoch 초)"""
+        return self.next_session(now)[0].timestamp()
+
+    def last_closed_session(self, now, max_days=30):
+        """now(epoch 초) 기준 마지막으로 마감된 거래일 (거래소 현지 date, 장중이면 전 거래일)"""
+        day = self.local_date(now)
+        for offset in range(max_days):
+            candidate = day - timedelta(days=offset)
+            session = self.session(candidate)
+            if session and session[1].timestamp() <= now:
+                return candidate
+        raise RuntimeError(f"최근 {max_days}일 안에 {self.exchange} 거래일이 없습니다")
+
+    def describe(self, day):
+        """일자 설명 (휴장/조기 마감/지연 개장 표시용, 정규 일정이면 빈 문자열)"""
+        name = self.holiday_name(day)
+        if name:
+            return f"휴장: {name}"
+        notes = []
+        if day in self.late_opens:
+            notes.append(f"지연 개장 {self.late_opens[day][0]:02d}:{self.late_opens[day][1]:02d}")
+        if day in self.early_closes:
+            notes.append(f"조기 마감 {self.early_closes[day][0]:02d}:{self.early_closes[day][1]:02d}")
+        if day in self.late_closes:
+            notes.append(f"연장 마감 {self.late_closes[day][0]:02d}:{self.late_closes[day][1]:02d}")
+        return ", ".join(notes)
+
+
+# ===== 달력 파일 생성 (NYSE 규칙) =====
+
+def easter_sunday(year):
+    """부활절 일자 (그레고리력, Anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """해당 월 n번째 weekday (n=-1이면 마지막)"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    """토요일 휴일은 금요일, 일요일 휴일은 월요일로 대체"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def us_exchange_year(year):
+    """NYSE/NASDAQ 정규장 휴장일과 조기 마감 (규칙 기반, 임시 휴장은 포함하지 않음)"""
+    holidays = {}
+    new_year = date(year, 1, 1)
+    # 1월 1일이 토요일이면 전년도 12월 31일은 휴장하지 않음 (NYSE Rule 7.2)
+    if new_year.weekday() != 5:
+        holidays[observed(new_year)] = "New Year's Day"
+    holidays[nth_weekday(year, 1, 0, 3)] = "Martin Luther King Jr. Day"
+    holidays[nth_weekday(year, 2, 0, 3)] = "Washington's Birthday"
+    holidays[easter_sunday(year) - timedelta(days=2)] = "Good Friday"
+    holidays[nth_weekday(year, 5, 0, -1)] = "Memorial Day"
+    if year >= 2022:
+        holidays[observed(date(year, 6, 19))] = "Juneteenth National Independence Day"
+    holidays[observed(date(year, 7, 4))] = "Independence Day"
+    holidays[nth_weekday(year, 9, 0, 1)] = "Labor Day"
+    thanksgiving = nth_weekday(year, 11, 3, 4)
+    holidays[thanksgiving] = "Thanksgiving Day"
+    holidays[observed(date(year, 12, 25))] = "Christmas Day"
+
+    # 독립기념일 전날, 추수감사절 다음날, 크리스마스 이브 (평일이고 휴장일이 아닐 때만)
+    early_closes = {}
+    for day in (date(year, 7, 3), thanksgiving + timedelta(days=1), date(year, 12, 24)):
+        if day.weekday() < 5 and day not in holidays:
+            early_closes[day] = US_EARLY_CLOSE
+    # 7월 3일이 금요일이면 7월 4일(토) 대체 휴장일이라 위에서 제외됨
+    return {
+        'holidays': {day.isoformat(): name for day, name in sorted(holidays.items()) if day.year == year},
+        'early_closes': {day.isoformat(): hhmm for day, hhmm in sorted(early_closes.items())},
+        'late_opens': {},
+        'late_closes': {},
+    }
+
+
+# ===== 달력 파일 생성 (KRX 규칙) =====
+# 음력 공휴일(설날/부처님오신날/추석)과 수능일은 규칙으로 계산할 수 없어 연도별 표로 관리
+# 선거일/임시공휴일처럼 해마다 따로 지정되는 휴장일은 달력 파일에 직접 추가 (재계산해도 유지됨)
+KRX_LUNAR_HOLIDAYS = {             # {연도: (설날, 부처님오신날, 추석)} - 설날/추석은 당일 기준 앞뒤 하루씩 휴장
+    2025: (date(2025, 1, 29), date(2025, 5, 5), date(2025, 10, 6)),
+    2026: (date(2026, 2, 17), date(2026, 5, 24), date(2026, 9, 25)),
+    2027: (date(2027, 2, 7), date(2027, 5, 13), date(2027, 9, 15)),
+}
+KRX_EXAM_DAYS = {                  # {연도: 대학수학능력시험일} - 개장 10:00, 마감 16:30
+    2025: date(2025, 11, 13),
+    2026: date(2026, 11, 19),
+    2027: date(2027, 11, 18),
+}
+
+
+def krx_exchange_year(year):
+    """KRX 유가증권/코스닥 정규장 휴장일과 특별 거래 시간 (선거일/임시공휴일은 포함하지 않음)"""
+    if year not in KRX_LUNAR_HOLIDAYS or year not in KRX_EXAM_DAYS:
+        raise ValueError(f"{year}년 음력 공휴일/수능일 표가 없습니다 (KRX_LUNAR_HOLIDAYS, KRX_EXAM_DAYS에 추가 필요)")
+    seollal, buddha, chuseok = KRX_LUNAR_HOLIDAYS[year]
+    one_day = timedelta(days=1)
+    holidays = {
+        date(year, 1, 1): "신정",
+        date(year, 5, 1): "근로자의 날",
+        date(year, 6, 6): "현충일",
+    }
+    substitutes = []               # [(연휴 마지막 날, 대체공휴일 이름)]
+
+    def add(day, name):
+        """공휴일 추가 (이미 공휴일이면 이름을 합치고 True 반환)"""
+        overlapped = day in holidays
+        holidays[day] = f"{holidays[day]}·{name}" if overlapped else name
+        return overlapped
+
+    # 설날/추석 연휴: 일요일 또는 다른 공휴일과 겹치면 대체공휴일
+    for center, name in ((seollal, "설날"), (chuseok, "추석")):
+        days = (center - one_day, center, center + one_day)
+        overlapped = [add(day, name if day == center else f"{name} 연휴") for day in days]
+        if any(overlapped) or any(day.weekday() == 6 for day in days):
+            substitutes.append((days[-1], f"{name} 대체공휴일"))
+    # 토/일요일 또는 다른 공휴일과 겹치면 대체공휴일 (어린이날은 2014년, 나머지는 2021·2023년부터 적용)
+    for day, name in ((date(year, 3, 1), "삼일절"), (buddha, "부처님오신날"), (date(year, 5, 5), "어린이날"),
+                      (date(year, 8, 15), "광복절"), (date(year, 10, 3), "개천절"),
+                      (date(year, 10, 9), "한글날"), (date(year, 12, 25), "기독탄신일")):
+        if add(day, name) or day.weekday() >= 5:
+            substitutes.append((day, f"{name} 대체공휴일"))
+
+    # 대체공휴일은 연휴가 끝난 뒤 공휴일이 아닌 첫 평일 (날짜순으로 차례대로 지정)
+    for last_day, name in sorted(substitutes):
+        day = last_day + one_day
+        while day.weekday() >= 5 or day in holidays:
+            day += one_day
+        holidays[day] = name
+
+    # 연말 휴장: 그 해 마지막 평일
+    year_end = date(year, 12, 31)
+    while year_end.weekday() >= 5:
+        year_end -= one_day
+    holidays.setdefault(year_end, "연말 휴장일")
+
+    # 새해 첫 거래일은 10:00 개장, 수능일은 10:00 개장 / 16:30 마감
+    first_day = date(year, 1, 2)
+    while first_day.weekday() >= 5 or first_day in holidays:
+        first_day += one_day
+    exam_day = KRX_EXAM_DAYS[year]
+    return {
+        'holidays': {day.isoformat(): name for day, name in sorted(holidays.items())
+                     if day.year == year and day.weekday() < 5},
+        'early_closes': {},
+        'late_opens': {first_day.isoformat(): KRX_LATE_OPEN, exam_day.isoformat(): KRX_LATE_OPEN},
+        'late_closes': {exam_day.isoformat(): KRX_EXAM_CLOSE},
+    }
+
+
+def update_calendar_file(path, years, year_builder, header):
+    """연도별 규칙 계산 결과를 달력 파일에 병합 저장 (파일에 직접 추가한 일정은 유지)"""
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    else:
+        data = dict(header, years={})
+    for year in years:
+        entry = data['years'].setdefault(str(year), {})
+        built = year_builder(year)
+        for key, values in built.items():
+            merged = dict(entry.get(key, {}))
+            merged.update(values)
+            entry[key] = dict(sorted(merged.items()))
+    data['years'] = dict(sorted(data['years'].items()))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+    return data
+
+
+CALENDAR_BUILDERS = {
+    'us': (US_CALENDAR_PATH, us_exchange_year,
+           {'exchange': 'XNYS', 'timezone': 'America/New_York', 'open': '09:30', 'close': '16:00'}),
+    'krx': (KRX_CALENDAR_PATH, krx_exchange_year,
+            {'exchange': 'XKRX', 'timezone': 'Asia/Seoul', 'open': '09:00', 'close': '15:30'}),
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in CALENDAR_BUILDERS:
+        print(f"사용법: python market_calendar.py [{'|'.join(CALENDAR_BUILDERS)}] 연도 [연도 ...]")
+        sys.exit(1)
+    calendar_path, builder, calendar_header = CALENDAR_BUILDERS[sys.argv[1]]
+    target_years = [int(y) for y in sys.argv[2:]]
+    update_calendar_file(calendar_path, target_years, builder, calendar_header)
+    print(f"{calendar_path} 저장 완료: {target_years}")
@@ -0,0 +1,503 @@
+# 디스코드 알림 서비스 (백그라운드 발송)
+# 매매 스레드는 메시지를 큐에 넣고 바로 반환하고, 웹훅 발송은 전용 스레드/프로세스가 담당
+# - 레이트 리밋: 발송 간 최소 간격 + 디스코드 429 응답의 retry_after 준수
+# - 중복 제거: 같은 dedup_key는 dedup_window 초 안에 1회만 발송
+# - 배치: 덜 중요한 메시지는 모았다가 batch_interval마다(또는 max_batch_size개가 차면) 한 번에 발송
+# - 재시도: 네트워크 오류/5xx는 지수 백오프로 max_retries회까지 재시도
+# - 첨부 파일: 리포트 문서(선택적으로 gzip) + 짧은 embed를 multipart 요청 1회로 발송 (send_file)
+#
+# 여러 봇(미국/국내 주식, 업비트)이 같은 웹훅을 공유하면 서버 프로세스 하나로 레이트 리밋을 통합:
+#     python notify_service.py            # config.yaml의 DISCORD_WEBHOOK_URL로 로컬 알림 서버 실행
+#     NOTIFIER = create_notifier(DISCORD_WEBHOOK_URL, address=NOTIFY_SERVER_ADDRESS, authkey=NOTIFY_AUTHKEY)
+#     NOTIFIER.send("매수 완료", dedup_key="AAPL_매수 완료")
+# 서버에 연결할 수 없으면 프로세스 안의 NotifyService로 직접 발송
+# 서버/클라이언트 모두 config.yaml의 NOTIFY_AUTHKEY(봇들이 공유하는 비밀값)가 있어야 사용 (없으면 서버는 시작 거부, 봇은 직접 발송)
+# 전송 형식: TCP 위 줄 단위 JSON {"op", "content", "dedup_key"} (pickle 미사용 - 받은 메시지로 코드가 실행되지 않음)
+#   연결 시 서버가 보낸 challenge에 HMAC-SHA256(NOTIFY_AUTHKEY, challenge)로 응답해야 메시지 수신
+
+import atexit
+import base64
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+import requests
+
+DISCORD_MAX_CONTENT = 2000          # 디스코드 메시지 최대 길이
+DEFAULT_SERVER_ADDRESS = ('127.0.0.1', 47651)
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024  # 알림 서버 메시지 1건 최대 크기 (첨부 리포트 포함)
+CONNECT_TIMEOUT = 5                   # 알림 서버 연결/인증 제한 시간 (초)
+MESSAGE_OPS = ('send', 'batch', 'file')
+
+
+def build_attachment(text, filename, compress=False):
+    """리포트 문자열 → (파일명, 바이트) (compress면 gzip 압축 후 파일명에 .gz 추가)"""
+    data = text.encode('utf-8')
+    if compress:
+        return f"{filename}.gz", gzip.compress(data)
+    return filename, data
+
+
+def _split_content(lines, limit):
+    """줄 목록을 limit 글자 이하 덩어리로 분할 (한 줄이 limit보다 길면 잘라서 넣음)"""
+    chunks, current = [], ""
+    for line in lines:
+        line = line[:limit]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class NotifyService:
+    """웹훅 발송 전용 스레드 (send/add_to_batch는 큐에 넣고 바로 반환)"""
+
+    def __init__(self, webhook_url, min_interval=2.0, batch_interval=60, max_batch_size=10,
+                 dedup_window=300, max_retries=3, timeout=10, batch_header="📊 **배치 업데이트**",
+                 session=None):
+        """
+        min_interval: 발송 간 최소 간격 (초)
+        batch_interval: 배치 메시지 발송 간격 (초)
+        max_batch_size: 배치 메시지가 이 개수만큼 쌓이면 간격과 관계없이 발송
+        dedup_window: 같은 dedup_key 재발송 방지 시간 (초)
+        max_retries: 네트워크 오류/5xx 재시도 횟수 (429는 retry_after만큼 기다린 뒤 횟수 제한 없이 재시도)
+        """
+        self.webhook_url = webhook_url
+        self.min_interval = min_interval
+        self.batch_interval = batch_interval
+        self.max_batch_size = max_batch_size
+        self.dedup_window = dedup_window
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.batch_header = batch_header
+        self.session = session or requests.Session()
+
+        self._queue = queue.Queue()
+        self._batch = []
+        self._last_batch_send = time.time()
+        self._next_send_at = 0.0        # 레이트 리밋 (다음 발송 가능 시각)
+        self._dedup = {}                # {dedup_key: 마지막 발송 시각}
+        self._dedup_lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+        self.sent_count = 0
+        self.failed_count = 0
+        self.rate_limited_count = 0
+        self.deduped_count = 0
+
+    # ===== 호출 측 (매매 스레드) =====
+
+    def is_duplicate(self, dedup_key):
+        """dedup_window 안에 같은 키가 있었으면 True (없으면 지금 시각으로 기록)"""
+        if dedup_key is None or self.dedup_window <= 0:
+            return False
+        now = time.time()
+        with self._dedup_lock:
+            last = self._dedup.get(dedup_key)
+            if last is not None and now - last < self.dedup_window:
+                self.deduped_count += 1
+                return True
+            self._dedup[dedup_key] = now
+            if len(self._dedup) > 1000:
+                # 오래된 키 정리 (재발송 방지 시간의 2배 지난 항목)
+                self._dedup = {k: v for k, v in self._dedup.items() if now - v < self.dedup_window * 2}
+        return False
+
+    def send(self, content, dedup_key=None):
+        """즉시 발송 큐에 추가 (중복이면 False)"""
+        if self.is_duplicate(dedup_key):
+            return False
+        self._ensure_started()
+        self._queue.put(('send', content))
+        return True
+
+    def add_to_batch(self, content, dedup_key=None):
+        """배치 메시지 추가 (batch_interval마다 모아서 발송, 중복이면 False)"""
+        if self.is_duplicate(dedup_key):
+            return False
+        self._ensure_started()
+        self._queue.put(('batch', content))
+        return True
+
+    def send_file(self, filename, data, content="", embeds=None):
+        """첨부 파일 1개 + 메시지/embed를 multipart 요청 1회로 발송 (큐에 넣고 바로 반환)"""
+        self._ensure_started()
+        self._queue.put(('file', {'filename': filename, 'data': data, 'content': content, 'embeds': embeds}))
+        return True
+
+    def flush(self, timeout=None):
+        """배치 메시지 포함 큐에 쌓인 메시지를 모두 발송할 때까지 대기 (시간 안에 끝나면 True)"""
+        self._ensure_started()
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def stop(self, timeout=10):
+        """남은 메시지 발송 후 스레드 종료"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self.flush(timeout)
+        self._stopped.set()
+        self._queue.put(('stop', None))
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'batched': len(self._batch),
+            'sent': self.sent_count,
+            'failed': self.failed_count,
+            'rate_limited': self.rate_limited_count,
+            'deduped': self.deduped_count,
+        }
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._dedup_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stopped.clear()
+                    self._thread = threading.Thread(target=self._run, name='notify-service', daemon=True)
+                    self._thread.start()
+                    # 프로세스 종료 시 남은 메시지 발송 (최대 10초)
+                    atexit.register(self.stop)
+
+    # ===== 발송 스레드 =====
+
+    def _run(self):
+        while not self._stopped.is_set():
+            timeout = None
+            if self._batch:
+                timeout = max(0.0, self._last_batch_send + self.batch_interval - time.time())
+            try:
+                op, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._send_batch()
+                continue
+
+            if op == 'send':
+                self._post_content(payload)
+            elif op == 'file':
+                self._post_file(**payload)
+            elif op == 'batch':
+                self._batch.append(payload)
+                if len(self._batch) >= self.max_batch_size:
+                    self._send_batch()
+            elif op == 'flush':
+                self._send_batch()
+                payload.set()
+            elif op == 'stop':
+                self._send_batch()
+                return
+
+            if self._batch and time.time() - self._last_batch_send >= self.batch_interval:
+                self._send_batch()
+
+    def _send_batch(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._last_batch_send = time.time()
+        # 코드 블록 표시(헤더 + ``` 2줄) 길이를 빼고 디스코드 길이 제한에 맞게 분할
+        limit = DISCORD_MAX_CONTENT - len(self.batch_header) - 10
+        for chunk in _split_content(batch, limit):
+            self._post_content(f"{self.batch_header}\n```\n{chunk}\n```")
+        print(f"배치 메시지 발송 완료: {len(batch)} 건")
+
+    def _post_content(self, content):
+        # 빈 메시지(구분용 빈 줄)는 디스코드가 거부하므로 폭 없는 공백으로 발송
+        for chunk in _split_content(str(content).split("\n"), DISCORD_MAX_CONTENT) or ["\u200b"]:
+            self._post(data={"content": chunk})
+
+    def _post_file(self, filename, data, content="", embeds=None):
+        payload = {"content": content[:DISCORD_MAX_CONTENT]}
+        if embeds:
+            payload["embeds"] = embeds
+        mime = 'application/gzip' if filename.endswith('.gz') else 'text/markdown'
+        ok = self._post(data={"payload_json": json.dumps(payload, ensure_ascii=False)},
+                        files={"files[0]": (filename, data, mime)})
+        if ok:
+            print(f"첨부 파일 발송 완료: {filename} ({len(data):,} bytes)")
+
+    def _post(self, data=None, files=None):
+        """웹훅 POST 1건 (레이트 리밋/429/재시도 처리, 성공하면 True)"""
+        attempt = 0
+        while True:
+            wait = self._next_send_at - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                res = self.session.post(self.webhook_url, data=data, files=files, timeout=self.timeout)
+            except requests.RequestException as e:
+                res = None
+                error = str(e)
+            self._next_send_at = time.time() + self.min_interval
+
+            if res is not None and res.status_code == 429:
+                # 디스코드 레이트 리밋: 응답의 retry_after(초)만큼 대기 후 재시도 (재시도 횟수에 포함하지 않음)
+                self.rate_limited_count += 1
+                try:
+                    retry_after = float(res.json().get('retry_after', 1))
+                except ValueError:
+                    retry_after = float(res.headers.get('Retry-After', 1))
+                self._next_send_at = time.time() + retry_after
+                continue
+            if res is not None and res.status_code < 500:
+                if res.status_code >= 400:
+                    self.failed_count += 1
+                    print(f"메시지 발송 실패: 상태 코드 {res.status_code} {res.text[:200]}")
+                    return False
+                self.sent_count += 1
+                return True
+
+            attempt += 1
+            if attempt > self.max_retries:
+                self.failed_count += 1
+                print(f"메시지 발송 실패 ({self.max_retries}회 재시도): "
+                      f"{error if res is None else f'상태 코드 {res.status_code}'}")
+                return False
+            self._next_send_at = time.time() + min(2 ** attempt, 30)
+
+
+class NotifyClient:
+    """로컬 알림 서버 클라이언트 (NotifyService와 같은 send/add_to_batch 인터페이스)
+
+    전송은 내부 큐와 스레드가 담당하므로 호출은 바로 반환됨.
+    서버에 연결할 수 없으면 프로세스 안의 NotifyService(fallback)로 발송하고 retry_interval 뒤 재연결 시도.
+    """
+
+    def __init__(self, address, authkey, fallback=None, retry_interval=30):
+        """authkey: 서버와 공유하는 비밀값 (없으면 ValueError)"""
+        self.address = tuple(address)
+        self.authkey = require_authkey(authkey)
+        self.fallback = fallback
+        self.retry_interval = retry_interval
+        self._queue = queue.Queue()
+        self._conn = None               # (소켓, 파일) - 인증이 끝난 연결
+        self._next_connect_at = 0.0
+        self._thread = threading.Thread(target=self._run, name='notify-client', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush, 10)
+
+    def send(self, content, dedup_key=None):
+        self._queue.put(('send', content, dedup_key))
+        return True
+
+    def add_to_batch(self, content, dedup_key=None):
+        self._queue.put(('batch', content, dedup_key))
+        return True
+
+    def send_file(self, filename, data, content="", embeds=None):
+        self._queue.put(('file', {'filename': filename, 'data': data, 'content': content, 'embeds': embeds}, None))
+        return True
+
+    def flush(self, timeout=None):
+        """큐에 쌓인 메시지를 서버(또는 fallback)로 모두 넘길 때까지 대기"""
+        done = threading.Event()
+        self._queue.put(('flush', done, None))
+        return done.wait(timeout)
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        if time.time() < self._next_connect_at:
+            return None
+        sock = None
+        try:
+            sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+            stream = sock.makefile('rwb')
+            challenge = (_read_json(stream) or {}).get('challenge', '')
+            _write_json(stream, {'auth': sign_challenge(self.authkey, challenge)})
+            if not (_read_json(stream) or {}).get('ok'):
+                raise ConnectionError("인증 실패")
+            sock.settimeout(None)
+            self._conn = (sock, stream)
+            print(f"📡 알림 서버 연결: {self.address}")
+        except (OSError, ValueError) as e:
+            if sock is not None:
+                sock.close()
+            self._next_connect_at = time.time() + self.retry_interval
+            print(f"알림 서버 연결 실패 ({e}) - 직접 발송으로 대체")
+        return self._conn
+
+    def _close(self):
+        sock, stream = self._conn
+        self._conn = None
+        for closable in (stream, sock):
+            try:
+                closable.close()
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            op, payload, dedup_key = self._queue.get()
+            if op == 'flush':
+                if self._conn is None and self.fallback is not None:
+                    self.fallback.flush(10)
+                payload.set()
+                continue
+            conn = self._connect()
+            if conn is not None:
+                try:
+                    _write_json(conn[1], encode_message(op, payload, dedup_key))
+                    continue
+                except OSError as e:
+                    print(f"알림 서버 전송 실패 ({e}) - 직접 발송으로 대체")
+                    self._close()
+                    self._next_connect_at = time.time() + self.retry_interval
+            if self.fallback is not None:
+                dispatch(self.fallback, op, payload, dedup_key)
+
+
+def require_authkey(authkey):
+    """알림 서버 공유 비밀값 → bytes (설정되지 않았으면 ValueError)"""
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    if not authkey:
+        raise ValueError("NOTIFY_AUTHKEY가 설정되지 않았습니다 (config.yaml에 봇들이 공유할 비밀값 필요)")
+    return authkey
+
+
+def sign_challenge(authkey, challenge):
+    """서버 challenge에 대한 응답 (HMAC-SHA256 hex)"""
+    return hmac.new(authkey, str(challenge).encode(), hashlib.sha256).hexdigest()
+
+
+def _write_json(stream, message):
+    stream.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n")
+    stream.flush()
+
+
+def _read_json(stream):
+    """줄 단위 JSON 1건 (연결 종료면 None, 크기 초과/형식 오류면 ValueError)"""
+    line = stream.readline(MAX_MESSAGE_BYTES + 1)
+    if not line:
+        return None
+    if len(line) > MAX_MESSAGE_BYTES:
+        raise ValueError("메시지 크기 초과")
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError("메시지 형식 오류")
+    return message
+
+
+def encode_message(op, payload, dedup_key=None):
+    """(op, payload, dedup_key) → 알림 서버 JSON 메시지 (첨부 파일 바이트는 base64)"""
+    if op == 'file':
+        return {'op': op, 'filename': payload['filename'], 'data': base64.b64encode(payload['data']).decode('ascii'),
+                'content': payload['content'], 'embeds': payload['embeds']}
+    return {'op': op, 'content': str(payload), 'dedup_key': dedup_key}
+
+
+def decode_message(message):
+    """알림 서버 JSON 메시지 → (op, payload, dedup_key) (형식이 맞지 않으면 ValueError)"""
+    op = message.get('op')
+    if op not in MESSAGE_OPS:
+        raise ValueError(f"알 수 없는 op: {op!r}")
+    if op == 'file':
+        filename, content, embeds = message.get('filename'), message.get('content', ''), message.get('embeds')
+        if not isinstance(filename, str) or not isinstance(content, str) or not isinstance(embeds, (list, type(None))):
+            raise ValueError("첨부 파일 메시지 형식 오류")
+        data = base64.b64decode(message.get('data', ''), validate=True)
+        return op, {'filename': filename, 'data': data, 'content': content, 'embeds': embeds}, None
+    content, dedup_key = message.get('content'), message.get('dedup_key')
+    if not isinstance(content, str) or not isinstance(dedup_key, (str, type(None))):
+        raise ValueError("메시지 형식 오류")
+    return op, content, dedup_key
+
+
+def dispatch(service, op, payload, dedup_key=None):
+    """(op, payload, dedup_key) 메시지를 NotifyService 호출로 변환 (서버 수신/클라이언트 대체 발송 공용)"""
+    if op == 'send':
+        service.send(payload, dedup_key)
+    elif op == 'batch':
+        service.add_to_batch(payload, dedup_key)
+    elif op == 'file':
+        service.send_file(**payload)
+
+
+def create_notifier(webhook_url, address=None, authkey=None, **service_kwargs):
+    """알림 발송기 생성 (address와 authkey가 있으면 로컬 알림 서버 클라이언트, 없으면 프로세스 안의 NotifyService)"""
+    service = NotifyService(webhook_url, **service_kwargs)
+    if address is None:
+        return service
+    if not authkey:
+        print("⚠️ NOTIFY_AUTHKEY가 없어 알림 서버를 사용하지 않고 직접 발송합니다")
+        return service
+    return NotifyClient(address, authkey, fallback=service)
+
+
+class _NotifyHandler(socketserver.StreamRequestHandler):
+    """알림 서버 연결 1개: challenge 인증 후 줄 단위 JSON 메시지를 service 큐로 전달"""
+
+    def handle(self):
+        self.connection.settimeout(CONNECT_TIMEOUT)
+        challenge = os.urandom(16).hex()
+        try:
+            _write_json(self.wfile, {'challenge': challenge})
+            hello = _read_json(self.rfile) or {}
+            if not hmac.compare_digest(str(hello.get('auth', '')), sign_challenge(self.server.authkey, challenge)):
+                print(f"알림 서버 연결 거부: 인증 실패 {self.client_address}")
+                return
+            _write_json(self.wfile, {'ok': True})
+        except (OSError, ValueError) as e:
+            print(f"알림 서버 연결 거부: {e}")
+            return
+        self.connection.settimeout(None)
+        while True:
+            try:
+                message = _read_json(self.rfile)
+            except OSError:
+                return
+            except ValueError as e:
+                print(f"알림 서버 잘못된 메시지로 연결 종료: {e}")
+                return
+            if message is None:
+                return
+            try:
+                dispatch(self.server.service, *decode_message(message))
+            except (ValueError, TypeError) as e:
+                print(f"알림 서버 잘못된 메시지 무시: {e}")
+
+
+class _NotifyServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(service, address=DEFAULT_SERVER_ADDRESS, authkey=None):
+    """로컬 알림 서버 (연결마다 수신 스레드 1개, 받은 메시지는 service 큐로 전달)
+
+    authkey가 없으면 ValueError (인증 없이 메시지를 받지 않음)
+    """
+    authkey = require_authkey(authkey)
+    with _NotifyServer(tuple(address), _NotifyHandler) as server:
+        server.service = service
+        server.authkey = authkey
+        print(f"📡 알림 서버 시작: {tuple(address)}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    import sys
+    import yaml
+
+    with open('config.yaml', encoding='UTF-8') as f:
+        _cfg = yaml.safe_load(f)
+    _address = tuple(_cfg.get('NOTIFY_SERVER_ADDRESS', DEFAULT_SERVER_ADDRESS))
+    if not _cfg.get('NOTIFY_AUTHKEY'):
+        sys.exit("config.yaml에 NOTIFY_AUTHKEY(봇들이 공유할 비밀값)를 설정해야 알림 서버를 시작합니다")
+    serve(NotifyService(_cfg['DISCORD_WEBHOOK_URL']), _address, _cfg['NOTIFY_AUTHKEY'])
@@ -0,0 +1,115 @@
+# kis_indicators.IndicatorState 증분 지표가 기존 pandas 전체 재계산(calculate_rsi / calculate_moving_averages)과 같은지 확인
+# 실행: python -m pytest test_kis_indicators.py
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kis_indicators import IndicatorState
+
+RSI_PERIODS = 14
+MA_SHORT_PERIOD = 20
+MA_LONG_PERIOD = 50
+
+
+def legacy_rsi(prices, periods=RSI_PERIODS):
+    """기존 calculate_rsi의 RSI 식 (rolling 단순 평균, 반올림 전 값)"""
+    price = pd.Series(prices, dtype=float)
+    delta = price.diff()
+    gain = (delta.where(delta > 0, 0)).fillna(0)
+    loss = (-delta.where(delta < 0, 0)).fillna(0)
+    avg_gain = gain.rolling(window=periods, min_periods=periods).mean()
+    avg_loss = loss.rolling(window=periods, min_periods=periods).mean()
+    rs = avg_gain / avg_loss
+    return (100 - (100 / (1 + rs))).iloc[-1]
+
+
+def legacy_moving_averages(prices, short_period=MA_SHORT_PERIOD, long_period=MA_LONG_PERIOD):
+    """기존 calculate_moving_averages의 (단기 이평, 장기 이평) (데이터 부족 시 NaN)"""
+    price = pd.Series(prices, dtype=float)
+    return price.rolling(window=short_period).mean().iloc[-1], price.rolling(window=long_period).mean().iloc[-1]
+
+
+def random_walk(count, seed):
+    rng = np.random.default_rng(seed)
+    return (100 + np.cumsum(rng.normal(0, 1, count))).round(2).tolist()
+
+
+def feed(state, prices, start, end):
+    """get_streaming_indicators와 같은 방식으로 [start, end) 구간 봉 반영 (마지막 봉은 진행 중인 봉)"""
+    state.update(list(zip(range(start, end), prices[start:end])))
+
+
+def assert_matches(state, prices):
+    rsi = state.rsi_value()
+    expected_rsi = legacy_rsi(prices)
+    if math.isnan(expected_rsi):
+        assert rsi is None or math.isnan(rsi)
+    else:
+        assert rsi == pytest.approx(expected_rsi, abs=1e-9)
+        assert round(rsi, 2) == round(expected_rsi, 2)
+
+    ma_short, ma_long = state.moving_averages()
+    expected_short, expected_long = legacy_moving_averages(prices)
+    for value, expected in ((ma_short, expected_short), (ma_long, expected_long)):
+        if math.isnan(expected):
+            assert value is None
+        else:
+            assert value == pytest.approx(expected, abs=1e-9)
+
+
+@pytest.mark.parametrize("seed", [1, 7, 42])
+@pytest.mark.parametrize("split", [60, 200, 399])
+def test_two_chunks_match_pandas(seed, split):
+    prices = random_walk(400, seed)
+    state = IndicatorState(RSI_PERIODS, MA_SHORT_PERIOD, MA_LONG_PERIOD)
+
+    feed(state, prices, 0, split)
+    assert_matches(state, prices[:split])
+
+    # 다음 조회는 마지막 누적 봉 이후부터 (이전 조회의 진행 중인 봉이 마감되어 다시 들어옴)
+    feed(state, prices, state.last_key + 1, len(prices))
+    assert state.bar_count() == len(prices)
+    assert_matches(state, prices)
+
+
+def test_provisional_bar_update_matches_pandas():
+    prices = random_walk(120, 3)
+    state = IndicatorState(RSI_PERIODS, MA_SHORT_PERIOD, MA_LONG_PERIOD)
+    feed(state, prices, 0, len(prices))
+
+    # 같은 봉이 진행 중에 가격만 바뀐 경우
+    revised = prices[:-1] + [prices[-1] + 1.5]
+    state.update([(len(prices) - 1, revised[-1])])
+    assert_matches(state, revised)
+
+
+def test_rising_prices_avg_loss_zero():
+    prices = [100 + i * 0.5 for i in range(60)]
+    state = IndicatorState(RSI_PERIODS, MA_SHORT_PERIOD, MA_LONG_PERIOD)
+    feed(state, prices, 0, len(prices))
+    assert legacy_rsi(prices) == 100
+    assert state.rsi_value() == 100
+    assert_matches(state, prices)
+
+
+def test_flat_prices_avg_gain_and_loss_zero():
+    prices = [100.0] * 60
+    state = IndicatorState(RSI_PERIODS, MA_SHORT_PERIOD, MA_LONG_PERIOD)
+    feed(state, prices, 0, len(prices))
+    assert math.isnan(legacy_rsi(prices))
+    assert math.isnan(state.rsi_value())
+    assert_matches(state, prices)
+
+
+@pytest.mark.parametrize("count", [1, 2, RSI_PERIODS - 1, RSI_PERIODS, MA_SHORT_PERIOD - 1, MA_SHORT_PERIOD,
+                                   MA_LONG_PERIOD - 1, MA_LONG_PERIOD])
+def test_short_data(count):
+    prices = random_walk(count, 11)
+    state = IndicatorState(RSI_PERIODS, MA_SHORT_PERIOD, MA_LONG_PERIOD)
+    feed(state, prices, 0, count)
+    if count < RSI_PERIODS:
+        assert state.rsi_value() is None
+    assert_matches(state, prices)
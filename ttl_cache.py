@@ -0,0 +1,167 @@
+# 크기 제한 TTL 캐시 (LRU 제거, 실패 결과 별도 TTL, 동시 미스 1회 조회, 적중/미스/제거 카운터)
+# 자동매매 스크립트의 현재가/주문 가능 금액 같은 조회 결과를 함수별 TTL로 재사용하기 위한 모듈
+#
+# 사용 예:
+#     @ttl_cache('price', ttl=30, failure_ttl=5)
+#     def fetch_current_price(symbol): ...
+#     fetch_current_price.invalidate('AAPL')   # 특정 인자 항목 삭제
+#     fetch_current_price.cache.clear()        # 전체 삭제
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+CACHE_REGISTRY = {}     # {캐시 이름: TTLCache} - 통계 출력용
+
+
+def is_failure_result(value):
+    """기본 실패 판정: None 또는 숫자 0 (조회 실패 시 None/0을 반환하는 함수들 기준)"""
+    if value is None:
+        return True
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == 0
+
+
+class TTLCache:
+    """스레드 안전 TTL + LRU 캐시"""
+
+    def __init__(self, name, ttl, maxsize=256, failure_ttl=0, is_failure=is_failure_result, clock=time.monotonic):
+        """
+        ttl: 정상 결과 유지 시간 (초)
+        maxsize: 최대 항목 수 (넘으면 가장 오래 사용하지 않은 항목부터 제거)
+        failure_ttl: 실패 결과 유지 시간 (초, 0이면 실패 결과는 저장하지 않음)
+        is_failure: 결과가 실패인지 판정하는 함수 (None이면 모든 결과를 정상으로 취급)
+        """
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.failure_ttl = failure_ttl
+        self.is_failure = is_failure
+        self.clock = clock
+
+        self._data = OrderedDict()      # {key: (value, expires_at)}
+        self._inflight = {}             # {key: threading.Event} - 조회 중인 키
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.failures = 0
+        self.waits = 0
+
+    def _lookup(self, key, now):
+        """유효한 항목 (found, value) - 락 안에서만 호출"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if expires_at <= now:
+            del self._data[key]
+            self.expirations += 1
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value, now):
+        """결과 저장 (실패 결과는 failure_ttl 적용) - 락 안에서만 호출"""
+        failed = self.is_failure is not None and self.is_failure(value)
+        if failed:
+            self.failures += 1
+        ttl = self.failure_ttl if failed else self.ttl
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (value, now + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_fetch(self, key, fetch):
+        """캐시 값 반환, 없으면 fetch() 호출 (같은 키를 동시에 조회하면 한 스레드만 fetch하고 나머지는 결과를 기다림)"""
+        while True:
+            with self._lock:
+                found, value = self._lookup(key, self.clock())
+                if found:
+                    self.hits += 1
+                    return value
+                event = self._inflight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    self.misses += 1
+                    break
+                self.waits += 1
+            # 조회한 스레드가 결과를 저장했으면 다음 반복에서 적중, 저장하지 않았으면(실패 TTL 0/예외) 직접 조회
+            event.wait()
+
+        try:
+            value = fetch()
+            with self._lock:
+                self._store(key, value, self.clock())
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'failures': self.failures,
+                'waits': self.waits,
+            }
+
+
+def make_key(args, kwargs):
+    return (args, tuple(sorted(kwargs.items()))) if kwargs else args
+
+
+def ttl_cache(name, ttl, maxsize=256, failure_ttl=0, is_failure=is_failure_result, registry=CACHE_REGISTRY):
+    """함수 결과 캐시 데코레이터 (인자별 항목, wrapper.cache / wrapper.invalidate(*args, **kwargs) 제공)"""
+    def decorator(func):
+        cache = TTLCache(name, ttl, maxsize=maxsize, failure_ttl=failure_ttl, is_failure=is_failure)
+        if registry is not None:
+            registry[name] = cache
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.get_or_fetch(make_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        def invalidate(*args, **kwargs):
+            cache.invalidate(make_key(args, kwargs))
+
+        wrapper.cache = cache
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
+
+
+def format_cache_stats(registry=CACHE_REGISTRY):
+    """캐시별 통계 한 줄 요약"""
+    parts = []
+    for cache in registry.values():
+        s = cache.stats()
+        parts.append(f"{s['name']} {s['size']}개 적중 {s['hits']}/{s['hits'] + s['misses']} ({s['hit_rate'] * 100:.0f}%) "
+                     f"실패 {s['failures']} 제거 {s['evictions']} 대기 {s['waits']}")
+    return " | ".join(parts)